@@ -0,0 +1,352 @@
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import httpx
+import orjson
+from sqlalchemy import func, select
+
+from vrc_world_crawler.crawler.cassette import CassetteTransport
+from vrc_world_crawler.crawler.deduplicator import Deduplicator
+from vrc_world_crawler.crawler.fetcher import Fetcher
+from vrc_world_crawler.crawler.snapshot_reader import SnapshotReader
+from vrc_world_crawler.crawler.valueobject.account import Account
+from vrc_world_crawler.crawler.valueobject.fetched_info import FetchedInfo
+from vrc_world_crawler.db.analytics_mirror import AnalyticsMirror
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.db.model import DEFAULT_ACCOUNT_NAME, FavoriteWorld
+from vrc_world_crawler.db.trending_engine import TrendingEngine
+from vrc_world_crawler.memory import MemoryTracker
+
+# ベンチマーク名から、件数を受け取り計測対象の処理を返す関数を引く辞書
+# 返された処理の実行時間のみを計測し、準備にかかる時間は含めない
+BENCHMARK_DICT: dict[str, Callable[[int], Callable[[], None]]] = {}
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    name: str
+    size: int
+    best_sec: float
+    mean_sec: float
+
+    @property
+    def per_item_usec(self) -> float:
+        return self.best_sec / self.size * 1_000_000
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name:<24} size={self.size:<8} best={self.best_sec * 1000:10.2f}ms "
+            f"mean={self.mean_sec * 1000:10.2f}ms per_item={self.per_item_usec:8.2f}us"
+        )
+
+
+def benchmark(name: str) -> Callable:
+    """ベンチマークとして登録するデコレータ"""
+
+    def decorator(func: Callable[[int], Callable[[], None]]) -> Callable[[int], Callable[[], None]]:
+        BENCHMARK_DICT[name] = func
+        return func
+
+    return decorator
+
+
+def make_fetched_dict(index: int, favorite_group: str = "worlds1") -> dict:
+    """API のレスポンスを模した1ワールド分の辞書を作成する
+
+    Args:
+        index (int): ワールドの通し番号、id などの一意な値に使う
+        favorite_group (str): お気に入りグループ名
+
+    Returns:
+        dict: fetch データの辞書の1レコード
+    """
+    return {
+        "id": f"wrld_{index:08}-0000-0000-0000-000000000000",
+        "name": f"world_name_{index}",
+        "description": f"description_{index} " * 8,
+        "authorId": f"usr_{index % 100:08}-0000-0000-0000-000000000000",
+        "authorName": f"author_name_{index % 100}",
+        "favoriteId": f"fvrt_{index:08}-0000-0000-0000-000000000000",
+        "favoriteGroup": favorite_group,
+        "releaseStatus": "public",
+        "featured": False,
+        "imageUrl": f"https://api.vrchat.cloud/api/1/file/file_{index:08}/1/file",
+        "thumbnailImageUrl": f"https://api.vrchat.cloud/api/1/image/file_{index:08}/1/256",
+        "version": index % 10 + 1,
+        "favorites": index * 3,
+        "visits": index * 11,
+        "publicationDate": _make_timestamp(datetime(2024, 1, 1), index),
+        "labsPublicationDate": "none",
+        "created_at": _make_timestamp(datetime(2023, 1, 1), index),
+        "updated_at": _make_timestamp(datetime(2024, 6, 1), index),
+    }
+
+
+def _make_timestamp(base: datetime, index: int) -> str:
+    # 実際のスナップショットと同じく、日時はワールドごとに異なるミリ秒単位の値とする
+    timestamp = base + timedelta(seconds=index * 61, milliseconds=index * 7 % 1000)
+    return timestamp.isoformat(timespec="milliseconds") + "Z"
+
+
+def make_favorites_transport(size: int) -> httpx.MockTransport:
+    """お気に入りワールド API を模したトランスポートを作成する
+
+    size 件のワールドを Fetcher.tag_list のタグに先頭から順に振り分け、n, offset, tag に応じたページを返す
+    1タグに入るのは Fetcher.max_offset + Fetcher.page_size 件までのため、それを超える分は返さない
+
+    Args:
+        size (int): お気に入りの件数
+
+    Returns:
+        httpx.MockTransport: レスポンスを返すトランスポート
+    """
+    tag_size = Fetcher.max_offset + Fetcher.page_size
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        tag = params["tag"]
+        start = Fetcher.tag_list.index(tag) * tag_size + int(params["offset"])
+        end = min(start + int(params["n"]), size, (Fetcher.tag_list.index(tag) + 1) * tag_size)
+        return httpx.Response(200, content=orjson.dumps([make_fetched_dict(i, tag) for i in range(start, end)]))
+
+    return httpx.MockTransport(handler)
+
+
+def make_record_list(size: int) -> list[FavoriteWorld]:
+    return [FavoriteWorld.create(FetchedInfo.create(make_fetched_dict(i)).to_dict()) for i in range(size)]
+
+
+@benchmark("fetched_info_create")
+def _bench_fetched_info_create(size: int) -> Callable[[], None]:
+    fetched_dict_list = [make_fetched_dict(i) for i in range(size)]
+    return lambda: [FetchedInfo.create(fetched_dict) for fetched_dict in fetched_dict_list]
+
+
+@benchmark("favorite_world_create")
+def _bench_favorite_world_create(size: int) -> Callable[[], None]:
+    fetched_info_list = [FetchedInfo.create(make_fetched_dict(i)) for i in range(size)]
+    return lambda: [FavoriteWorld.create(fetched_info.to_dict()) for fetched_info in fetched_info_list]
+
+
+@benchmark("snapshot_replay")
+def _bench_snapshot_replay(size: int) -> Callable[[], None]:
+    # デバッグ実行と同じく、キャッシュファイルを読み込んで FetchedInfo に変換する
+    temp_dir = tempfile.TemporaryDirectory()
+    snapshot_path = Path(temp_dir.name) / "favorites_world_bench.json"
+    fetched_dict_list = [make_fetched_dict(i) for i in range(size)]
+    snapshot_path.write_bytes(orjson.dumps(fetched_dict_list, option=orjson.OPT_INDENT_2))
+    del fetched_dict_list
+
+    def run() -> None:
+        # temp_dir は run が参照している間だけ残す
+        assert temp_dir
+        registered_at = datetime.now().isoformat()
+        for page in SnapshotReader(snapshot_path).iter_pages(50):
+            for fetched_dict in page:
+                FetchedInfo.create(fetched_dict, registered_at)
+
+    return run
+
+
+@benchmark("fetch_replay")
+def _bench_fetch_replay(size: int) -> Callable[[], None]:
+    # 記録したレスポンスを再生し、ページングを含む Fetcher の HTTP 処理を通して FetchedInfo に変換する
+    temp_dir = tempfile.TemporaryDirectory()
+    cassette_path = Path(temp_dir.name) / "cassette.json"
+    account = Account(DEFAULT_ACCOUNT_NAME, "", "", "")
+    transport = CassetteTransport(cassette_path, "record", inner_transport=make_favorites_transport(size))
+    fetcher = Fetcher(account, cache_path=Path(temp_dir.name), transport=transport)
+    fetcher.fetch()
+    fetcher.close()
+
+    def run() -> None:
+        fetcher = Fetcher(account, cache_path=Path(temp_dir.name), transport=CassetteTransport(cassette_path))
+        fetcher.fetch()
+        fetcher.close()
+
+    return run
+
+
+@benchmark("deduplicate")
+def _bench_deduplicate(size: int) -> Callable[[], None]:
+    # 半数のワールドが2つのグループに登録されている場合
+    half = max(size // 2, 1)
+    fetched_info_list = [
+        FetchedInfo.create(make_fetched_dict(i % half, f"worlds{i // half + 1}"), "2024-09-01T00:00:00")
+        for i in range(size)
+    ]
+    return lambda: Deduplicator().filter(fetched_info_list)
+
+
+@benchmark("upsert_insert")
+def _bench_upsert_insert(size: int) -> Callable[[], None]:
+    def run() -> None:
+        db = FavoriteWorldDB(":memory:")
+        db.upsert(make_record_list(size))
+        db.dispose()
+
+    return run
+
+
+@benchmark("upsert_update")
+def _bench_upsert_update(size: int) -> Callable[[], None]:
+    db = FavoriteWorldDB(":memory:")
+    db.upsert(make_record_list(size))
+
+    def run() -> None:
+        with db.session_scope() as session:
+            db.clear_favorited(session)
+            db.upsert(make_record_list(size), session)
+
+    return run
+
+
+@benchmark("iter_rows")
+def _bench_iter_rows(size: int) -> Callable[[], None]:
+    db = FavoriteWorldDB(":memory:")
+    db.upsert(make_record_list(size))
+    return lambda: sum(1 for _ in db.iter_rows())
+
+
+@benchmark("search")
+def _bench_search(size: int) -> Callable[[], None]:
+    # 件数が増えても1回の検索時間がほぼ変わらないことを確認する
+    db = FavoriteWorldDB(":memory:")
+    db.upsert(make_record_list(size))
+    return lambda: db.search(f"world_name_{size - 1}")
+
+
+@benchmark("sql_aggregate")
+def _bench_sql_aggregate(size: int) -> Callable[[], None]:
+    # analytics_aggregate と同じ集計を SQL の GROUP BY で行う
+    db = FavoriteWorldDB(":memory:")
+    db.upsert(make_record_list(size))
+    statement = select(FavoriteWorld.author_name, func.sum(FavoriteWorld.star)).group_by(FavoriteWorld.author_name)
+
+    def run() -> None:
+        with db.snapshot_scope() as session:
+            dict(session.execute(statement).all())
+
+    return run
+
+
+@benchmark("analytics_aggregate")
+def _bench_analytics_aggregate(size: int) -> Callable[[], None]:
+    db = FavoriteWorldDB(":memory:")
+    db.upsert(make_record_list(size))
+    mirror = AnalyticsMirror()
+    mirror.refresh(db)
+    return lambda: mirror.aggregate("author_name", "star", "sum")
+
+
+@benchmark("analytics_refresh")
+def _bench_analytics_refresh(size: int) -> Callable[[], None]:
+    # 空のミラーに全件を読み込む、クロール後の差分の反映は変更された行の分のみとなる
+    db = FavoriteWorldDB(":memory:")
+    db.upsert(make_record_list(size))
+    db.get_index()
+    return lambda: AnalyticsMirror().refresh(db)
+
+
+@benchmark("trending_update")
+def _bench_trending_update(size: int) -> Callable[[], None]:
+    # 1時間ごとのクロールで全ワールドの star が増えた場合の反映、30日分のバケットが溜まると古い分を引き始める
+    engine = TrendingEngine()
+    observed_at = datetime(2024, 9, 1)
+    engine.update({f"world_{i}": (0, 0) for i in range(size)}, observed_at)
+    step_list = [0]
+
+    def run() -> None:
+        step_list[0] += 1
+        metric_dict = {f"world_{i}": (step_list[0] * (i % 7 + 1), 0) for i in range(size)}
+        engine.update(metric_dict, observed_at + timedelta(hours=step_list[0]))
+
+    return run
+
+
+@benchmark("trending_top")
+def _bench_trending_top(size: int) -> Callable[[], None]:
+    engine = TrendingEngine()
+    observed_at = datetime(2024, 9, 1)
+    engine.update({f"world_{i}": (0, 0) for i in range(size)}, observed_at)
+    engine.update({f"world_{i}": (i, 0) for i in range(size)}, observed_at + timedelta(hours=1))
+    return lambda: engine.top("24h", "star", 10)
+
+
+def run_benchmark(name_list: list[str] | None = None, size: int = 1000, repeat: int = 3) -> list[BenchmarkResult]:
+    """ベンチマークを実行する
+
+    Args:
+        name_list (list[str] | None): 実行するベンチマーク名のリスト、None の場合はすべて
+        size (int): 1回の計測で処理する件数
+        repeat (int): 計測回数
+
+    Returns:
+        list[BenchmarkResult]: ベンチマークごとの計測結果
+    """
+    name_list = name_list or list(BENCHMARK_DICT.keys())
+    unknown_name_list = [name for name in name_list if name not in BENCHMARK_DICT]
+    if unknown_name_list:
+        raise ValueError(f"Unknown benchmark: {unknown_name_list}.")
+
+    result = []
+    for name in name_list:
+        run = BENCHMARK_DICT[name](size)
+        elapsed_list = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            elapsed_list.append(time.perf_counter() - start)
+        result.append(BenchmarkResult(name, size, min(elapsed_list), statistics.mean(elapsed_list)))
+    return result
+
+
+def measure_pipeline_memory(size: int = 10_000, page_size: int = 50) -> MemoryTracker:
+    """クロール1回分の処理を段階ごとに順に実行し、各段階のメモリ使用量を計測する
+
+    合成したお気に入り size 件をキャッシュファイルに書き出し、次の順に処理する
+    各段階の結果は次の段階まで保持するため、1回の run で同時に保持されるデータの量を再現する
+
+    - fetch: Fetcher.fetch でキャッシュファイルを再生し FetchedInfo のリストを作る
+    - record: FetchedInfo から FavoriteWorld を作る
+    - upsert: 空の DB に FavoriteWorldDB.upsert で書き込む
+
+    キャッシュファイルと DB の作成は計測に含めない
+
+    Args:
+        size (int): お気に入りの件数
+        page_size (int): Fetcher が1ページとして読み込む件数
+
+    Returns:
+        MemoryTracker: 段階ごとの使用量を usage_list に持つ、計測を終了した MemoryTracker
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        snapshot_path = Path(temp_dir) / "favorites_world_bench.json"
+        snapshot_path.write_bytes(
+            orjson.dumps([make_fetched_dict(i) for i in range(size)], option=orjson.OPT_INDENT_2)
+        )
+        account = Account(DEFAULT_ACCOUNT_NAME, "", "", "")
+        fetcher = Fetcher(
+            account, is_debug=True, cache_path=Path(temp_dir), page_size=page_size, snapshot_path=snapshot_path
+        )
+        db = FavoriteWorldDB(":memory:")
+        try:
+            with MemoryTracker() as tracker:
+                with tracker.phase("fetch"):
+                    fetched_info_list = fetcher.fetch()
+                with tracker.phase("record"):
+                    record_list = [
+                        FavoriteWorld.create(fetched_info.to_dict() | {"account": account.name})
+                        for fetched_info in fetched_info_list
+                    ]
+                with tracker.phase("upsert"):
+                    db.upsert(record_list)
+                del fetched_info_list, record_list
+        finally:
+            db.dispose()
+    return tracker
@@ -0,0 +1,149 @@
+import os
+import threading
+from collections import OrderedDict
+from logging import INFO, getLogger
+from pathlib import Path
+
+import orjson
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+class AssetCache:
+    """画像などのアセットを内容のハッシュ値(sha256)をファイル名として保存するディスクキャッシュ
+
+    URL からハッシュ値を引く索引を持ち、同じ内容のアセットは URL が違っても1ファイルだけ保存する
+    保存したファイルの合計サイズが max_size を超えた場合は、最も長く使われていないファイルから削除する
+    複数スレッドから同時に呼び出してよい
+
+    ディレクトリ構成
+        root/index.json       URL とハッシュ値の索引、ファイルの使用順
+        root/blobs/ab/abcd... アセットの内容
+    """
+
+    root: Path
+    max_size: int
+    total_size: int
+
+    def __init__(self, root: Path, max_size: int) -> None:
+        """AssetCache を作成する、索引ファイルがあれば読み込む
+
+        Args:
+            root (Path): キャッシュディレクトリ
+            max_size (int): 保存するファイルの合計サイズの上限(バイト)
+        """
+        if max_size <= 0:
+            raise ValueError("max_size must be positive.")
+        self.root = root
+        self.max_size = max_size
+        self._index_path = root / "index.json"
+        self._lock = threading.Lock()
+        # URL からハッシュ値を引く辞書
+        self._url_dict: dict[str, str] = {}
+        # ハッシュ値からファイルサイズを引く辞書、先頭ほど長く使われていない
+        self._blob_dict: OrderedDict[str, int] = OrderedDict()
+        # ハッシュ値からそれを指す URL を引く辞書、削除時に使う
+        self._url_set_dict: dict[str, set[str]] = {}
+        self.total_size = 0
+        (root / "blobs").mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        if not self._index_path.is_file():
+            return
+        index_dict = orjson.loads(self._index_path.read_bytes())
+        for digest, size in index_dict["blobs"]:
+            # 索引の保存後に消されたファイルは無視する
+            if self.blob_path(digest).is_file():
+                self._blob_dict[digest] = size
+                self.total_size += size
+        for url, digest in index_dict["urls"].items():
+            if digest in self._blob_dict:
+                self._url_dict[url] = digest
+                self._url_set_dict.setdefault(digest, set()).add(url)
+
+    def save(self) -> None:
+        """索引をファイルに保存する"""
+        with self._lock:
+            index_dict = {"urls": self._url_dict, "blobs": list(self._blob_dict.items())}
+            data = orjson.dumps(index_dict)
+        tmp_path = self._index_path.with_name(self._index_path.name + ".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, self._index_path)
+
+    def blob_path(self, digest: str) -> Path:
+        """ハッシュ値に対応するファイルのパスを返す"""
+        return self.root / "blobs" / digest[:2] / digest
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._url_dict
+
+    def __len__(self) -> int:
+        return len(self._blob_dict)
+
+    def get_path(self, url: str) -> Path | None:
+        """URL のアセットのファイルパスを返し、最近使ったものとして記録する
+
+        Args:
+            url (str): アセットの URL
+
+        Returns:
+            Path | None: ファイルのパス、キャッシュに無い場合は None
+        """
+        with self._lock:
+            digest = self._url_dict.get(url)
+            if digest is None:
+                return None
+            self._blob_dict.move_to_end(digest)
+        return self.blob_path(digest)
+
+    def put(self, url: str, digest: str, tmp_path: Path) -> Path:
+        """ダウンロードした一時ファイルをキャッシュに登録する
+
+        同じ内容のファイルが既にある場合は一時ファイルを削除して既存のファイルを使う
+        登録後に合計サイズが上限を超えた場合は古いファイルから削除する
+
+        Args:
+            url (str): アセットの URL
+            digest (str): 一時ファイルの内容の sha256 ハッシュ値(16進数)
+            tmp_path (Path): ダウンロードした一時ファイル、キャッシュディレクトリと同じファイルシステム上に置くこと
+
+        Returns:
+            Path: 登録したファイルのパス
+        """
+        blob_path = self.blob_path(digest)
+        with self._lock:
+            if digest in self._blob_dict:
+                tmp_path.unlink(missing_ok=True)
+            else:
+                blob_path.parent.mkdir(exist_ok=True)
+                os.replace(tmp_path, blob_path)
+                size = blob_path.stat().st_size
+                self._blob_dict[digest] = size
+                self.total_size += size
+            old_digest = self._url_dict.get(url)
+            if old_digest is not None and old_digest != digest:
+                self._url_set_dict[old_digest].discard(url)
+            self._url_dict[url] = digest
+            self._url_set_dict.setdefault(digest, set()).add(url)
+            self._blob_dict.move_to_end(digest)
+            self._evict(keep_digest=digest)
+        return blob_path
+
+    def _evict(self, keep_digest: str) -> None:
+        """合計サイズが上限以下になるまで、最も長く使われていないファイルから削除する
+
+        直前に登録した keep_digest は上限を超えていても削除しない
+        """
+        while self.total_size > self.max_size and len(self._blob_dict) > 1:
+            digest, size = next(iter(self._blob_dict.items()))
+            if digest == keep_digest:
+                break
+            del self._blob_dict[digest]
+            self.total_size -= size
+            for url in self._url_set_dict.pop(digest, set()):
+                if self._url_dict.get(url) == digest:
+                    del self._url_dict[url]
+            self.blob_path(digest).unlink(missing_ok=True)
+            logger.info(f"Evict asset: {digest}, {size} bytes.")
@@ -0,0 +1,134 @@
+import hashlib
+import tempfile
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from logging import INFO, getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from vrc_world_crawler.crawler.asset_cache import AssetCache
+from vrc_world_crawler.crawler.rate_limiter import RateLimiter
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+class AssetDownloader:
+    """ワールドのサムネイルなどの画像を AssetCache にダウンロードする
+
+    キャッシュに無い URL のみを、最大 concurrency 件まで並行してダウンロードする
+    ダウンロード中の内容は一時ファイルに書きながらハッシュ値を計算するため、画像の大きさに依らずメモリ使用量は一定となる
+    """
+
+    cache: AssetCache
+    concurrency: int
+    rate_limiter: RateLimiter
+    client: "httpx.Client | None"
+
+    def __init__(
+        self,
+        cache: AssetCache,
+        concurrency: int = 4,
+        rate_limiter: RateLimiter | None = None,
+    ) -> None:
+        """AssetDownloader を作成する
+
+        Args:
+            cache (AssetCache): 保存先のキャッシュ
+            concurrency (int): 同時にダウンロードする件数の上限
+            rate_limiter (RateLimiter | None): リクエスト前に待つレートリミッタ、None の場合は制限しない
+        """
+        if concurrency <= 0:
+            raise ValueError("concurrency must be positive.")
+        self.cache = cache
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter or RateLimiter(0)
+        self.client = None
+
+    def _get_client(self) -> "httpx.Client":
+        """HTTP クライアントを取得する、コネクションプールは並行するダウンロードで共有する"""
+        if self.client is None:
+            import httpx
+
+            headers = {
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0",
+            }
+            limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+            transport = httpx.HTTPTransport(retries=3, limits=limits)
+            self.client = httpx.Client(follow_redirects=True, transport=transport, headers=headers)
+        return self.client
+
+    def close(self) -> None:
+        """HTTP クライアントを閉じる"""
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    def _download(self, url: str) -> Path:
+        """1件ダウンロードしてキャッシュに登録する
+
+        Args:
+            url (str): アセットの URL
+
+        Returns:
+            Path: 登録したファイルのパス
+        """
+        client = self._get_client()
+        self.rate_limiter.acquire()
+        sha256 = hashlib.sha256()
+        # os.replace で移動できるよう、一時ファイルはキャッシュと同じディレクトリに作る
+        with tempfile.NamedTemporaryFile(dir=self.cache.root, suffix=".tmp", delete=False) as tmp_file:
+            tmp_path = Path(tmp_file.name)
+            try:
+                with client.stream("GET", url) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_bytes():
+                        sha256.update(chunk)
+                        tmp_file.write(chunk)
+            except BaseException:
+                tmp_file.close()
+                tmp_path.unlink(missing_ok=True)
+                raise
+        return self.cache.put(url, sha256.hexdigest(), tmp_path)
+
+    def download(self, url_list: Iterable[str | None]) -> dict[str, int]:
+        """キャッシュに無い URL をダウンロードする
+
+        1件の失敗は全体を止めず、ログに記録して件数に数える
+        キャッシュにあった URL も最近使ったものとして記録し、終了時にキャッシュの索引を保存する
+
+        Args:
+            url_list (Iterable[str | None]): ダウンロードする URL、None や空文字と重複は無視する
+
+        Returns:
+            dict[str, int]: 結果ごとの件数 {"downloaded": int, "skipped": int, "failed": int}
+                            skipped はキャッシュにあった件数
+        """
+        result = {"downloaded": 0, "skipped": 0, "failed": 0}
+        target_url_list = []
+        for url in dict.fromkeys(url for url in url_list if url):
+            # キャッシュにある URL は、今回も使われたものとして削除される順を後ろに回す
+            if self.cache.get_path(url) is not None:
+                result["skipped"] += 1
+            else:
+                target_url_list.append(url)
+
+        if target_url_list:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="AssetDownloader") as executor:
+                future_dict = {executor.submit(self._download, url): url for url in target_url_list}
+                for future, url in future_dict.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.warning(f"Asset download failed: {url}, {e!r}")
+                        result["failed"] += 1
+                    else:
+                        result["downloaded"] += 1
+        if target_url_list or result["skipped"]:
+            self.cache.save()
+        summary = ", ".join(f"{count} {key}" for key, count in result.items())
+        logger.info(f"Asset download: {summary}.")
+        return result
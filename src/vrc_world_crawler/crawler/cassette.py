@@ -0,0 +1,174 @@
+import base64
+import os
+import threading
+import time
+from logging import INFO, getLogger
+from pathlib import Path
+
+import httpx
+import orjson
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# カセットの動作モード
+CASSETTE_MODE_LIST = ["record", "replay"]
+
+# カセットファイルの形式のバージョン
+CASSETTE_VERSION = 1
+
+# 認証情報を含むため、値を記録しないヘッダ
+_REDACTED_HEADER_SET = {"authorization", "cookie", "set-cookie"}
+_REDACTED = "REDACTED"
+
+
+def _dump_headers(headers: httpx.Headers) -> list[list[str]]:
+    # 同じ名前のヘッダが複数ある場合も順序を保つよう、名前と値の組のリストにする
+    return [
+        [name, _REDACTED if name.lower() in _REDACTED_HEADER_SET else value] for name, value in headers.multi_items()
+    ]
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """httpx のトランスポート層でリクエストとレスポンスを記録・再生する
+
+    record モードでは inner_transport に実際にリクエストし、リクエストとレスポンスの組を
+    ヘッダ、ステータス、本文、応答にかかった時間とともに記録して、close 時にカセットファイルに保存する
+    replay モードではネットワークに接続せず、カセットファイルから同じメソッドと URL のレスポンスを記録順に返す
+    記録した回数より多く同じリクエストをした場合は、最後に記録したレスポンスを繰り返す
+
+    クライアントから見ると実際の通信と同じレスポンスが返るため、ページングやエラー処理など
+    Fetcher の HTTP 処理をネットワーク無しで実行できる
+    本文は Content-Encoding を解く前のまま記録し、展開はクライアントが行う
+    認証に関するヘッダの値は記録しない
+    """
+
+    path: Path
+    mode: str
+    latency_scale: float
+
+    def __init__(
+        self,
+        path: Path,
+        mode: str = "replay",
+        inner_transport: httpx.BaseTransport | None = None,
+        latency_scale: float = 0.0,
+    ) -> None:
+        """CassetteTransport を作成する
+
+        Args:
+            path (Path): カセットファイルのパス
+            mode (str): CASSETTE_MODE_LIST のいずれか
+            inner_transport (httpx.BaseTransport | None): record モードで実際にリクエストするトランスポート
+                                                         None の場合はリトライ付きの HTTPTransport
+            latency_scale (float): replay モードで、記録した応答時間にこの倍率を掛けた時間だけ待ってから返す
+                                   0 の場合は待たない
+
+        Raises:
+            ValueError: 不明なモードの場合と latency_scale が負の場合
+            FileNotFoundError: replay モードでカセットファイルが無い場合
+        """
+        if mode not in CASSETTE_MODE_LIST:
+            raise ValueError(f"Unknown cassette mode: {mode}.")
+        if latency_scale < 0:
+            raise ValueError("latency_scale must not be negative.")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._interaction_list: list[dict] = []
+        self._played_dict: dict[tuple[str, str], int] = {}
+        self._inner_transport = None
+        if mode == "record":
+            self._inner_transport = inner_transport or httpx.HTTPTransport(retries=3)
+        else:
+            self._interaction_list = self.load(path)
+            self._interaction_dict: dict[tuple[str, str], list[dict]] = {}
+            for interaction in self._interaction_list:
+                request = interaction["request"]
+                self._interaction_dict.setdefault((request["method"], request["url"]), []).append(interaction)
+
+    @property
+    def interaction_list(self) -> list[dict]:
+        """記録したリクエストとレスポンスの組のリスト"""
+        return self._interaction_list
+
+    @staticmethod
+    def load(path: Path) -> list[dict]:
+        """カセットファイルを読み込む
+
+        Raises:
+            ValueError: 対応していない形式のファイルの場合
+        """
+        cassette_dict = orjson.loads(path.read_bytes())
+        if cassette_dict.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version: {path}.")
+        return cassette_dict["interactions"]
+
+    def save(self) -> None:
+        """記録したリクエストとレスポンスをカセットファイルに書き出す"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with self._lock:
+            cassette_dict = {"version": CASSETTE_VERSION, "interactions": self._interaction_list}
+            tmp_path.write_bytes(orjson.dumps(cassette_dict, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, self.path)
+        logger.info(f"Cassette saved: {self.path}, {len(self._interaction_list)} interactions.")
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.mode == "record":
+            return self._record(request)
+        return self._replay(request)
+
+    def _record(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        response = self._inner_transport.handle_request(request)
+        try:
+            content = b"".join(response.stream)
+        finally:
+            response.close()
+        elapsed = time.perf_counter() - start
+        interaction = {
+            "request": {"method": request.method, "url": str(request.url), "headers": _dump_headers(request.headers)},
+            "response": {
+                "status_code": response.status_code,
+                "http_version": response.extensions.get("http_version", b"HTTP/1.1").decode(),
+                "headers": _dump_headers(response.headers),
+                "content": base64.b64encode(content).decode(),
+            },
+            "elapsed": elapsed,
+        }
+        with self._lock:
+            self._interaction_list.append(interaction)
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            content=content,
+            extensions={"http_version": interaction["response"]["http_version"].encode()},
+        )
+
+    def _replay(self, request: httpx.Request) -> httpx.Response:
+        key = (request.method, str(request.url))
+        interaction_list = self._interaction_dict.get(key)
+        if not interaction_list:
+            raise LookupError(f"No recorded response: {request.method} {request.url}.")
+        with self._lock:
+            played_num = self._played_dict.get(key, 0)
+            self._played_dict[key] = played_num + 1
+        interaction = interaction_list[min(played_num, len(interaction_list) - 1)]
+        if self.latency_scale:
+            time.sleep(interaction["elapsed"] * self.latency_scale)
+        response_dict = interaction["response"]
+        return httpx.Response(
+            response_dict["status_code"],
+            headers=[(name, value) for name, value in response_dict["headers"] if value != _REDACTED],
+            content=base64.b64decode(response_dict["content"]),
+            extensions={"http_version": response_dict["http_version"].encode()},
+        )
+
+    def close(self) -> None:
+        """record モードの場合は記録をカセットファイルに保存し、inner_transport を閉じる"""
+        if self._inner_transport is not None:
+            self._inner_transport.close()
+            self._inner_transport = None
+            self.save()
@@ -0,0 +1,207 @@
+import os
+import socket
+import time
+import uuid
+from collections.abc import Callable
+from datetime import datetime
+from logging import INFO, getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from vrc_world_crawler.crawler.db_writer import DBWriter
+from vrc_world_crawler.crawler.fetcher import Fetcher
+from vrc_world_crawler.crawler.valueobject.account import Account
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.db.trending_engine import TrendingEngine
+from vrc_world_crawler.db.valueobject.work_unit import WorkUnit
+from vrc_world_crawler.db.work_queue import WorkQueue
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+class CrawlWorker:
+    """WorkQueue から作業単位を1つずつ取得し、ページを取得して結果をキューに保存するワーカー
+
+    DB には書き込まず、すべての作業単位が終わった後に merge_crawl で1つの DBWriter からまとめて書き込む
+    複数のプロセス・ホストで同時に動かしてよい、各アカウントのリクエスト頻度の制限はプロセスごとに行う
+    """
+
+    queue: WorkQueue
+    worker_id: str
+    fetcher_dict: dict[str, Fetcher]
+
+    def __init__(
+        self,
+        queue: WorkQueue,
+        account_list: list[Account],
+        worker_id: str | None = None,
+        cache_path: Path | None = None,
+        transport_factory: "Callable[[Account], httpx.BaseTransport] | None" = None,
+    ) -> None:
+        """CrawlWorker を作成する
+
+        Args:
+            queue (WorkQueue): 作業単位を取得するキュー
+            account_list (list[Account]): 取得に使うアカウントのリスト、作業単位のアカウント名で引く
+            worker_id (str | None): リースの所有者として記録する識別子、None の場合はホスト名とプロセス ID から作る
+            cache_path (Path | None): Fetcher のキャッシュディレクトリ
+            transport_factory (Callable[[Account], httpx.BaseTransport] | None): Fetcher が使う HTTP トランスポートを
+                                                                                 作成する関数
+        """
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.fetcher_dict = {
+            account.name: Fetcher(
+                account,
+                cache_path=cache_path,
+                transport=None if transport_factory is None else transport_factory(account),
+            )
+            for account in account_list
+        }
+
+    def close(self) -> None:
+        """HTTP クライアントを閉じる"""
+        for fetcher in self.fetcher_dict.values():
+            fetcher.close()
+
+    def process(self, unit: WorkUnit) -> bool:
+        """作業単位のページを取得して結果を保存する
+
+        ページを1つ取得するごとにリースを延長し、リースを失っていた場合は結果を保存せずに中断する
+        取得に失敗した場合は失敗を記録し、取得回数の上限までは他のワーカーが再び取得する
+
+        Returns:
+            bool: 結果を保存できた場合 True
+        """
+        fetcher = self.fetcher_dict.get(unit.account)
+        if fetcher is None:
+            self.queue.fail(unit, self.worker_id, f"Unknown account: {unit.account}.")
+            return False
+        page_list = []
+        try:
+            for page in fetcher.iter_tag_pages(unit.tag, unit.offset_start, unit.offset_end, unit.page_size):
+                page_list.append(page)
+                if not self.queue.heartbeat(unit, self.worker_id):
+                    logger.warning(f"Lease lost, work unit: {unit.unit_id}.")
+                    return False
+        except Exception as e:
+            logger.exception(f"Work unit failed: {unit.unit_id}, attempt {unit.attempt}.")
+            self.queue.fail(unit, self.worker_id, repr(e))
+            return False
+        if not self.queue.complete(unit, self.worker_id, page_list):
+            logger.warning(f"Lease lost, work unit: {unit.unit_id}.")
+            return False
+        return True
+
+    def run(
+        self, crawl_id: str | None = None, max_units: int | None = None, wait: bool = False, poll_interval: float = 5.0
+    ) -> int:
+        """作業単位が無くなるまで取得と処理を繰り返す
+
+        Args:
+            crawl_id (str | None): 指定した場合、このクロールの作業単位のみを処理する
+            max_units (int | None): 処理する作業単位の数の上限
+            wait (bool): True の場合、取得できる作業単位が無くてもクロールが終わるまで poll_interval ごとに待つ
+                         他のワーカーのリースが切れた作業単位を引き継ぐために使う、crawl_id の指定が必要
+            poll_interval (float): wait の場合に作業単位を探す間隔(秒)
+
+        Returns:
+            int: 結果を保存できた作業単位の数
+        """
+        if wait and crawl_id is None:
+            raise ValueError("crawl_id is required to wait.")
+        done_num = 0
+        processed_num = 0
+        while max_units is None or processed_num < max_units:
+            unit = self.queue.claim(self.worker_id, crawl_id)
+            if unit is None:
+                if not wait or self.queue.is_finished(crawl_id):
+                    break
+                time.sleep(poll_interval)
+                continue
+            processed_num += 1
+            if self.process(unit):
+                done_num += 1
+        logger.info(f"Worker {self.worker_id}: {done_num} of {processed_num} work units done.")
+        return done_num
+
+
+def merge_crawl(
+    queue: WorkQueue,
+    db: FavoriteWorldDB,
+    crawl_id: str,
+    dry_run: bool = False,
+    purge: bool = True,
+    trending_engine: TrendingEngine | None = None,
+) -> DBWriter:
+    """完了したクロールの結果を1つの DBWriter で DB に書き込む
+
+    Crawler.run と同じく、アカウントごとにまとめて反映し、全アカウントを書き込んだ後に1回だけ commit する
+    失敗した作業単位があるアカウントは、見つからなかったワールドを外したと誤認しないよう書き込まない
+
+    Args:
+        queue (WorkQueue): 結果を保持するキュー
+        db (FavoriteWorldDB): 書き込み先の DB
+        crawl_id (str): 書き込むクロール
+        dry_run (bool): True の場合 commit せずに rollback する
+        purge (bool): True の場合、すべてのアカウントを書き込めたらキューからクロールを削除する
+        trending_engine (TrendingEngine | None): 指定した場合、書き込めたアカウントの star, visit をクロールの
+                                                 登録日時の観測として反映し、state_path があれば保存する
+
+    Returns:
+        DBWriter: 書き込みを終えた DBWriter、アカウントごとの結果とエラーを持つ
+
+    Raises:
+        ValueError: クロールが登録されていない場合と、未完了の作業単位がある場合
+    """
+    account_name_list = queue.account_name_list(crawl_id)
+    if not account_name_list:
+        raise ValueError(f"Unknown crawl_id: {crawl_id}.")
+    if not queue.is_finished(crawl_id):
+        raise ValueError(f"Crawl is not finished: {crawl_id}.")
+    registered_at = queue.created_at(crawl_id)
+    writer = DBWriter(db, account_name_list, dry_run=dry_run, crawl_id=crawl_id)
+    writer.start()
+    for account_name in account_name_list:
+        failed_num = queue.count_status(crawl_id, account_name)["failed"]
+        if failed_num:
+            writer.error_dict[account_name] = RuntimeError(f"{failed_num} work units failed, account: {account_name}.")
+            writer.abort(account_name)
+            continue
+        fetched_num = 0
+        try:
+            for page in queue.iter_pages(crawl_id, account_name):
+                fetched_num += len(page)
+                writer.put(Fetcher.create_fetched_info_list(page, registered_at), account_name)
+            if not fetched_num:
+                raise ValueError("Fetching failed, null response.")
+        except Exception as e:
+            logger.exception(f"Merge failed, account: {account_name}.")
+            writer.error_dict[account_name] = e
+            writer.abort(account_name)
+            continue
+        writer.finish(account_name)
+    writer.join()
+    for account_name, result in writer.result_dict.items():
+        if account_name in writer.error_dict:
+            logger.info(f"Account {account_name}: failed.")
+        elif account_name not in writer.fetched_num_dict:
+            logger.info(f"Account {account_name}: fetched_info_list is empty.")
+        else:
+            duplicate_num = writer.duplicate_dict[account_name].duplicate_num
+            # upsert の結果は DB に無かったレコードが0、既にあったレコードが1で、変化が無く書き込まなかった分も含む
+            logger.info(
+                f"Account {account_name}: {duplicate_num} duplicates skipped, "
+                f"{result.count(0)} new and {result.count(1)} existing records upserted."
+            )
+    if trending_engine is not None and not dry_run:
+        trending_engine.update(writer.observed_metric_dict(), datetime.fromisoformat(registered_at))
+        if trending_engine.state_path is not None:
+            trending_engine.save()
+    if purge and not dry_run and not writer.error_dict:
+        queue.purge(crawl_id)
+    return writer
@@ -1,10 +1,27 @@
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from logging import INFO, getLogger
 from pathlib import Path
+from typing import TYPE_CHECKING
 
+import orjson
+
+from vrc_world_crawler.crawler.asset_downloader import AssetDownloader
+from vrc_world_crawler.crawler.db_writer import DBWriter
+from vrc_world_crawler.crawler.enricher import Enricher
 from vrc_world_crawler.crawler.fetcher import Fetcher
-from vrc_world_crawler.crawler.valueobject.fetched_info import FetchedInfo
+from vrc_world_crawler.crawler.valueobject.account import Account
+from vrc_world_crawler.db.analytics_mirror import AnalyticsMirror
 from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
-from vrc_world_crawler.db.model import FavoriteWorld
+from vrc_world_crawler.db.model import DEFAULT_ACCOUNT_NAME
+from vrc_world_crawler.db.trending_engine import TrendingEngine
+from vrc_world_crawler.db.valueobject.world_filter import WorldFilter
+from vrc_world_crawler.feed.change_feed import ChangeFeed
+from vrc_world_crawler.feed.sink import ChangeSink
+
+if TYPE_CHECKING:
+    import httpx
 
 logger = getLogger(__name__)
 logger.setLevel(INFO)
@@ -12,28 +29,258 @@ logger.setLevel(INFO)
 
 class Crawler:
     config_path: Path = Path("./config/config.json")
-    fetcher: Fetcher
+    account_list: list[Account]
+    fetcher_list: list[Fetcher]
     db: FavoriteWorldDB
+    concurrency: int
+    dry_run: bool
+    asset_downloader: AssetDownloader | None
+    enricher: Enricher | None
+    change_sink_dict: dict[str, ChangeSink]
+    archive_after: timedelta | None
+    analytics_mirror: AnalyticsMirror | None
+    trending_engine: TrendingEngine | None
+
+    def __init__(
+        self,
+        config_path: Path | None = None,
+        db_path: str = "vrc.db",
+        cache_path: Path | None = None,
+        is_debug: bool = False,
+        snapshot_path: Path | None = None,
+        concurrency: int | None = None,
+        page_size: int | None = None,
+        dry_run: bool = False,
+        persist_index: bool = False,
+        asset_downloader: AssetDownloader | None = None,
+        enrich: bool = False,
+        record_changes: bool = False,
+        change_sink_dict: dict[str, ChangeSink] | None = None,
+        archive_after: timedelta | None = None,
+        transport_factory: "Callable[[Account], httpx.BaseTransport] | None" = None,
+        analytics_mirror: AnalyticsMirror | None = None,
+        trending_engine: TrendingEngine | None = None,
+    ) -> None:
+        """Crawler を作成する
 
-    def __init__(self) -> None:
+        Args:
+            config_path (Path | None): 設定ファイルのパス、None の場合は既定のパス
+            db_path (str): DB ファイルのパス
+            cache_path (Path | None): キャッシュファイルの保存先ディレクトリ、None の場合は既定のディレクトリ
+            is_debug (bool): True の場合 API にアクセスせずキャッシュファイルを再生する
+                             設定ファイルが無い場合は既定のアカウントのキャッシュを再生する
+            snapshot_path (Path | None): is_debug 時に再生するキャッシュファイル、単一アカウントの場合のみ指定できる
+            concurrency (int | None): 同時に fetch するアカウント数の上限、None の場合は全アカウント
+            page_size (int | None): 1リクエストで取得する件数、None の場合は既定値
+            dry_run (bool): True の場合 fetch と書き込みは行うが commit せずに rollback する
+            persist_index (bool): True の場合 DB の WorldIndex をファイルに保存し、次回起動時に再利用する
+            asset_downloader (AssetDownloader | None): 指定した場合、run の後にお気に入りワールドの画像を取得する
+            enrich (bool): True の場合、run の後に変更のあったワールドの詳細情報を取得する
+                           API にアクセスしない is_debug 時は取得しない
+            record_changes (bool): True の場合、書き込んだ変更を ChangeEvent に記録する
+            change_sink_dict (dict[str, ChangeSink] | None): 利用者名から送り先を引く辞書
+                                                             指定した場合は変更を記録し、run の後に未送信の変更を送る
+            archive_after (timedelta | None): 指定した場合、run の後にお気に入りから外れてこの期間が経ったレコードを
+                                              アーカイブに移し、空いた領域を解放する
+            transport_factory (Callable[[Account], httpx.BaseTransport] | None): アカウントごとの Fetcher が使う
+                                                                                 HTTP トランスポートを作成する関数
+                                                                                 None の場合は既定のトランスポート
+            analytics_mirror (AnalyticsMirror | None): 指定した場合、run の後に commit した内容を反映する
+            trending_engine (TrendingEngine | None): 指定した場合、run の後に書き込めたアカウントの star, visit を
+                                                     反映し、state_path があれば保存する
+        """
         logger.info("Crawler init -> start")
-        self.fetcher = Fetcher(self.config_path, is_debug=False)
-        self.db = FavoriteWorldDB()
+        config_path = config_path or self.config_path
+        if is_debug and not config_path.exists():
+            self.account_list = [Account(DEFAULT_ACCOUNT_NAME, "", "", "")]
+        else:
+            self.account_list = Account.create_list(orjson.loads(config_path.read_bytes()))
+        if snapshot_path is not None and len(self.account_list) > 1:
+            raise ValueError("snapshot_path can be used only with a single account.")
+        self.fetcher_list = [
+            Fetcher(
+                account,
+                is_debug=is_debug,
+                cache_path=cache_path,
+                page_size=page_size,
+                snapshot_path=snapshot_path,
+                transport=None if transport_factory is None else transport_factory(account),
+            )
+            for account in self.account_list
+        ]
+        # 同じインスタンスで繰り返し run する場合は、DB が保持する読み込み済みの WorldIndex を使い回す
+        self.change_sink_dict = change_sink_dict or {}
+        self.db = FavoriteWorldDB(
+            db_path, persist_index=persist_index, record_changes=record_changes or bool(self.change_sink_dict)
+        )
+        self.concurrency = concurrency or len(self.fetcher_list)
+        self.dry_run = dry_run
+        self.asset_downloader = asset_downloader
+        self.archive_after = archive_after
+        self.analytics_mirror = analytics_mirror
+        self.trending_engine = trending_engine
+        # 詳細情報は最初のアカウントのクライアントとレートリミッタで取得する
+        self.enricher = Enricher(self.db, self.fetcher_list[0]) if enrich and not is_debug else None
         logger.info("Crawler init -> done")
 
-    def run(self) -> None:
-        logger.info("Crawler run -> start")
-        fetched_info_list: list[FetchedInfo] = self.fetcher.fetch()
+    def close(self) -> None:
+        """HTTP クライアントと DB のコネクションを閉じる"""
+        for fetcher in self.fetcher_list:
+            fetcher.close()
+        if self.asset_downloader is not None:
+            self.asset_downloader.close()
+        if self.enricher is not None:
+            self.enricher.close()
+        for sink in self.change_sink_dict.values():
+            sink.close()
+        self.db.dispose()
+
+    def _produce(self, fetcher: Fetcher, writer: DBWriter, registered_at: str) -> None:
+        """1アカウント分を fetch して DBWriter に渡す
+
+        fetch に失敗した場合はそのアカウントの書き込みのみを取り消す
+        """
+        account_name = fetcher.account.name
+        try:
+            for fetched_info_list in fetcher.iter_fetch(registered_at):
+                writer.put(fetched_info_list, account_name)
+        except Exception as e:
+            logger.exception(f"Fetch failed, account: {account_name}.")
+            writer.error_dict[account_name] = e
+            writer.abort(account_name)
+            return
+        writer.finish(account_name)
+
+    def _enrich(self) -> None:
+        """変更のあったワールドの詳細情報を取得する、取得の失敗はクロール自体の失敗とはしない"""
+        if self.enricher is None:
+            return
+        logger.info("Enrich -> start")
+        try:
+            self.enricher.enrich()
+        except Exception:
+            logger.exception("Enrich failed.")
+        logger.info("Enrich -> done")
+
+    def _dispatch_changes(self) -> None:
+        """記録した変更のうち、送り先ごとに未送信のものを送る
+
+        送信に失敗した変更は次回の run で再送する、送信の失敗はクロール自体の失敗とはしない
+        """
+        if not self.change_sink_dict:
+            return
+        logger.info("Change feed dispatch -> start")
+        change_feed = ChangeFeed(self.db)
+        for consumer, sink in self.change_sink_dict.items():
+            try:
+                change_feed.consume(consumer, sink)
+            except Exception:
+                logger.exception(f"Change feed dispatch failed: {consumer}.")
+        logger.info("Change feed dispatch -> done")
+
+    def _archive(self) -> None:
+        """お気に入りから外れて archive_after が経ったレコードをアーカイブに移し、空いた領域を解放する
+
+        アーカイブの失敗はクロール自体の失敗とはしない
+        """
+        if self.archive_after is None:
+            return
+        logger.info("Archive -> start")
+        try:
+            if self.db.archive_unfavorited(self.archive_after):
+                self.db.incremental_vacuum()
+        except Exception:
+            logger.exception("Archive failed.")
+        logger.info("Archive -> done")
+
+    def _refresh_analytics(self) -> None:
+        """commit した内容を AnalyticsMirror に反映する、反映の失敗はクロール自体の失敗とはしない"""
+        if self.analytics_mirror is None:
+            return
+        logger.info("Analytics refresh -> start")
+        try:
+            self.analytics_mirror.refresh(self.db)
+        except Exception:
+            logger.exception("Analytics refresh failed.")
+        logger.info("Analytics refresh -> done")
 
-        if not fetched_info_list:
-            logger.info("fetched_info_list is empty.")
+    def _update_trending(self, writer: DBWriter, observed_at: datetime) -> None:
+        """書き込めたアカウントの star, visit を TrendingEngine に反映する、反映の失敗はクロール自体の失敗とはしない"""
+        if self.trending_engine is None:
             return
+        logger.info("Trending update -> start")
+        try:
+            self.trending_engine.update(writer.observed_metric_dict(), observed_at)
+            if self.trending_engine.state_path is not None:
+                self.trending_engine.save()
+        except Exception:
+            logger.exception("Trending update failed.")
+        logger.info("Trending update -> done")
+
+    def _download_assets(self) -> None:
+        """お気に入りワールドの画像のうち、まだダウンロードしていないものをダウンロードする
+
+        画像の URL は画像が更新されると変わるため、新規と更新された画像のみがダウンロード対象となる
+        ダウンロードの失敗はクロール自体の失敗とはしない
+        """
+        if self.asset_downloader is None:
+            return
+        logger.info("Asset download -> start")
+        columns = ["image_url", "thmbnail_image_url"]
+        url_list = [url for row in self.db.iter_rows(WorldFilter(is_favorited=True), columns) for url in row[1:]]
+        try:
+            self.asset_downloader.download(url_list)
+        except Exception:
+            logger.exception("Asset download failed.")
+        logger.info("Asset download -> done")
+
+    def run(self) -> None:
+        logger.info("Crawler run -> start")
+        # 常駐時は前回の実行から索引を保持しているため、間に replay, merge, archive などで
+        # 別のプロセスが DB を変更していれば、読み込み済みの索引を捨てて読み込み直す
+        self.db.revalidate_index()
+        logger.info("Fetch and DB control -> start.")
+        # アカウントごとの fetch と DB 書き込みを並行させる
+        # fetch したページは DBWriter スレッドに渡され、全アカウント分を書き込んだ後に1回だけ commit される
+        # 各アカウントのリクエスト頻度は Fetcher が持つアカウント単位のレートリミッタで制限される
+        writer = DBWriter(
+            self.db,
+            [account.name for account in self.account_list],
+            dry_run=self.dry_run,
+        )
+        writer.start()
+        # 1回のクロールで取得したレコードの登録日時は、アカウントに依らずクロール開始時の日時に揃える
+        started_at = datetime.now()
+        registered_at = started_at.isoformat()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="Fetcher") as executor:
+            for fetcher in self.fetcher_list:
+                executor.submit(self._produce, fetcher, writer, registered_at)
+        writer.join()
+        logger.info("Fetch and DB control -> done.")
 
-        logger.info("DB control -> start.")
-        self.db.clear_favorited()
-        record_list = [FavoriteWorld.create(fetched_info.to_dict()) for fetched_info in fetched_info_list]
-        self.db.upsert(record_list)
-        logger.info("DB control -> done.")
+        for account_name, result in writer.result_dict.items():
+            if account_name in writer.error_dict:
+                logger.info(f"Account {account_name}: failed.")
+            elif account_name not in writer.fetched_num_dict:
+                logger.info(f"Account {account_name}: fetched_info_list is empty.")
+            else:
+                fetched_num = writer.fetched_num_dict[account_name]
+                deduplicator = writer.duplicate_dict[account_name]
+                # upsert の結果は DB に無かったレコードが0、既にあったレコードが1で、変化が無く書き込まなかった分も含む
+                logger.info(
+                    f"Account {account_name}: {fetched_num} records fetched, "
+                    f"{deduplicator.duplicate_num} duplicates skipped {deduplicator.duplicate_group_dict}, "
+                    f"{result.count(0)} new and {result.count(1)} existing records upserted."
+                )
+        if not self.dry_run:
+            self._dispatch_changes()
+            self._enrich()
+            self._download_assets()
+            self._archive()
+            self._refresh_analytics()
+            self._update_trending(writer, started_at)
+        if writer.error_dict:
+            raise next(iter(writer.error_dict.values()))
 
         logger.info("Crawler run -> done")
 
@@ -46,3 +293,4 @@ if __name__ == "__main__":
     logger = getLogger(__name__)
     crawler = Crawler()
     crawler.run()
+    crawler.close()
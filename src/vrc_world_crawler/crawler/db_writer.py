@@ -0,0 +1,222 @@
+import threading
+from datetime import datetime
+from logging import INFO, getLogger
+from queue import Queue
+
+from sqlalchemy.orm import Session, SessionTransaction
+
+from vrc_world_crawler.crawler.deduplicator import Deduplicator
+from vrc_world_crawler.crawler.valueobject.fetched_info import FetchedInfo
+from vrc_world_crawler.db.favorite_world_db import CRAWL_ID_KEY, FavoriteWorldDB
+from vrc_world_crawler.db.model import DEFAULT_ACCOUNT_NAME, FavoriteWorld
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# キューに流す制御用の番兵
+_DONE = object()
+_ABORT = object()
+
+
+class DBWriter(threading.Thread):
+    """fetch 結果をキュー経由で受け取り DB に書き込むスレッド
+
+    fetch(ネットワーク)と DB 書き込みを並行させるための消費者側
+    アカウントごとにキューを持ち、アカウントの並び順に1つずつ書き込む
+    後のアカウントの fetch は、キューが一杯になると前のアカウントの書き込みが終わるまで待たされる
+    アカウントごとのセーブポイントは1つのセッションの中で入れ子にできないため、キューを交互に読んで書き込むことはしない
+    各アカウントの書き込みはセーブポイントで区切り、受け取ったページごとに upsert して flush する
+    すべてのアカウントを処理し終えた時点で1回だけ commit する
+
+    あるアカウントで abort を受け取った場合や書き込み中に例外が発生した場合は
+    そのアカウントの更新のみを rollback し、他のアカウントの更新は commit する
+    失敗や中断の後も、すべてのキューを終了通知まで消費するため、put 側が待ち続けることはない
+    各アカウントの upsert からフラグを落とすまでの更新は、まとめて反映されるかまったく反映されないかのどちらかになる
+
+    書き込み中は専用のセッションを保持し続けるため、実行中に他のスレッドから同じ DB に書き込まないこと
+
+    書き込みは DB の WorldIndex との差分のみを反映する
+    フラグクリアは行わず、upsert は内容か is_favorited が変わったレコードのみを書き込み
+    最後に、お気に入り状態だったが今回のクロールで見つからなかったレコードのみフラグを落とす
+
+    dry_run の場合は最後に commit せず rollback する
+    DB が変更を記録する設定の場合、記録する ChangeEvent には crawl_id を付ける
+
+    同じワールドがクロール内に複数回現れた場合は、Deduplicator の優先順位で1件に絞ってから書き込む
+    書き込んだ公開ワールドの star, visit をアカウントごとに記録し、TrendingEngine に渡せるようにする
+    """
+
+    db: FavoriteWorldDB
+    queue_dict: dict[str, Queue]
+    result_dict: dict[str, list[int]]
+    error_dict: dict[str, Exception]
+    fetched_num_dict: dict[str, int]
+    duplicate_dict: dict[str, Deduplicator]
+    metric_dict: dict[str, dict[str, tuple[int, int]]]
+    dry_run: bool
+    crawl_id: str
+
+    def __init__(
+        self,
+        db: FavoriteWorldDB,
+        account_name_list: list[str] | None = None,
+        queue_size: int = 8,
+        dry_run: bool = False,
+        crawl_id: str | None = None,
+    ) -> None:
+        """DBWriter を作成する
+
+        Args:
+            db (FavoriteWorldDB): 書き込み先の DB
+            account_name_list (list[str] | None): 書き込むアカウント名のリスト、None の場合は既定のアカウントのみ
+            queue_size (int): アカウントごとにキューに溜められるページ数の上限
+                              上限に達すると put 側が待たされるため、メモリ使用量が一定に保たれる
+            dry_run (bool): True の場合 commit せずに rollback する
+            crawl_id (str | None): このクロールの識別子、None の場合は作成日時
+        """
+        super().__init__(name="DBWriter", daemon=True)
+        account_name_list = account_name_list or [DEFAULT_ACCOUNT_NAME]
+        self.db = db
+        self.queue_dict = {account_name: Queue(maxsize=queue_size) for account_name in account_name_list}
+        self.result_dict = {account_name: [] for account_name in account_name_list}
+        self.error_dict = {}
+        # 1ページ以上受け取り、書き込みを終えたアカウントの受け取ったレコード数
+        self.fetched_num_dict = {}
+        # 書き込みを終えたアカウントの重複の統計
+        self.duplicate_dict = {}
+        # アカウントごとに、world_id から受け取った公開ワールドの (star, visit) を引く辞書
+        self.metric_dict = {account_name: {} for account_name in account_name_list}
+        # 終了通知(finish または abort)を受け取ったアカウント
+        self._finished_set: set[str] = set()
+        self.dry_run = dry_run
+        self.crawl_id = crawl_id or datetime.now().isoformat(timespec="seconds")
+
+    def put(self, fetched_info_list: list[FetchedInfo], account_name: str = DEFAULT_ACCOUNT_NAME) -> None:
+        """書き込むページを渡す、キューが一杯の場合は空きが出るまで待つ"""
+        self.queue_dict[account_name].put(fetched_info_list)
+
+    def finish(self, account_name: str = DEFAULT_ACCOUNT_NAME) -> None:
+        """アカウントのすべてのページを渡し終えたことを通知する、受け取ったページを commit 対象にする"""
+        self.queue_dict[account_name].put(_DONE)
+
+    def abort(self, account_name: str = DEFAULT_ACCOUNT_NAME) -> None:
+        """アカウントの fetch が失敗したことを通知する、受け取ったページはすべて rollback する"""
+        self.queue_dict[account_name].put(_ABORT)
+
+    def run(self) -> None:
+        session = self.db.Session()
+        session.info[CRAWL_ID_KEY] = self.crawl_id
+        try:
+            for account_name in self.queue_dict:
+                self._write_account(session, account_name)
+            if self.dry_run:
+                logger.info("Dry run, rollback.")
+                session.rollback()
+            else:
+                session.commit()
+        except Exception as e:
+            logger.exception("DBWriter commit failed, rollback.")
+            session.rollback()
+            for account_name in self.queue_dict.keys():
+                self.error_dict.setdefault(account_name, e)
+        finally:
+            # 途中で中断した場合も、残りのアカウントのキューを終了通知まで消費する
+            for account_name in self.queue_dict:
+                self._drain(account_name)
+            session.close()
+
+    def _write_account(self, session: Session, account_name: str) -> None:
+        """1アカウント分のページをキューから受け取り書き込む
+
+        Args:
+            session (Session): 書き込みに使うセッション
+            account_name (str): アカウント名
+        """
+        savepoint = session.begin_nested()
+        result = self.result_dict[account_name]
+        # 今回のクロールで見つかった favorite_id
+        # 公開状態が変わると world_id で引けなくなるため、favorite_id 単位で存在を判定する
+        seen_favorite_id_set: set[str] = set()
+        deduplicator = Deduplicator()
+        try:
+            fetched_num = 0
+            while True:
+                item = self._get(account_name)
+                if item is _DONE:
+                    if fetched_num:
+                        self._unfavorite_removed(session, account_name, seen_favorite_id_set)
+                    savepoint.commit()
+                    if fetched_num:
+                        self.fetched_num_dict[account_name] = fetched_num
+                        self.duplicate_dict[account_name] = deduplicator
+                    break
+                if item is _ABORT:
+                    self._rollback(session, savepoint, account_name)
+                    break
+                if not item:
+                    continue
+
+                fetched_num += len(item)
+                # 重複として取り除くレコードの favorite_id も、お気に入りに残っているものとして扱う
+                seen_favorite_id_set.update(fetched_info.favorite_id for fetched_info in item)
+                item = deduplicator.filter(item)
+                if not item:
+                    continue
+                self.metric_dict[account_name].update(
+                    (fetched_info.world_id, (fetched_info.star, fetched_info.visit))
+                    for fetched_info in item
+                    if fetched_info.release_status == "public"
+                )
+                record_list = [
+                    FavoriteWorld.create(fetched_info.to_dict() | {"account": account_name}) for fetched_info in item
+                ]
+                result.extend(self.db.upsert(record_list, session))
+        except Exception as e:
+            logger.exception(f"DBWriter failed, rollback account: {account_name}.")
+            self.error_dict[account_name] = e
+            self._rollback(session, savepoint, account_name)
+        finally:
+            # rollback に失敗した場合も、次のアカウントに進む前にこのアカウントのキューを消費する
+            self._drain(account_name)
+
+    def _rollback(self, session: Session, savepoint: SessionTransaction, account_name: str) -> None:
+        """アカウントの書き込みを取り消し、索引に保留中の変更も破棄する"""
+        savepoint.rollback()
+        self.db.get_index(session).discard(session, account_name)
+        self.result_dict[account_name].clear()
+        self.metric_dict[account_name].clear()
+
+    def observed_metric_dict(self) -> dict[str, tuple[int, int]]:
+        """書き込めたアカウントで受け取った公開ワールドの star, visit を返す
+
+        Returns:
+            dict[str, tuple[int, int]]: world_id から (star, visit) を引く辞書
+        """
+        result = {}
+        for account_name, metric_dict in self.metric_dict.items():
+            if account_name not in self.error_dict:
+                result.update(metric_dict)
+        return result
+
+    def _unfavorite_removed(self, session: Session, account_name: str, seen_favorite_id_set: set[str]) -> None:
+        """お気に入り状態だったが今回のクロールで見つからなかったレコードの is_favorited フラグを落とす"""
+        removed_favorite_id_list = self.db.get_index(session).removed_favorite_id_list(
+            session, account_name, seen_favorite_id_set
+        )
+        if removed_favorite_id_list:
+            self.db.unfavorite(removed_favorite_id_list, session, account_name)
+
+    def _get(self, account_name: str) -> object:
+        """アカウントのキューから1件受け取る、終了通知の場合は受け取ったことを記録する"""
+        item = self.queue_dict[account_name].get()
+        if item is _DONE or item is _ABORT:
+            self._finished_set.add(account_name)
+        return item
+
+    def _drain(self, account_name: str) -> None:
+        """エラー後も終了通知が来るまでキューを消費し、put 側が待ち続けないようにする
+
+        終了通知を受け取り済みのアカウントでは何もしない
+        """
+        while account_name not in self._finished_set:
+            self._get(account_name)
@@ -0,0 +1,58 @@
+from vrc_world_crawler.crawler.valueobject.fetched_info import FetchedInfo
+
+
+class Deduplicator:
+    """1回のクロールの1アカウント分の FetchedInfo から、同じワールドの2件目以降を取り除く
+
+    同じワールドは複数のお気に入りグループに登録でき、offset によるページ送りの途中でお気に入りが増減すると
+    同じレコードが続くページにも現れる
+    ページを受け取るたびに呼び出し、それまでに受け取ったページとの重複もハッシュで O(1) に判定する
+    取り除いた分は upsert で検索も書き込みもされず、ワールドごとの書き込みは1回になる
+
+    優先順位は次のとおり
+    - 公開ワールドは world_id、非公開ワールド(world_id を持たない)は favorite_id で同じものとみなす
+    - 先に受け取ったものを残す、Fetcher は tag_list の順に取得するため tag_list で前にあるグループのものが残る
+      取得日時はクロール内で揃えてあり、後から受け取ったものを優先する理由は無い
+
+    FavoriteWorldDB.upsert も1回の呼び出しの中で同じ優先順位で重複を読み飛ばす
+    """
+
+    record_num: int
+    duplicate_num: int
+    duplicate_group_dict: dict[str, int]
+
+    def __init__(self) -> None:
+        self._seen_key_set: set[str] = set()
+        # 受け取ったレコード数と、取り除いたレコード数
+        self.record_num = 0
+        self.duplicate_num = 0
+        # 取り除いたレコードのお気に入りグループから件数を引く辞書
+        self.duplicate_group_dict = {}
+
+    @staticmethod
+    def _key(fetched_info: FetchedInfo) -> str:
+        if fetched_info.release_status == "public":
+            return f"world:{fetched_info.world_id}"
+        return f"favorite:{fetched_info.favorite_id}"
+
+    def filter(self, fetched_info_list: list[FetchedInfo]) -> list[FetchedInfo]:
+        """受け取ったページから、これまでに受け取ったワールドを取り除く
+
+        Args:
+            fetched_info_list (list[FetchedInfo]): 1ページ分の FetchedInfo リスト
+
+        Returns:
+            list[FetchedInfo]: 初めて受け取ったワールドのみのリスト、順序は保つ
+        """
+        result = []
+        for fetched_info in fetched_info_list:
+            key = self._key(fetched_info)
+            if key in self._seen_key_set:
+                group = fetched_info.favorite_group
+                self.duplicate_group_dict[group] = self.duplicate_group_dict.get(group, 0) + 1
+                continue
+            self._seen_key_set.add(key)
+            result.append(fetched_info)
+        self.record_num += len(fetched_info_list)
+        self.duplicate_num += len(fetched_info_list) - len(result)
+        return result
@@ -0,0 +1,159 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from logging import INFO, getLogger
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.dialects.sqlite import insert
+
+from vrc_world_crawler.crawler.fetcher import Fetcher
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.db.model import FavoriteWorld, WorldDetail
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+class Enricher:
+    """お気に入りワールドの詳細情報をワールド詳細 API から取得し WorldDetail に保存する
+
+    前回取得したときから version か updated_at が変わったワールドのみを取得するため
+    取得コストはお気に入りの件数ではなく変更の件数に比例する
+
+    同じワールドの取得が実行中の場合は新たにリクエストせず、実行中の取得結果を共有する
+    リクエストは Fetcher のクライアントとレートリミッタを使い、最大 concurrency 件まで並行して行う
+    """
+
+    db: FavoriteWorldDB
+    fetcher: Fetcher
+    concurrency: int
+    batch_size: int = 100
+
+    def __init__(self, db: FavoriteWorldDB, fetcher: Fetcher, concurrency: int = 4) -> None:
+        """Enricher を作成する
+
+        Args:
+            db (FavoriteWorldDB): 対象の DB
+            fetcher (Fetcher): リクエストに使う Fetcher
+            concurrency (int): 同時にリクエストする件数の上限
+        """
+        if concurrency <= 0:
+            raise ValueError("concurrency must be positive.")
+        self.db = db
+        self.fetcher = fetcher
+        self.concurrency = concurrency
+        self._executor: ThreadPoolExecutor | None = None
+        self._in_flight_dict: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        """実行中の取得の完了を待ってスレッドを終了する"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def select_target_list(self) -> list[tuple[str, int, str]]:
+        """詳細情報を取得するワールドを返す
+
+        お気に入り状態の公開ワールドのうち、WorldDetail が無いか
+        WorldDetail の version, updated_at が FavoriteWorld と異なるものを対象とする
+        複数アカウントで同じワールドがある場合は最新の version, updated_at を使う
+
+        Returns:
+            list[tuple[str, int, str]]: (world_id, version, updated_at) のリスト
+        """
+        latest = (
+            select(
+                FavoriteWorld.world_id,
+                func.max(FavoriteWorld.version).label("version"),
+                func.max(FavoriteWorld.updated_at).label("updated_at"),
+            )
+            .where(FavoriteWorld.is_favorited, FavoriteWorld.release_status == "public")
+            .group_by(FavoriteWorld.world_id)
+            .subquery()
+        )
+        statement = (
+            select(latest.c.world_id, latest.c.version, latest.c.updated_at)
+            .outerjoin(WorldDetail, WorldDetail.world_id == latest.c.world_id)
+            .where(
+                or_(
+                    WorldDetail.world_id.is_(None),
+                    WorldDetail.version != latest.c.version,
+                    WorldDetail.updated_at != latest.c.updated_at,
+                )
+            )
+            .order_by(latest.c.world_id)
+        )
+        with self.db.session_scope() as session:
+            return [tuple(row) for row in session.execute(statement)]
+
+    def fetch_detail(self, world_id: str) -> Future:
+        """ワールド詳細 API の取得を開始する
+
+        同じ world_id の取得が実行中の場合は、その Future をそのまま返す
+
+        Args:
+            world_id (str): 取得するワールドの world_id
+
+        Returns:
+            Future: 結果がワールド詳細 API のレスポンスとなる Future
+        """
+        with self._lock:
+            future = self._in_flight_dict.get(world_id)
+            if future is not None:
+                return future
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="Enricher")
+            future = self._executor.submit(self.fetcher.fetch_world, world_id)
+            self._in_flight_dict[world_id] = future
+        future.add_done_callback(lambda _: self._done(world_id, future))
+        return future
+
+    def _done(self, world_id: str, future: Future) -> None:
+        with self._lock:
+            if self._in_flight_dict.get(world_id) is future:
+                del self._in_flight_dict[world_id]
+
+    def _save(self, detail_list: list[WorldDetail]) -> None:
+        """WorldDetail をまとめて追加・更新する"""
+        if not detail_list:
+            return
+        value_list = [detail.to_dict() for detail in detail_list]
+        statement = insert(WorldDetail).values(value_list)
+        update_dict = {
+            column.name: statement.excluded[column.name]
+            for column in WorldDetail.__table__.columns
+            if not column.primary_key
+        }
+        with self.db.session_scope() as session:
+            session.execute(statement.on_conflict_do_update(index_elements=["world_id"], set_=update_dict))
+
+    def enrich(self) -> dict[str, int]:
+        """変更のあったワールドの詳細情報を取得して保存する
+
+        1件の失敗は全体を止めず、ログに記録して件数に数える、失敗したワールドは次回も対象となる
+        取得結果は batch_size 件ごとに保存する
+
+        Returns:
+            dict[str, int]: 結果ごとの件数 {"target": int, "fetched": int, "failed": int}
+        """
+        target_list = self.select_target_list()
+        result = {"target": len(target_list), "fetched": 0, "failed": 0}
+        future_list = [self.fetch_detail(world_id) for world_id, _, _ in target_list]
+        detail_list = []
+        for (world_id, version, updated_at), future in zip(target_list, future_list):
+            try:
+                detail_dict = future.result()
+                detail_list.append(WorldDetail.create(detail_dict, version, updated_at, datetime.now().isoformat()))
+            except Exception as e:
+                logger.warning(f"World detail fetch failed: {world_id}, {e!r}")
+                result["failed"] += 1
+                continue
+            result["fetched"] += 1
+            if len(detail_list) >= self.batch_size:
+                self._save(detail_list)
+                detail_list = []
+        self._save(detail_list)
+        summary = ", ".join(f"{count} {key}" for key, count in result.items())
+        logger.info(f"World detail enrichment: {summary}.")
+        return result
@@ -1,98 +1,239 @@
 import pprint
+from collections.abc import Iterator
 from datetime import datetime
 from logging import INFO, getLogger
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import httpx
 import orjson
 
+from vrc_world_crawler.crawler.rate_limiter import RateLimiter
+from vrc_world_crawler.crawler.snapshot_reader import SnapshotReader
+from vrc_world_crawler.crawler.valueobject.account import Account
 from vrc_world_crawler.crawler.valueobject.fetched_info import FetchedInfo
+from vrc_world_crawler.db.model import DEFAULT_ACCOUNT_NAME
+
+if TYPE_CHECKING:
+    import httpx
 
 logger = getLogger(__name__)
 logger.setLevel(INFO)
 
 
 class Fetcher:
+    account: Account
     is_debug: bool
     cache_path = Path("./cache/")
-    cookie_dict: dict
-
-    def __init__(self, config_path: Path, is_debug: bool = False) -> None:
+    rate_limiter: RateLimiter
+    client: "httpx.Client | None"
+    transport: "httpx.BaseTransport | None"
+    snapshot_path: Path | None
+    page_size: int = 50
+    max_offset: int = 300
+    tag_list: list[str] = [
+        "worlds1",
+        "worlds2",
+        "worlds3",
+        "worlds4",
+        "vrcPlusWorlds1",
+        "vrcPlusWorlds2",
+        "vrcPlusWorlds3",
+        "vrcPlusWorlds4",
+    ]
+
+    def __init__(
+        self,
+        account: Account,
+        is_debug: bool = False,
+        rate_limiter: RateLimiter | None = None,
+        cache_path: Path | None = None,
+        page_size: int | None = None,
+        snapshot_path: Path | None = None,
+        transport: "httpx.BaseTransport | None" = None,
+    ) -> None:
+        """Fetcher を作成する
+
+        Args:
+            account (Account): fetch に使うアカウント
+            is_debug (bool): True の場合 API にアクセスせずキャッシュファイルを読み込む
+            rate_limiter (RateLimiter | None): リクエスト前に待つレートリミッタ
+                                               None の場合は account.rate_limit から作成する
+            cache_path (Path | None): キャッシュファイルの保存先ディレクトリ、None の場合は既定のディレクトリ
+            page_size (int | None): 1リクエストで取得する件数、None の場合は既定値
+            snapshot_path (Path | None): is_debug 時に読み込むキャッシュファイル
+                                         None の場合はキャッシュディレクトリ内の最新のファイル
+            transport (httpx.BaseTransport | None): HTTP クライアントが使うトランスポート
+                                                   None の場合はリトライ付きの HTTPTransport
+                                                   CassetteTransport を渡すと通信を記録・再生できる
+        """
         logger.info("Fetcher init -> start")
-        self.config_dict = orjson.loads(config_path.read_bytes())
+        if page_size is not None and page_size <= 0:
+            raise ValueError("page_size must be positive.")
+        self.account = account
         self.is_debug = is_debug
+        self.rate_limiter = rate_limiter or RateLimiter(account.rate_limit)
+        self.client = None
+        self.transport = transport
+        self.snapshot_path = snapshot_path
+        if cache_path is not None:
+            self.cache_path = cache_path
+        if page_size is not None:
+            self.page_size = page_size
+        if account.name != DEFAULT_ACCOUNT_NAME:
+            # キャッシュファイルはアカウントごとに分けて保存する
+            self.cache_path = self.cache_path / account.name
         self.cache_path.mkdir(parents=True, exist_ok=True)
         logger.info("Fetcher init -> done")
 
-    def fetch(self) -> list[FetchedInfo]:
-        logger.info("Fetcher fetch -> start")
-        logger.info("Fetching -> start")
-        fetched_info_list = []
-        fetched_dict_list = []
-        if self.is_debug:
-            last_cache_file: Path = max(self.cache_path.glob("*"), key=lambda path: path.stat().st_mtime)
-            fetched_dict_list = orjson.loads(last_cache_file.read_bytes())
-        else:
-            response = None
-            response_list = []
+    def _get_client(self) -> "httpx.Client":
+        """HTTP クライアントを取得する
+
+        クライアントは初回に作成して使い回すため、繰り返し fetch する場合も
+        コネクションプールと TLS セッションが維持される
+        httpx の import もここで行い、キャッシュのみを読むデバッグ時は読み込まない
+        """
+        if self.client is None:
+            import httpx
+
+            payload = {
+                "apiKey": self.account.api_key,
+                "auth": self.account.auth,
+                "twoFactorAuth": self.account.two_factor_auth,
+            }
             headers = {
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:125.0) Gecko/20100101 Firefox/125.0",
                 "Content-Type": "application/json",
             }
-            payload = {
-                "apiKey": self.config_dict["vrc"]["apiKey"],
-                "auth": self.config_dict["vrc"]["auth"],
-                "twoFactorAuth": self.config_dict["vrc"]["twoFactorAuth"],
-            }
-            cookies = httpx.Cookies(payload)
-            transport = httpx.HTTPTransport(retries=3)
-            base_url = "https://vrchat.com/api/1/worlds/favorites?n=50&offset={}&tag=worlds{}"
-            with httpx.Client(follow_redirects=True, transport=transport) as client:
-                for world_index in [1, 2, 3, 4]:
-                    for offset_count in [0, 50, 100, 150, 200, 250, 300]:
-                        url = base_url.format(offset_count, world_index)
-
-                        response = client.get(url, headers=headers, cookies=cookies)
-                        response.raise_for_status()
-                        if not response.text:
-                            break
-                        response_dict = orjson.loads(response.text)
-                        if not response_dict:
-                            break
-                        response_list.append(response_dict)
-
-            base_url = "https://vrchat.com/api/1/worlds/favorites?n=50&offset={}&tag=vrcPlusWorlds{}"
-            with httpx.Client(follow_redirects=True, transport=transport) as client:
-                for world_index in [1, 2, 3, 4]:
-                    for offset_count in [0, 50, 100, 150, 200, 250, 300]:
-                        url = base_url.format(offset_count, world_index)
-
-                        response = client.get(url, headers=headers, cookies=cookies)
-                        response.raise_for_status()
-                        if not response.text:
-                            break
-                        response_dict = orjson.loads(response.text)
-                        if not response_dict:
-                            break
-                        response_list.append(response_dict)
-
-            if not response_list:
+            transport = self.transport or httpx.HTTPTransport(retries=3)
+            self.client = httpx.Client(
+                follow_redirects=True, transport=transport, headers=headers, cookies=httpx.Cookies(payload)
+            )
+        return self.client
+
+    def close(self) -> None:
+        """HTTP クライアントを閉じる"""
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    def iter_tag_pages(
+        self, tag: str, offset_start: int = 0, offset_end: int | None = None, page_size: int | None = None
+    ) -> Iterator[list[dict]]:
+        """1つのタグのお気に入りワールドの API を、offset の範囲を指定してページ単位で取得する
+
+        空のページを受け取った時点でタグの最後とみなして終了する
+
+        Args:
+            tag (str): お気に入りのタグ
+            offset_start (int): 最初のページの offset
+            offset_end (int | None): 最後のページの offset の上限、None の場合は max_offset
+            page_size (int | None): 1リクエストで取得する件数、None の場合は self.page_size
+
+        Yields:
+            list[dict]: 1ページ分のレスポンス(ワールド辞書のリスト)
+        """
+        client = self._get_client()
+        base_url = "https://vrchat.com/api/1/worlds/favorites?n={}&offset={}&tag={}"
+        offset_end = self.max_offset if offset_end is None else offset_end
+        page_size = page_size or self.page_size
+        for offset_count in range(offset_start, offset_end + 1, page_size):
+            url = base_url.format(page_size, offset_count, tag)
+
+            self.rate_limiter.acquire()
+            response = client.get(url)
+            response.raise_for_status()
+            if not response.text:
+                break
+            response_dict = orjson.loads(response.text)
+            if not response_dict:
+                break
+            yield response_dict
+
+    def _iter_response(self) -> Iterator[list[dict]]:
+        """お気に入りワールドの API を全タグについてページ単位で取得する
+
+        Yields:
+            list[dict]: 1ページ分のレスポンス(ワールド辞書のリスト)
+        """
+        for tag in self.tag_list:
+            yield from self.iter_tag_pages(tag)
+
+    def fetch_world(self, world_id: str) -> dict:
+        """ワールド詳細 API を取得する
+
+        お気に入り一覧の取得と同じクライアントとレートリミッタを使う
+        複数スレッドから同時に呼び出してよい
+
+        Args:
+            world_id (str): 取得するワールドの world_id
+
+        Returns:
+            dict: ワールド詳細 API のレスポンス
+        """
+        client = self._get_client()
+        self.rate_limiter.acquire()
+        response = client.get(f"https://vrchat.com/api/1/worlds/{world_id}")
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
+    @staticmethod
+    def create_fetched_info_list(fetched_dict_list: list[dict], registered_at: str) -> list[FetchedInfo]:
+        """1ページ分のレスポンスを FetchedInfo に変換する、変換できないレコードは読み飛ばす"""
+        fetched_info_list = []
+        for fetched_dict in fetched_dict_list:
+            try:
+                fetched_info_list.append(FetchedInfo.create(fetched_dict, registered_at))
+            except Exception:
+                pass
+        return fetched_info_list
+
+    def iter_fetch(self, registered_at: str | None = None) -> Iterator[list[FetchedInfo]]:
+        """fetch 結果をページ単位で逐次返す
+
+        1ページ取得するごとに FetchedInfo に変換して返すため
+        呼び出し側は残りのページの取得を待たずに後続処理を開始できる
+        全ページ取得後、取得結果をキャッシュファイルに保存する
+
+        Args:
+            registered_at (str | None): 取得したレコードの登録日時、None の場合は取得開始時の日時
+
+        Yields:
+            list[FetchedInfo]: 1ページ分の FetchedInfo リスト
+
+        Raises:
+            ValueError: 1ページも取得できなかった場合
+        """
+        logger.info("Fetching -> start")
+        if registered_at is None:
+            registered_at = datetime.now().isoformat()
+        if self.is_debug:
+            last_cache_file = self.snapshot_path
+            if last_cache_file is None:
+                cache_file_list = [path for path in self.cache_path.glob("*") if path.is_file()]
+                last_cache_file = max(cache_file_list, key=lambda path: path.stat().st_mtime)
+            logger.info(f"Replay cache file: {last_cache_file}")
+            # ファイル全体を読み込まず、mmap したファイルから1ページずつ変換する
+            for fetched_dict_list in SnapshotReader(last_cache_file).iter_pages(self.page_size):
+                yield self.create_fetched_info_list(fetched_dict_list, registered_at)
+        else:
+            fetched_dict_list = []
+            for response_dict_list in self._iter_response():
+                fetched_dict_list.extend(response_dict_list)  # flatten
+                yield self.create_fetched_info_list(response_dict_list, registered_at)
+
+            if not fetched_dict_list:
                 logger.info("Fetching -> failed")
                 raise ValueError("Fetching failed, null response.")
 
-            for response_dict_list in response_list:
-                fetched_dict_list.extend(response_dict_list)  # flatten
             cache_filename = "favorites_world_" + datetime.now().strftime("%Y%m%d%H%M%S") + ".json"
             (self.cache_path / cache_filename).write_bytes(orjson.dumps(fetched_dict_list, option=orjson.OPT_INDENT_2))
         logger.info("Fetching -> done")
 
-        logger.info("Create FetchedInfo -> start")
-        for fetched_dict in fetched_dict_list:
-            try:
-                fetched_info_list.append(FetchedInfo.create(fetched_dict))
-            except Exception:
-                pass
-        logger.info("Create FetchedInfo -> done")
+    def fetch(self) -> list[FetchedInfo]:
+        logger.info("Fetcher fetch -> start")
+        fetched_info_list = []
+        for page in self.iter_fetch():
+            fetched_info_list.extend(page)
         logger.info("Fetcher fetch -> done")
         return fetched_info_list
 
@@ -104,6 +245,8 @@ if __name__ == "__main__":
     config_path: Path = Path("./config/config.json")
     cache_path = Path("./cache/")
 
-    fetcher = Fetcher(config_path, is_debug=False)
+    account = Account.create_list(orjson.loads(config_path.read_bytes()))[0]
+    fetcher = Fetcher(account, is_debug=False)
     response = fetcher.fetch()
+    fetcher.close()
     pprint.pprint(response)
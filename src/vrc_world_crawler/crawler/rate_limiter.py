@@ -0,0 +1,50 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """トークンバケット方式のレートリミッタ
+
+    1秒あたり rate 個のトークンが補充され、バケットには最大 burst 個まで溜まる
+    acquire はトークンを1個消費し、トークンが無い場合は補充されるまで待つ
+    複数スレッドから同時に呼び出してよい
+    """
+
+    rate: float
+    burst: int
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        """RateLimiter を作成する
+
+        Args:
+            rate (float): 1秒あたりのリクエスト数の上限、0 以下の場合は制限しない
+            burst (int): 連続して待たずに送信できるリクエスト数
+        """
+        if burst < 1:
+            raise ValueError("burst must be positive.")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """トークンを1個消費する、必要なら補充されるまで待つ
+
+        Returns:
+            float: 待機した秒数
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            # トークンを前借りした分だけ待つ
+            # ロック内で残量を確定させるため、同時に呼ばれても待機時間は順に積み上がる
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
@@ -0,0 +1,70 @@
+import os
+import sys
+from pathlib import Path
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+
+class RunLock:
+    """ロックファイルによるプロセス間の排他
+
+    OS のファイルロック(POSIX では flock、Windows では msvcrt.locking)を取得する
+    ロックはプロセスが異常終了しても OS が解放するため、ロックファイルが残っていても次の取得を妨げない
+    同じプロセス内でも、別のインスタンスからの取得は排他される
+    ロックファイルには取得したプロセスの ID を書き込む
+    """
+
+    path: Path
+
+    def __init__(self, path: Path) -> None:
+        """RunLock を作成する、ロックは acquire するまで取得しない
+
+        Args:
+            path (Path): ロックファイルのパス、無ければ作成する
+        """
+        self.path = path
+        self._fd: int | None = None
+
+    @property
+    def is_locked(self) -> bool:
+        """このインスタンスがロックを保持しているかを返す"""
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        """待たずにロックの取得を試みる
+
+        Returns:
+            bool: 取得できた場合 True、他が保持している場合とこのインスタンスが保持済みの場合 False
+        """
+        if self._fd is not None:
+            return False
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if sys.platform == "win32":
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        """ロックを解放する、保持していない場合は何もしない"""
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            if sys.platform == "win32":
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
@@ -0,0 +1,112 @@
+import random
+import signal
+import threading
+import time
+from collections.abc import Callable
+from logging import INFO, getLogger
+
+from vrc_world_crawler.crawler.run_lock import RunLock
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+class Scheduler:
+    """ジョブを一定間隔で繰り返し実行するスケジューラ
+
+    実行間隔は前回の開始時刻から interval 秒に 0 から jitter 秒の揺らぎを加えたものとする
+    ジョブが実行間隔より長くかかった場合、過ぎてしまった回は実行せずに次の回から再開する
+    ジョブは1つのスレッドで順に実行するため、同じスケジューラの中で重なることは無い
+    run_lock を指定した場合は回ごとにロックを取得し、同じロックファイルを使う他のプロセス
+    (別のデーモンや手動の crawl)が実行中の回は実行しない
+    ジョブで例外が発生してもログに記録してスケジュールを継続する
+    """
+
+    job: Callable[[], None]
+    interval: float
+    jitter: float
+    run_count: int
+    run_lock: RunLock | None
+
+    def __init__(
+        self, job: Callable[[], None], interval: float, jitter: float = 0.0, run_lock: RunLock | None = None
+    ) -> None:
+        """Scheduler を作成する
+
+        Args:
+            job (Callable[[], None]): 実行するジョブ
+            interval (float): 実行間隔(秒)
+            jitter (float): 実行間隔に加える揺らぎの最大値(秒)
+            run_lock (RunLock | None): 実行中に保持するプロセス間のロック、None の場合は排他しない
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive.")
+        if jitter < 0:
+            raise ValueError("jitter must not be negative.")
+        self.job = job
+        self.interval = interval
+        self.jitter = jitter
+        self.run_count = 0
+        self.run_lock = run_lock
+        self._stop_event = threading.Event()
+
+    def _next_delay(self, started_at: float) -> float:
+        """次の実行までの待機秒数を返す"""
+        period = self.interval + random.uniform(0, self.jitter)
+        elapsed = time.monotonic() - started_at
+        if elapsed > period:
+            skipped = int(elapsed // period)
+            logger.info(f"Job took {elapsed:.1f}s, skip {skipped} scheduled run(s).")
+            return period - elapsed % period
+        return period - elapsed
+
+    def run_once(self) -> bool:
+        """ジョブを1回実行する
+
+        Returns:
+            bool: 実行した場合 True、他のプロセスがロックを保持しており実行しなかった場合 False
+        """
+        if self.run_lock is not None and not self.run_lock.acquire():
+            logger.info(f"Another run holds {self.run_lock.path}, skip.")
+            return False
+        try:
+            self.job()
+        except Exception:
+            logger.exception("Job failed.")
+        finally:
+            self.run_count += 1
+            if self.run_lock is not None:
+                self.run_lock.release()
+        return True
+
+    def run_forever(self, max_run_count: int | None = None) -> None:
+        """stop が呼ばれるまでジョブを繰り返し実行する
+
+        Args:
+            max_run_count (int | None): 実行回数の上限、None の場合は上限なし
+        """
+        logger.info(f"Scheduler start, interval: {self.interval}s, jitter: {self.jitter}s.")
+        while not self._stop_event.is_set():
+            started_at = time.monotonic()
+            self.run_once()
+            if max_run_count is not None and self.run_count >= max_run_count:
+                break
+            self._stop_event.wait(self._next_delay(started_at))
+        logger.info("Scheduler stopped.")
+
+    def stop(self) -> None:
+        """スケジュールを停止する、実行中のジョブは最後まで実行される"""
+        self._stop_event.set()
+
+    def install_signal_handlers(self) -> None:
+        """SIGINT/SIGTERM を受け取ったときに stop するようにする
+
+        メインスレッドからのみ呼び出せる
+        """
+
+        def handler(signum, frame) -> None:
+            logger.info(f"Signal {signum} received, stop after current job.")
+            self.stop()
+
+        signal.signal(signal.SIGINT, handler)
+        signal.signal(signal.SIGTERM, handler)
@@ -0,0 +1,162 @@
+import mmap
+import re
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import orjson
+
+# 次の括弧までを1回のマッチで読み飛ばし、括弧のみを返す、文字列リテラル中の括弧は数えない
+_BRACKET_PATTERN = re.compile(rb'[^"\[\]{}]*(?:"(?:[^"\\]|\\.)*"[^"\[\]{}]*)*([\[\]{}])', re.DOTALL)
+
+# orjson.OPT_INDENT_2 で書き出したファイルの、トップレベル要素の区切り
+# JSON の文字列は改行をエスケープするため、行頭が2スペース + 括弧となるのはトップレベル要素の先頭と末尾のみ
+_INDENTED_FIRST = b"[\n  {"
+_INDENTED_NEXT = b",\n  {"
+_INDENTED_END = b"\n  }"
+
+
+class SnapshotReader:
+    """キャッシュファイル(fetch 結果の JSON 配列)を mmap で開き、1レコードずつ遅延して読み込む
+
+    ファイル全体を bytes や辞書のツリーとして読み込まず、レコードごとに memoryview のスライスから辞書に変換するため
+    ファイルの大きさに依らずメモリ使用量はレコード1件分で済む
+    ファイルはイテレータが動いている間だけ開き、最後まで消費するか close すると閉じる
+
+    fetch 結果の保存形式(orjson.OPT_INDENT_2)はレコードの区切りを mmap.find で探し
+    それ以外の形式の JSON 配列は文字列と括弧を数えて区切りを探す
+    """
+
+    path: Path
+
+    def __init__(self, path: Path) -> None:
+        """SnapshotReader を作成する
+
+        Args:
+            path (Path): 読み込むキャッシュファイル
+        """
+        self.path = path
+
+    def _iter_spans(self, buffer: mmap.mmap) -> Iterator[tuple[int, int]]:
+        """トップレベルの各レコードの (開始位置, 終了位置) を返す
+
+        Raises:
+            ValueError: JSON 配列のファイルではない場合
+        """
+        start = 0
+        while start < len(buffer) and buffer[start : start + 1].isspace():
+            start += 1
+        if buffer[start : start + 1] != b"[":
+            raise ValueError(f"Not a snapshot file: {self.path}.")
+        if buffer[start : start + len(_INDENTED_FIRST)] == _INDENTED_FIRST:
+            yield from self._iter_indented_spans(buffer, start + len(_INDENTED_FIRST) - 1)
+        else:
+            yield from self._iter_compact_spans(buffer, start)
+
+    def _iter_indented_spans(self, buffer: mmap.mmap, start: int) -> Iterator[tuple[int, int]]:
+        while True:
+            if buffer[start : start + 2] == b"{}":
+                end = start + 2
+            else:
+                end = buffer.find(_INDENTED_END, start)
+                if end < 0:
+                    raise ValueError(f"Truncated snapshot file: {self.path}.")
+                end += len(_INDENTED_END)
+            yield start, end
+            if buffer[end : end + len(_INDENTED_NEXT)] != _INDENTED_NEXT:
+                return
+            start = end + len(_INDENTED_NEXT) - 1
+
+    def _iter_compact_spans(self, buffer: mmap.mmap, start: int) -> Iterator[tuple[int, int]]:
+        depth = 0
+        record_start = start
+        for match in _BRACKET_PATTERN.finditer(buffer, start):
+            token = match.group(1)
+            if token in (b"[", b"{"):
+                depth += 1
+                if depth == 2:
+                    record_start = match.start(1)
+            else:
+                if depth == 2:
+                    yield record_start, match.end(1)
+                depth -= 1
+                if depth == 0:
+                    return
+        raise ValueError(f"Truncated snapshot file: {self.path}.")
+
+    def _iter_buffer(self, world_id: str | None = None) -> Iterator[dict]:
+        with self.path.open("rb") as file:
+            if self.path.stat().st_size == 0:
+                raise ValueError(f"Not a snapshot file: {self.path}.")
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                needle = None if world_id is None else orjson.dumps(world_id)
+                if needle is not None and buffer.find(needle) < 0:
+                    # ファイルに world_id が含まれなければレコードの区切りも探さない
+                    return
+                with memoryview(buffer) as view:
+                    for start, end in self._iter_spans(buffer):
+                        if needle is not None and buffer.find(needle, start, end) < 0:
+                            continue
+                        yield orjson.loads(view[start:end])
+
+    def __iter__(self) -> Iterator[dict]:
+        """レコードを先頭から1件ずつ返す
+
+        Yields:
+            dict: 1レコード分の fetch 結果
+
+        Raises:
+            ValueError: JSON 配列のファイルではない場合
+        """
+        return self._iter_buffer()
+
+    def iter_pages(self, page_size: int) -> Iterator[list[dict]]:
+        """レコードを page_size 件ずつ返す
+
+        Args:
+            page_size (int): 1ページの件数
+
+        Yields:
+            list[dict]: 最大 page_size 件のレコード
+        """
+        if page_size <= 0:
+            raise ValueError("page_size must be positive.")
+        page = []
+        for record in self:
+            page.append(record)
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def find(self, world_id: str) -> dict | None:
+        """world_id のレコードを探す
+
+        world_id を含むレコードのみを辞書に変換するため、ほかのレコードの変換コストはかからない
+
+        Args:
+            world_id (str): 探すワールドの world_id
+
+        Returns:
+            dict | None: 見つかったレコード、見つからない場合は None
+        """
+        for record in self._iter_buffer(world_id):
+            if record.get("id") == world_id:
+                return record
+        return None
+
+
+def find_world(path_list: Iterable[Path], world_id: str) -> Iterator[tuple[Path, dict]]:
+    """複数のキャッシュファイルから world_id のレコードを探す
+
+    Args:
+        path_list (Iterable[Path]): 探すキャッシュファイル
+        world_id (str): 探すワールドの world_id
+
+    Yields:
+        tuple[Path, dict]: (レコードが見つかったファイル, レコード)
+    """
+    for path in path_list:
+        record = SnapshotReader(path).find(world_id)
+        if record is not None:
+            yield path, record
@@ -0,0 +1,85 @@
+from dataclasses import dataclass
+from typing import Self
+
+from vrc_world_crawler.db.model import DEFAULT_ACCOUNT_NAME
+
+
+@dataclass(frozen=True)
+class Account:
+    """クロール対象の VRChat アカウント
+
+    rate_limit はこのアカウントで1秒あたりに送信するリクエスト数の上限
+    0 以下の場合は制限しない
+    """
+
+    name: str
+    api_key: str
+    auth: str
+    two_factor_auth: str
+    rate_limit: float = 0.0
+
+    def __post_init__(self) -> None:
+        """引数チェック
+        Raises: ValueError
+        """
+        if not isinstance(self.name, str):
+            raise ValueError("name must be str.")
+        if not self.name:
+            raise ValueError("name must not be empty.")
+        if not isinstance(self.api_key, str):
+            raise ValueError("api_key must be str.")
+        if not isinstance(self.auth, str):
+            raise ValueError("auth must be str.")
+        if not isinstance(self.two_factor_auth, str):
+            raise ValueError("two_factor_auth must be str.")
+        if not isinstance(self.rate_limit, int | float) or isinstance(self.rate_limit, bool):
+            raise ValueError("rate_limit must be float.")
+
+    @classmethod
+    def create(cls, account_dict: dict, default_name: str = DEFAULT_ACCOUNT_NAME) -> Self:
+        """設定ファイルの1アカウント分の辞書から Account を作成する
+
+        Args:
+            account_dict (dict): {"name", "apiKey", "auth", "twoFactorAuth", "rateLimit"} を持つ辞書
+                                 "name", "rateLimit" は省略可能
+            default_name (str): "name" を省略した場合のアカウント名
+
+        Returns:
+            Self: Account インスタンス
+        """
+        match account_dict:
+            case {"apiKey": api_key, "auth": auth, "twoFactorAuth": two_factor_auth}:
+                name = account_dict.get("name", default_name)
+                rate_limit = account_dict.get("rateLimit", 0.0)
+                return Account(name, api_key, auth, two_factor_auth, rate_limit)
+            case _:
+                raise ValueError("Unmatch account_dict.")
+
+    @classmethod
+    def create_list(cls, config_dict: dict) -> list[Self]:
+        """設定ファイルの辞書から Account のリストを作成する
+
+        config_dict["vrc"] が辞書の場合は単一アカウント、リストの場合は複数アカウントとして扱う
+        複数アカウントの場合は各アカウントに一意な "name" が必要
+
+        Args:
+            config_dict (dict): 設定ファイルの辞書
+
+        Returns:
+            list[Self]: Account のリスト
+        """
+        match config_dict:
+            case {"vrc": dict(account_dict)}:
+                return [Account.create(account_dict)]
+            case {"vrc": [dict(), *_] as account_dict_list}:
+                account_list = []
+                for account_dict in account_dict_list:
+                    if "name" not in account_dict:
+                        raise ValueError("name is required for multiple accounts.")
+                    account_list.append(Account.create(account_dict))
+                name_list = [account.name for account in account_list]
+                if len(name_list) != len(set(name_list)):
+                    raise ValueError("Account name must be unique.")
+                return account_list
+            case _:
+                raise ValueError("Unmatch config_dict.")
@@ -8,7 +8,9 @@ from typing import Self
 import orjson
 
 from vrc_world_crawler.db.model import FavoriteWorld
-from vrc_world_crawler.util import find_values, to_jst
+from vrc_world_crawler.util import find_values, normalize_date_at, parse_iso_date
+
+WORLD_ID_PATTERN = re.compile("wrld_.*")
 
 
 @dataclass(frozen=True)
@@ -84,7 +86,7 @@ class FetchedInfo:
 
         # world_id フォーマットチェック
         if self.release_status == "public":
-            if not re.search("wrld_.*", self.world_id):
+            if not WORLD_ID_PATTERN.search(self.world_id):
                 raise ValueError("world_id must be 'wrld_.*'.")
         else:
             if self.world_id != "???":
@@ -92,6 +94,7 @@ class FetchedInfo:
 
         # 日付系フォーマットチェック
         # 空、もしくはISOフォーマットの文字列のみ受け付ける
+        # ワールドごとに異なる日時はキャッシュせず、クロール内で共通の registered_at のみキャッシュを使う
         if self.published_at:
             datetime.fromisoformat(self.published_at)
         if self.lab_published_at:
@@ -101,7 +104,7 @@ class FetchedInfo:
         if self.updated_at:
             datetime.fromisoformat(self.updated_at)
         if self.registered_at:
-            datetime.fromisoformat(self.registered_at)
+            parse_iso_date(self.registered_at)
 
     def to_dict(self) -> dict:
         return {
@@ -129,7 +132,7 @@ class FetchedInfo:
         }
 
     @classmethod
-    def create(cls, fetched_dict: dict) -> Self:
+    def create(cls, fetched_dict: dict, registered_at: str | None = None) -> Self:
         """FetchedInfo インスタンスを作成する
 
         fetch データの辞書解析を行う
@@ -137,26 +140,14 @@ class FetchedInfo:
 
         Args:
             fetched_dict (dict): fetch したデータ辞書の1レコード
+            registered_at (str | None): 登録日時、1回のクロールで取得したレコードには同じ値を渡す
+                                        None の場合は現在日時
 
         Returns:
             Self: FetchedInfo インスタンス
         """
-
-        def normalize_date_at(date_at_str: str) -> str:
-            """日時文字列を日本時間に変換する
-
-            Args:
-                date_at_str (str): ISOフォーマットの日時文字列(UTC)
-
-            Returns:
-                str: ISOフォーマットの日時文字列(JST)
-            """
-            result = to_jst(datetime.fromisoformat(date_at_str)).isoformat()
-            if result.endswith("+00:00"):
-                result = result[:-6]
-            return result
-
-        registered_at = datetime.now().isoformat()
+        if registered_at is None:
+            registered_at = datetime.now().isoformat()
         find = functools.partial(find_values, obj=fetched_dict, is_predict_one=True, key_white_list=[""])
 
         # fetch データの辞書解析
@@ -0,0 +1,486 @@
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+from logging import INFO, getLogger
+
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.db.model import FavoriteWorld
+from vrc_world_crawler.db.world_index import IndexEntry
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# 辞書符号化して保持する文字列の列、集計のグループ分けと絞り込みに使う
+CATEGORY_COLUMN_LIST = ["account", "world_id", "author_id", "author_name", "favorite_group", "release_status"]
+
+# 整数のまま保持する列、集計の対象とする
+VALUE_COLUMN_LIST = ["star", "visit"]
+
+# aggregate で指定できる集計関数
+AGGREGATE_FUNC_LIST = ["count", "sum", "mean", "min", "max"]
+
+# 変更のあった行を DB から読み直すときに IN 句に1度に渡す id の数
+_IN_CHUNK_SIZE = 500
+
+
+def _load_numpy(use_numpy: bool | None):
+    """use_numpy に応じて NumPy を import する
+
+    Args:
+        use_numpy (bool | None): True なら必ず使う、False なら使わない、None なら import できる場合のみ使う
+
+    Returns:
+        module | None: numpy モジュール、使わない場合は None
+
+    Raises:
+        ImportError: use_numpy が True で NumPy がインストールされていない場合
+    """
+    if use_numpy is False:
+        return None
+    try:
+        import numpy
+    except ImportError:
+        if use_numpy:
+            raise
+        return None
+    return numpy
+
+
+class _Dictionary:
+    """文字列と整数の符号を相互に引く辞書、一度割り当てた符号は変えない"""
+
+    def __init__(self) -> None:
+        self.value_list: list[str] = []
+        self.code_dict: dict[str, int] = {}
+
+    def encode(self, value: str) -> int:
+        code = self.code_dict.get(value)
+        if code is None:
+            code = self.code_dict[value] = len(self.value_list)
+            self.value_list.append(value)
+        return code
+
+
+class _PythonKernel:
+    """標準ライブラリのみで集計する、NumPy が無い場合に使う"""
+
+    name = "python"
+
+    def group_reduce(
+        self, code_list: array, value_list: array | None, mask: bytearray | None, size: int, func: str
+    ) -> tuple[list[int], list]:
+        """符号ごとに値を集計する
+
+        Args:
+            code_list (array): 行ごとのグループの符号
+            value_list (array | None): 行ごとの値、count の場合は None
+            mask (bytearray | None): 行ごとに集計の対象なら 1、None の場合はすべての行
+            size (int): 符号の種類数
+            func (str): 集計関数
+
+        Returns:
+            tuple[list[int], list]: (符号ごとの件数, 符号ごとの集計値)
+        """
+        count_list = [0] * size
+        result_list = [0] * size
+        if mask is None:
+            mask = b"\x01" * len(code_list)
+        if value_list is None:
+            value_list = code_list
+        for code, value, is_target in zip(code_list, value_list, mask):
+            if not is_target:
+                continue
+            if not count_list[code] or func == "min" and value < result_list[code]:
+                result_list[code] = value
+            elif func in ["sum", "mean"]:
+                result_list[code] += value
+            elif func == "max" and value > result_list[code]:
+                result_list[code] = value
+            count_list[code] += 1
+        if func == "count":
+            return count_list, count_list
+        if func == "mean":
+            result_list = [total / count if count else 0.0 for total, count in zip(result_list, count_list)]
+        return count_list, result_list
+
+    def filter_mask(self, mask: bytearray, code_list: array, code: int | None) -> bytearray:
+        """mask のうち、符号が code と一致する行のみを 1 として残す"""
+        return bytearray(is_target and row_code == code for is_target, row_code in zip(mask, code_list))
+
+    def histogram(self, value_list: Sequence[int], edge_list: list[int]) -> list[int]:
+        """値を edge_list で区切った区間ごとに数える、区間は左端を含み右端を含まない、最後の区間のみ右端も含む"""
+        count_list = [0] * (len(edge_list) - 1)
+        last = len(edge_list) - 1
+        for value in value_list:
+            if value == edge_list[-1]:
+                count_list[-1] += 1
+                continue
+            position = bisect_right(edge_list, value)
+            if 0 < position <= last:
+                count_list[position - 1] += 1
+        return count_list
+
+
+class _NumpyKernel:
+    """NumPy で集計する、array のバッファをコピーせずに参照して一括で計算する"""
+
+    name = "numpy"
+
+    def __init__(self, np) -> None:
+        self.np = np
+
+    def group_reduce(
+        self, code_list: array, value_list: array | None, mask: bytearray | None, size: int, func: str
+    ) -> tuple[list[int], list]:
+        np = self.np
+        codes = np.frombuffer(code_list, dtype=np.int64) if code_list else np.zeros(0, dtype=np.int64)
+        values = None
+        if value_list is not None:
+            values = np.frombuffer(value_list, dtype=np.int64) if value_list else np.zeros(0, dtype=np.int64)
+        if mask is not None:
+            selected = np.frombuffer(mask, dtype=np.bool_) if mask else np.zeros(0, dtype=np.bool_)
+            codes = codes[selected]
+            values = None if values is None else values[selected]
+        counts = np.bincount(codes, minlength=size)
+        if func == "count":
+            return counts.tolist(), counts.tolist()
+        if func in ["sum", "mean"]:
+            # bincount の重みは float64 で計算されるため、合計は整数に丸め直す
+            totals = np.bincount(codes, weights=values, minlength=size)
+            if func == "sum":
+                return counts.tolist(), np.rint(totals).astype(np.int64).tolist()
+            means = np.divide(totals, counts, out=np.zeros(size), where=counts > 0)
+            return counts.tolist(), means.tolist()
+        info = np.iinfo(np.int64)
+        if func == "min":
+            results = np.full(size, info.max, dtype=np.int64)
+            np.minimum.at(results, codes, values)
+        else:
+            results = np.full(size, info.min, dtype=np.int64)
+            np.maximum.at(results, codes, values)
+        results[counts == 0] = 0
+        return counts.tolist(), results.tolist()
+
+    def filter_mask(self, mask: bytearray, code_list: array, code: int | None) -> bytearray:
+        np = self.np
+        if not mask:
+            return bytearray()
+        if code is None:
+            return bytearray(len(mask))
+        selected = np.frombuffer(mask, dtype=np.bool_) & (np.frombuffer(code_list, dtype=np.int64) == code)
+        return bytearray(selected.tobytes())
+
+    def histogram(self, value_list: Sequence[int], edge_list: list[int]) -> list[int]:
+        np = self.np
+        counts, _ = np.histogram(np.asarray(value_list, dtype=np.int64), bins=np.asarray(edge_list, dtype=np.int64))
+        return counts.tolist()
+
+
+class AnalyticsMirror:
+    """FavoriteWorld の集計用の列をメモリ上に列ごとの配列として保持する
+
+    文字列の列は辞書符号化して整数の配列とし、集計は行ごとのオブジェクトを作らずに配列を一括で走査する
+    NumPy がインストールされていれば NumPy で、無ければ標準ライブラリのみで集計する
+
+    refresh では WorldIndex の内容のハッシュ値と比べ、追加・変更された行のみを DB から読み直す
+    star, visit の変化は履歴として保持し、growth で期間を区切った増加量を集計できる
+    履歴はメモリ上にのみ保持するため、refresh を繰り返した期間の変化のみが対象となる
+
+    ライブラリとして、デーモンなど長く動くプロセスの中で保持し続けて使う(Crawler の analytics_mirror)
+    空の状態からの refresh は全行を読み込むため SQL の GROUP BY より遅く、1回ごとに起動する CLI には向かない
+    CLI からのグループ・作者ごとの集計は、書き込み時に更新される集計テーブル(summary サブコマンド)を使う
+    """
+
+    history_max_age: timedelta
+
+    def __init__(self, use_numpy: bool | None = None, history_max_age: timedelta = timedelta(days=30)) -> None:
+        """AnalyticsMirror を作成する
+
+        Args:
+            use_numpy (bool | None): True なら NumPy で集計する、False なら標準ライブラリのみで集計する
+                                     None の場合は NumPy を import できれば使う
+            history_max_age (timedelta): star, visit の変化の履歴を保持する期間
+
+        Raises:
+            ImportError: use_numpy が True で NumPy がインストールされていない場合
+        """
+        if history_max_age <= timedelta(0):
+            raise ValueError("history_max_age must be positive.")
+        np = _load_numpy(use_numpy)
+        self._kernel = _PythonKernel() if np is None else _NumpyKernel(np)
+        self.history_max_age = history_max_age
+        self._lock = threading.Lock()
+        self._position_dict: dict[int, int] = {}
+        self._row_id_list = array("q")
+        self._hash_list = array("q")
+        self._favorited_list = bytearray()
+        self._dictionary_dict = {column: _Dictionary() for column in CATEGORY_COLUMN_LIST}
+        self._code_dict = {column: array("q") for column in CATEGORY_COLUMN_LIST}
+        self._value_dict = {column: array("q") for column in VALUE_COLUMN_LIST}
+        # 時刻の昇順に追記する
+        self._history_time_list = array("d")
+        self._history_row_id_list = array("q")
+        self._history_value_dict = {column: array("q") for column in VALUE_COLUMN_LIST}
+
+    def __len__(self) -> int:
+        return len(self._row_id_list)
+
+    @property
+    def backend(self) -> str:
+        """集計に使う実装の名前、numpy または python"""
+        return self._kernel.name
+
+    def refresh(self, db: FavoriteWorldDB, now: datetime | None = None) -> int:
+        """DB の commit 済みの内容を反映する
+
+        WorldIndex のエントリと保持している内容のハッシュ値・お気に入り状態を比べ、違う行のみを DB から読み直す
+        WorldIndex に無くなった行(アーカイブした行)は削除する
+
+        Args:
+            db (FavoriteWorldDB): 反映元の DB
+            now (datetime | None): 履歴に記録する時刻、None の場合は現在時刻
+
+        Returns:
+            int: 追加・変更・削除した行の数
+        """
+        now_timestamp = (now or datetime.now()).timestamp()
+        entry_dict: dict[int, IndexEntry] = {}
+        with self._lock:
+            seen_row_id_set = set()
+            for entry in db.get_index().iter_entries():
+                seen_row_id_set.add(entry.row_id)
+                position = self._position_dict.get(entry.row_id)
+                if (
+                    position is None
+                    or self._hash_list[position] != entry.content_hash
+                    or self._favorited_list[position] != entry.is_favorited
+                ):
+                    entry_dict[entry.row_id] = entry
+            removed_row_id_list = [row_id for row_id in self._position_dict if row_id not in seen_row_id_set]
+
+        # DB の読み出し中はロックを持たず、読み出した行をまとめて反映する
+        column_list = [*CATEGORY_COLUMN_LIST, *VALUE_COLUMN_LIST]
+        row_list = []
+        row_id_list = list(entry_dict)
+        for start in range(0, len(row_id_list), _IN_CHUNK_SIZE):
+            clause_list = [FavoriteWorld.id.in_(row_id_list[start : start + _IN_CHUNK_SIZE])]
+            for chunk in db.iter_chunks(columns=column_list, clause_list=clause_list):
+                row_list.extend(chunk)
+
+        with self._lock:
+            for row_id in removed_row_id_list:
+                self._remove(row_id)
+            for row in row_list:
+                entry = entry_dict[row[0]]
+                self._put(entry, dict(zip(column_list, row[1:])), now_timestamp)
+            self._trim_history(now_timestamp)
+        changed_num = len(row_list) + len(removed_row_id_list)
+        logger.info(f"AnalyticsMirror refreshed, {changed_num} rows changed, {len(self)} rows.")
+        return changed_num
+
+    def _put(self, entry: IndexEntry, row_dict: dict, timestamp: float) -> None:
+        position = self._position_dict.get(entry.row_id)
+        if position is None:
+            self._position_dict[entry.row_id] = len(self._row_id_list)
+            self._row_id_list.append(entry.row_id)
+            self._hash_list.append(entry.content_hash)
+            self._favorited_list.append(entry.is_favorited)
+            for column in CATEGORY_COLUMN_LIST:
+                self._code_dict[column].append(self._dictionary_dict[column].encode(row_dict[column]))
+            for column in VALUE_COLUMN_LIST:
+                self._value_dict[column].append(row_dict[column])
+            return
+
+        delta_list = [row_dict[column] - self._value_dict[column][position] for column in VALUE_COLUMN_LIST]
+        if any(delta_list):
+            self._history_time_list.append(timestamp)
+            self._history_row_id_list.append(entry.row_id)
+            for column, delta in zip(VALUE_COLUMN_LIST, delta_list):
+                self._history_value_dict[column].append(delta)
+        self._hash_list[position] = entry.content_hash
+        self._favorited_list[position] = entry.is_favorited
+        for column in CATEGORY_COLUMN_LIST:
+            self._code_dict[column][position] = self._dictionary_dict[column].encode(row_dict[column])
+        for column in VALUE_COLUMN_LIST:
+            self._value_dict[column][position] = row_dict[column]
+
+    def _remove(self, row_id: int) -> None:
+        # 最後の行を削除する行の位置に移し、配列の途中を詰めずに O(1) で削除する
+        position = self._position_dict.pop(row_id)
+        last = len(self._row_id_list) - 1
+        column_array_list = [
+            self._row_id_list,
+            self._hash_list,
+            *self._code_dict.values(),
+            *self._value_dict.values(),
+        ]
+        if position != last:
+            self._position_dict[self._row_id_list[last]] = position
+            for values in column_array_list:
+                values[position] = values[last]
+            self._favorited_list[position] = self._favorited_list[last]
+        for values in column_array_list:
+            values.pop()
+        self._favorited_list.pop()
+
+    def _trim_history(self, timestamp: float) -> None:
+        cut = bisect_left(self._history_time_list, timestamp - self.history_max_age.total_seconds())
+        if not cut:
+            return
+        for values in [self._history_time_list, self._history_row_id_list, *self._history_value_dict.values()]:
+            del values[:cut]
+
+    def _validate(self, by: str | None, value: str | None, func: str | None = None) -> None:
+        if by is not None and by not in CATEGORY_COLUMN_LIST:
+            raise ValueError(f"Unknown group column: {by}.")
+        if value is not None and value not in VALUE_COLUMN_LIST:
+            raise ValueError(f"Unknown value column: {value}.")
+        if func is not None:
+            if func not in AGGREGATE_FUNC_LIST:
+                raise ValueError(f"Unknown aggregate function: {func}.")
+            if func != "count" and value is None:
+                raise ValueError(f"value is required for {func}.")
+
+    def _mask(self, favorited_only: bool, where: dict[str, str] | None) -> bytearray | None:
+        """絞り込み条件に合う行を 1 とするマスクを返す、条件が無い場合は None"""
+        if not favorited_only and not where:
+            return None
+        mask = bytearray(self._favorited_list) if favorited_only else bytearray(b"\x01" * len(self))
+        for column, value in (where or {}).items():
+            self._validate(column, None)
+            mask = self._kernel.filter_mask(
+                mask, self._code_dict[column], self._dictionary_dict[column].code_dict.get(value)
+            )
+        return mask
+
+    def aggregate(
+        self,
+        by: str,
+        value: str | None = None,
+        func: str = "count",
+        favorited_only: bool = False,
+        where: dict[str, str] | None = None,
+    ) -> dict[str, int | float]:
+        """by の値ごとに value を集計する
+
+        Args:
+            by (str): グループ分けに使う列、CATEGORY_COLUMN_LIST のいずれか
+            value (str | None): 集計する列、VALUE_COLUMN_LIST のいずれか、count の場合は不要
+            func (str): 集計関数、AGGREGATE_FUNC_LIST のいずれか
+            favorited_only (bool): True ならお気に入り状態の行のみを集計する
+            where (dict[str, str] | None): 列名から値を引く辞書、すべて一致する行のみを集計する
+
+        Returns:
+            dict[str, int | float]: by の値から集計値を引く辞書、対象の行が無い値は含めない
+        """
+        self._validate(by, value, func)
+        with self._lock:
+            count_list, result_list = self._kernel.group_reduce(
+                self._code_dict[by],
+                None if func == "count" else self._value_dict[value],
+                self._mask(favorited_only, where),
+                len(self._dictionary_dict[by].value_list),
+                func,
+            )
+            key_list = self._dictionary_dict[by].value_list
+            return {key: result for key, count, result in zip(key_list, count_list, result_list) if count}
+
+    def top(
+        self,
+        by: str,
+        value: str | None = None,
+        func: str = "sum",
+        n: int = 10,
+        favorited_only: bool = False,
+        where: dict[str, str] | None = None,
+    ) -> list[tuple[str, int | float]]:
+        """aggregate の結果のうち、集計値の大きい順に n 件を返す
+
+        Returns:
+            list[tuple[str, int | float]]: (by の値, 集計値) のリスト、集計値が同じ場合は by の値の順
+        """
+        if n <= 0:
+            raise ValueError("n must be positive.")
+        result_dict = self.aggregate(by, value, func, favorited_only, where)
+        return heapq.nsmallest(n, result_dict.items(), key=lambda item: (-item[1], item[0]))
+
+    def _growth_list(self, value: str, window: timedelta, now: datetime | None) -> list[int]:
+        """行の位置ごとに、window の期間の value の増加量を返す"""
+        if window <= timedelta(0):
+            raise ValueError("window must be positive.")
+        now_timestamp = (now or datetime.now()).timestamp()
+        start = bisect_left(self._history_time_list, now_timestamp - window.total_seconds())
+        end = bisect_right(self._history_time_list, now_timestamp)
+        growth_list = [0] * len(self)
+        delta_list = self._history_value_dict[value]
+        for index in range(start, end):
+            position = self._position_dict.get(self._history_row_id_list[index])
+            if position is not None:
+                growth_list[position] += delta_list[index]
+        return growth_list
+
+    def growth(
+        self,
+        value: str,
+        window: timedelta,
+        by: str = "world_id",
+        now: datetime | None = None,
+        favorited_only: bool = False,
+    ) -> dict[str, int]:
+        """直近 window の期間の value の増加量を by の値ごとに合計する
+
+        Args:
+            value (str): 集計する列、VALUE_COLUMN_LIST のいずれか
+            window (timedelta): 集計する期間
+            by (str): グループ分けに使う列
+            now (datetime | None): 期間の終わり、None の場合は現在時刻
+            favorited_only (bool): True ならお気に入り状態の行のみを集計する
+
+        Returns:
+            dict[str, int]: by の値から増加量を引く辞書、期間内に変化の無い値は含めない
+        """
+        self._validate(by, value)
+        with self._lock:
+            growth_list = array("q", self._growth_list(value, window, now))
+            mask = self._mask(favorited_only, None)
+            if mask is None:
+                mask = bytearray(growth != 0 for growth in growth_list)
+            else:
+                mask = bytearray(is_target and growth != 0 for is_target, growth in zip(mask, growth_list))
+            count_list, total_list = self._kernel.group_reduce(
+                self._code_dict[by], growth_list, mask, len(self._dictionary_dict[by].value_list), "sum"
+            )
+            key_list = self._dictionary_dict[by].value_list
+            return {key: total for key, count, total in zip(key_list, count_list, total_list) if count}
+
+    def growth_histogram(
+        self,
+        value: str,
+        window: timedelta,
+        edge_list: list[int],
+        now: datetime | None = None,
+        favorited_only: bool = False,
+    ) -> list[int]:
+        """直近 window の期間の value の増加量の分布を返す、変化の無い行は増加量 0 として数える
+
+        Args:
+            value (str): 集計する列、VALUE_COLUMN_LIST のいずれか
+            window (timedelta): 集計する期間
+            edge_list (list[int]): 区間の境界の昇順のリスト、区間は左端を含み右端を含まない、最後の区間のみ右端も含む
+            now (datetime | None): 期間の終わり、None の場合は現在時刻
+            favorited_only (bool): True ならお気に入り状態の行のみを数える
+
+        Returns:
+            list[int]: 区間ごとの行数、境界の外の行は数えない
+        """
+        self._validate(None, value)
+        if len(edge_list) < 2 or any(low >= high for low, high in zip(edge_list, edge_list[1:])):
+            raise ValueError("edge_list must have at least 2 strictly increasing values.")
+        with self._lock:
+            growth_list = self._growth_list(value, window, now)
+            if favorited_only:
+                growth_list = [growth for growth, is_target in zip(growth_list, self._favorited_list) if is_target]
+            return self._kernel.histogram(growth_list, edge_list)
@@ -1,12 +1,56 @@
+import sqlite3
 from abc import ABCMeta, abstractmethod
+from collections.abc import Iterator
+from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.pool import StaticPool
 
+from vrc_world_crawler.db.migration import is_schema_current, migrate
 from vrc_world_crawler.db.model import Base as ModelBase
 
+# PRAGMA auto_vacuum の INCREMENTAL を表す値
+_AUTO_VACUUM_INCREMENTAL = 2
+
+
+def _on_connect(dbapi_connection, connection_record) -> None:
+    # pysqlite の暗黙的なトランザクション制御を無効にする
+    # BEGIN は _on_begin で明示的に発行し、トランザクション境界を SQLAlchemy 側に揃える
+    dbapi_connection.isolation_level = None
+    # 書き込み中も他のコネクションから読み出せるよう WAL モードにする、:memory: の DB では無視される
+    # journal_mode は DB ファイルに保存され、他のプロセスのコネクションにも適用される
+    dbapi_connection.execute("PRAGMA journal_mode=WAL")
+    # WAL モードでは commit ごとの fsync を省いても DB は壊れない、電源断時に直前の commit が失われうるのみ
+    dbapi_connection.execute("PRAGMA synchronous=NORMAL")
+
+
+def _on_write_connect(dbapi_connection, connection_record) -> None:
+    # 削除で空いたページを incremental_vacuum で少しずつ解放できるようにする
+    # テーブルを作成する前の新しい DB にのみ効果があり、既存の DB は enable_incremental_vacuum で切り替える
+    # 書き込み中に実行すると待たされるため、読み出し専用のコネクションでは実行しない
+    dbapi_connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+
+
+def _on_read_connect(dbapi_connection, connection_record) -> None:
+    # 読み出し専用のコネクションからは書き込めないようにする
+    dbapi_connection.execute("PRAGMA query_only=ON")
+
+
+def _on_begin(connection) -> None:
+    connection.exec_driver_sql("BEGIN")
+
 
 class Base(metaclass=ABCMeta):
+    """SQLite の DB への接続を管理する
+
+    ファイルの DB は WAL モードで開き、書き込み中も他のコネクションからの読み出しを待たせない
+    書き込みは engine の1つのコネクションで行い、読み出し専用の API は read_engine のコネクションを使う
+    read_engine のコネクションは読み出しを始めた時点の commit 済みの内容のみを参照するため
+    クロールの書き込み中も、読み出し側はクロール前かクロール後のどちらかの状態のみを見る
+    :memory: の DB はコネクションを分けられないため、読み出しも engine のコネクションを使う
+    """
+
     def __init__(self, db_path: str = "vrc.db") -> None:
         self.db_path = db_path
         self.db_url = f"sqlite:///{self.db_path}"
@@ -21,7 +65,159 @@ class Base(metaclass=ABCMeta):
                 "check_same_thread": False,
             },
         )
-        ModelBase.metadata.create_all(self.engine)
+        event.listen(self.engine, "connect", _on_write_connect)
+        event.listen(self.engine, "connect", _on_connect)
+        event.listen(self.engine, "begin", _on_begin)
+        self.is_memory = db_path == ":memory:"
+        if self.is_memory:
+            self.read_engine = self.engine
+        else:
+            # 読み出し専用のエンジンはスレッドごとに別のコネクションを使う
+            self.read_engine = create_engine(
+                self.db_url, echo=False, connect_args={"timeout": 30, "check_same_thread": False}
+            )
+            event.listen(self.read_engine, "connect", _on_connect)
+            event.listen(self.read_engine, "connect", _on_read_connect)
+            event.listen(self.read_engine, "begin", _on_begin)
+        if not is_schema_current(self.engine):
+            # スキーマが最新の場合はテーブル定義の確認を省略して起動を速くする
+            ModelBase.metadata.create_all(self.engine)
+            migrate(self.engine)
+
+        # セッションファクトリはインスタンスごとに1つだけ作成して使い回す
+        self.Session = sessionmaker(bind=self.engine, autoflush=False)
+        self.ReadSession = sessionmaker(bind=self.read_engine, autoflush=False)
+
+    def dispose(self) -> None:
+        """書き込み用と読み出し用のエンジンのコネクションを閉じる"""
+        self.read_engine.dispose()
+        self.engine.dispose()
+
+    def checkpoint(self) -> bool:
+        """WAL に書かれた commit 済みの内容を DB ファイルに書き戻す
+
+        読み出し中のコネクションを待たず、書き戻せる分のみを書き戻す
+
+        Returns:
+            bool: すべて書き戻した場合 True、読み出し中のコネクションなどのために一部が残った場合 False
+        """
+        if self.is_memory:
+            return True
+        connection = sqlite3.connect(self.db_path, timeout=0)
+        try:
+            busy, log_frame_num, checkpointed_frame_num = connection.execute(
+                "PRAGMA wal_checkpoint(PASSIVE)"
+            ).fetchone()
+        finally:
+            connection.close()
+        return not busy and log_frame_num == checkpointed_frame_num
+
+    def enable_incremental_vacuum(self) -> bool:
+        """既存の DB の auto_vacuum を INCREMENTAL に切り替える
+
+        切り替えには DB 全体を作り直す VACUUM が必要で、実行中は他のコネクションからの書き込みを待たせる
+        1度切り替えれば以降は incremental_vacuum で少しずつ容量を減らせるため、最初の1回のみ実行する
+
+        Returns:
+            bool: 切り替えた場合 True、既に INCREMENTAL の場合や :memory: の DB の場合は False
+        """
+        if self.is_memory:
+            return False
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            if connection.execute("PRAGMA auto_vacuum").fetchone()[0] == _AUTO_VACUUM_INCREMENTAL:
+                return False
+            connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            connection.execute("VACUUM")
+        finally:
+            connection.close()
+        return True
+
+    def incremental_vacuum(self, max_pages: int = 1024, step_pages: int = 64) -> int:
+        """削除で空いたページを少しずつ解放し、DB ファイルを小さくする
+
+        1回に step_pages ページずつ、別々のトランザクションで解放するため、書き込みを長く止めない
+        auto_vacuum が INCREMENTAL ではない DB では何もしない
+
+        Args:
+            max_pages (int): 解放するページ数の上限
+            step_pages (int): 1回のトランザクションで解放するページ数
+
+        Returns:
+            int: 解放したページ数
+        """
+        if max_pages <= 0 or step_pages <= 0:
+            raise ValueError("max_pages and step_pages must be positive.")
+        if self.is_memory:
+            return 0
+        freed_num = 0
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.isolation_level = None
+        try:
+            if connection.execute("PRAGMA auto_vacuum").fetchone()[0] != _AUTO_VACUUM_INCREMENTAL:
+                return 0
+            while freed_num < max_pages:
+                free_num = connection.execute("PRAGMA freelist_count").fetchone()[0]
+                if free_num == 0:
+                    break
+                step = min(step_pages, max_pages - freed_num, free_num)
+                # execute では1ページずつしか解放されないため、executescript で最後まで実行する
+                connection.executescript(f"PRAGMA incremental_vacuum({step})")
+                step_freed_num = free_num - connection.execute("PRAGMA freelist_count").fetchone()[0]
+                if step_freed_num <= 0:
+                    break
+                freed_num += step_freed_num
+        finally:
+            connection.close()
+        return freed_num
+
+    @contextmanager
+    def snapshot_scope(self) -> Iterator[Session]:
+        """読み出し専用のセッションを提供する
+
+        セッション内のすべての読み出しは、最初の読み出し時点の commit 済みの内容を参照する
+        書き込み中のトランザクションを待たず、書き込み側もこのセッションを待たない
+        セッションからは書き込めず、with ブロックを抜けると close する
+
+        Yields:
+            Session: 読み出し専用のセッション
+        """
+        session = self.ReadSession()
+        try:
+            # 最初の読み出しでスナップショットが決まるため、すぐに読み出して時点を固定する
+            session.execute(text("SELECT count(*) FROM sqlite_master")).one()
+            yield session
+        finally:
+            session.rollback()
+            session.close()
+
+    @contextmanager
+    def session_scope(self, session: Session | None = None) -> Iterator[Session]:
+        """作業単位(1トランザクション)を表すセッションを提供する
+
+        session を渡さなかった場合は新しいセッションを作成し
+        with ブロックを正常に抜けたときに commit、例外時に rollback して必ず close する
+        session を渡した場合は呼び出し元の作業単位に参加し、commit/rollback/close は呼び出し元に任せる
+
+        Args:
+            session (Session | None): 参加する既存のセッション
+
+        Yields:
+            Session: 作業単位のセッション
+        """
+        if session is not None:
+            yield session
+            return
+
+        session = self.Session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
 
     @abstractmethod
     def select(self):
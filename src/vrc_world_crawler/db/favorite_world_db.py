@@ -1,51 +1,518 @@
+import threading
+from collections.abc import Iterable, Iterator
+from dataclasses import replace
+from datetime import datetime, timedelta
 from logging import INFO, getLogger
+from pathlib import Path
 
-from sqlalchemy import and_
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.orm.exc import NoResultFound
+import orjson
+from sqlalchemy import ColumnElement, Row, delete, event, func, insert, literal, literal_column, select, text, tuple_
+from sqlalchemy import union_all, update
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.util import ClauseAdapter
 
 from vrc_world_crawler.db.base import Base
-from vrc_world_crawler.db.model import FavoriteWorld
+from vrc_world_crawler.db.model import DEFAULT_ACCOUNT_NAME, AuthorSummary, ChangeEvent, FavoriteWorld
+from vrc_world_crawler.db.model import FavoriteWorldArchive, GroupSummary
+from vrc_world_crawler.db.search_index import rebuild_search_index, search_statement
+from vrc_world_crawler.db.summary_table import AGGREGATE_COLUMN_DICT, check_summary_tables, rebuild_summary_tables
+from vrc_world_crawler.db.valueobject.world_filter import WorldFilter
+from vrc_world_crawler.db.world_index import HASH_COLUMN_LIST, IndexEntry, WorldIndex, content_hash
 
 logger = getLogger(__name__)
 logger.setLevel(INFO)
 
+# 公開ワールドの更新で書き換える列
+UPDATE_COLUMN_LIST = [*HASH_COLUMN_LIST, "is_favorited", "unfavorited_at"]
+
+# 非公開ワールドの公開状態が変わったときに書き換える列
+STATUS_UPDATE_COLUMN_LIST = [
+    "favorite_id",
+    "favorite_group",
+    "is_favorited",
+    "unfavorited_at",
+    "release_status",
+    "registered_at",
+]
+
+# FavoriteWorldArchive に移す FavoriteWorld の列
+ARCHIVE_COLUMN_LIST = list(FavoriteWorld.__table__.columns.keys())
+
+# ChangeEvent の記録に使う、変更内容以外の列
+EVENT_KEY_COLUMN_LIST = ["account", "world_id", "favorite_id", "favorite_group"]
+
+# ChangeEvent に記録するクロールの識別子を置く session.info のキー
+CRAWL_ID_KEY = "crawl_id"
+
+# IN 句に1度に渡す値の数
+_IN_CHUNK_SIZE = 500
+
 
 class FavoriteWorldDB(Base):
-    def __init__(self, db_path: str = "vrc.db"):
+    index_path: Path | None
+    record_changes: bool
+
+    def __init__(self, db_path: str = "vrc.db", persist_index: bool = False, record_changes: bool = False):
+        """FavoriteWorldDB を作成する
+
+        Args:
+            db_path (str): DB ファイルのパス
+            persist_index (bool): True の場合、WorldIndex を DB ファイルの隣に保存し、次回起動時に再利用する
+            record_changes (bool): True の場合、upsert, unfavorite, clear_favorited による変更を ChangeEvent に記録する
+        """
         super().__init__(db_path)
+        self.index_path = Path(f"{db_path}.index") if persist_index and db_path != ":memory:" else None
+        self.record_changes = record_changes
+        self._index: WorldIndex | None = None
+        # 索引を読み込んだ時点の書き込み用コネクションの PRAGMA data_version
+        self._data_version: int | None = None
+        self._index_lock = threading.Lock()
+        event.listen(self.Session, "after_commit", self._on_after_commit)
+        event.listen(self.Session, "after_rollback", self._on_after_rollback)
+
+    def _index_signature(self) -> list:
+        """保存した索引が現在の DB と一致するかを判定するための値を返す
+
+        WAL の内容は DB ファイルに書き戻してから保存するため、DB ファイルのみで判定する
+        """
+        path = Path(self.db_path)
+        if not path.is_file():
+            return []
+        stat = path.stat()
+        return [path.name, stat.st_mtime_ns, stat.st_size]
+
+    @property
+    def index(self) -> WorldIndex:
+        """全レコードの WorldIndex、初回アクセス時に読み込む"""
+        return self.get_index()
+
+    def get_index(self, session: Session | None = None) -> WorldIndex:
+        """全レコードの WorldIndex を返す、初回と DB が他のコネクションから変更された後に読み込む
+
+        保存済みの索引が DB と一致する場合はそれを使い、一致しない場合は DB から作り直す
+        トランザクションを始める前のセッションを渡した場合は、先に revalidate_index で読み込み済みの索引を確かめる
+        StaticPool では接続が1つしかないため、トランザクション中に呼ぶ場合はそのセッションを渡すこと
+
+        Args:
+            session (Session | None): 読み込みに使うセッション、None の場合は新しいセッションを使う
+
+        Returns:
+            WorldIndex: 索引
+        """
+        if session is not None and not session.in_transaction():
+            self.revalidate_index(session)
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    index = WorldIndex()
+                    with self.session_scope(session) as load_session:
+                        self._data_version = self._get_data_version(load_session)
+                        if self.index_path is None or not index.load_file(self.index_path, self._index_signature()):
+                            index.load(load_session)
+                            self._save_index(index)
+                    self._index = index
+        return self._index
+
+    def _get_data_version(self, session: Session) -> int:
+        return session.execute(text("PRAGMA data_version")).scalar_one()
+
+    def revalidate_index(self, session: Session | None = None) -> bool:
+        """読み込み後に他のコネクションから DB が変更されていれば、読み込み済みの WorldIndex を捨てる
+
+        PRAGMA data_version は同じコネクションで読み出した値を比べると、他のコネクションの commit の有無がわかる
+        書き込み用のコネクションは StaticPool の1つのみのため、このインスタンス自身の commit では値は変わらない
+        別のプロセスや別のインスタンスの upsert, archive_unfavorited などで変わり、次の読み込みで DB から作り直す
+        保存済みの索引は DB ファイルに書き戻されていない変更を判定できないため、あわせて削除する
+        作業単位の途中で捨てると未確定の変更を失うため、トランザクションを始める前に呼ぶこと
+
+        Args:
+            session (Session | None): 確認に使うセッション、None の場合は新しいセッションを使う
+
+        Returns:
+            bool: 索引を捨てた場合 True
+        """
+        if self._index is None:
+            return False
+        with self.session_scope(session) as check_session:
+            data_version = self._get_data_version(check_session)
+        with self._index_lock:
+            if self._index is None or data_version == self._data_version:
+                return False
+            self._index = None
+            if self.index_path is not None:
+                self.index_path.unlink(missing_ok=True)
+        logger.info(f"{self.db_path} was changed by another connection, reload WorldIndex.")
+        return True
+
+    def _save_index(self, index: WorldIndex) -> None:
+        if self.index_path is not None:
+            index.save(self.index_path, self._index_signature())
+
+    def _on_after_commit(self, session: Session) -> None:
+        # after_commit はセーブポイントの解放でも呼ばれるため、最も外側のトランザクションの commit のみ反映する
+        if session.in_nested_transaction():
+            return
+        if self._index is not None and self._index.commit(session):
+            # 書き戻しきれなかった場合は終了時の書き戻しで DB ファイルが変わり、次回の起動時は DB から作り直す
+            if self.index_path is not None and self.checkpoint():
+                self._save_index(self._index)
+
+    def _on_after_rollback(self, session: Session) -> None:
+        if self._index is not None:
+            self._index.discard(session)
 
     def select(self) -> list[FavoriteWorld]:
-        Session = sessionmaker(bind=self.engine, autoflush=False)
-        session = Session()
-        result = session.query(FavoriteWorld).all()
-        session.close()
+        session = self.Session()
+        try:
+            result = session.query(FavoriteWorld).all()
+        finally:
+            session.close()
+        return result
+
+    def _select_statement(
+        self,
+        world_filter: WorldFilter | None,
+        columns: list[str] | None,
+        clause_list: list[ColumnElement[bool]] | None = None,
+        include_archived: bool = False,
+    ):
+        """読み出し用の select 文を作成する
+
+        ORM インスタンスではなく列単位で取得するため、結果は軽量な Row となる
+
+        Args:
+            world_filter (WorldFilter | None): 読み出し条件、None なら全件
+            columns (list[str] | None): 取得する列名のリスト、None なら全列
+            clause_list (list[ColumnElement[bool]] | None): world_filter に加える条件
+            include_archived (bool): True なら FavoriteWorldArchive の行も同じ条件で読み出す
+
+        Returns:
+            Select: id 昇順の select 文
+        """
+        table_columns = FavoriteWorld.__table__.columns
+        if columns is None:
+            columns = list(table_columns.keys())
+        invalid_columns = [c for c in columns if c not in table_columns]
+        if invalid_columns:
+            raise ValueError(f"Unknown columns: {invalid_columns}.")
+        if "id" not in columns:
+            # keyset ページングの基準に使うため id は常に含める
+            columns = ["id", *columns]
+
+        statement = select(*[table_columns[c] for c in columns])
+        if world_filter:
+            statement = statement.where(*world_filter.to_clause_list())
+        if clause_list:
+            statement = statement.where(*clause_list)
+        if not include_archived:
+            return statement.order_by(FavoriteWorld.id)
+        # FavoriteWorld の列に対する条件を、同じ名前の FavoriteWorldArchive の列に置き換える
+        archive_statement = ClauseAdapter(FavoriteWorldArchive.__table__, adapt_on_names=True).traverse(statement)
+        return union_all(statement, archive_statement).order_by("id")
+
+    def iter_rows(
+        self,
+        world_filter: WorldFilter | None = None,
+        columns: list[str] | None = None,
+        as_dict: bool = False,
+        chunk_size: int = 1000,
+        include_archived: bool = False,
+    ) -> Iterator[Row | dict]:
+        """条件に合うレコードを逐次読み出す
+
+        yield_per によって chunk_size 件ずつカーソルから取得するため
+        テーブル全体の件数に依らずメモリ使用量は一定となる
+        イテレータを最後まで消費するか close するまでセッションは開いたままになる
+
+        Args:
+            world_filter (WorldFilter | None): 読み出し条件、None なら全件
+            columns (list[str] | None): 取得する列名のリスト、None なら全列
+            as_dict (bool): True なら辞書、False なら Row(名前付きタプル) を返す
+            chunk_size (int): 一度にカーソルから取得する件数
+            include_archived (bool): True ならアーカイブ済みのレコードも読み出す
+
+        Yields:
+            Row | dict: 1レコード分の列値
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive.")
+        statement = self._select_statement(world_filter, columns, include_archived=include_archived)
+        statement = statement.execution_options(yield_per=chunk_size)
+
+        session = self.ReadSession()
+        try:
+            for row in session.execute(statement):
+                yield row._asdict() if as_dict else row
+        finally:
+            session.close()
+
+    def iter_chunks(
+        self,
+        world_filter: WorldFilter | None = None,
+        columns: list[str] | None = None,
+        chunk_size: int = 1000,
+        clause_list: list[ColumnElement[bool]] | None = None,
+        include_archived: bool = False,
+    ) -> Iterator[list[tuple]]:
+        """条件に合うレコードを chunk_size 件ずつのタプルのリストとして逐次読み出す
+
+        ORM のセッションを介さずコネクションのカーソルから直接取得するため、iter_rows よりも1件あたりのコストが小さい
+        大量のレコードを書き出す用途に使う
+        イテレータを最後まで消費するか close するまでコネクションは使用中のままになる
+
+        Args:
+            world_filter (WorldFilter | None): 読み出し条件、None なら全件
+            columns (list[str] | None): 取得する列名のリスト、None なら全列、id は常に先頭に含まれる
+            chunk_size (int): 1回に返す件数
+            clause_list (list[ColumnElement[bool]] | None): world_filter に加える条件
+            include_archived (bool): True ならアーカイブ済みのレコードも読み出す
+
+        Yields:
+            list[tuple]: 最大 chunk_size 件のレコード、各レコードは select 文の列順の値のタプル
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive.")
+        statement = self._select_statement(world_filter, columns, clause_list, include_archived)
+        with self.read_engine.connect() as connection:
+            result = connection.execution_options(yield_per=chunk_size).execute(statement)
+            for partition in result.partitions():
+                yield [tuple(row) for row in partition]
+
+    def select_page(
+        self,
+        world_filter: WorldFilter | None = None,
+        after_id: int = 0,
+        limit: int = 100,
+        columns: list[str] | None = None,
+        as_dict: bool = False,
+    ) -> tuple[list[Row | dict], int | None]:
+        """keyset ページングでレコードを読み出す
+
+        OFFSET を使わず id > after_id で絞り込むため、後ろのページでも取得コストは一定となる
+
+        Args:
+            world_filter (WorldFilter | None): 読み出し条件、None なら全件
+            after_id (int): この id より後ろのレコードを取得する、先頭ページは0
+            limit (int): 1ページの件数
+            columns (list[str] | None): 取得する列名のリスト、None なら全列
+            as_dict (bool): True なら辞書、False なら Row(名前付きタプル) を返す
+
+        Returns:
+            tuple[list[Row | dict], int | None]: (ページのレコードリスト, 次ページの after_id)
+                                                 次ページが無い場合 after_id は None
+        """
+        if limit <= 0:
+            raise ValueError("limit must be positive.")
+        statement = self._select_statement(world_filter, columns)
+        statement = statement.where(FavoriteWorld.id > after_id).limit(limit)
+
+        session = self.ReadSession()
+        try:
+            row_list = session.execute(statement).all()
+        finally:
+            session.close()
+
+        next_after_id = row_list[-1].id if len(row_list) == limit else None
+        if as_dict:
+            return [row._asdict() for row in row_list], next_after_id
+        return list(row_list), next_after_id
+
+    def search(
+        self,
+        query: str,
+        world_filter: WorldFilter | None = None,
+        limit: int = 20,
+    ) -> list[dict]:
+        """world_name, author_name, description を全文検索する
+
+        LIKE による全件走査ではなく FTS5 の索引を使うため、レコード数が増えても検索時間はほぼ変わらない
+        空白で区切った語をすべて含むレコードを、順位の高い順に返す
+
+        Args:
+            query (str): 検索語
+            world_filter (WorldFilter | None): 追加の読み出し条件、None なら全件が対象
+            limit (int): 最大件数
+
+        Returns:
+            list[dict]: 検索結果、各要素は id, account, world_id, world_name, author_name, rank, snippet を持つ
+                        rank は小さいほど一致度が高く、snippet は一致箇所を [] で囲んだ抜粋
+        """
+        if limit <= 0:
+            raise ValueError("limit must be positive.")
+        statement = search_statement(query, limit, world_filter.to_clause_list() if world_filter else None)
+        with self.snapshot_scope() as session:
+            row_list = session.execute(statement).all()
+        return [row._asdict() for row in row_list]
+
+    def rebuild_search_index(self) -> None:
+        """全文検索の索引を FavoriteWorld の全レコードから作り直す"""
+        with self.engine.begin() as connection:
+            rebuild_search_index(connection)
+
+    def stats(self) -> dict:
+        """レコード数の集計を返す
+
+        全体・account・favorite_group ごとの件数は GroupSummary から計算する
+
+        Returns:
+            dict: 全体の件数と、account, favorite_group, release_status ごとの件数
+                  {"total": int, "favorited": int, "archived": int, "account": {値: 件数}, ...}
+                  archived 以外はアーカイブ済みのレコードを含めない
+        """
+        # 複数の集計を同じ時点の内容から計算する
+        with self.snapshot_scope() as session:
+            total, favorited = session.execute(
+                select(
+                    func.coalesce(func.sum(GroupSummary.world_num), 0),
+                    func.coalesce(func.sum(GroupSummary.favorited_num), 0),
+                )
+            ).one()
+            archived = session.execute(select(func.count()).select_from(FavoriteWorldArchive.__table__)).scalar()
+            result = {"total": total, "favorited": favorited, "archived": archived}
+            for column in [GroupSummary.account, GroupSummary.favorite_group]:
+                statement = select(column, func.sum(GroupSummary.world_num)).group_by(column).order_by(column)
+                result[column.key] = {value: count for value, count in session.execute(statement)}
+            column = FavoriteWorld.release_status
+            statement = select(column, func.count(FavoriteWorld.id)).group_by(column).order_by(column)
+            result["release_status"] = {value: count for value, count in session.execute(statement)}
         return result
 
-    def clear_favorited(self) -> int:
+    def summary(
+        self,
+        by: str = "favorite_group",
+        account: str | None = None,
+        order_by: str = "world_num",
+        limit: int | None = None,
+    ) -> list[dict]:
+        """グループ・作者ごとの件数と star, visit の合計を返す
+
+        GroupSummary, AuthorSummary から読み出すため
+        FavoriteWorld の行数に依らず、グループ・作者の数に比例した時間で済む
+
+        Args:
+            by (str): "favorite_group" または "author"
+            account (str | None): 対象のアカウント名、None の場合は全アカウントの合計
+            order_by (str): 並び順に使う集計値の列、大きい順に並べる、同じ値の場合はキーの順
+            limit (int | None): 最大件数、None の場合はすべて
+
+        Returns:
+            list[dict]: 1グループ・1作者ごとに、キーの列と world_num, favorited_num, star_total, visit_total を持つ
+                        作者の場合は author_id, author_name をキーとする
+        """
+        summary_dict = {"favorite_group": GroupSummary, "author": AuthorSummary}
+        if by not in summary_dict:
+            raise ValueError(f"Unknown summary: {by}.")
+        if order_by not in AGGREGATE_COLUMN_DICT:
+            raise ValueError(f"Unknown order_by: {order_by}.")
+        if limit is not None and limit <= 0:
+            raise ValueError("limit must be positive.")
+        model = summary_dict[by]
+        key_list = [model.favorite_group] if model is GroupSummary else [model.author_id]
+        aggregate_list = [func.sum(getattr(model, column)).label(column) for column in AGGREGATE_COLUMN_DICT]
+        label_list = [] if model is GroupSummary else [func.max(model.author_name).label("author_name")]
+        statement = (
+            select(*key_list, *label_list, *aggregate_list)
+            .group_by(*key_list)
+            .order_by(literal_column(order_by).desc(), *key_list)
+            .limit(limit)
+        )
+        if account is not None:
+            statement = statement.where(model.account == account)
+        with self.snapshot_scope() as session:
+            return [row._asdict() for row in session.execute(statement)]
+
+    def check_summary(self) -> dict[str, int]:
+        """集計テーブルが FavoriteWorld の内容と一致しているかを全件走査で確認する
+
+        Returns:
+            dict[str, int]: テーブル名から一致しなかった行の数を引く辞書
+        """
+        with self.read_engine.connect() as connection:
+            return check_summary_tables(connection)
+
+    def rebuild_summary(self) -> None:
+        """集計テーブルを FavoriteWorld の全レコードから作り直す"""
+        with self.engine.begin() as connection:
+            rebuild_summary_tables(connection)
+
+    def clear_favorited(self, session: Session | None = None, account: str = DEFAULT_ACCOUNT_NAME) -> int:
         """flag_clear
 
-        全レコードの is_favorited フラグをすべて False にする
+        指定アカウントの全レコードの is_favorited フラグをすべて False にする
+        他のアカウントのレコードには影響しない
+        record_changes が True の場合は、お気に入りから外れたレコードを unfavorite と同じく removed として記録する
+
+        Args:
+            session (Session | None): 参加する作業単位のセッション
+                                      None の場合はこの処理単体で commit する
+            account (str): 対象のアカウント名
 
         Returns:
             int: 成功時0
         """
-        Session = sessionmaker(bind=self.engine, autoflush=False)
-        session = Session()
-        session.query(FavoriteWorld).update({FavoriteWorld.is_favorited: False})
-        session.commit()
-        session.close()
+        with self.session_scope(session) as session:
+            # 索引は更新前の状態で読み込んでおく
+            index = self.get_index(session)
+            if self.record_changes:
+                self._add_removed_events(session, account)
+            # 既にお気に入りから外れていたレコードの unfavorited_at は変えない
+            session.query(FavoriteWorld).filter(FavoriteWorld.account == account).update({
+                FavoriteWorld.is_favorited: False,
+                FavoriteWorld.unfavorited_at: func.coalesce(FavoriteWorld.unfavorited_at, datetime.now().isoformat()),
+            })
+            index.stage_unfavorited(session, account)
         return 0
 
-    def upsert(self, record: FavoriteWorld | list[FavoriteWorld]) -> list[int]:
+    def unfavorite(
+        self, favorite_id_list: list[str], session: Session | None = None, account: str = DEFAULT_ACCOUNT_NAME
+    ) -> int:
+        """指定した favorite_id のレコードの is_favorited フラグを False にする
+
+        今回のクロールで見つからなかった(お気に入りから外れた)レコードに対して使う
+
+        Args:
+            favorite_id_list (list[str]): 対象の favorite_id のリスト
+            session (Session | None): 参加する作業単位のセッション
+                                      None の場合はこの処理単体で commit する
+            account (str): 対象のアカウント名
+
+        Returns:
+            int: 更新したレコード数
+        """
+        count = 0
+        unfavorited_at = datetime.now().isoformat()
+        with self.session_scope(session) as session:
+            index = self.get_index(session)
+            for i in range(0, len(favorite_id_list), _IN_CHUNK_SIZE):
+                chunk = favorite_id_list[i : i + _IN_CHUNK_SIZE]
+                if self.record_changes:
+                    self._add_removed_events(session, account, chunk)
+                count += (
+                    session
+                    .query(FavoriteWorld)
+                    .filter(FavoriteWorld.account == account, FavoriteWorld.favorite_id.in_(chunk))
+                    .update({FavoriteWorld.is_favorited: False, FavoriteWorld.unfavorited_at: unfavorited_at})
+                )
+            index.stage_unfavorited(session, account, favorite_id_list)
+        return count
+
+    def upsert(self, record: FavoriteWorld | list[FavoriteWorld], session: Session | None = None) -> list[int]:
         """upsert
 
+        レコードの検索はレコードの account の範囲で行う
+        既存レコードの判定は WorldIndex で行い、DB への書き込みは INSERT と主キー指定の UPDATE をまとめて発行する
+        内容も is_favorited も変わっていないレコードは書き込まない
+        record_changes が True の場合は、書き込んだレコードの変更を同じトランザクションで ChangeEvent に記録する
+
         Args:
             record (FavoriteWorld | list[FavoriteWorld]): 投入レコード、またはレコード辞書のリスト
+            session (Session | None): 参加する作業単位のセッション
+                                      None の場合はこの処理単体で commit する
 
         Returns:
             list[int]: レコードに対応した投入結果のリスト
                        追加したレコードは0、更新したレコードは1が入る
+                       同じワールドが重複して渡された場合は先のものを書き込み、後のものには書き込まずに1が入る
         """
         result: list[int] = []
         record_list: list[FavoriteWorld] = []
@@ -57,71 +524,251 @@ class FavoriteWorldDB(Base):
             case _:
                 raise TypeError("record is invalid type.")
 
-        Session = sessionmaker(bind=self.engine, autoflush=False)
-        session = Session()
+        with self.session_scope(session) as session:
+            index = self.get_index(session)
+            # 今回追加するレコード
+            insert_dict: dict[tuple[str, str], FavoriteWorld] = {}
+            # 同じワールドが重複して渡された場合は Deduplicator と同じく先のものを残し、後のものは読み飛ばす
+            # 公開ワールドは world_id、非公開ワールドは favorite_id で同じものとみなす
+            seen_key_set: set[tuple[str, str, str]] = set()
+            # 行 id ごとの UPDATE 内容
+            update_dict: dict[int, dict] = {}
+            # 公開状態が変わり、内容のハッシュ値を DB から計算し直す行 id
+            rehash_entry_dict: dict[int, IndexEntry] = {}
 
-        for r in record_list:
-            if r.release_status == "public":
-                try:
-                    q = (
-                        session.query(FavoriteWorld)
-                        .filter(and_(FavoriteWorld.world_id == r.world_id))
-                        .with_for_update()
-                    )
-                    p = q.one()
-                except NoResultFound:
-                    # INSERT
-                    session.add(r)
-                    logger.info(f"Add World: {r.world_name}")
-                    result.append(0)
-                else:
+            for r in record_list:
+                is_public = r.release_status == "public"
+                seen_key = (
+                    r.account,
+                    "world" if is_public else "favorite",
+                    r.world_id if is_public else r.favorite_id,
+                )
+                if seen_key in seen_key_set:
+                    result.append(1)
+                    continue
+                seen_key_set.add(seen_key)
+                if is_public:
+                    key = (r.account, r.world_id)
+                    entry = index.get_by_world_id(session, *key)
+                    if entry is None:
+                        # INSERT
+                        insert_dict[key] = r
+                        logger.info(f"Add World: {r.world_name}")
+                        result.append(0)
+                        continue
                     # UPDATE
-                    p.world_id = r.world_id
-                    p.world_name = r.world_name
-                    p.world_url = r.world_url
-                    p.description = r.description
-                    p.author_id = r.author_id
-                    p.author_name = r.author_name
-                    p.favorite_id = r.favorite_id
-                    p.favorite_group = r.favorite_group
-                    p.is_favorited = r.is_favorited
-                    p.release_status = r.release_status
-                    p.featured = r.featured
-                    p.image_url = r.image_url
-                    p.thmbnail_image_url = r.thmbnail_image_url
-                    p.version = r.version
-                    p.star = r.star
-                    p.visit = r.visit
-                    p.published_at = r.published_at
-                    p.lab_published_at = r.lab_published_at
-                    p.created_at = r.created_at
-                    p.updated_at = r.updated_at
-                    # p.registered_at = r.registered_at
+                    hash_value = content_hash(r)
+                    if hash_value != entry.content_hash or entry.is_favorited != r.is_favorited:
+                        update_dict[entry.row_id] = update_dict.get(entry.row_id, {}) | {
+                            column: getattr(r, column) for column in UPDATE_COLUMN_LIST
+                        }
+                        index.stage(
+                            session,
+                            [
+                                replace(
+                                    entry,
+                                    favorite_id=r.favorite_id,
+                                    content_hash=hash_value,
+                                    is_favorited=bool(r.is_favorited),
+                                    release_status=r.release_status,
+                                )
+                            ],
+                        )
                     result.append(1)
-            else:
-                try:
-                    q = (
-                        session.query(FavoriteWorld)
-                        .filter(and_(FavoriteWorld.favorite_id == r.favorite_id))
-                        .with_for_update()
-                    )
-                    p = q.one()
-                except NoResultFound:
-                    # 対象 favorite_id が見つからなかった場合 INSERT はしない
-                    pass
-                    result.append(0)
                 else:
+                    entry = index.get_by_favorite_id(session, r.account, r.favorite_id)
+                    if entry is None:
+                        # 対象 favorite_id が見つからなかった場合 INSERT はしない
+                        result.append(0)
+                        continue
                     # UPDATE
-                    if p.release_status != r.release_status:
-                        p.favorite_id = r.favorite_id
-                        p.favorite_group = r.favorite_group
-                        p.is_favorited = r.is_favorited
-                        p.release_status = r.release_status
-                        p.registered_at = r.registered_at
-                        msg = f"release_status from '{p.release_status}' to '{r.release_status}'"
-                        logger.info(f"Change {msg}, World: {p.world_name}")
+                    if entry.release_status != r.release_status:
+                        update_dict[entry.row_id] = update_dict.get(entry.row_id, {}) | {
+                            column: getattr(r, column) for column in STATUS_UPDATE_COLUMN_LIST
+                        }
+                        new_entry = replace(
+                            entry,
+                            favorite_id=r.favorite_id,
+                            is_favorited=bool(r.is_favorited),
+                            release_status=r.release_status,
+                        )
+                        index.stage(session, [new_entry])
+                        rehash_entry_dict[entry.row_id] = new_entry
+                        msg = f"release_status from '{entry.release_status}' to '{r.release_status}'"
+                        logger.info(f"Change {msg}, World: {entry.world_id}")
                     result.append(1)
 
-        session.commit()
-        session.close()
+            if insert_dict:
+                # アーカイブ済みのワールドが再びお気に入りに登録された場合は、新しい行に置き換える
+                self._delete_archived(session, list(insert_dict.keys()))
+                session.add_all(insert_dict.values())
+                session.flush()
+                index.stage(
+                    session,
+                    [
+                        IndexEntry(
+                            r.account,
+                            r.id,
+                            r.world_id,
+                            r.favorite_id,
+                            content_hash(r),
+                            bool(r.is_favorited),
+                            r.release_status,
+                        )
+                        for r in insert_dict.values()
+                    ],
+                )
+            if self.record_changes:
+                self._add_upsert_events(session, insert_dict.values(), update_dict)
+            self._bulk_update(session, update_dict)
+            if rehash_entry_dict:
+                self._rehash(session, rehash_entry_dict)
         return result
+
+    def _delete_archived(self, session: Session, key_list: list[tuple[str, str]]) -> None:
+        """(account, world_id) がいずれかに一致するアーカイブ済みの行を削除する"""
+        archive_table = FavoriteWorldArchive.__table__
+        for i in range(0, len(key_list), _IN_CHUNK_SIZE):
+            session.execute(
+                delete(archive_table).where(
+                    tuple_(archive_table.c.account, archive_table.c.world_id).in_(key_list[i : i + _IN_CHUNK_SIZE])
+                )
+            )
+
+    def archive_unfavorited(self, max_age: timedelta, batch_size: int = 500, now: datetime | None = None) -> int:
+        """お気に入りから外れて max_age 以上経ったレコードを FavoriteWorldArchive に移す
+
+        batch_size 件ずつ別々のトランザクションで移すため、書き込みのロックを長く保持しない
+        移したレコードは iter_rows, iter_chunks に include_archived=True を渡すと読み出せる
+        移したワールドが再びお気に入りに登録された場合は、upsert で FavoriteWorld に新しい行として追加し
+        アーカイブ済みの行は削除する
+
+        Args:
+            max_age (timedelta): お気に入りから外れてからアーカイブするまでの期間
+            batch_size (int): 1トランザクションで移すレコード数
+            now (datetime | None): 期間の基準とする日時、None の場合は現在日時
+
+        Returns:
+            int: 移したレコード数
+        """
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive.")
+        now = now or datetime.now()
+        threshold = (now - max_age).isoformat()
+        archive_table = FavoriteWorldArchive.__table__
+        table_columns = FavoriteWorld.__table__.columns
+        archived_num = 0
+        while True:
+            with self.session_scope() as session:
+                index = self.get_index(session)
+                row_list = session.execute(
+                    select(FavoriteWorld.id, FavoriteWorld.account, FavoriteWorld.world_id, FavoriteWorld.favorite_id)
+                    .where(~FavoriteWorld.is_favorited, FavoriteWorld.unfavorited_at < threshold)
+                    .order_by(FavoriteWorld.id)
+                    .limit(batch_size)
+                ).all()
+                if not row_list:
+                    break
+                row_id_list = [row.id for row in row_list]
+                session.execute(
+                    insert(archive_table).from_select(
+                        [*ARCHIVE_COLUMN_LIST, "archived_at"],
+                        select(
+                            *[table_columns[column] for column in ARCHIVE_COLUMN_LIST], literal(now.isoformat())
+                        ).where(FavoriteWorld.id.in_(row_id_list)),
+                    )
+                )
+                # 全文検索の索引はトリガで削除される
+                session.execute(delete(FavoriteWorld).where(FavoriteWorld.id.in_(row_id_list)))
+            index.remove(
+                IndexEntry(row.account, row.id, row.world_id, row.favorite_id, 0, False, "") for row in row_list
+            )
+            archived_num += len(row_list)
+        if archived_num:
+            logger.info(f"Archived {archived_num} worlds unfavorited before {threshold}.")
+            if self.index_path is not None and self.checkpoint():
+                self._save_index(self.index)
+        return archived_num
+
+    def _bulk_update(self, session: Session, update_dict: dict[int, dict]) -> None:
+        """行 id ごとの UPDATE 内容を、更新する列の組み合わせごとにまとめて発行する"""
+        group_dict: dict[tuple[str, ...], list[dict]] = {}
+        for row_id, value_dict in update_dict.items():
+            group_dict.setdefault(tuple(sorted(value_dict)), []).append({"id": row_id} | value_dict)
+        for mapping_list in group_dict.values():
+            session.execute(update(FavoriteWorld), mapping_list)
+
+    def _rehash(self, session: Session, entry_dict: dict[int, IndexEntry]) -> None:
+        """一部の列のみ更新した行の内容のハッシュ値を DB から計算し直す"""
+        table_columns = FavoriteWorld.__table__.columns
+        statement = select(*[table_columns[column] for column in ["id", *HASH_COLUMN_LIST]]).where(
+            FavoriteWorld.id.in_(entry_dict.keys())
+        )
+        self.get_index(session).stage(
+            session,
+            [
+                replace(entry_dict[row["id"]], content_hash=content_hash(row))
+                for row in session.execute(statement).mappings()
+            ],
+        )
+
+    def _add_change_event(self, session: Session, event_type: str, key_dict: dict, changes: dict) -> None:
+        session.add(
+            ChangeEvent(
+                crawl_id=session.info.get(CRAWL_ID_KEY),
+                event_type=event_type,
+                changes=orjson.dumps(changes).decode(),
+                created_at=datetime.now().isoformat(),
+                **{column: key_dict[column] for column in EVENT_KEY_COLUMN_LIST},
+            )
+        )
+
+    def _add_upsert_events(
+        self, session: Session, inserted_list: Iterable[FavoriteWorld], update_dict: dict[int, dict]
+    ) -> None:
+        """upsert で追加・更新するレコードの ChangeEvent を追加する、UPDATE の前に呼ぶこと
+
+        更新前の値は、実際に書き換える行のみを DB から読み出して比較する
+        """
+        for r in inserted_list:
+            self._add_change_event(session, "added", r.to_dict(), {})
+
+        table_columns = FavoriteWorld.__table__.columns
+        column_set = {"id", *EVENT_KEY_COLUMN_LIST, *UPDATE_COLUMN_LIST, *STATUS_UPDATE_COLUMN_LIST}
+        row_id_list = list(update_dict)
+        for i in range(0, len(row_id_list), _IN_CHUNK_SIZE):
+            statement = select(*[table_columns[column] for column in column_set]).where(
+                FavoriteWorld.id.in_(row_id_list[i : i + _IN_CHUNK_SIZE])
+            )
+            for old in session.execute(statement).mappings():
+                new = update_dict[old["id"]]
+                # unfavorited_at は is_favorited の変更に伴って書き換わるのみのため、変更内容に含めない
+                changes = {
+                    column: [old[column], value]
+                    for column, value in new.items()
+                    if old[column] != value and column != "unfavorited_at"
+                }
+                if not changes:
+                    continue
+                if "is_favorited" in changes and new["is_favorited"]:
+                    # お気に入りから外れていたワールドが再び登録された
+                    event_type = "added"
+                elif "release_status" in changes:
+                    event_type = "status_changed"
+                else:
+                    event_type = "updated"
+                self._add_change_event(session, event_type, {**old, **new}, changes)
+
+    def _add_removed_events(self, session: Session, account: str, favorite_id_list: list[str] | None = None) -> None:
+        """お気に入りから外れるレコードの ChangeEvent を追加する、UPDATE の前に呼ぶこと
+
+        favorite_id_list が None の場合は、アカウントのお気に入り中の全レコードを対象とする
+        """
+        table_columns = FavoriteWorld.__table__.columns
+        statement = select(*[table_columns[column] for column in EVENT_KEY_COLUMN_LIST]).where(
+            FavoriteWorld.account == account, FavoriteWorld.is_favorited
+        )
+        if favorite_id_list is not None:
+            statement = statement.where(FavoriteWorld.favorite_id.in_(favorite_id_list))
+        for row in session.execute(statement).mappings():
+            self._add_change_event(session, "removed", row, {"is_favorited": [True, False]})
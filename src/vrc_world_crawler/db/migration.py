@@ -0,0 +1,118 @@
+from collections.abc import Callable
+from datetime import datetime
+from logging import INFO, getLogger
+
+from sqlalchemy import Connection, Engine, inspect
+
+from vrc_world_crawler.db.model import DEFAULT_ACCOUNT_NAME, FavoriteWorld
+from vrc_world_crawler.db.search_index import create_search_index, has_search_index
+from vrc_world_crawler.db.summary_table import create_summary_tables, has_summary_tables
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+def _add_account_column(connection: Connection) -> None:
+    """FavoriteWorld に account 列を追加する
+
+    一意制約を world_id 単独から (account, world_id) に変更する必要があり
+    SQLite では制約を ALTER TABLE で変更できないため、テーブルを作り直して既存レコードを移し替える
+    既存レコードはすべて既定のアカウントのものとする
+    """
+    column_list = [column["name"] for column in inspect(connection).get_columns(FavoriteWorld.__tablename__)]
+    if "account" in column_list:
+        return
+
+    logger.info("Migration: add account column to FavoriteWorld.")
+    old_table_name = f"{FavoriteWorld.__tablename__}_old"
+    columns = ", ".join(f'"{column}"' for column in column_list)
+    connection.exec_driver_sql(f'ALTER TABLE "{FavoriteWorld.__tablename__}" RENAME TO "{old_table_name}"')
+    FavoriteWorld.__table__.create(connection)
+    connection.exec_driver_sql(
+        f'INSERT INTO "{FavoriteWorld.__tablename__}" ({columns}, "account") '
+        f'SELECT {columns}, ? FROM "{old_table_name}"',
+        (DEFAULT_ACCOUNT_NAME,),
+    )
+    connection.exec_driver_sql(f'DROP TABLE "{old_table_name}"')
+
+
+def _add_search_index(connection: Connection) -> None:
+    """FavoriteWorld の全文検索テーブルを追加し、既存レコードから索引を作る"""
+    if has_search_index(connection):
+        return
+
+    logger.info("Migration: add full-text search index to FavoriteWorld.")
+    create_search_index(connection)
+
+
+def _add_unfavorited_at_column(connection: Connection) -> None:
+    """FavoriteWorld に unfavorited_at 列を追加する
+
+    既にお気に入りから外れているレコードは外れた日時が分からないため、マイグレーションの日時を入れる
+    アーカイブの対象となるまでの期間は、マイグレーションの日時から数える
+    """
+    column_list = [column["name"] for column in inspect(connection).get_columns(FavoriteWorld.__tablename__)]
+    if "unfavorited_at" not in column_list:
+        logger.info("Migration: add unfavorited_at column to FavoriteWorld.")
+        connection.exec_driver_sql(
+            f'ALTER TABLE "{FavoriteWorld.__tablename__}" ADD COLUMN "unfavorited_at" VARCHAR(256)'
+        )
+    connection.exec_driver_sql(
+        f'UPDATE "{FavoriteWorld.__tablename__}" SET "unfavorited_at" = ? '
+        'WHERE NOT "is_favorited" AND "unfavorited_at" IS NULL',
+        (datetime.now().isoformat(),),
+    )
+
+
+def _add_summary_tables(connection: Connection) -> None:
+    """グループ・作者ごとの集計テーブルを追加し、既存レコードから集計する"""
+    if has_summary_tables(connection):
+        return
+
+    logger.info("Migration: add GroupSummary and AuthorSummary tables.")
+    create_summary_tables(connection)
+
+
+# 適用順に並べたマイグレーションのリスト
+# 各マイグレーションは適用済かどうかを自身で判定し、何度実行しても結果が変わらないようにする
+MIGRATION_LIST: list[Callable[[Connection], None]] = [
+    _add_account_column,
+    _add_search_index,
+    _add_unfavorited_at_column,
+    _add_summary_tables,
+]
+
+# DB のスキーマバージョン、PRAGMA user_version に保存する
+# モデル定義(テーブル・列の追加を含む)やマイグレーションを変更したら1つ上げる
+SCHEMA_VERSION = 6
+
+
+def is_schema_current(engine: Engine) -> bool:
+    """DB のスキーマが現在のモデル定義に一致しているかを返す
+
+    一致している場合は create_all とマイグレーションを省略できる
+
+    Args:
+        engine (Engine): 対象 DB のエンジン
+
+    Returns:
+        bool: DB のスキーマバージョンが SCHEMA_VERSION 以上なら True
+    """
+    with engine.connect() as connection:
+        schema_version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+    return schema_version >= SCHEMA_VERSION
+
+
+def migrate(engine: Engine) -> None:
+    """既存の DB を現在のモデル定義に合わせる
+
+    create_all は既存テーブルの変更を行わないため、列の追加や制約の変更はここで行う
+    すべてのマイグレーションは1トランザクションで適用し、最後にスキーマバージョンを更新する
+
+    Args:
+        engine (Engine): 対象 DB のエンジン
+    """
+    with engine.begin() as connection:
+        for migration in MIGRATION_LIST:
+            migration(connection)
+        connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
@@ -1,18 +1,24 @@
 from typing import Self
 
-from sqlalchemy import Boolean, Column, Integer, String, create_engine
+import orjson
+from sqlalchemy import Boolean, Column, Index, Integer, String, Table, UniqueConstraint, create_engine
 from sqlalchemy.orm import Session, declarative_base
 
 Base = declarative_base()
 
+# アカウントを指定しなかった場合のアカウント名
+DEFAULT_ACCOUNT_NAME = "default"
+
 
 class FavoriteWorld(Base):
     """FavoriteWorldモデル"""
 
     __tablename__ = "FavoriteWorld"
+    __table_args__ = (UniqueConstraint("account", "world_id"),)
 
     id = Column(Integer, primary_key=True)
-    world_id = Column(String(256), nullable=False, unique=True)
+    account = Column(String(256), nullable=False, default=DEFAULT_ACCOUNT_NAME, server_default=DEFAULT_ACCOUNT_NAME)
+    world_id = Column(String(256), nullable=False)
     world_name = Column(String(256), nullable=False)
     world_url = Column(String(512), nullable=False)
     description = Column(String(512))
@@ -33,6 +39,8 @@ class FavoriteWorld(Base):
     created_at = Column(String(256), nullable=False)
     updated_at = Column(String(256), nullable=False)
     registered_at = Column(String(256), nullable=False)
+    # お気に入りから外れた日時、お気に入り状態の間は None
+    unfavorited_at = Column(String(256))
 
     def __init__(
         self,
@@ -57,8 +65,10 @@ class FavoriteWorld(Base):
         created_at: str,
         updated_at: str,
         registered_at: str,
+        account: str = DEFAULT_ACCOUNT_NAME,
     ) -> None:
         # self.id = id
+        self.account = account
         self.world_id = world_id
         self.world_name = world_name
         self.world_url = world_url
@@ -129,6 +139,7 @@ class FavoriteWorld(Base):
                     created_at,
                     updated_at,
                     registered_at,
+                    args_dict.get("account", DEFAULT_ACCOUNT_NAME),
                 )
             case _:
                 raise ValueError("Unmatch args_dict.")
@@ -137,10 +148,11 @@ class FavoriteWorld(Base):
         return f"<FavoriteWorld(world_id='{self.world_id}')>"
 
     def __eq__(self, other: Self) -> bool:
-        return isinstance(other, FavoriteWorld) and other.world_id == self.world_id
+        return isinstance(other, FavoriteWorld) and other.world_id == self.world_id and other.account == self.account
 
     def to_dict(self) -> dict:
         return {
+            "account": self.account,
             "world_id": self.world_id,
             "world_name": self.world_name,
             "world_url": self.world_url,
@@ -165,6 +177,189 @@ class FavoriteWorld(Base):
         }
 
 
+class FavoriteWorldArchive(Base):
+    """FavoriteWorldArchiveモデル
+
+    お気に入りから外れて一定期間が経った FavoriteWorld の移動先
+    列は FavoriteWorld と同じで、移動した日時 archived_at を加える
+    id は FavoriteWorld での行 id のまま残し、archive_id を主キーとする
+    全文検索の索引と (account, world_id) の一意制約を持たないため、FavoriteWorld よりも1行あたりの容量が小さい
+    FavoriteWorld に列を追加する場合は、このテーブルにも列を追加するマイグレーションが必要となる
+    """
+
+    __table__ = Table(
+        "FavoriteWorldArchive",
+        Base.metadata,
+        Column("archive_id", Integer, primary_key=True),
+        *[Column(column.name, column.type, nullable=column.nullable) for column in FavoriteWorld.__table__.columns],
+        Column("archived_at", String(256), nullable=False),
+        Index("ix_FavoriteWorldArchive_account_world_id", "account", "world_id"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<FavoriteWorldArchive(world_id='{self.world_id}')>"
+
+
+class GroupSummary(Base):
+    """GroupSummaryモデル
+
+    (account, favorite_group) ごとの FavoriteWorld の件数と star, visit の合計
+    FavoriteWorld への書き込みに合わせてトリガで増減させるため、集計のために FavoriteWorld を全件走査しない
+    アーカイブ済みのレコードは含めず、件数が0になった行は削除する
+    """
+
+    __tablename__ = "GroupSummary"
+
+    account = Column(String(256), primary_key=True)
+    favorite_group = Column(String(256), primary_key=True)
+    world_num = Column(Integer, nullable=False)
+    favorited_num = Column(Integer, nullable=False)
+    star_total = Column(Integer, nullable=False)
+    visit_total = Column(Integer, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<GroupSummary(account='{self.account}', favorite_group='{self.favorite_group}')>"
+
+
+class AuthorSummary(Base):
+    """AuthorSummaryモデル
+
+    (account, author_id) ごとの FavoriteWorld の件数と star, visit の合計
+    author_name は最後に書き込まれたレコードの値とする
+    GroupSummary と同じくトリガで増減させる
+    """
+
+    __tablename__ = "AuthorSummary"
+
+    account = Column(String(256), primary_key=True)
+    author_id = Column(String(256), primary_key=True)
+    author_name = Column(String(256), nullable=False)
+    world_num = Column(Integer, nullable=False)
+    favorited_num = Column(Integer, nullable=False)
+    star_total = Column(Integer, nullable=False)
+    visit_total = Column(Integer, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<AuthorSummary(account='{self.account}', author_id='{self.author_id}')>"
+
+
+class WorldDetail(Base):
+    """WorldDetailモデル
+
+    ワールド詳細 API (/api/1/worlds/{id}) の結果のうち、お気に入り一覧の API に含まれない項目を保持する
+    アカウントに依らないため world_id ごとに1レコードとする
+    version, updated_at は取得時点の FavoriteWorld の値で、これらが変わったワールドのみ再取得する
+    """
+
+    __tablename__ = "WorldDetail"
+
+    world_id = Column(String(256), primary_key=True)
+    capacity = Column(Integer)
+    recommended_capacity = Column(Integer)
+    heat = Column(Integer)
+    popularity = Column(Integer)
+    occupants = Column(Integer)
+    favorites = Column(Integer)
+    # JSON 配列の文字列
+    tags = Column(String, nullable=False)
+    platforms = Column(String, nullable=False)
+    version = Column(Integer, nullable=False)
+    updated_at = Column(String(256), nullable=False)
+    fetched_at = Column(String(256), nullable=False)
+
+    @classmethod
+    def create(cls, detail_dict: dict, version: int, updated_at: str, fetched_at: str) -> Self:
+        """ワールド詳細 API のレスポンスから作成する
+
+        Args:
+            detail_dict (dict): ワールド詳細 API のレスポンス
+            version (int): 取得時点の FavoriteWorld の version
+            updated_at (str): 取得時点の FavoriteWorld の updated_at
+            fetched_at (str): 取得日時
+
+        Returns:
+            WorldDetail: 作成したレコード
+
+        Raises:
+            ValueError: レスポンスに id が含まれない場合
+        """
+        match detail_dict:
+            case {"id": str(world_id)}:
+                platform_list = sorted({
+                    package["platform"] for package in detail_dict.get("unityPackages", []) if "platform" in package
+                })
+                return cls(
+                    world_id=world_id,
+                    capacity=detail_dict.get("capacity"),
+                    recommended_capacity=detail_dict.get("recommendedCapacity"),
+                    heat=detail_dict.get("heat"),
+                    popularity=detail_dict.get("popularity"),
+                    occupants=detail_dict.get("occupants"),
+                    favorites=detail_dict.get("favorites"),
+                    tags=orjson.dumps(detail_dict.get("tags", [])).decode(),
+                    platforms=orjson.dumps(platform_list).decode(),
+                    version=version,
+                    updated_at=updated_at,
+                    fetched_at=fetched_at,
+                )
+            case _:
+                raise ValueError("Unmatch detail_dict.")
+
+    def __repr__(self) -> str:
+        return f"<WorldDetail(world_id='{self.world_id}')>"
+
+    def to_dict(self) -> dict:
+        return {column.name: getattr(self, column.name) for column in self.__table__.columns}
+
+
+class ChangeEvent(Base):
+    """ChangeEventモデル
+
+    クロールで検出した FavoriteWorld の変更を1件ずつ追記する変更フィード
+    id は単調増加し再利用されないため、利用者は最後に読んだ id をカーソルとして差分のみを読み出せる
+    """
+
+    __tablename__ = "ChangeEvent"
+    # 削除後も id を再利用させず、カーソルより前に新しいイベントが挿入されないようにする
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    crawl_id = Column(String(256))
+    # added, removed, updated, status_changed のいずれか
+    event_type = Column(String(32), nullable=False)
+    account = Column(String(256), nullable=False)
+    world_id = Column(String(256), nullable=False)
+    favorite_id = Column(String(256), nullable=False)
+    favorite_group = Column(String(256), nullable=False)
+    # 変更のあった列の {列名: [変更前, 変更後]} の JSON 文字列
+    changes = Column(String, nullable=False)
+    created_at = Column(String(256), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<ChangeEvent(id={self.id}, event_type='{self.event_type}', world_id='{self.world_id}')>"
+
+    def to_dict(self) -> dict:
+        return {column.name: getattr(self, column.name) for column in self.__table__.columns} | {
+            "changes": orjson.loads(self.changes)
+        }
+
+
+class ChangeFeedCursor(Base):
+    """ChangeFeedCursorモデル
+
+    変更フィードの利用者ごとに、最後に処理し終えた ChangeEvent の id を保持する
+    """
+
+    __tablename__ = "ChangeFeedCursor"
+
+    consumer = Column(String(256), primary_key=True)
+    last_id = Column(Integer, nullable=False)
+    updated_at = Column(String(256), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<ChangeFeedCursor(consumer='{self.consumer}', last_id={self.last_id})>"
+
+
 if __name__ == "__main__":
     engine = create_engine(f"sqlite:///:memory:", echo=True)
     Base.metadata.create_all(engine)
@@ -0,0 +1,135 @@
+from sqlalchemy import ColumnElement, Connection, Select, func, literal_column, or_, select, table
+
+from vrc_world_crawler.db.model import FavoriteWorld
+
+# FavoriteWorld の world_name, author_name, description を全文検索する FTS5 仮想テーブル
+#
+# 外部コンテンツテーブルとして FavoriteWorld を参照し、文字列自体は重複して保存しない
+# 日本語は空白で単語が区切られないため trigram トークナイザで3文字ずつに分割し、部分一致で検索する
+# FavoriteWorld への INSERT / UPDATE / DELETE はトリガで反映するため、upsert など書き込み側の変更は不要
+SEARCH_TABLE_NAME = "FavoriteWorldSearch"
+SEARCH_COLUMN_LIST = ["world_name", "author_name", "description"]
+
+# 検索順位の計算で使う列ごとの重み、world_name の一致を最も重視する
+SEARCH_WEIGHT_LIST = [10.0, 5.0, 1.0]
+
+# trigram トークナイザで MATCH に使える語の最小文字数
+MIN_MATCH_LENGTH = 3
+
+_COLUMNS = ", ".join(SEARCH_COLUMN_LIST)
+_NEW_COLUMNS = ", ".join(f"new.{column}" for column in SEARCH_COLUMN_LIST)
+_OLD_COLUMNS = ", ".join(f"old.{column}" for column in SEARCH_COLUMN_LIST)
+_DELETE_COLUMNS = f"{SEARCH_TABLE_NAME}, rowid, {_COLUMNS}"
+_DELETE_OLD = f"INSERT INTO {SEARCH_TABLE_NAME}({_DELETE_COLUMNS}) VALUES ('delete', old.id, {_OLD_COLUMNS});"
+_INSERT_NEW = f"INSERT INTO {SEARCH_TABLE_NAME}(rowid, {_COLUMNS}) VALUES (new.id, {_NEW_COLUMNS});"
+_CHANGED = " OR ".join(f"old.{column} IS NOT new.{column}" for column in SEARCH_COLUMN_LIST)
+
+SEARCH_DDL_LIST = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE_NAME} USING fts5("
+    f"{_COLUMNS}, content='{FavoriteWorld.__tablename__}', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE_NAME}_insert AFTER INSERT ON {FavoriteWorld.__tablename__} "
+    f"BEGIN {_INSERT_NEW} END",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE_NAME}_delete AFTER DELETE ON {FavoriteWorld.__tablename__} "
+    f"BEGIN {_DELETE_OLD} END",
+    # is_favorited など検索対象外の列のみの更新では索引を書き換えない
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE_NAME}_update AFTER UPDATE OF {_COLUMNS} "
+    f"ON {FavoriteWorld.__tablename__} WHEN {_CHANGED} BEGIN {_DELETE_OLD} {_INSERT_NEW} END",
+]
+
+search_table = table(SEARCH_TABLE_NAME)
+
+
+def has_search_index(connection: Connection) -> bool:
+    """全文検索テーブルが作成済みかを返す"""
+    statement = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+    return connection.exec_driver_sql(statement, (SEARCH_TABLE_NAME,)).first() is not None
+
+
+def create_search_index(connection: Connection) -> None:
+    """全文検索テーブルと同期用のトリガを作成する、作成済みの場合は何もしない
+
+    作成時は既存の FavoriteWorld のレコードから索引を作る
+
+    Args:
+        connection (Connection): 対象 DB のコネクション
+    """
+    if has_search_index(connection):
+        return
+    for ddl in SEARCH_DDL_LIST:
+        connection.exec_driver_sql(ddl)
+    rebuild_search_index(connection)
+
+
+def rebuild_search_index(connection: Connection) -> None:
+    """FavoriteWorld の全レコードから全文検索の索引を作り直す
+
+    トリガを経由せずに FavoriteWorld を書き換えた場合など、索引が一致しなくなったときに使う
+
+    Args:
+        connection (Connection): 対象 DB のコネクション
+    """
+    connection.exec_driver_sql(f"INSERT INTO {SEARCH_TABLE_NAME}({SEARCH_TABLE_NAME}) VALUES ('rebuild')")
+    connection.exec_driver_sql(f"INSERT INTO {SEARCH_TABLE_NAME}({SEARCH_TABLE_NAME}) VALUES ('optimize')")
+
+
+def _quote(term: str) -> str:
+    """FTS5 のクエリ構文として解釈されないよう、語を文字列リテラルにする"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_statement(
+    query: str,
+    limit: int,
+    clause_list: list[ColumnElement[bool]] | None = None,
+    snippet_length: int = 16,
+) -> Select:
+    """全文検索の select 文を作成する
+
+    空白で区切った語をすべて含むレコードを、world_name, author_name, description のいずれかから探す
+    MIN_MATCH_LENGTH 文字以上の語は全文検索の索引を使い、それより短い語は LIKE で絞り込む
+    索引を使う語が無い場合は順位と抜粋を計算できないため、rank, snippet は None となり id 順に並ぶ
+
+    Args:
+        query (str): 検索語
+        limit (int): 最大件数
+        clause_list (list[ColumnElement[bool]] | None): FavoriteWorld に対する追加の条件
+        snippet_length (int): 抜粋の最大トークン数
+
+    Returns:
+        Select: 順位の高い順の select 文
+                列は id, account, world_id, world_name, author_name, rank, snippet
+    """
+    term_list = query.split()
+    if not term_list:
+        raise ValueError("query must not be empty.")
+    match_term_list = [term for term in term_list if len(term) >= MIN_MATCH_LENGTH]
+    like_term_list = [term for term in term_list if len(term) < MIN_MATCH_LENGTH]
+
+    column_list = [
+        FavoriteWorld.id,
+        FavoriteWorld.account,
+        FavoriteWorld.world_id,
+        FavoriteWorld.world_name,
+        FavoriteWorld.author_name,
+    ]
+    if match_term_list:
+        search_column = literal_column(SEARCH_TABLE_NAME)
+        rank = func.bm25(search_column, *SEARCH_WEIGHT_LIST)
+        snippet = func.snippet(search_column, -1, "[", "]", "…", snippet_length)
+        statement = (
+            select(*column_list, rank.label("rank"), snippet.label("snippet"))
+            .select_from(search_table)
+            .join(FavoriteWorld, FavoriteWorld.id == literal_column(f"{SEARCH_TABLE_NAME}.rowid"))
+            .where(search_column.op("MATCH")(" ".join(_quote(term) for term in match_term_list)))
+            .order_by(rank, FavoriteWorld.id)
+        )
+    else:
+        statement = select(*column_list, literal_column("NULL").label("rank"), literal_column("NULL").label("snippet"))
+        statement = statement.order_by(FavoriteWorld.id)
+    for term in like_term_list:
+        statement = statement.where(
+            or_(*[FavoriteWorld.__table__.columns[c].contains(term, autoescape=True) for c in SEARCH_COLUMN_LIST])
+        )
+    if clause_list:
+        statement = statement.where(*clause_list)
+    return statement.limit(limit)
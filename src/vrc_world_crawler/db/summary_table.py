@@ -0,0 +1,185 @@
+from sqlalchemy import Connection, Table
+
+from vrc_world_crawler.db.model import AuthorSummary, FavoriteWorld, GroupSummary
+
+# FavoriteWorld の件数と star, visit の合計を、グループ・作者ごとに保持する集計テーブル
+#
+# FavoriteWorld への INSERT / UPDATE / DELETE をトリガで反映し、変更前後の行の値の差分だけ集計値を増減させる
+# upsert, clear_favorited, unfavorite, archive_unfavorited など書き込み側は集計テーブルを意識しなくてよい
+# 集計はテーブルの行数(グループ数・作者数)に比例する時間で済み、FavoriteWorld の行数に依らない
+#
+# 書き込み側で差分を計算しないのは、UPDATE の差分に変更前の star, visit, グループ, 作者が必要だが
+# WorldIndex はそれらを持たず、upsert で変更前の行を読み直すことになるため
+# トリガは SQLite 内で変更前後の行を参照でき、追加の読み込みが要らない
+# 1行あたりの書き込みの増加は 5,000 行で計測して INSERT が約 3us(約 100us 中)、UPDATE が約 4us(約 45us 中)
+# is_favorited のみの更新が約 1.5us(約 6us 中)
+SUMMARY_TABLE_LIST: list[Table] = [GroupSummary.__table__, AuthorSummary.__table__]
+
+# 集計値の列から、FavoriteWorld の1行が加える値を引く辞書、{row} は new または old に置き換える
+AGGREGATE_COLUMN_DICT = {
+    "world_num": "1",
+    "favorited_num": "{row}.is_favorited",
+    "star_total": "{row}.star",
+    "visit_total": "{row}.visit",
+}
+
+# 集計テーブルごとに作成するトリガの名前の接尾辞
+TRIGGER_EVENT_LIST = ["insert", "delete", "update", "move"]
+
+_SOURCE = f'"{FavoriteWorld.__tablename__}"'
+
+
+def _key_column_list(table: Table) -> list[str]:
+    return [column.name for column in table.primary_key.columns]
+
+
+def _label_column_list(table: Table) -> list[str]:
+    """キーでも集計値でもない列、最後に書き込まれたレコードの値を持つ"""
+    key_column_list = _key_column_list(table)
+    return [
+        column.name
+        for column in table.columns
+        if column.name not in key_column_list and column.name not in AGGREGATE_COLUMN_DICT
+    ]
+
+
+def _add_row_sql(table: Table) -> str:
+    """new の行の値を集計値に加える SQL"""
+    key_column_list = _key_column_list(table)
+    column_list = [*key_column_list, *_label_column_list(table)]
+    value_list = [f"new.{column}" for column in column_list]
+    value_list += [value.format(row="new") for value in AGGREGATE_COLUMN_DICT.values()]
+    set_list = [f"{column} = excluded.{column}" for column in _label_column_list(table)]
+    set_list += [f"{column} = {column} + excluded.{column}" for column in AGGREGATE_COLUMN_DICT]
+    return (
+        f'INSERT INTO "{table.name}" ({", ".join([*column_list, *AGGREGATE_COLUMN_DICT])}) '
+        f"VALUES ({', '.join(value_list)}) "
+        f"ON CONFLICT ({', '.join(key_column_list)}) DO UPDATE SET {', '.join(set_list)};"
+    )
+
+
+def _subtract_row_sql(table: Table) -> str:
+    """old の行の値を集計値から引き、件数が0になった行を削除する SQL"""
+    where = " AND ".join(f"{column} = old.{column}" for column in _key_column_list(table))
+    set_list = [f"{column} = {column} - {value.format(row='old')}" for column, value in AGGREGATE_COLUMN_DICT.items()]
+    return (
+        f'UPDATE "{table.name}" SET {", ".join(set_list)} WHERE {where}; '
+        f'DELETE FROM "{table.name}" WHERE {where} AND world_num = 0;'
+    )
+
+
+def _update_row_sql(table: Table) -> str:
+    """キーが変わらない行の更新で、変更前後の値の差を集計値に加える SQL"""
+    where = " AND ".join(f"{column} = new.{column}" for column in _key_column_list(table))
+    set_list = [f"{column} = new.{column}" for column in _label_column_list(table)]
+    set_list += [
+        f"{column} = {column} + {value.format(row='new')} - {value.format(row='old')}"
+        for column, value in AGGREGATE_COLUMN_DICT.items()
+        if value != "1"
+    ]
+    return f'UPDATE "{table.name}" SET {", ".join(set_list)} WHERE {where};'
+
+
+def _trigger_ddl_list(table: Table) -> list[str]:
+    # 集計に関わらない列のみの更新では集計テーブルを書き換えない
+    key_column_list = _key_column_list(table)
+    watch_column_list = [*key_column_list, *_label_column_list(table), "is_favorited", "star", "visit"]
+    changed = " OR ".join(f"old.{column} IS NOT new.{column}" for column in watch_column_list)
+    same_key = " AND ".join(f"old.{column} IS new.{column}" for column in key_column_list)
+    update_of = f"AFTER UPDATE OF {', '.join(watch_column_list)} ON {_SOURCE}"
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS "{table.name}_insert" AFTER INSERT ON {_SOURCE} '
+        f"BEGIN {_add_row_sql(table)} END",
+        f'CREATE TRIGGER IF NOT EXISTS "{table.name}_delete" AFTER DELETE ON {_SOURCE} '
+        f"BEGIN {_subtract_row_sql(table)} END",
+        # お気に入り状態や star, visit のみの更新は、1つの UPDATE で差分を加える
+        f'CREATE TRIGGER IF NOT EXISTS "{table.name}_update" {update_of} WHEN ({same_key}) AND ({changed}) '
+        f"BEGIN {_update_row_sql(table)} END",
+        # グループや作者が変わった場合は、変更前のキーから引いて変更後のキーに加える
+        f'CREATE TRIGGER IF NOT EXISTS "{table.name}_move" {update_of} WHEN NOT ({same_key}) '
+        f"BEGIN {_subtract_row_sql(table)} {_add_row_sql(table)} END",
+    ]
+
+
+def _aggregate_sql(table: Table) -> str:
+    """FavoriteWorld を全件走査して集計値を計算する SQL
+
+    SQLite では max(id) と同じ select の集計していない列は id が最大の行の値になるため
+    ラベルの列は最後に追加されたレコードの値となる
+    """
+    key_column_list = _key_column_list(table)
+    aggregate_list = [
+        f"count(*) AS {column}" if value == "1" else f"sum({value.format(row=_SOURCE)}) AS {column}"
+        for column, value in AGGREGATE_COLUMN_DICT.items()
+    ]
+    column_list = [*key_column_list, *_label_column_list(table)]
+    return (
+        f"SELECT {', '.join(column_list)}, {', '.join(aggregate_list)}, max(id) AS max_id FROM {_SOURCE} "
+        f"GROUP BY {', '.join(key_column_list)}"
+    )
+
+
+def has_summary_tables(connection: Connection) -> bool:
+    """集計テーブルの同期用のトリガが作成済みかを返す"""
+    name_list = [f"{table.name}_{event}" for table in SUMMARY_TABLE_LIST for event in TRIGGER_EVENT_LIST]
+    statement = "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN ({})".format(
+        ", ".join("?" * len(name_list))
+    )
+    return connection.exec_driver_sql(statement, tuple(name_list)).scalar() == len(name_list)
+
+
+def create_summary_tables(connection: Connection) -> None:
+    """集計テーブルと同期用のトリガを作成する、作成済みの場合は何もしない
+
+    作成時は既存の FavoriteWorld のレコードから集計する
+
+    Args:
+        connection (Connection): 対象 DB のコネクション
+    """
+    if has_summary_tables(connection):
+        return
+    for table in SUMMARY_TABLE_LIST:
+        table.create(connection, checkfirst=True)
+        for ddl in _trigger_ddl_list(table):
+            connection.exec_driver_sql(ddl)
+    rebuild_summary_tables(connection)
+
+
+def rebuild_summary_tables(connection: Connection) -> None:
+    """FavoriteWorld の全レコードから集計テーブルを作り直す
+
+    トリガを経由せずに集計テーブルを書き換えた場合など、集計値が一致しなくなったときに使う
+
+    Args:
+        connection (Connection): 対象 DB のコネクション
+    """
+    for table in SUMMARY_TABLE_LIST:
+        column_list = [*_key_column_list(table), *_label_column_list(table), *AGGREGATE_COLUMN_DICT]
+        connection.exec_driver_sql(f'DELETE FROM "{table.name}"')
+        connection.exec_driver_sql(
+            f'INSERT INTO "{table.name}" ({", ".join(column_list)}) '
+            f"SELECT {', '.join(column_list)} FROM ({_aggregate_sql(table)})"
+        )
+
+
+def check_summary_tables(connection: Connection) -> dict[str, int]:
+    """集計テーブルの内容を FavoriteWorld の全件走査の結果と比べる
+
+    ラベルの列は集計の順序によって変わりうるため比べない
+
+    Args:
+        connection (Connection): 対象 DB のコネクション
+
+    Returns:
+        dict[str, int]: テーブル名から一致しなかった行の数を引く辞書、すべて一致していれば値はすべて0
+                        集計テーブルにのみある行と、全件走査の結果にのみある行の両方を数える
+    """
+    result = {}
+    for table in SUMMARY_TABLE_LIST:
+        column_list = ", ".join([*_key_column_list(table), *AGGREGATE_COLUMN_DICT])
+        stored = f'SELECT {column_list} FROM "{table.name}"'
+        expected = f"SELECT {column_list} FROM ({_aggregate_sql(table)})"
+        result[table.name] = connection.exec_driver_sql(
+            f"SELECT count(*) FROM ({stored} EXCEPT {expected} UNION ALL SELECT * FROM ({expected} EXCEPT {stored}))"
+        ).scalar()
+    return result
@@ -0,0 +1,258 @@
+import heapq
+import os
+import threading
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from logging import INFO, getLogger
+from pathlib import Path
+
+import orjson
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# ランキングを作る期間の名前と長さ
+WINDOW_DICT = {"24h": timedelta(hours=24), "7d": timedelta(days=7), "30d": timedelta(days=30)}
+
+# ランキングを作る値
+METRIC_LIST = ["star", "visit"]
+
+# 保存するファイルの形式のバージョン
+STATE_VERSION = 1
+
+
+class _Ranking:
+    """キーごとの値を保持し、値の大きい順に上位を取り出すランキング
+
+    値を更新するたびにヒープへ新しいエントリを積み、古くなったエントリは取り出すときに捨てる(遅延削除)
+    更新は O(log n)、上位 n 件の取得は O(n log n) に捨てたエントリの分を加えた時間で済む
+    値が正のキーのみをランキングに載せる
+    """
+
+    def __init__(self, value_dict: dict[str, int] | None = None) -> None:
+        self.value_dict: dict[str, int] = {}
+        self._heap: list[tuple[int, str]] = []
+        if value_dict:
+            self.value_dict = {key: value for key, value in value_dict.items() if value}
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        self._heap = [(-value, key) for key, value in self.value_dict.items() if value > 0]
+        heapq.heapify(self._heap)
+
+    def add(self, key: str, delta: int) -> None:
+        value = self.value_dict.get(key, 0) + delta
+        if value:
+            self.value_dict[key] = value
+        else:
+            self.value_dict.pop(key, None)
+        if value > 0:
+            heapq.heappush(self._heap, (-value, key))
+        # 捨てるべきエントリが溜まりすぎた場合は作り直す
+        if len(self._heap) > 2 * len(self.value_dict) + 64:
+            self._rebuild()
+
+    def top(self, n: int) -> list[tuple[str, int]]:
+        result = []
+        valid_list = []
+        seen_key_set = set()
+        while self._heap and len(result) < n:
+            entry = heapq.heappop(self._heap)
+            value, key = -entry[0], entry[1]
+            if self.value_dict.get(key) != value or key in seen_key_set:
+                continue
+            seen_key_set.add(key)
+            valid_list.append(entry)
+            result.append((key, value))
+        for entry in valid_list:
+            heapq.heappush(self._heap, entry)
+        return result
+
+
+class TrendingEngine:
+    """クロールごとの star, visit の増加量から、期間ごとに増加量の大きいワールドのランキングを保持する
+
+    増加量は bucket_seconds ごとのバケットにまとめて保持し、期間から外れたバケットの分をランキングから引く
+    ランキングは期間と値の組ごとに持ち、update ではクロールで変化のあったワールドの分のみを更新する
+    状態はファイルに保存でき、再起動後も履歴を集計し直さずに続きから更新できる
+
+    各ワールドの最初の観測は基準値とし、増加量には数えない
+    期間の境界はバケット単位で、直近 期間 / bucket_seconds 個のバケット(最新のバケットを含む)を集計する
+    """
+
+    state_path: Path | None
+    bucket_seconds: int
+
+    def __init__(self, state_path: Path | None = None, bucket_seconds: int = 3600) -> None:
+        """TrendingEngine を作成する、state_path にファイルがあれば読み込む
+
+        Args:
+            state_path (Path | None): 状態を保存するファイル、None の場合は保存しない
+            bucket_seconds (int): 増加量をまとめるバケットの長さ(秒)、各期間の長さを割り切れる値とする
+
+        Raises:
+            ValueError: bucket_seconds が不正な場合と、保存された状態の形式やバケットの長さが異なる場合
+        """
+        if bucket_seconds <= 0:
+            raise ValueError("bucket_seconds must be positive.")
+        if any(window.total_seconds() % bucket_seconds for window in WINDOW_DICT.values()):
+            raise ValueError("bucket_seconds must divide every window.")
+        self.state_path = state_path
+        self.bucket_seconds = bucket_seconds
+        self._lock = threading.Lock()
+        # world_id から最後に観測した [star, visit] を引く辞書
+        self._last_dict: dict[str, list[int]] = {}
+        # 開始時刻の昇順に並べたバケットの開始時刻と、world_id から [star, visit] の増加量を引く辞書
+        self._bucket_start_list: list[int] = []
+        self._bucket_dict_list: list[dict[str, list[int]]] = []
+        # 期間ごとに、これより前に始まるバケットはランキングから引いたことを表す時刻
+        self._threshold_dict: dict[str, int] = {window: 0 for window in WINDOW_DICT}
+        self._ranking_dict: dict[tuple[str, str], _Ranking] = {
+            (window, metric): _Ranking() for window in WINDOW_DICT for metric in METRIC_LIST
+        }
+        if state_path is not None and state_path.is_file():
+            self._load(state_path)
+
+    def _bucket_start(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds) * self.bucket_seconds
+
+    def update(self, metric_dict: dict[str, tuple[int, int]], observed_at: datetime) -> int:
+        """1回のクロールで観測した値を反映する
+
+        前回より前の時刻を渡した場合は、最新のバケットに加える
+
+        Args:
+            metric_dict (dict[str, tuple[int, int]]): world_id から (star, visit) を引く辞書
+            observed_at (datetime): 観測した時刻
+
+        Returns:
+            int: 前回から値の変わったワールドの数
+        """
+        bucket_start = self._bucket_start(observed_at.timestamp())
+        changed_num = 0
+        with self._lock:
+            if self._bucket_start_list and bucket_start < self._bucket_start_list[-1]:
+                logger.warning(f"Observation at {observed_at.isoformat()} is older than the latest bucket.")
+                bucket_start = self._bucket_start_list[-1]
+            self._advance(bucket_start)
+            if not self._bucket_start_list or self._bucket_start_list[-1] != bucket_start:
+                self._bucket_start_list.append(bucket_start)
+                self._bucket_dict_list.append({})
+            bucket_dict = self._bucket_dict_list[-1]
+            for world_id, value_tuple in metric_dict.items():
+                last = self._last_dict.get(world_id)
+                self._last_dict[world_id] = list(value_tuple)
+                if last is None:
+                    continue
+                delta_list = [value - last_value for value, last_value in zip(value_tuple, last)]
+                if not any(delta_list):
+                    continue
+                changed_num += 1
+                bucket_delta_list = bucket_dict.setdefault(world_id, [0] * len(METRIC_LIST))
+                for index, (metric, delta) in enumerate(zip(METRIC_LIST, delta_list)):
+                    bucket_delta_list[index] += delta
+                    for window in WINDOW_DICT:
+                        self._ranking_dict[(window, metric)].add(world_id, delta)
+        logger.info(f"TrendingEngine updated, {changed_num} of {len(metric_dict)} worlds changed.")
+        return changed_num
+
+    def _advance(self, bucket_start: int) -> None:
+        """bucket_start のバケットを最新とみなし、各期間から外れたバケットの分をランキングから引く"""
+        for window, length in WINDOW_DICT.items():
+            threshold = bucket_start - int(length.total_seconds()) + self.bucket_seconds
+            if threshold <= self._threshold_dict[window]:
+                continue
+            start = bisect_left(self._bucket_start_list, self._threshold_dict[window])
+            end = bisect_left(self._bucket_start_list, threshold)
+            for bucket_dict in self._bucket_dict_list[start:end]:
+                for world_id, delta_list in bucket_dict.items():
+                    for metric, delta in zip(METRIC_LIST, delta_list):
+                        if delta:
+                            self._ranking_dict[(window, metric)].add(world_id, -delta)
+            self._threshold_dict[window] = threshold
+        # 最も長い期間からも外れたバケットは捨てる
+        cut = bisect_left(self._bucket_start_list, min(self._threshold_dict.values()))
+        del self._bucket_start_list[:cut]
+        del self._bucket_dict_list[:cut]
+
+    def advance(self, now: datetime) -> None:
+        """now までに各期間から外れたバケットの分をランキングから引く、update の間隔が空いた場合に使う"""
+        with self._lock:
+            bucket_start = self._bucket_start(now.timestamp())
+            if self._bucket_start_list and bucket_start < self._bucket_start_list[-1]:
+                return
+            self._advance(bucket_start)
+
+    def _validate(self, window: str, metric: str) -> None:
+        if window not in WINDOW_DICT:
+            raise ValueError(f"Unknown window: {window}.")
+        if metric not in METRIC_LIST:
+            raise ValueError(f"Unknown metric: {metric}.")
+
+    def top(self, window: str = "24h", metric: str = "star", n: int = 10) -> list[tuple[str, int]]:
+        """期間内の増加量が大きい順に n 件のワールドを返す
+
+        Args:
+            window (str): 期間、WINDOW_DICT のいずれか
+            metric (str): 値、METRIC_LIST のいずれか
+            n (int): 最大件数
+
+        Returns:
+            list[tuple[str, int]]: (world_id, 増加量) のリスト、増加量が正のワールドのみを返す
+                                   同じ増加量の場合は world_id の順
+        """
+        self._validate(window, metric)
+        if n <= 0:
+            raise ValueError("n must be positive.")
+        with self._lock:
+            return self._ranking_dict[(window, metric)].top(n)
+
+    def growth(self, world_id: str, window: str = "24h", metric: str = "star") -> int:
+        """ワールドの期間内の増加量を返す"""
+        self._validate(window, metric)
+        with self._lock:
+            return self._ranking_dict[(window, metric)].value_dict.get(world_id, 0)
+
+    def save(self, path: Path | None = None) -> None:
+        """状態をファイルに保存する
+
+        Args:
+            path (Path | None): 保存先、None の場合は state_path
+        """
+        path = path or self.state_path
+        if path is None:
+            raise ValueError("path is required.")
+        with self._lock:
+            state_bytes = orjson.dumps({
+                "version": STATE_VERSION,
+                "bucket_seconds": self.bucket_seconds,
+                "last": self._last_dict,
+                "buckets": list(zip(self._bucket_start_list, self._bucket_dict_list)),
+                "thresholds": self._threshold_dict,
+                "rankings": {
+                    f"{window}:{metric}": ranking.value_dict
+                    for (window, metric), ranking in self._ranking_dict.items()
+                },
+            })
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(state_bytes)
+        os.replace(tmp_path, path)
+
+    def _load(self, path: Path) -> None:
+        state = orjson.loads(path.read_bytes())
+        if state.get("version") != STATE_VERSION:
+            raise ValueError(f"Unsupported trending state version: {state.get('version')}.")
+        if state["bucket_seconds"] != self.bucket_seconds:
+            raise ValueError(f"bucket_seconds of the saved state is {state['bucket_seconds']}.")
+        self._last_dict = state["last"]
+        self._bucket_start_list = [bucket_start for bucket_start, _ in state["buckets"]]
+        self._bucket_dict_list = [bucket_dict for _, bucket_dict in state["buckets"]]
+        self._threshold_dict = {window: state["thresholds"].get(window, 0) for window in WINDOW_DICT}
+        # 保存した集計値からヒープを作るのみで、バケットから集計し直さない
+        self._ranking_dict = {
+            (window, metric): _Ranking(state["rankings"].get(f"{window}:{metric}"))
+            for window in WINDOW_DICT
+            for metric in METRIC_LIST
+        }
+        logger.info(f"TrendingEngine loaded, {len(self._last_dict)} worlds, {len(self._bucket_start_list)} buckets.")
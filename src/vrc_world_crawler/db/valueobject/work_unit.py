@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class WorkUnit:
+    """分散クロールの作業単位
+
+    1アカウントの1タグについて、offset_start から offset_end までの offset のページを取得する
+    attempt はこの作業単位を取得した回数で、現在の取得を含む
+    """
+
+    unit_id: int
+    crawl_id: str
+    account: str
+    tag: str
+    offset_start: int
+    offset_end: int
+    page_size: int
+    attempt: int
+
+    def __post_init__(self) -> None:
+        """引数チェック
+        Raises: ValueError
+        """
+        if not isinstance(self.unit_id, int) or isinstance(self.unit_id, bool):
+            raise ValueError("unit_id must be int.")
+        if not isinstance(self.crawl_id, str) or not self.crawl_id:
+            raise ValueError("crawl_id must be non-empty str.")
+        if not isinstance(self.account, str) or not self.account:
+            raise ValueError("account must be non-empty str.")
+        if not isinstance(self.tag, str) or not self.tag:
+            raise ValueError("tag must be non-empty str.")
+        if self.offset_start < 0:
+            raise ValueError("offset_start must not be negative.")
+        if self.offset_end < self.offset_start:
+            raise ValueError("offset_end must not be less than offset_start.")
+        if self.page_size <= 0:
+            raise ValueError("page_size must be positive.")
+        if self.attempt <= 0:
+            raise ValueError("attempt must be positive.")
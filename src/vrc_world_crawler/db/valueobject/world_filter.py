@@ -0,0 +1,65 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import ColumnElement
+
+from vrc_world_crawler.db.model import FavoriteWorld
+
+
+@dataclass(frozen=True)
+class WorldFilter:
+    """FavoriteWorld の読み出し条件
+
+    None の項目は条件に含めない
+    すべて None の場合は全件が対象となる
+    """
+
+    favorite_group: str | None = None
+    release_status: str | None = None
+    author_id: str | None = None
+    author_name: str | None = None
+    is_favorited: bool | None = None
+    updated_since: str | None = None
+
+    def __post_init__(self) -> None:
+        """引数チェック
+        Raises: ValueError
+        """
+        if not isinstance(self.favorite_group, str | None):
+            raise ValueError("favorite_group must be str or None.")
+        if not isinstance(self.release_status, str | None):
+            raise ValueError("release_status must be str or None.")
+        if not isinstance(self.author_id, str | None):
+            raise ValueError("author_id must be str or None.")
+        if not isinstance(self.author_name, str | None):
+            raise ValueError("author_name must be str or None.")
+        if not isinstance(self.is_favorited, bool | None):
+            raise ValueError("is_favorited must be bool or None.")
+        if not isinstance(self.updated_since, str | None):
+            raise ValueError("updated_since must be str or None.")
+
+        # updated_at は ISOフォーマットの文字列で保存されているため
+        # 同じフォーマットであれば文字列比較で大小判定できる
+        if self.updated_since:
+            datetime.fromisoformat(self.updated_since)
+
+    def to_clause_list(self) -> list[ColumnElement[bool]]:
+        """SQLAlchemy の where 句に渡す条件リストを返す
+
+        Returns:
+            list[ColumnElement[bool]]: 条件リスト、条件が無い場合は空リスト
+        """
+        clause_list = []
+        if self.favorite_group is not None:
+            clause_list.append(FavoriteWorld.favorite_group == self.favorite_group)
+        if self.release_status is not None:
+            clause_list.append(FavoriteWorld.release_status == self.release_status)
+        if self.author_id is not None:
+            clause_list.append(FavoriteWorld.author_id == self.author_id)
+        if self.author_name is not None:
+            clause_list.append(FavoriteWorld.author_name == self.author_name)
+        if self.is_favorited is not None:
+            clause_list.append(FavoriteWorld.is_favorited == self.is_favorited)
+        if self.updated_since:
+            clause_list.append(FavoriteWorld.updated_at >= self.updated_since)
+        return clause_list
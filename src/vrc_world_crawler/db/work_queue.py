@@ -0,0 +1,320 @@
+import time
+import zlib
+from collections.abc import Iterator
+from datetime import datetime
+from logging import INFO, getLogger
+
+import orjson
+from sqlalchemy import Column, Float, Index, Integer, LargeBinary, MetaData, String, Table, create_engine, delete
+from sqlalchemy import event, func, insert, or_, select, update
+from sqlalchemy.pool import NullPool
+
+from vrc_world_crawler.db.valueobject.work_unit import WorkUnit
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# 作業単位の状態
+# pending: 未取得、leased: いずれかのワーカーが取得中、done: 完了、failed: 取得回数の上限に達した
+WORK_STATUS_LIST = ["pending", "leased", "done", "failed"]
+
+# キューの DB は FavoriteWorld などとは別のファイルに置くため、メタデータも分ける
+queue_metadata = MetaData()
+
+work_unit_table = Table(
+    "CrawlWorkUnit",
+    queue_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("crawl_id", String(256), nullable=False),
+    Column("account", String(256), nullable=False),
+    Column("tag", String(256), nullable=False),
+    Column("offset_start", Integer, nullable=False),
+    Column("offset_end", Integer, nullable=False),
+    Column("page_size", Integer, nullable=False),
+    Column("status", String(16), nullable=False),
+    Column("attempt", Integer, nullable=False),
+    Column("lease_owner", String(256)),
+    # time.time() の値、この時刻を過ぎたリースは放棄されたとみなして他のワーカーが取得し直す
+    Column("lease_expires_at", Float),
+    # 取得したページのリストを orjson で変換し zlib で圧縮したもの
+    Column("result", LargeBinary),
+    Column("error", String(1024)),
+    Column("created_at", String(256), nullable=False),
+    Column("updated_at", String(256), nullable=False),
+    Index("ix_CrawlWorkUnit_status_id", "status", "id"),
+    Index("ix_CrawlWorkUnit_crawl_id_account", "crawl_id", "account"),
+)
+
+
+def _on_connect(dbapi_connection, connection_record) -> None:
+    # BEGIN は _on_begin で明示的に発行する
+    dbapi_connection.isolation_level = None
+
+
+def _on_begin(connection) -> None:
+    # 取得する作業単位を選んでから更新するまでに他のプロセスが割り込まないよう、最初に書き込みロックを取る
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+class WorkQueue:
+    """分散クロールの作業単位を保持する SQLite のキュー
+
+    クロールをアカウント・タグ・offset の範囲ごとの作業単位に分けて登録し
+    複数のワーカー(別プロセス、共有ファイルシステム上の別ホストを含む)がリース付きで1つずつ取得する
+    リースの期限内に完了も延長もされない作業単位は、ワーカーが止まったとみなして他のワーカーが取得し直す
+    取得回数が max_attempts に達した作業単位は failed となり、そのアカウントは書き込まない
+
+    ネットワーク越しの共有ファイルシステムでも使えるよう、WAL ではなく既定のロールバックジャーナルで開く
+    各操作は短いトランザクションで完結し、コネクションを保持しない
+    """
+
+    db_path: str
+    lease_seconds: int
+    max_attempts: int
+
+    def __init__(self, db_path: str = "queue.db", lease_seconds: int = 300, max_attempts: int = 3) -> None:
+        """WorkQueue を作成する、DB ファイルが無い場合は作成する
+
+        Args:
+            db_path (str): キューの DB ファイルのパス
+            lease_seconds (int): 作業単位を取得してから完了または延長するまでの期限(秒)
+            max_attempts (int): 1つの作業単位を取得できる回数の上限
+        """
+        if lease_seconds <= 0:
+            raise ValueError("lease_seconds must be positive.")
+        if max_attempts <= 0:
+            raise ValueError("max_attempts must be positive.")
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.engine = create_engine(f"sqlite:///{db_path}", poolclass=NullPool, connect_args={"timeout": 30})
+        event.listen(self.engine, "connect", _on_connect)
+        event.listen(self.engine, "begin", _on_begin)
+        queue_metadata.create_all(self.engine)
+
+    def dispose(self) -> None:
+        """エンジンを閉じる"""
+        self.engine.dispose()
+
+    def enqueue(
+        self,
+        account_name_list: list[str],
+        tag_list: list[str],
+        max_offset: int,
+        page_size: int,
+        unit_pages: int = 1,
+        crawl_id: str | None = None,
+    ) -> str:
+        """1回のクロールを作業単位に分けて登録する
+
+        各アカウントの各タグの offset 0 から max_offset までを、unit_pages ページずつの作業単位に分ける
+
+        Args:
+            account_name_list (list[str]): クロールするアカウント名のリスト
+            tag_list (list[str]): お気に入りのタグのリスト
+            max_offset (int): 取得する offset の上限
+            page_size (int): 1リクエストで取得する件数
+            unit_pages (int): 1つの作業単位で取得するページ数
+            crawl_id (str | None): このクロールの識別子、None の場合は登録日時
+
+        Returns:
+            str: crawl_id
+        """
+        if page_size <= 0 or unit_pages <= 0:
+            raise ValueError("page_size and unit_pages must be positive.")
+        if max_offset < 0:
+            raise ValueError("max_offset must not be negative.")
+        now = datetime.now().isoformat()
+        crawl_id = crawl_id or datetime.now().isoformat(timespec="seconds")
+        span = page_size * unit_pages
+        value_list = [
+            {
+                "crawl_id": crawl_id,
+                "account": account_name,
+                "tag": tag,
+                "offset_start": offset_start,
+                "offset_end": min(offset_start + span - page_size, max_offset),
+                "page_size": page_size,
+                "status": "pending",
+                "attempt": 0,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for account_name in account_name_list
+            for tag in tag_list
+            for offset_start in range(0, max_offset + 1, span)
+        ]
+        with self.engine.begin() as connection:
+            if connection.execute(select(work_unit_table.c.id).where(work_unit_table.c.crawl_id == crawl_id)).first():
+                raise ValueError(f"crawl_id already exists: {crawl_id}.")
+            if value_list:
+                connection.execute(insert(work_unit_table), value_list)
+        logger.info(f"Enqueued crawl {crawl_id}: {len(value_list)} work units.")
+        return crawl_id
+
+    def claim(self, worker_id: str, crawl_id: str | None = None) -> WorkUnit | None:
+        """未取得か、リースの期限が切れた作業単位を1つ取得する
+
+        Args:
+            worker_id (str): 取得するワーカーの識別子
+            crawl_id (str | None): 指定した場合、このクロールの作業単位のみを取得する
+
+        Returns:
+            WorkUnit | None: 取得した作業単位、取得できる作業単位が無い場合は None
+        """
+        table = work_unit_table
+        now = time.time()
+        is_expired = (table.c.status == "leased") & (table.c.lease_expires_at < now)
+        with self.engine.begin() as connection:
+            # 期限切れのまま取得回数の上限に達したものは、もう取得しない
+            connection.execute(
+                update(table)
+                .where(is_expired, table.c.attempt >= self.max_attempts)
+                .values(status="failed", error="lease expired", updated_at=datetime.now().isoformat())
+            )
+            statement = select(*[column for column in table.columns if column.name != "result"]).where(
+                or_(table.c.status == "pending", is_expired)
+            )
+            if crawl_id is not None:
+                statement = statement.where(table.c.crawl_id == crawl_id)
+            row = connection.execute(statement.order_by(table.c.id).limit(1)).mappings().first()
+            if row is None:
+                return None
+            connection.execute(
+                update(table)
+                .where(table.c.id == row["id"])
+                .values(
+                    status="leased",
+                    attempt=table.c.attempt + 1,
+                    lease_owner=worker_id,
+                    lease_expires_at=now + self.lease_seconds,
+                    updated_at=datetime.now().isoformat(),
+                )
+            )
+        return WorkUnit(
+            row["id"],
+            row["crawl_id"],
+            row["account"],
+            row["tag"],
+            row["offset_start"],
+            row["offset_end"],
+            row["page_size"],
+            row["attempt"] + 1,
+        )
+
+    def _update_leased(self, unit: WorkUnit, worker_id: str, **values) -> bool:
+        """worker_id がリースを保持している場合のみ作業単位を更新する"""
+        table = work_unit_table
+        with self.engine.begin() as connection:
+            result = connection.execute(
+                update(table)
+                .where(
+                    table.c.id == unit.unit_id,
+                    table.c.status == "leased",
+                    table.c.lease_owner == worker_id,
+                    table.c.attempt == unit.attempt,
+                )
+                .values(updated_at=datetime.now().isoformat(), **values)
+            )
+        return result.rowcount == 1
+
+    def heartbeat(self, unit: WorkUnit, worker_id: str) -> bool:
+        """リースの期限を延長する
+
+        Returns:
+            bool: 延長できた場合 True、期限切れで他のワーカーが取得し直した場合など、リースを失っていた場合 False
+        """
+        return self._update_leased(unit, worker_id, lease_expires_at=time.time() + self.lease_seconds)
+
+    def complete(self, unit: WorkUnit, worker_id: str, page_list: list[list[dict]]) -> bool:
+        """取得したページを保存して作業単位を完了にする
+
+        Args:
+            unit (WorkUnit): 完了した作業単位
+            worker_id (str): 作業単位を取得したワーカーの識別子
+            page_list (list[list[dict]]): 取得したページのリスト
+
+        Returns:
+            bool: 完了にできた場合 True、リースを失っていた場合は結果を保存せず False
+        """
+        result = zlib.compress(orjson.dumps(page_list), 1)
+        return self._update_leased(unit, worker_id, status="done", result=result, lease_expires_at=None, error=None)
+
+    def fail(self, unit: WorkUnit, worker_id: str, error: str) -> bool:
+        """作業単位の失敗を記録する、取得回数が上限に達していなければ再び取得できるようにする
+
+        Returns:
+            bool: 記録できた場合 True、リースを失っていた場合 False
+        """
+        status = "failed" if unit.attempt >= self.max_attempts else "pending"
+        return self._update_leased(unit, worker_id, status=status, lease_expires_at=None, error=error[:1024])
+
+    def count_status(self, crawl_id: str, account: str | None = None) -> dict[str, int]:
+        """クロールの作業単位の状態ごとの件数を返す
+
+        Returns:
+            dict[str, int]: WORK_STATUS_LIST の各状態の件数
+        """
+        table = work_unit_table
+        statement = select(table.c.status, func.count()).where(table.c.crawl_id == crawl_id)
+        if account is not None:
+            statement = statement.where(table.c.account == account)
+        with self.engine.connect() as connection:
+            count_dict = dict(connection.execute(statement.group_by(table.c.status)).all())
+        return {status: count_dict.get(status, 0) for status in WORK_STATUS_LIST}
+
+    def is_finished(self, crawl_id: str) -> bool:
+        """クロールのすべての作業単位が done か failed になったかを返す"""
+        count_dict = self.count_status(crawl_id)
+        return count_dict["pending"] == 0 and count_dict["leased"] == 0
+
+    def account_name_list(self, crawl_id: str) -> list[str]:
+        """クロールのアカウント名を登録順に返す"""
+        table = work_unit_table
+        statement = select(table.c.account).where(table.c.crawl_id == crawl_id).group_by(table.c.account)
+        with self.engine.connect() as connection:
+            return list(connection.execute(statement.order_by(func.min(table.c.id))).scalars())
+
+    def created_at(self, crawl_id: str) -> str | None:
+        """クロールを登録した日時を返す、登録されていない場合は None"""
+        table = work_unit_table
+        statement = select(func.min(table.c.created_at)).where(table.c.crawl_id == crawl_id)
+        with self.engine.connect() as connection:
+            return connection.execute(statement).scalar()
+
+    def crawl_id_list(self) -> list[str]:
+        """登録されているクロールの crawl_id を登録順に返す"""
+        table = work_unit_table
+        statement = select(table.c.crawl_id).group_by(table.c.crawl_id).order_by(func.min(table.c.id))
+        with self.engine.connect() as connection:
+            return list(connection.execute(statement).scalars())
+
+    def iter_pages(self, crawl_id: str, account: str) -> Iterator[list[dict]]:
+        """完了した作業単位のページを、登録順(タグ順、offset 順)に1ページずつ返す
+
+        Yields:
+            list[dict]: 1ページ分のレスポンス(ワールド辞書のリスト)
+        """
+        table = work_unit_table
+        statement = (
+            select(table.c.id)
+            .where(table.c.crawl_id == crawl_id, table.c.account == account, table.c.status == "done")
+            .order_by(table.c.id)
+        )
+        with self.engine.connect() as connection:
+            unit_id_list = list(connection.execute(statement).scalars())
+        # 結果は作業単位ごとに読み込み、全ページを同時にメモリに置かない
+        for unit_id in unit_id_list:
+            with self.engine.connect() as connection:
+                result = connection.execute(select(table.c.result).where(table.c.id == unit_id)).scalar_one()
+            yield from orjson.loads(zlib.decompress(result))
+
+    def purge(self, crawl_id: str) -> int:
+        """クロールの作業単位をすべて削除する
+
+        Returns:
+            int: 削除した作業単位の数
+        """
+        with self.engine.begin() as connection:
+            result = connection.execute(delete(work_unit_table).where(work_unit_table.c.crawl_id == crawl_id))
+        return result.rowcount
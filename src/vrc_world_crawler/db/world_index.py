@@ -0,0 +1,328 @@
+import hashlib
+import os
+import threading
+from collections.abc import Iterable
+from dataclasses import dataclass, replace
+from logging import INFO, getLogger
+from pathlib import Path
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from vrc_world_crawler.db.model import FavoriteWorld
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# content_hash の計算対象の列
+# id, account は識別子、is_favorited はフラグとして別に持ち、registered_at はクロールごとに変わるため含めない
+HASH_COLUMN_LIST = [
+    "world_id",
+    "world_name",
+    "world_url",
+    "description",
+    "author_id",
+    "author_name",
+    "favorite_id",
+    "favorite_group",
+    "release_status",
+    "featured",
+    "image_url",
+    "thmbnail_image_url",
+    "version",
+    "star",
+    "visit",
+    "published_at",
+    "lab_published_at",
+    "created_at",
+    "updated_at",
+]
+
+# session.info に未 commit の変更を保持するキー
+_PENDING_KEY = "world_index_pending"
+
+
+def content_hash(record: FavoriteWorld | dict) -> int:
+    """レコードの内容から、プロセスをまたいでも変わらないハッシュ値を計算する
+
+    Args:
+        record (FavoriteWorld | dict): レコード、またはレコードの列名をキーとする辞書
+
+    Returns:
+        int: 64bit のハッシュ値
+    """
+    if isinstance(record, FavoriteWorld):
+        value_list = [getattr(record, column) for column in HASH_COLUMN_LIST]
+    else:
+        value_list = [record[column] for column in HASH_COLUMN_LIST]
+    # featured は bool で渡されて DB からは int で読み出されるため、揃えてからハッシュする
+    value_list = [int(value) if isinstance(value, bool) else value for value in value_list]
+    digest = hashlib.blake2b(orjson.dumps(value_list), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+@dataclass(frozen=True, slots=True)
+class IndexEntry:
+    account: str
+    row_id: int
+    world_id: str
+    favorite_id: str
+    content_hash: int
+    is_favorited: bool
+    release_status: str
+
+    def to_list(self) -> list:
+        return [
+            self.account,
+            self.row_id,
+            self.world_id,
+            self.favorite_id,
+            self.content_hash,
+            self.is_favorited,
+            self.release_status,
+        ]
+
+
+class WorldIndex:
+    """FavoriteWorld の全レコードをメモリ上に保持する索引
+
+    (account, world_id) と (account, favorite_id) の両方から、行 id と内容のハッシュ値を O(1) で引ける
+    upsert はこの索引で既存レコードを判定するため、レコードごとに DB へ問い合わせる必要がない
+
+    索引への変更はセッションごとに保留され、そのセッションが commit されたときに反映される
+    rollback された場合は保留中の変更を破棄する
+    セッション内の検索では保留中の変更も参照する
+    """
+
+    by_world_id: dict[tuple[str, str], IndexEntry]
+    by_favorite_id: dict[tuple[str, str], IndexEntry]
+
+    def __init__(self) -> None:
+        self.by_world_id = {}
+        self.by_favorite_id = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.by_favorite_id)
+
+    def _put(self, entry: IndexEntry) -> None:
+        old_entry = self.by_favorite_id.get((entry.account, entry.favorite_id))
+        if old_entry is None:
+            # favorite_id が変わった場合は古い favorite_id の登録を消す
+            old_entry = self.by_world_id.get((entry.account, entry.world_id))
+        if old_entry is not None and old_entry.row_id == entry.row_id:
+            self.by_favorite_id.pop((old_entry.account, old_entry.favorite_id), None)
+            self.by_world_id.pop((old_entry.account, old_entry.world_id), None)
+        self.by_favorite_id[(entry.account, entry.favorite_id)] = entry
+        if entry.release_status == "public":
+            self.by_world_id[(entry.account, entry.world_id)] = entry
+
+    def load(self, session: Session) -> None:
+        """DB の全レコードから索引を作り直す
+
+        Args:
+            session (Session): 読み込みに使うセッション
+        """
+        column_list = ["id", "account", "is_favorited", *HASH_COLUMN_LIST]
+        statement = select(*[FavoriteWorld.__table__.columns[column] for column in column_list])
+        with self._lock:
+            self.by_world_id = {}
+            self.by_favorite_id = {}
+            for row in session.execute(statement.execution_options(yield_per=1000)).mappings():
+                self._put(
+                    IndexEntry(
+                        row["account"],
+                        row["id"],
+                        row["world_id"],
+                        row["favorite_id"],
+                        content_hash(row),
+                        bool(row["is_favorited"]),
+                        row["release_status"],
+                    )
+                )
+        logger.info(f"WorldIndex loaded from DB, {len(self)} entries.")
+
+    def save(self, path: Path, signature: list) -> None:
+        """索引をファイルに保存する
+
+        Args:
+            path (Path): 保存先のパス
+            signature (list): 保存時点の DB を識別する値、読み込み時に一致を確認する
+        """
+        with self._lock:
+            entry_list = [entry.to_list() for entry in self.by_favorite_id.values()]
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(orjson.dumps({"signature": signature, "entries": entry_list}))
+        os.replace(tmp_path, path)
+
+    def load_file(self, path: Path, signature: list) -> bool:
+        """ファイルから索引を読み込む
+
+        Args:
+            path (Path): 読み込むパス
+            signature (list): 現在の DB を識別する値
+
+        Returns:
+            bool: 読み込んだ場合 True、ファイルが無いか DB と一致しない場合 False
+        """
+        if not path.is_file():
+            return False
+        try:
+            index_dict = orjson.loads(path.read_bytes())
+        except orjson.JSONDecodeError:
+            return False
+        if index_dict.get("signature") != signature:
+            return False
+        with self._lock:
+            self.by_world_id = {}
+            self.by_favorite_id = {}
+            for entry_list in index_dict["entries"]:
+                self._put(IndexEntry(*entry_list))
+        logger.info(f"WorldIndex loaded from file, {len(self)} entries.")
+        return True
+
+    def _pending(self, session: Session) -> "_PendingIndex":
+        pending = session.info.get(_PENDING_KEY)
+        if pending is None:
+            pending = session.info[_PENDING_KEY] = _PendingIndex()
+        return pending
+
+    def get_by_world_id(self, session: Session, account: str, world_id: str) -> IndexEntry | None:
+        """(account, world_id) のエントリを返す、セッションで保留中の変更を優先する"""
+        pending = self._pending(session)
+        entry = pending.by_world_id.get((account, world_id))
+        if entry is not None:
+            return entry
+        entry = self.by_world_id.get((account, world_id))
+        if entry is None or entry.row_id in pending.by_row_id:
+            return None
+        return entry
+
+    def get_by_favorite_id(self, session: Session, account: str, favorite_id: str) -> IndexEntry | None:
+        """(account, favorite_id) のエントリを返す、セッションで保留中の変更を優先する"""
+        pending = self._pending(session)
+        entry = pending.by_favorite_id.get((account, favorite_id))
+        if entry is not None:
+            return entry
+        entry = self.by_favorite_id.get((account, favorite_id))
+        if entry is None or entry.row_id in pending.by_row_id:
+            return None
+        return entry
+
+    def stage(self, session: Session, entry_list: Iterable[IndexEntry]) -> None:
+        """セッションが commit されたときに反映する変更を登録する"""
+        pending = self._pending(session)
+        for entry in entry_list:
+            pending.put(entry)
+
+    def stage_unfavorited(self, session: Session, account: str, favorite_id_list: Iterable[str] | None = None) -> None:
+        """is_favorited を False にした変更を登録する
+
+        Args:
+            session (Session): 変更を行ったセッション
+            account (str): 対象のアカウント名
+            favorite_id_list (Iterable[str] | None): 対象の favorite_id、None の場合はアカウントの全エントリ
+        """
+        if favorite_id_list is None:
+            entry_list = [entry for entry in self.iter_entries(session) if entry.account == account]
+        else:
+            entry_list = [self.get_by_favorite_id(session, account, favorite_id) for favorite_id in favorite_id_list]
+        self.stage(
+            session,
+            [replace(entry, is_favorited=False) for entry in entry_list if entry is not None and entry.is_favorited],
+        )
+
+    def iter_entries(self, session: Session | None = None) -> Iterable[IndexEntry]:
+        """全エントリを返す、session を渡した場合は保留中の変更を反映した結果を返す"""
+        pending_by_row_id = self._pending(session).by_row_id if session is not None else {}
+        for entry in list(self.by_favorite_id.values()):
+            if entry.row_id not in pending_by_row_id:
+                yield entry
+        yield from list(pending_by_row_id.values())
+
+    def discard(self, session: Session, account: str | None = None) -> None:
+        """セッションで保留中の変更を破棄する
+
+        Args:
+            session (Session): 対象のセッション
+            account (str | None): 対象のアカウント名、None の場合はすべて
+        """
+        if account is None:
+            session.info.pop(_PENDING_KEY, None)
+            return
+        pending = self._pending(session)
+        for entry in [entry for entry in pending.by_row_id.values() if entry.account == account]:
+            pending.remove(entry)
+
+    def commit(self, session: Session) -> bool:
+        """セッションで保留中の変更を索引に反映する
+
+        Returns:
+            bool: 反映する変更があった場合 True
+        """
+        pending = session.info.pop(_PENDING_KEY, None)
+        if pending is None or not pending.by_row_id:
+            return False
+        with self._lock:
+            for entry in pending.by_row_id.values():
+                self._put(entry)
+        return True
+
+    def remove(self, entry_list: Iterable[IndexEntry]) -> None:
+        """commit 済みの行の削除を索引に反映する
+
+        Args:
+            entry_list (Iterable[IndexEntry]): 削除した行のエントリ、row_id が一致するエントリのみを消す
+        """
+        with self._lock:
+            for entry in entry_list:
+                for index_dict, key in [
+                    (self.by_favorite_id, (entry.account, entry.favorite_id)),
+                    (self.by_world_id, (entry.account, entry.world_id)),
+                ]:
+                    old_entry = index_dict.get(key)
+                    if old_entry is not None and old_entry.row_id == entry.row_id:
+                        del index_dict[key]
+
+    def removed_favorite_id_list(self, session: Session, account: str, seen_favorite_id_set: set[str]) -> list[str]:
+        """お気に入り状態のエントリのうち、今回のクロールで見つからなかったものの favorite_id を返す
+
+        Args:
+            session (Session): クロール結果を書き込み中のセッション
+            account (str): 対象のアカウント名
+            seen_favorite_id_set (set[str]): 今回のクロールで見つかった favorite_id の集合
+
+        Returns:
+            list[str]: お気に入りから外れた favorite_id のリスト
+        """
+        return [
+            entry.favorite_id
+            for entry in self.iter_entries(session)
+            if entry.account == account and entry.is_favorited and entry.favorite_id not in seen_favorite_id_set
+        ]
+
+
+class _PendingIndex:
+    """1セッション分の未 commit のエントリ、WorldIndex と同じキーで引けるようにする"""
+
+    def __init__(self) -> None:
+        self.by_row_id: dict[int, IndexEntry] = {}
+        self.by_world_id: dict[tuple[str, str], IndexEntry] = {}
+        self.by_favorite_id: dict[tuple[str, str], IndexEntry] = {}
+
+    def put(self, entry: IndexEntry) -> None:
+        old_entry = self.by_row_id.get(entry.row_id)
+        if old_entry is not None:
+            self.remove(old_entry)
+        self.by_row_id[entry.row_id] = entry
+        self.by_favorite_id[(entry.account, entry.favorite_id)] = entry
+        if entry.release_status == "public":
+            self.by_world_id[(entry.account, entry.world_id)] = entry
+
+    def remove(self, entry: IndexEntry) -> None:
+        del self.by_row_id[entry.row_id]
+        if self.by_favorite_id.get((entry.account, entry.favorite_id)) is entry:
+            del self.by_favorite_id[(entry.account, entry.favorite_id)]
+        if self.by_world_id.get((entry.account, entry.world_id)) is entry:
+            del self.by_world_id[(entry.account, entry.world_id)]
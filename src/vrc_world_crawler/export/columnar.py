@@ -0,0 +1,168 @@
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from typing import BinaryIO
+
+import orjson
+
+from vrc_world_crawler.export.writer import ExportWriter
+
+# 列指向バイナリ形式
+#
+# ファイル := MAGIC, ヘッダ, 行グループ*
+# ヘッダ := uint32 長さ, JSON {"columns": [列名, ...], "types": [型, ...]}
+# 行グループ := uint32 行数, 列チャンク * 列数
+# 列チャンク := uint32 長さ, zlib 圧縮した (NULL マスク, 値)
+#   NULL マスク := 行数バイト、NULL の行は 1
+#   int, bool の値 := int64 * 行数
+#   str の値 := uint32 バイト長 * 行数, UTF-8 文字列を連結したもの
+# 整数はすべてリトルエンディアン
+MAGIC = b"VRCCOL1\n"
+COLUMN_TYPE_LIST = ["int", "bool", "str"]
+
+_UINT32 = struct.Struct("<I")
+_IS_BIG_ENDIAN = sys.byteorder == "big"
+
+
+def _to_little_endian(values: array) -> bytes:
+    if _IS_BIG_ENDIAN:
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes | memoryview) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if _IS_BIG_ENDIAN:
+        values.byteswap()
+    return values
+
+
+def _encode_column(column_type: str, value_list: Sequence) -> bytes:
+    """1列分の値を列チャンクのバイト列にする"""
+    mask = bytes(value is None for value in value_list)
+    if column_type == "str":
+        encoded_list = [b"" if value is None else value.encode() for value in value_list]
+        payload = _to_little_endian(array("I", map(len, encoded_list))) + b"".join(encoded_list)
+    else:
+        payload = _to_little_endian(array("q", (0 if value is None else int(value) for value in value_list)))
+    return zlib.compress(mask + payload)
+
+
+def _decode_column(column_type: str, row_num: int, data: bytes) -> list:
+    """列チャンクのバイト列を1列分の値に戻す"""
+    data = memoryview(zlib.decompress(data))
+    mask, payload = data[:row_num], data[row_num:]
+    if column_type == "str":
+        length_list = _from_little_endian("I", payload[: 4 * row_num])
+        value_list = []
+        offset = 4 * row_num
+        for length in length_list:
+            value_list.append(str(payload[offset : offset + length], "utf-8"))
+            offset += length
+    else:
+        value_list = _from_little_endian("q", payload).tolist()
+        if column_type == "bool":
+            value_list = [bool(value) for value in value_list]
+    return [None if is_null else value for is_null, value in zip(mask, value_list)]
+
+
+class ColumnarWriter(ExportWriter):
+    """列指向バイナリ形式、受け取ったチャンクごとに1つの行グループとして書き出す"""
+
+    def __init__(self, output: BinaryIO, column_dict: dict[str, str]) -> None:
+        super().__init__(output, column_dict)
+        invalid_type_list = [t for t in column_dict.values() if t not in COLUMN_TYPE_LIST]
+        if invalid_type_list:
+            raise ValueError(f"Unknown column types: {invalid_type_list}.")
+        header = orjson.dumps({"columns": list(column_dict), "types": list(column_dict.values())})
+        output.write(MAGIC + _UINT32.pack(len(header)) + header)
+
+    def write_chunk(self, row_list: Sequence[Sequence]) -> None:
+        if not row_list:
+            return
+        buffer = [_UINT32.pack(len(row_list))]
+        for column_type, value_list in zip(self.column_dict.values(), zip(*row_list)):
+            chunk = _encode_column(column_type, value_list)
+            buffer.append(_UINT32.pack(len(chunk)))
+            buffer.append(chunk)
+        self.output.write(b"".join(buffer))
+
+
+class ColumnarReader:
+    """列指向バイナリ形式のファイルを読み込む
+
+    行グループ単位で読み込むため、ファイルの大きさに依らずメモリ使用量は行グループ1つ分で済む
+    """
+
+    path: Path
+    column_dict: dict[str, str]
+
+    def __init__(self, path: Path) -> None:
+        """ColumnarReader を作成する、ヘッダのみを読み込む
+
+        Args:
+            path (Path): 読み込むファイル
+
+        Raises:
+            ValueError: 列指向バイナリ形式のファイルではない場合
+        """
+        self.path = path
+        with path.open("rb") as file:
+            self.column_dict, self._data_offset = self._read_header(file)
+
+    @staticmethod
+    def _read_header(file: BinaryIO) -> tuple[dict[str, str], int]:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a columnar export file.")
+        (header_size,) = _UINT32.unpack(file.read(_UINT32.size))
+        header = orjson.loads(file.read(header_size))
+        return dict(zip(header["columns"], header["types"])), file.tell()
+
+    def iter_columns(self, column_list: list[str] | None = None) -> Iterator[dict[str, list]]:
+        """行グループごとに、列名から値のリストを引く辞書を返す
+
+        Args:
+            column_list (list[str] | None): 読み込む列名のリスト、None の場合はすべての列
+                                            指定しなかった列は展開しない
+
+        Yields:
+            dict[str, list]: 1行グループ分の列ごとの値
+        """
+        column_list = list(self.column_dict) if column_list is None else column_list
+        invalid_columns = [column for column in column_list if column not in self.column_dict]
+        if invalid_columns:
+            raise ValueError(f"Unknown columns: {invalid_columns}.")
+
+        with self.path.open("rb") as file:
+            file.seek(self._data_offset)
+            while True:
+                row_num_bytes = file.read(_UINT32.size)
+                if not row_num_bytes:
+                    break
+                (row_num,) = _UINT32.unpack(row_num_bytes)
+                group_dict = {}
+                for column, column_type in self.column_dict.items():
+                    (chunk_size,) = _UINT32.unpack(file.read(_UINT32.size))
+                    if column not in column_list:
+                        file.seek(chunk_size, 1)
+                        continue
+                    group_dict[column] = _decode_column(column_type, row_num, file.read(chunk_size))
+                yield {column: group_dict[column] for column in column_list}
+
+    def iter_rows(self, column_list: list[str] | None = None) -> Iterator[dict]:
+        """1レコードずつ、列名から値を引く辞書を返す
+
+        Args:
+            column_list (list[str] | None): 読み込む列名のリスト、None の場合はすべての列
+
+        Yields:
+            dict: 1レコード分の値
+        """
+        for group_dict in self.iter_columns(column_list):
+            column_list = list(group_dict)
+            for value_tuple in zip(*group_dict.values()):
+                yield dict(zip(column_list, value_tuple))
@@ -0,0 +1,122 @@
+import os
+import sys
+from logging import INFO, getLogger
+from pathlib import Path
+
+from sqlalchemy import Boolean, Integer
+
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.db.model import FavoriteWorld
+from vrc_world_crawler.db.valueobject.world_filter import WorldFilter
+from vrc_world_crawler.export.columnar import ColumnarWriter
+from vrc_world_crawler.export.valueobject.watermark import Watermark
+from vrc_world_crawler.export.writer import CsvWriter, ExportWriter, JsonlWriter
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# エクスポート形式名から ExportWriter を引く辞書
+FORMAT_DICT: dict[str, type[ExportWriter]] = {
+    "jsonl": JsonlWriter,
+    "csv": CsvWriter,
+    "columnar": ColumnarWriter,
+}
+
+
+def _get_column_type(column_name: str) -> str:
+    column_type = FavoriteWorld.__table__.columns[column_name].type
+    if isinstance(column_type, Boolean):
+        return "bool"
+    if isinstance(column_type, Integer):
+        return "int"
+    return "str"
+
+
+class Exporter:
+    """FavoriteWorld を CSV / JSON Lines / 列指向バイナリ形式のファイルに書き出す
+
+    DB のカーソルから chunk_size 件ずつ読み出しては書き出すため、レコード数に依らずメモリ使用量は一定となる
+    watermark_path を指定した場合は、前回のエクスポート以降に追加・更新されたレコードのみを書き出す
+    """
+
+    db: FavoriteWorldDB
+    export_format: str
+    chunk_size: int
+
+    def __init__(self, db: FavoriteWorldDB, export_format: str = "jsonl", chunk_size: int = 1000) -> None:
+        """Exporter を作成する
+
+        Args:
+            db (FavoriteWorldDB): 読み出し元の DB
+            export_format (str): エクスポート形式、FORMAT_DICT のキーのいずれか
+            chunk_size (int): 1回に読み出して書き出す件数、列指向バイナリ形式では行グループの行数となる
+        """
+        if export_format not in FORMAT_DICT:
+            raise ValueError(f"Unknown format: {export_format}.")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive.")
+        self.db = db
+        self.export_format = export_format
+        self.chunk_size = chunk_size
+
+    def export(
+        self,
+        output_path: Path | None,
+        world_filter: WorldFilter | None = None,
+        columns: list[str] | None = None,
+        watermark_path: Path | None = None,
+    ) -> int:
+        """レコードを書き出す
+
+        ファイルへは一時ファイルに書き出してから置き換えるため、途中で失敗しても既存のファイルは壊れない
+        watermark はすべて書き出し終えた後に更新する
+
+        Args:
+            output_path (Path | None): 出力先のファイル、None の場合は標準出力
+            world_filter (WorldFilter | None): 読み出し条件、None なら全件
+            columns (list[str] | None): 書き出す列名のリスト、None なら全列
+            watermark_path (Path | None): 前回のエクスポート位置を保存するファイル、None の場合は常に全件を対象とする
+
+        Returns:
+            int: 書き出したレコード数
+        """
+        column_list = list(FavoriteWorld.__table__.columns.keys()) if columns is None else columns
+        invalid_columns = [c for c in column_list if c not in FavoriteWorld.__table__.columns]
+        if invalid_columns:
+            raise ValueError(f"Unknown columns: {invalid_columns}.")
+        # watermark の更新に使うため、指定されなくても id と updated_at は読み出す
+        select_column_list = list(dict.fromkeys(["id", "updated_at", *column_list]))
+        index_list = [select_column_list.index(column) for column in column_list]
+        column_dict = {column: _get_column_type(column) for column in column_list}
+
+        watermark = Watermark.load(watermark_path) if watermark_path is not None else None
+        clause_list = [watermark.to_clause()] if watermark is not None else None
+
+        if output_path is None:
+            output = sys.stdout.buffer
+        else:
+            tmp_path = output_path.with_name(output_path.name + ".tmp")
+            output = tmp_path.open("wb")
+        count = 0
+        try:
+            writer = FORMAT_DICT[self.export_format](output, column_dict)
+            for row_list in self.db.iter_chunks(world_filter, select_column_list, self.chunk_size, clause_list):
+                writer.write_chunk([tuple(row[i] for i in index_list) for row in row_list])
+                count += len(row_list)
+                if watermark is not None:
+                    watermark = watermark.advance(
+                        row_list[-1][0], max((row[1] for row in row_list if row[1] is not None), default=None)
+                    )
+            writer.close()
+        except BaseException:
+            if output_path is not None:
+                output.close()
+                tmp_path.unlink(missing_ok=True)
+            raise
+        if output_path is not None:
+            output.close()
+            os.replace(tmp_path, output_path)
+        if watermark is not None:
+            watermark.save(watermark_path)
+        logger.info(f"Export {count} records, format: {self.export_format}.")
+        return count
@@ -0,0 +1,60 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Self
+
+import orjson
+from sqlalchemy import ColumnElement, or_
+
+from vrc_world_crawler.db.model import FavoriteWorld
+
+
+@dataclass(frozen=True)
+class Watermark:
+    """前回のエクスポートでどこまで書き出したかを表す
+
+    id が last_id より大きいレコード(新規追加)と、updated_at が updated_at より新しいレコード(更新)を
+    「前回のエクスポート以降」に変化したレコードとみなす
+    """
+
+    last_id: int = 0
+    updated_at: str = ""
+
+    def __post_init__(self) -> None:
+        """引数チェック
+        Raises: ValueError
+        """
+        if not isinstance(self.last_id, int) or isinstance(self.last_id, bool):
+            raise ValueError("last_id must be int.")
+        if self.last_id < 0:
+            raise ValueError("last_id must not be negative.")
+        if not isinstance(self.updated_at, str):
+            raise ValueError("updated_at must be str.")
+
+    def to_clause(self) -> ColumnElement[bool]:
+        """前回のエクスポート以降に変化したレコードを選ぶ条件を返す"""
+        return or_(FavoriteWorld.id > self.last_id, FavoriteWorld.updated_at > self.updated_at)
+
+    def advance(self, last_id: int, updated_at: str | None) -> Self:
+        """書き出したレコードの id と updated_at を反映した Watermark を返す"""
+        return Watermark(
+            max(self.last_id, last_id),
+            max(self.updated_at, updated_at or ""),
+        )
+
+    def to_dict(self) -> dict:
+        return {"last_id": self.last_id, "updated_at": self.updated_at}
+
+    @classmethod
+    def load(cls, path: Path) -> Self:
+        """ファイルから読み込む、ファイルが無い場合は全件を対象とする Watermark を返す"""
+        if not path.is_file():
+            return cls()
+        watermark_dict = orjson.loads(path.read_bytes())
+        return cls(watermark_dict["last_id"], watermark_dict["updated_at"])
+
+    def save(self, path: Path) -> None:
+        """ファイルに保存する、書き込み途中で中断されても前回の内容が壊れないよう置き換えで保存する"""
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(orjson.dumps(self.to_dict()))
+        os.replace(tmp_path, path)
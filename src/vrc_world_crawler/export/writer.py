@@ -0,0 +1,69 @@
+import csv
+import io
+from abc import ABCMeta, abstractmethod
+from collections.abc import Sequence
+from typing import BinaryIO
+
+import orjson
+
+
+class ExportWriter(metaclass=ABCMeta):
+    """エクスポート形式ごとの書き出し処理
+
+    レコードはチャンク単位で受け取り、受け取ったそばから出力先に書き出す
+    出力先のクローズは呼び出し元が行う
+    """
+
+    output: BinaryIO
+    column_dict: dict[str, str]
+
+    def __init__(self, output: BinaryIO, column_dict: dict[str, str]) -> None:
+        """ExportWriter を作成する
+
+        Args:
+            output (BinaryIO): 出力先
+            column_dict (dict[str, str]): 書き出す列名から列の型("int", "bool", "str")を引く辞書、列の並び順で渡す
+        """
+        self.output = output
+        self.column_dict = column_dict
+
+    @abstractmethod
+    def write_chunk(self, row_list: Sequence[Sequence]) -> None:
+        """レコードのチャンクを書き出す
+
+        Args:
+            row_list (Sequence[Sequence]): レコードのリスト、各レコードは column_dict の列順の値
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """書き出しを終える"""
+        self.output.flush()
+
+
+class JsonlWriter(ExportWriter):
+    """JSON Lines 形式、1行に1レコードの JSON オブジェクトを書き出す"""
+
+    def write_chunk(self, row_list: Sequence[Sequence]) -> None:
+        column_list = list(self.column_dict)
+        option = orjson.OPT_APPEND_NEWLINE
+        self.output.write(b"".join(orjson.dumps(dict(zip(column_list, row)), option=option) for row in row_list))
+
+
+class CsvWriter(ExportWriter):
+    """CSV 形式、1行目に列名を書き出す、None は空文字とする"""
+
+    def __init__(self, output: BinaryIO, column_dict: dict[str, str]) -> None:
+        super().__init__(output, column_dict)
+        self._text_output = io.TextIOWrapper(output, encoding="utf-8", newline="", write_through=True)
+        self._csv_writer = csv.writer(self._text_output)
+        self._csv_writer.writerow(column_dict.keys())
+
+    def write_chunk(self, row_list: Sequence[Sequence]) -> None:
+        self._csv_writer.writerows(row_list)
+
+    def close(self) -> None:
+        self._text_output.flush()
+        # TextIOWrapper の破棄時に出力先が閉じられないよう切り離す
+        self._text_output.detach()
+        super().close()
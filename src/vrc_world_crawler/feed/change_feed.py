@@ -0,0 +1,123 @@
+from datetime import datetime
+from logging import INFO, getLogger
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.db.model import ChangeEvent, ChangeFeedCursor
+from vrc_world_crawler.feed.sink import ChangeSink
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# ChangeEvent.event_type の値
+EVENT_TYPE_LIST = ["added", "removed", "updated", "status_changed"]
+
+
+class ChangeFeed:
+    """ChangeEvent をカーソル位置から読み出す変更フィード
+
+    利用者は前回読み終えた id をカーソルとして渡し、それより後に記録されたイベントのみを受け取る
+    利用者名を指定する consume では、カーソルを ChangeFeedCursor に保存して送信に成功した分だけ進める
+    """
+
+    db: FavoriteWorldDB
+
+    def __init__(self, db: FavoriteWorldDB) -> None:
+        """ChangeFeed を作成する
+
+        Args:
+            db (FavoriteWorldDB): イベントを記録している DB
+        """
+        self.db = db
+
+    def read(
+        self,
+        after_id: int = 0,
+        limit: int = 100,
+        event_type: str | None = None,
+        account: str | None = None,
+        favorite_group: str | None = None,
+    ) -> tuple[list[dict], int]:
+        """カーソルより後のイベントを読み出す
+
+        Args:
+            after_id (int): カーソル、この id より後のイベントを読み出す、先頭から読む場合は0
+            limit (int): 最大件数
+            event_type (str | None): 指定した種類のイベントのみを読み出す
+            account (str | None): 指定したアカウントのイベントのみを読み出す
+            favorite_group (str | None): 指定したお気に入りグループのイベントのみを読み出す
+
+        Returns:
+            tuple[list[dict], int]: (id 昇順のイベントのリスト, 次回のカーソル)
+                                    絞り込みで読み飛ばしたイベントも次回のカーソルより前となる
+        """
+        if limit <= 0:
+            raise ValueError("limit must be positive.")
+        if event_type is not None and event_type not in EVENT_TYPE_LIST:
+            raise ValueError(f"Unknown event_type: {event_type}.")
+        statement = select(ChangeEvent).where(ChangeEvent.id > after_id)
+        if event_type is not None:
+            statement = statement.where(ChangeEvent.event_type == event_type)
+        if account is not None:
+            statement = statement.where(ChangeEvent.account == account)
+        if favorite_group is not None:
+            statement = statement.where(ChangeEvent.favorite_group == favorite_group)
+        statement = statement.order_by(ChangeEvent.id).limit(limit)
+
+        with self.db.session_scope() as session:
+            event_list = [event.to_dict() for event in session.scalars(statement)]
+            if len(event_list) < limit:
+                # 絞り込み条件に合わないイベントを次回また読み直さないよう、最新のイベントまでカーソルを進める
+                last_id = session.scalar(select(ChangeEvent.id).order_by(ChangeEvent.id.desc()).limit(1))
+                next_id = max(after_id, last_id or 0)
+            else:
+                next_id = event_list[-1]["id"]
+        return event_list, next_id
+
+    def get_cursor(self, consumer: str) -> int:
+        """利用者が最後に処理し終えたイベントの id を返す、初めての利用者は0"""
+        with self.db.session_scope() as session:
+            cursor = session.get(ChangeFeedCursor, consumer)
+            return 0 if cursor is None else cursor.last_id
+
+    def set_cursor(self, consumer: str, last_id: int) -> None:
+        """利用者のカーソルを保存する"""
+        statement = insert(ChangeFeedCursor).values(
+            consumer=consumer, last_id=last_id, updated_at=datetime.now().isoformat()
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["consumer"],
+            set_={"last_id": statement.excluded.last_id, "updated_at": statement.excluded.updated_at},
+        )
+        with self.db.session_scope() as session:
+            session.execute(statement)
+
+    def consume(self, consumer: str, sink: ChangeSink, batch_size: int = 100) -> int:
+        """利用者のカーソルより後のイベントをすべて sink に送り、送り終えた分だけカーソルを進める
+
+        batch_size 件ごとに送信してカーソルを保存するため、途中で失敗しても送信済みの分は再送しない
+
+        Args:
+            consumer (str): 利用者名、カーソルの保存に使う
+            sink (ChangeSink): 送り先
+            batch_size (int): 1回に送るイベント数
+
+        Returns:
+            int: 送ったイベント数
+        """
+        after_id = self.get_cursor(consumer)
+        count = 0
+        while True:
+            event_list, next_id = self.read(after_id, batch_size)
+            if event_list:
+                sink.send(event_list)
+                count += len(event_list)
+            if next_id != after_id:
+                self.set_cursor(consumer, next_id)
+                after_id = next_id
+            if len(event_list) < batch_size:
+                break
+        logger.info(f"Change feed: {count} events sent to {consumer}.")
+        return count
@@ -0,0 +1,108 @@
+from abc import ABCMeta, abstractmethod
+from logging import INFO, getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO
+
+import orjson
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+class ChangeSink(metaclass=ABCMeta):
+    """変更フィードのイベントの送り先
+
+    send が例外を送出しなかった場合のみ、ChangeFeed は利用者のカーソルを進める
+    送信に失敗したイベントは次回も送られるため、送り先では id で重複を判定すること
+    """
+
+    @abstractmethod
+    def send(self, event_list: list[dict]) -> None:
+        """イベントを送る
+
+        Args:
+            event_list (list[dict]): id 昇順のイベントのリスト、空リストは渡されない
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """送り先との接続などを閉じる"""
+
+
+class StreamSink(ChangeSink):
+    """JSON Lines 形式で、1行に1イベントを出力先に書き出す"""
+
+    output: BinaryIO
+
+    def __init__(self, output: BinaryIO) -> None:
+        """StreamSink を作成する
+
+        Args:
+            output (BinaryIO): 出力先、クローズは呼び出し元が行う
+        """
+        self.output = output
+
+    def send(self, event_list: list[dict]) -> None:
+        option = orjson.OPT_APPEND_NEWLINE
+        self.output.write(b"".join(orjson.dumps(event, option=option) for event in event_list))
+        self.output.flush()
+
+
+class FileSink(ChangeSink):
+    """JSON Lines 形式で、1行に1イベントをファイルに追記する"""
+
+    path: Path
+
+    def __init__(self, path: Path) -> None:
+        """FileSink を作成する
+
+        Args:
+            path (Path): 追記するファイル、無い場合は作成する
+        """
+        self.path = path
+
+    def send(self, event_list: list[dict]) -> None:
+        with self.path.open("ab") as file:
+            StreamSink(file).send(event_list)
+
+
+class WebhookSink(ChangeSink):
+    """イベントを {"events": [...]} の JSON として URL に POST する
+
+    2xx 以外の応答は送信失敗として例外を送出する
+    """
+
+    url: str
+    timeout: float
+    client: "httpx.Client | None"
+
+    def __init__(self, url: str, timeout: float = 10.0) -> None:
+        """WebhookSink を作成する
+
+        Args:
+            url (str): POST する URL
+            timeout (float): 1リクエストのタイムアウト(秒)
+        """
+        self.url = url
+        self.timeout = timeout
+        self.client = None
+
+    def _get_client(self) -> "httpx.Client":
+        if self.client is None:
+            import httpx
+
+            self.client = httpx.Client(timeout=self.timeout, transport=httpx.HTTPTransport(retries=3))
+        return self.client
+
+    def send(self, event_list: list[dict]) -> None:
+        content = orjson.dumps({"events": event_list})
+        response = self._get_client().post(self.url, content=content, headers={"Content-Type": "application/json"})
+        response.raise_for_status()
+
+    def close(self) -> None:
+        if self.client is not None:
+            self.client.close()
+            self.client = None
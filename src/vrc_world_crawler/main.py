@@ -1,25 +1,586 @@
-import logging.config
+import argparse
+import sys
+from contextlib import AbstractContextManager, nullcontext
+from datetime import timedelta
 from logging import INFO, getLogger
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-from vrc_world_crawler.crawler.crawler import Crawler
+if TYPE_CHECKING:
+    from collections.abc import Callable
 
-logging.config.fileConfig("./log/logging.ini", disable_existing_loggers=False)
-# for name in logging.root.manager.loggerDict:
-#     if "vrc_world_crawler" not in name:
-#         getLogger(name).disabled = True
+    import httpx
+
+    from vrc_world_crawler.crawler.asset_downloader import AssetDownloader
+    from vrc_world_crawler.crawler.run_lock import RunLock
+    from vrc_world_crawler.crawler.valueobject.account import Account
+    from vrc_world_crawler.db.trending_engine import TrendingEngine
+    from vrc_world_crawler.feed.sink import ChangeSink
+
+# 起動時間を短くするため、ログ設定とクローラ本体(SQLAlchemy, httpx を含む)の import は各サブコマンド内で行う
 logger = getLogger(__name__)
 logger.setLevel(INFO)
 
 
-def main() -> None:
+def _setup_logging(args: argparse.Namespace) -> None:
+    import logging.config
+
+    logging.config.fileConfig(args.log_config, disable_existing_loggers=False)
+    # for name in logging.root.manager.loggerDict:
+    #     if "vrc_world_crawler" not in name:
+    #         getLogger(name).disabled = True
+
+
+def _profile_context(args: argparse.Namespace | None) -> AbstractContextManager:
+    # 計測しない場合はプロファイラを import もしない
+    if args is None or getattr(args, "profile", None) is None:
+        return nullcontext()
+    from vrc_world_crawler.profiler import profile_run
+
+    profile_dir = args.profile_dir or Path(args.log_config).parent / "profile"
+    return profile_run(args.profile, profile_dir, args.handler.__name__, args.profile_top)
+
+
+def _memory_context(args: argparse.Namespace | None) -> AbstractContextManager:
+    if args is None or not getattr(args, "trace_memory", False):
+        return nullcontext()
+    from vrc_world_crawler.memory import track_memory
+
+    return track_memory(args.handler.__name__)
+
+
+def crawl_once(crawler, args: argparse.Namespace | None = None) -> None:
     horizontal_line = "-" * 80
     logger.info(horizontal_line)
     logger.info("VRC world crawler -> start")
-    crawler = Crawler()
-    crawler.run()
+    with _profile_context(args), _memory_context(args):
+        crawler.run()
     logger.info("VRC world crawler -> done")
     logger.info(horizontal_line)
 
 
+def _create_asset_downloader(args: argparse.Namespace) -> "AssetDownloader | None":
+    if getattr(args, "asset_dir", None) is None:
+        return None
+    from vrc_world_crawler.crawler.asset_cache import AssetCache
+    from vrc_world_crawler.crawler.asset_downloader import AssetDownloader
+
+    cache = AssetCache(args.asset_dir, args.asset_max_mb * 1024 * 1024)
+    return AssetDownloader(cache, args.asset_concurrency)
+
+
+def _create_change_sink_dict(args: argparse.Namespace) -> "dict[str, ChangeSink]":
+    from vrc_world_crawler.feed.sink import FileSink, WebhookSink
+
+    # 送り先ごとに送信済みの位置を保存するため、利用者名は送り先を含める
+    change_sink_dict: dict[str, ChangeSink] = {}
+    for path in getattr(args, "change_file", None) or []:
+        change_sink_dict[f"file:{path}"] = FileSink(path)
+    for url in getattr(args, "change_webhook", None) or []:
+        change_sink_dict[f"webhook:{url}"] = WebhookSink(url)
+    return change_sink_dict
+
+
+def _create_transport_factory(args: argparse.Namespace) -> "Callable[[Account], httpx.BaseTransport] | None":
+    record_dir = getattr(args, "record_cassette", None)
+    replay_dir = getattr(args, "replay_cassette", None)
+    if record_dir is None and replay_dir is None:
+        return None
+    from vrc_world_crawler.crawler.cassette import CassetteTransport
+
+    # カセットファイルはアカウントごとに分ける
+    if record_dir is not None:
+        return lambda account: CassetteTransport(record_dir / f"{account.name}.json", "record")
+    return lambda account: CassetteTransport(
+        replay_dir / f"{account.name}.json", "replay", latency_scale=args.replay_latency
+    )
+
+
+def _archive_after(args: argparse.Namespace) -> timedelta | None:
+    archive_after_days = getattr(args, "archive_after_days", None)
+    return None if archive_after_days is None else timedelta(days=archive_after_days)
+
+
+def _create_trending_engine(args: argparse.Namespace) -> "TrendingEngine | None":
+    if not getattr(args, "trending", False):
+        return None
+    from vrc_world_crawler.db.trending_engine import TrendingEngine
+
+    # ランキングの状態は DB の隣に保存する
+    return TrendingEngine(Path(f"{args.db}.trending"))
+
+
+def _create_run_lock(args: argparse.Namespace, acquire: bool = True) -> "RunLock":
+    from vrc_world_crawler.crawler.run_lock import RunLock
+
+    # 同じ DB へ書き込む crawl, replay, merge, archive は、デーモンと手動実行を問わずロックファイルで排他する
+    run_lock = RunLock(Path(f"{args.db}.lock"))
+    if acquire and not run_lock.acquire():
+        raise RuntimeError(f"Another crawl is running on {args.db}, lock file: {run_lock.path}.")
+    return run_lock
+
+
+def _run_crawler(args: argparse.Namespace, is_debug: bool) -> None:
+    _setup_logging(args)
+    from vrc_world_crawler.crawler.crawler import Crawler
+    from vrc_world_crawler.crawler.scheduler import Scheduler
+
+    # デーモンはロックを回ごとに取得する
+    is_daemon = getattr(args, "daemon", False)
+    run_lock = _create_run_lock(args, acquire=not is_daemon)
+    try:
+        crawler = Crawler(
+            config_path=args.config,
+            db_path=args.db,
+            cache_path=args.cache_dir,
+            is_debug=is_debug,
+            snapshot_path=getattr(args, "snapshot", None),
+            concurrency=getattr(args, "concurrency", None),
+            page_size=getattr(args, "page_size", None),
+            dry_run=args.dry_run,
+            persist_index=args.persist_index,
+            asset_downloader=_create_asset_downloader(args),
+            enrich=getattr(args, "enrich", False),
+            record_changes=getattr(args, "record_changes", False),
+            change_sink_dict=_create_change_sink_dict(args),
+            archive_after=_archive_after(args),
+            transport_factory=_create_transport_factory(args),
+            trending_engine=_create_trending_engine(args),
+        )
+        try:
+            if not is_daemon:
+                crawl_once(crawler, args)
+                return
+
+            # エンジン・HTTP クライアント・読み込み済みの WorldIndex を保持したまま繰り返し実行する
+            # ロックは回ごとに取得し、他のプロセスが実行中の回は飛ばす
+            scheduler = Scheduler(lambda: crawl_once(crawler, args), args.interval, args.jitter, run_lock)
+            scheduler.install_signal_handlers()
+            scheduler.run_forever()
+        finally:
+            crawler.close()
+    finally:
+        run_lock.release()
+
+
+def crawl(args: argparse.Namespace) -> None:
+    _run_crawler(args, is_debug=False)
+
+
+def replay(args: argparse.Namespace) -> None:
+    _run_crawler(args, is_debug=True)
+
+
+def export(args: argparse.Namespace) -> None:
+    from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+    from vrc_world_crawler.db.valueobject.world_filter import WorldFilter
+    from vrc_world_crawler.export.exporter import Exporter
+
+    world_filter = WorldFilter(
+        favorite_group=args.favorite_group,
+        release_status=args.release_status,
+        author_id=args.author_id,
+        is_favorited=True if args.favorited_only else None,
+        updated_since=args.updated_since,
+    )
+    db = FavoriteWorldDB(args.db)
+    try:
+        exporter = Exporter(db, args.format, args.chunk_size)
+        exporter.export(
+            None if args.output == "-" else Path(args.output),
+            world_filter,
+            args.columns.split(",") if args.columns else None,
+            args.watermark,
+        )
+    finally:
+        db.dispose()
+
+
+def changes(args: argparse.Namespace) -> None:
+    from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+    from vrc_world_crawler.feed.change_feed import ChangeFeed
+    from vrc_world_crawler.feed.sink import StreamSink
+
+    db = FavoriteWorldDB(args.db)
+    try:
+        change_feed = ChangeFeed(db)
+        sink = StreamSink(sys.stdout.buffer)
+        if args.consumer is not None:
+            # 前回この利用者が読み終えた位置から読み、読み終えた位置を保存する
+            change_feed.consume(args.consumer, sink, args.limit)
+            return
+        event_list, next_id = change_feed.read(args.after, args.limit, args.event_type, args.account)
+        if event_list:
+            sink.send(event_list)
+        print(f"next cursor: {next_id}", file=sys.stderr)
+    finally:
+        db.dispose()
+
+
+def stats(args: argparse.Namespace) -> None:
+    from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+
+    db = FavoriteWorldDB(args.db)
+    try:
+        stats_dict = db.stats()
+    finally:
+        db.dispose()
+    print(f"total: {stats_dict['total']}, favorited: {stats_dict['favorited']}, archived: {stats_dict['archived']}")
+    for key in ["account", "favorite_group", "release_status"]:
+        print(f"{key}:")
+        for value, count in stats_dict[key].items():
+            print(f"  {value}: {count}")
+
+
+def summary(args: argparse.Namespace) -> None:
+    from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+
+    db = FavoriteWorldDB(args.db)
+    try:
+        if args.rebuild:
+            db.rebuild_summary()
+        if args.check:
+            mismatch_dict = db.check_summary()
+            for table_name, mismatch_num in mismatch_dict.items():
+                print(f"{table_name}: {'ok' if not mismatch_num else f'{mismatch_num} rows mismatched'}")
+            if any(mismatch_dict.values()):
+                sys.exit(1)
+            return
+        row_list = db.summary(args.by, args.account, args.order_by, args.limit)
+    finally:
+        db.dispose()
+    for row in row_list:
+        print("\t".join(str(value) for value in row.values()))
+
+
+def trending(args: argparse.Namespace) -> None:
+    from datetime import datetime
+
+    from vrc_world_crawler.db.trending_engine import TrendingEngine
+
+    state_path = Path(f"{args.db}.trending")
+    if not state_path.is_file():
+        raise FileNotFoundError(f"Trending state not found: {state_path}, crawl with --trending first.")
+    engine = TrendingEngine(state_path)
+    # 最後のクロールから時間が経っている場合は、期間から外れた分を引いてから表示する
+    engine.advance(datetime.now())
+    for world_id, growth in engine.top(args.window, args.metric, args.top):
+        print(f"{world_id}\t{growth}")
+
+
+def search(args: argparse.Namespace) -> None:
+    from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+    from vrc_world_crawler.db.valueobject.world_filter import WorldFilter
+
+    db = FavoriteWorldDB(args.db)
+    try:
+        if args.rebuild:
+            db.rebuild_search_index()
+        if not args.query:
+            return
+        world_filter = WorldFilter(is_favorited=True if args.favorited_only else None)
+        result_list = db.search(" ".join(args.query), world_filter, args.limit)
+    finally:
+        db.dispose()
+    for result in result_list:
+        print(f"{result['world_id']}\t{result['world_name']}\t{result['author_name']}")
+        if result["snippet"] is not None:
+            print(f"  {result['snippet']}")
+
+
+def enqueue(args: argparse.Namespace) -> None:
+    import orjson
+
+    from vrc_world_crawler.crawler.fetcher import Fetcher
+    from vrc_world_crawler.crawler.valueobject.account import Account
+    from vrc_world_crawler.db.work_queue import WorkQueue
+
+    account_list = Account.create_list(orjson.loads(args.config.read_bytes()))
+    queue = WorkQueue(args.queue_db)
+    try:
+        crawl_id = queue.enqueue(
+            [account.name for account in account_list],
+            Fetcher.tag_list,
+            Fetcher.max_offset,
+            args.page_size or Fetcher.page_size,
+            args.unit_pages,
+            args.crawl_id,
+        )
+    finally:
+        queue.dispose()
+    print(crawl_id)
+
+
+def work(args: argparse.Namespace) -> None:
+    _setup_logging(args)
+    import orjson
+
+    from vrc_world_crawler.crawler.crawl_worker import CrawlWorker
+    from vrc_world_crawler.crawler.valueobject.account import Account
+    from vrc_world_crawler.db.work_queue import WorkQueue
+
+    account_list = Account.create_list(orjson.loads(args.config.read_bytes()))
+    queue = WorkQueue(args.queue_db, args.lease_seconds)
+    worker = CrawlWorker(
+        queue,
+        account_list,
+        args.worker_id,
+        args.cache_dir,
+        _create_transport_factory(args),
+    )
+    try:
+        worker.run(args.crawl_id, args.max_units, args.wait, args.poll_interval)
+    finally:
+        worker.close()
+        queue.dispose()
+
+
+def merge(args: argparse.Namespace) -> None:
+    _setup_logging(args)
+    from vrc_world_crawler.crawler.crawl_worker import merge_crawl
+    from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+    from vrc_world_crawler.db.work_queue import WorkQueue
+
+    run_lock = _create_run_lock(args)
+    try:
+        queue = WorkQueue(args.queue_db)
+        db = FavoriteWorldDB(args.db, persist_index=args.persist_index, record_changes=args.record_changes)
+        try:
+            crawl_id_list = queue.crawl_id_list()
+            crawl_id = args.crawl_id or (crawl_id_list[-1] if crawl_id_list else "")
+            writer = merge_crawl(queue, db, crawl_id, args.dry_run, not args.keep, _create_trending_engine(args))
+        finally:
+            db.dispose()
+            queue.dispose()
+    finally:
+        run_lock.release()
+    if writer.error_dict:
+        raise next(iter(writer.error_dict.values()))
+
+
+def archive(args: argparse.Namespace) -> None:
+    _setup_logging(args)
+    from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+
+    run_lock = _create_run_lock(args)
+    try:
+        db = FavoriteWorldDB(args.db, persist_index=args.persist_index)
+        try:
+            if args.enable_incremental_vacuum and db.enable_incremental_vacuum():
+                logger.info("Enabled incremental vacuum.")
+            archived_num = db.archive_unfavorited(timedelta(days=args.after_days), args.batch_size)
+            freed_num = db.incremental_vacuum(args.vacuum_pages) if args.vacuum_pages else 0
+        finally:
+            db.dispose()
+    finally:
+        run_lock.release()
+    print(f"archived: {archived_num}, freed pages: {freed_num}")
+
+
+def bench(args: argparse.Namespace) -> None:
+    from vrc_world_crawler.bench import measure_pipeline_memory, run_benchmark
+
+    if args.memory:
+        print(measure_pipeline_memory(args.size).report())
+        return
+    for result in run_benchmark(args.name or None, args.size, args.repeat):
+        print(result)
+
+
+def _add_crawl_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--concurrency", type=int, default=None, help="max number of accounts fetched at once")
+    parser.add_argument("--page-size", type=int, default=None, help="number of worlds per API request")
+    parser.add_argument("--dry-run", action="store_true", help="fetch and write but rollback instead of commit")
+    parser.add_argument("--daemon", action="store_true", help="run crawl repeatedly until SIGINT/SIGTERM")
+    parser.add_argument("--interval", type=float, default=3600.0, help="daemon crawl interval in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="max random delay added to the interval")
+    parser.add_argument("--enrich", action="store_true", help="fetch details of worlds changed since the last crawl")
+    parser.add_argument("--asset-dir", type=Path, default=None, help="download world images into this cache directory")
+    parser.add_argument("--asset-max-mb", type=int, default=1024, help="max total size of the image cache in MB")
+    parser.add_argument("--asset-concurrency", type=int, default=4, help="max number of images downloaded at once")
+    parser.add_argument("--record-changes", action="store_true", help="record added/removed/updated worlds")
+    parser.add_argument(
+        "--change-file", type=Path, action="append", help="append new change events to this JSON Lines file"
+    )
+    parser.add_argument("--change-webhook", action="append", help="POST new change events to this URL")
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument(
+        "--record-cassette", type=Path, default=None, help="record HTTP requests and responses into this directory"
+    )
+    cassette_group.add_argument(
+        "--replay-cassette", type=Path, default=None, help="replay recorded HTTP responses instead of the network"
+    )
+    parser.add_argument(
+        "--replay-latency", type=float, default=0.0, help="replay with the recorded latency multiplied by this"
+    )
+    parser.add_argument(
+        "--archive-after-days",
+        type=float,
+        default=None,
+        help="archive worlds unfavorited more than this many days ago",
+    )
+    parser.add_argument(
+        "--trending", action="store_true", help="update the trending rankings saved next to the database"
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="vrc_world_crawler", description="VRC world crawler")
+    parser.add_argument("--config", type=Path, default=Path("./config/config.json"), help="config file path")
+    parser.add_argument("--db", default="vrc.db", help="database file path")
+    parser.add_argument("--cache-dir", type=Path, default=Path("./cache/"), help="fetch cache directory")
+    parser.add_argument("--log-config", default="./log/logging.ini", help="logging config file path")
+    parser.add_argument("--queue-db", default="queue.db", help="work queue database file path for distributed crawls")
+    parser.add_argument(
+        "--persist-index", action="store_true", help="save the world index next to the database for fast restarts"
+    )
+    parser.add_argument(
+        "--profile",
+        choices=["sampling", "cprofile"],
+        default=None,
+        help="profile each crawl run and write a CPU profile and summary",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        type=Path,
+        default=None,
+        help="profile output directory, default is profile/ next to the log config",
+    )
+    parser.add_argument("--profile-top", type=int, default=20, help="number of functions in the profile summary")
+    parser.add_argument(
+        "--trace-memory", action="store_true", help="log peak memory and top allocation sites of each crawl run"
+    )
+    # サブコマンドを省略した場合は既定の設定の crawl として動作する
+    parser.set_defaults(
+        handler=crawl, concurrency=None, page_size=None, dry_run=False, daemon=False, interval=3600.0, jitter=0.0
+    )
+    subparsers = parser.add_subparsers(title="commands")
+
+    crawl_parser = subparsers.add_parser("crawl", help="fetch favorites from VRChat and update the database")
+    _add_crawl_arguments(crawl_parser)
+    crawl_parser.set_defaults(handler=crawl)
+
+    replay_parser = subparsers.add_parser("replay", help="update the database from a cached fetch snapshot")
+    replay_parser.add_argument("--snapshot", type=Path, default=None, help="snapshot file, default is the latest")
+    replay_parser.add_argument("--dry-run", action="store_true", help="write but rollback instead of commit")
+    replay_parser.add_argument(
+        "--trending", action="store_true", help="update the trending rankings saved next to the database"
+    )
+    replay_parser.set_defaults(handler=replay)
+
+    export_parser = subparsers.add_parser("export", help="export FavoriteWorld rows as JSON Lines, CSV or columnar")
+    export_parser.add_argument("-o", "--output", default="-", help="output file path, '-' for stdout")
+    export_parser.add_argument("--format", choices=["jsonl", "csv", "columnar"], default="jsonl")
+    export_parser.add_argument("--columns", default=None, help="comma separated column names, default is all")
+    export_parser.add_argument("--chunk-size", type=int, default=1000, help="rows read and written at once")
+    export_parser.add_argument(
+        "--watermark", type=Path, default=None, help="file to store the export position, export only changed rows"
+    )
+    export_parser.add_argument("--favorite-group", default=None)
+    export_parser.add_argument("--release-status", default=None)
+    export_parser.add_argument("--author-id", default=None)
+    export_parser.add_argument("--updated-since", default=None, help="ISO format datetime")
+    export_parser.add_argument("--favorited-only", action="store_true")
+    export_parser.set_defaults(handler=export)
+
+    changes_parser = subparsers.add_parser("changes", help="print recorded change events as JSON Lines")
+    changes_parser.add_argument("--after", type=int, default=0, help="print events after this cursor (event id)")
+    changes_parser.add_argument("--limit", type=int, default=100, help="max number of events")
+    changes_parser.add_argument("--event-type", choices=["added", "removed", "updated", "status_changed"])
+    changes_parser.add_argument("--account", default=None)
+    changes_parser.add_argument(
+        "--consumer", default=None, help="read all events after the saved cursor of this consumer and advance it"
+    )
+    changes_parser.set_defaults(handler=changes)
+
+    stats_parser = subparsers.add_parser("stats", help="print row counts of the database")
+    stats_parser.set_defaults(handler=stats)
+
+    summary_parser = subparsers.add_parser(
+        "summary", help="print world counts and star/visit totals per favorite group or author"
+    )
+    summary_parser.add_argument("by", nargs="?", choices=["favorite_group", "author"], default="favorite_group")
+    summary_parser.add_argument("--account", default=None, help="only this account, default is all accounts")
+    summary_parser.add_argument(
+        "--order-by", choices=["world_num", "favorited_num", "star_total", "visit_total"], default="world_num"
+    )
+    summary_parser.add_argument("--limit", type=int, default=None, help="max number of rows")
+    summary_parser.add_argument(
+        "--check", action="store_true", help="compare the summary tables with a full scan, exit 1 on mismatch"
+    )
+    summary_parser.add_argument("--rebuild", action="store_true", help="rebuild the summary tables from a full scan")
+    summary_parser.set_defaults(handler=summary)
+
+    trending_parser = subparsers.add_parser(
+        "trending", help="print worlds whose stars or visits grew the most in a recent window"
+    )
+    trending_parser.add_argument("--window", choices=["24h", "7d", "30d"], default="24h")
+    trending_parser.add_argument("--metric", choices=["star", "visit"], default="star")
+    trending_parser.add_argument("--top", type=int, default=10, help="number of worlds")
+    trending_parser.set_defaults(handler=trending)
+
+    search_parser = subparsers.add_parser("search", help="full-text search world names, authors and descriptions")
+    search_parser.add_argument("query", nargs="*", help="search terms, all terms must match")
+    search_parser.add_argument("--limit", type=int, default=20, help="max number of results")
+    search_parser.add_argument("--favorited-only", action="store_true")
+    search_parser.add_argument("--rebuild", action="store_true", help="rebuild the search index before searching")
+    search_parser.set_defaults(handler=search)
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="split a crawl into work units for distributed workers")
+    enqueue_parser.add_argument("--page-size", type=int, default=None, help="number of worlds per API request")
+    enqueue_parser.add_argument("--unit-pages", type=int, default=1, help="number of pages per work unit")
+    enqueue_parser.add_argument("--crawl-id", default=None, help="crawl identifier, default is the current time")
+    enqueue_parser.set_defaults(handler=enqueue)
+
+    work_parser = subparsers.add_parser("work", help="fetch work units from the queue until none is left")
+    work_parser.add_argument("--crawl-id", default=None, help="only process this crawl")
+    work_parser.add_argument("--worker-id", default=None, help="lease owner name, default is host:pid:random")
+    work_parser.add_argument("--max-units", type=int, default=None, help="max number of work units to process")
+    work_parser.add_argument("--lease-seconds", type=int, default=300, help="lease time of a claimed work unit")
+    work_parser.add_argument(
+        "--wait", action="store_true", help="keep polling until the crawl is finished, requires --crawl-id"
+    )
+    work_parser.add_argument("--poll-interval", type=float, default=5.0, help="polling interval in seconds")
+    work_cassette_group = work_parser.add_mutually_exclusive_group()
+    work_cassette_group.add_argument("--record-cassette", type=Path, default=None)
+    work_cassette_group.add_argument("--replay-cassette", type=Path, default=None)
+    work_parser.add_argument("--replay-latency", type=float, default=0.0)
+    work_parser.set_defaults(handler=work)
+
+    merge_parser = subparsers.add_parser("merge", help="write a finished distributed crawl into the database")
+    merge_parser.add_argument("--crawl-id", default=None, help="crawl to merge, default is the latest")
+    merge_parser.add_argument("--dry-run", action="store_true", help="write but rollback instead of commit")
+    merge_parser.add_argument("--record-changes", action="store_true", help="record added/removed/updated worlds")
+    merge_parser.add_argument("--keep", action="store_true", help="keep the work units in the queue after merging")
+    merge_parser.add_argument(
+        "--trending", action="store_true", help="update the trending rankings saved next to the database"
+    )
+    merge_parser.set_defaults(handler=merge)
+
+    archive_parser = subparsers.add_parser("archive", help="move long-unfavorited worlds to the archive table")
+    archive_parser.add_argument("--after-days", type=float, default=365.0, help="days since the world was unfavorited")
+    archive_parser.add_argument("--batch-size", type=int, default=500, help="rows moved per transaction")
+    archive_parser.add_argument("--vacuum-pages", type=int, default=1024, help="max pages freed after archiving")
+    archive_parser.add_argument(
+        "--enable-incremental-vacuum", action="store_true", help="switch an existing database to incremental vacuum"
+    )
+    archive_parser.set_defaults(handler=archive)
+
+    bench_parser = subparsers.add_parser("bench", help="run the benchmark suite")
+    bench_parser.add_argument("name", nargs="*", help="benchmark names, default is all")
+    bench_parser.add_argument("--size", type=int, default=1000, help="number of records per run")
+    bench_parser.add_argument("--repeat", type=int, default=3, help="number of runs")
+    bench_parser.add_argument(
+        "--memory", action="store_true", help="measure memory per phase of fetch, record creation and upsert instead"
+    )
+    bench_parser.set_defaults(handler=bench)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,163 @@
+import gc
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from logging import INFO, getLogger
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+@dataclass(frozen=True)
+class MemoryUsage:
+    """1つの処理区間のメモリ使用量
+
+    Attributes:
+        name (str): 区間名
+        allocated (int): 区間の終了時点で残っている、区間内で確保したメモリ(バイト)、解放した量が多い場合は負
+        peak (int): 区間内で最も多く確保していた時点の、区間開始時からの増加量(バイト)
+    """
+
+    name: str
+    allocated: int
+    peak: int
+
+    def __post_init__(self) -> None:
+        if self.peak < 0:
+            raise ValueError("peak must not be negative.")
+
+    def __str__(self) -> str:
+        return f"{self.name:<24} allocated={self.allocated / 1024:10.1f}KiB peak={self.peak / 1024:10.1f}KiB"
+
+
+class MemoryTracker:
+    """tracemalloc で処理区間ごとのメモリ使用量を計測する
+
+    phase で区切った区間ごとに、区間の終了時点で残っているメモリと、区間内のピークを記録する
+    区間の前後でガベージコレクションを行い、残っているメモリには到達可能なオブジェクトのみを数える
+    tracemalloc のピークはプロセス全体で1つのため、区間は入れ子にせず、1つずつ順に計測すること
+    他のスレッドの確保も区間に含まれる
+
+    計測中は Python のメモリ確保が遅くなるため、計測時のみ使う
+    """
+
+    frame_num: int
+    usage_list: list[MemoryUsage]
+
+    def __init__(self, frame_num: int = 1) -> None:
+        """MemoryTracker を作成する
+
+        Args:
+            frame_num (int): 確保した箇所として記録するスタックの深さ
+        """
+        self.frame_num = frame_num
+        self.usage_list = []
+        self._started = False
+        self._in_phase = False
+        self._base = 0
+        self._peak = 0
+
+    def start(self) -> None:
+        """計測を開始する、既に tracemalloc が動いている場合はそのまま使う"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frame_num)
+            self._started = True
+        self._base = tracemalloc.get_traced_memory()[0]
+        self._peak = 0
+        tracemalloc.reset_peak()
+
+    def stop(self) -> None:
+        """計測を終了する、start で tracemalloc を開始した場合は停止する"""
+        self._update_peak()
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+    def __enter__(self) -> "MemoryTracker":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def _update_peak(self) -> None:
+        if tracemalloc.is_tracing():
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1] - self._base)
+
+    @property
+    def peak(self) -> int:
+        """start からのピークの増加量(バイト)"""
+        self._update_peak()
+        return self._peak
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """with ブロックを1つの区間として計測し、usage_list に追加する
+
+        Args:
+            name (str): 区間名
+
+        Raises:
+            RuntimeError: 計測を開始していない場合と、区間を入れ子にした場合
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("MemoryTracker is not started.")
+        if self._in_phase:
+            raise RuntimeError("MemoryTracker phases must not be nested.")
+        self._in_phase = True
+        # 循環参照のごみの回収時期で結果が変わらないよう、区間の前後で回収する
+        gc.collect()
+        # 区間の開始時点までのピークを退避してから、区間内のピークを計る
+        self._update_peak()
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            gc.collect()
+            current, peak = tracemalloc.get_traced_memory()
+            self._peak = max(self._peak, peak - self._base)
+            self.usage_list.append(MemoryUsage(name, current - start, max(peak - start, 0)))
+            self._in_phase = False
+
+    def top_allocations(self, limit: int = 10) -> list[str]:
+        """現在残っているメモリを確保した箇所を、量の多い順に返す
+
+        Args:
+            limit (int): 返す箇所の数
+
+        Returns:
+            list[str]: "ファイル:行: size=..., count=..., average=..." 形式の文字列のリスト
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        return [str(statistic) for statistic in snapshot.statistics("lineno")[:limit]]
+
+    def report(self) -> str:
+        """区間ごとの使用量と全体のピークを文字列にする"""
+        line_list = [str(usage) for usage in self.usage_list]
+        line_list.append(f"{'total':<24} peak={self.peak / 1024:10.1f}KiB")
+        return "\n".join(line_list)
+
+
+@contextmanager
+def track_memory(name: str, top_n: int = 10) -> Iterator[MemoryTracker]:
+    """with ブロックのメモリ使用量を計測し、終了時にログに出力する
+
+    処理が終了した時点で残っているメモリを確保した箇所も、多い順に top_n 件出力する
+
+    Args:
+        name (str): 区間名
+        top_n (int): 出力する確保箇所の数
+
+    Yields:
+        MemoryTracker: 計測中の MemoryTracker
+    """
+    with MemoryTracker() as tracker:
+        try:
+            with tracker.phase(name):
+                yield tracker
+        finally:
+            logger.info(f"Memory usage:\n{tracker.report()}")
+            if top_n:
+                logger.info("Top allocations:\n" + "\n".join(tracker.top_allocations(top_n)))
@@ -0,0 +1,324 @@
+import cProfile
+import io
+import pstats
+import re
+import sys
+import threading
+import zlib
+from abc import ABCMeta, abstractmethod
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from html import escape
+from logging import INFO, getLogger
+from pathlib import Path
+from types import FrameType
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# プロファイラの種類
+PROFILE_MODE_LIST = ["sampling", "cprofile"]
+
+# スレッドプールのワーカー名の末尾の番号、同じプールのスレッドを1つにまとめるために取り除く
+_WORKER_SUFFIX_PATTERN = re.compile(r"_\d+$")
+
+# 待機中とみなす末端の関数、CPU を使っていないためサンプリングプロファイラでは数えない
+_IDLE_LEAF_SET = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("queue.py", "put"),
+    ("selectors.py", "select"),
+    ("socket.py", "readinto"),
+    ("ssl.py", "read"),
+    ("ssl.py", "recv_into"),
+    ("rate_limiter.py", "acquire"),
+    ("scheduler.py", "run_forever"),
+}
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    # collapsed stack 形式では ; が区切り文字のため、関数名に含めない
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})".replace(";", ":")
+
+
+class Profiler(metaclass=ABCMeta):
+    """1回の処理の CPU 使用箇所を計測するプロファイラ
+
+    start から stop までに実行された処理を計測し、write で結果をファイルに書き出す
+    """
+
+    @abstractmethod
+    def start(self) -> None:
+        """計測を開始する"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def stop(self) -> None:
+        """計測を終了する"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def write(self, output_dir: Path, name: str, top_n: int) -> list[Path]:
+        """計測結果を書き出す
+
+        Args:
+            output_dir (Path): 出力先ディレクトリ
+            name (str): 出力ファイル名の先頭部分
+            top_n (int): 集計に載せる関数の数
+
+        Returns:
+            list[Path]: 書き出したファイルのリスト
+        """
+        raise NotImplementedError
+
+
+class SamplingProfiler(Profiler):
+    """一定間隔で全スレッドのスタックを記録するサンプリングプロファイラ
+
+    計測対象の処理には手を加えないため、計測中も処理速度はほとんど変わらない
+    結果は collapsed stack 形式(flamegraph.pl, speedscope などで読める)と SVG のフレームグラフに書き出す
+    スタックの根元にはスレッド名を置き、同じスレッドプールのスレッドは1つにまとめる
+    """
+
+    interval: float
+    sample_counter: Counter[tuple[str, ...]]
+
+    def __init__(self, interval: float = 0.005) -> None:
+        """SamplingProfiler を作成する
+
+        Args:
+            interval (float): サンプリング間隔(秒)
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive.")
+        self.interval = interval
+        self.sample_counter = Counter()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            self.sample(own_ident)
+
+    def sample(self, own_ident: int | None = None) -> None:
+        """全スレッドのスタックを1回記録する、待機中のスレッドは記録しない"""
+        thread_name_dict = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            code = frame.f_code
+            if (Path(code.co_filename).name, code.co_name) in _IDLE_LEAF_SET:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            thread_name = _WORKER_SUFFIX_PATTERN.sub("", thread_name_dict.get(ident, str(ident)))
+            self.sample_counter[(thread_name, *reversed(stack))] += 1
+
+    def summary(self, top_n: int) -> str:
+        """自身での実行時間と、呼び出し先を含む実行時間の多い順に関数を並べた集計を返す"""
+        total = sum(self.sample_counter.values())
+        self_counter: Counter[str] = Counter()
+        inclusive_counter: Counter[str] = Counter()
+        for stack, count in self.sample_counter.items():
+            self_counter[stack[-1]] += count
+            for frame_name in set(stack[1:]):
+                inclusive_counter[frame_name] += count
+
+        line_list = [f"{total} samples, interval {self.interval * 1000:g}ms"]
+        for title, counter in [("self", self_counter), ("inclusive", inclusive_counter)]:
+            line_list.append("")
+            line_list.append(f"top {top_n} functions by {title} samples:")
+            for frame_name, count in counter.most_common(top_n):
+                line_list.append(f"{count:8} {count / total:7.1%}  {frame_name}")
+        return "\n".join(line_list) + "\n"
+
+    def write(self, output_dir: Path, name: str, top_n: int) -> list[Path]:
+        collapsed_path = output_dir / f"{name}.collapsed"
+        collapsed_path.write_text(
+            "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.sample_counter.items())),
+            encoding="utf-8",
+        )
+        svg_path = output_dir / f"{name}.svg"
+        svg_path.write_text(render_flame_graph(self.sample_counter, name), encoding="utf-8")
+        summary_path = output_dir / f"{name}_summary.txt"
+        summary_path.write_text(self.summary(top_n) if self.sample_counter else "0 samples\n", encoding="utf-8")
+        return [collapsed_path, svg_path, summary_path]
+
+
+class CProfileProfiler(Profiler):
+    """cProfile による決定的プロファイラ
+
+    呼び出し回数と実行時間を関数ごとに正確に計測するが、計測中は処理が数倍遅くなる
+    start を呼んだスレッドに加え、計測中に開始したスレッドも計測し、終了時に1つの pstats にまとめる
+    stop の時点で動いているスレッドの結果は含めない
+    """
+
+    def __init__(self) -> None:
+        self._profile = cProfile.Profile()
+        self._thread_profile_list: list[tuple[threading.Thread, cProfile.Profile]] = []
+        self._lock = threading.Lock()
+        self.stats: pstats.Stats | None = None
+
+    def _thread_hook(self, frame: FrameType, event: str, arg) -> None:
+        # threading.setprofile で新しいスレッドの最初の呼び出し時に呼ばれ、そのスレッドの計測を開始する
+        profile = cProfile.Profile()
+        with self._lock:
+            self._thread_profile_list.append((threading.current_thread(), profile))
+        profile.enable()
+
+    def start(self) -> None:
+        threading.setprofile(self._thread_hook)
+        self._profile.enable()
+
+    def stop(self) -> None:
+        self._profile.disable()
+        threading.setprofile(None)
+        self.stats = pstats.Stats(self._profile)
+        running_num = 0
+        with self._lock:
+            for thread, profile in self._thread_profile_list:
+                if thread.is_alive():
+                    running_num += 1
+                    continue
+                self.stats.add(profile)
+        if running_num:
+            logger.info(f"Profile: {running_num} threads still running are not included.")
+
+    def summary(self, top_n: int) -> str:
+        """自身での実行時間と、呼び出し先を含む実行時間の多い順に関数を並べた集計を返す"""
+        output = io.StringIO()
+        self.stats.stream = output
+        for sort_key in ["tottime", "cumulative"]:
+            self.stats.sort_stats(sort_key).print_stats(top_n)
+        return output.getvalue()
+
+    def write(self, output_dir: Path, name: str, top_n: int) -> list[Path]:
+        pstats_path = output_dir / f"{name}.pstats"
+        self.stats.dump_stats(pstats_path)
+        summary_path = output_dir / f"{name}_summary.txt"
+        summary_path.write_text(self.summary(top_n), encoding="utf-8")
+        return [pstats_path, summary_path]
+
+
+def create_profiler(mode: str) -> Profiler:
+    """PROFILE_MODE_LIST のいずれかの名前からプロファイラを作成する"""
+    match mode:
+        case "sampling":
+            return SamplingProfiler()
+        case "cprofile":
+            return CProfileProfiler()
+        case _:
+            raise ValueError(f"Unknown profile mode: {mode}.")
+
+
+@contextmanager
+def profile_run(mode: str, output_dir: Path, name: str = "crawl", top_n: int = 20) -> Iterator[Profiler]:
+    """with ブロック内の処理を計測し、終了時に output_dir に結果を書き出す
+
+    ファイル名には開始日時を付け、実行ごとに別のファイルとする
+    処理が例外で終了した場合も、それまでの計測結果を書き出す
+
+    Args:
+        mode (str): プロファイラの種類、PROFILE_MODE_LIST のいずれか
+        output_dir (Path): 出力先ディレクトリ、無い場合は作成する
+        name (str): 出力ファイル名の先頭部分
+        top_n (int): 集計に載せる関数の数
+
+    Yields:
+        Profiler: 計測中のプロファイラ
+    """
+    profiler = create_profiler(mode)
+    file_name = f"{name}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        output_dir.mkdir(parents=True, exist_ok=True)
+        path_list = profiler.write(output_dir, file_name, top_n)
+        logger.info(f"Profile written: {', '.join(str(path) for path in path_list)}")
+
+
+def render_flame_graph(sample_counter: Counter[tuple[str, ...]], title: str, width: int = 1200) -> str:
+    """スタックごとのサンプル数から SVG のフレームグラフを作成する
+
+    根元の関数を下に置き、各関数の幅をその関数を含むサンプル数に比例させる
+
+    Args:
+        sample_counter (Counter[tuple[str, ...]]): 根元から末端へのスタックごとのサンプル数
+        title (str): グラフのタイトル
+        width (int): SVG の幅(ピクセル)
+
+    Returns:
+        str: SVG 文書
+    """
+    # 木構造 [サンプル数, {子の名前: 子}] にまとめる
+    root: list = [0, {}]
+    for stack, count in sample_counter.items():
+        root[0] += count
+        node = root
+        for frame_name in stack:
+            node = node[1].setdefault(frame_name, [0, {}])
+            node[0] += count
+
+    def depth_of(node: list) -> int:
+        return 1 + max((depth_of(child) for child in node[1].values()), default=0)
+
+    row_height = 16
+    top_margin = 24
+    height = top_margin + depth_of(root) * row_height
+    total = root[0] or 1
+    scale = width / total
+    element_list = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" '
+        f'font-size="11">',
+        f'<text x="4" y="16">{escape(title)} ({root[0]} samples)</text>',
+    ]
+
+    def draw(node: list, name: str, x: float, depth: int) -> None:
+        node_width = node[0] * scale
+        if node_width < 0.5:
+            return
+        y = height - (depth + 1) * row_height
+        # 関数名から決まる暖色系の色
+        hue = zlib.crc32(name.encode()) % 60
+        label = escape(name)
+        element_list.append(
+            f"<g><title>{label} ({node[0]} samples, {node[0] / total:.1%})</title>"
+            f'<rect x="{x:.1f}" y="{y}" width="{node_width:.1f}" height="{row_height - 1}" '
+            f'fill="hsl({hue}, 80%, 60%)"/>'
+        )
+        char_num = int(node_width / 7)
+        if char_num >= 3:
+            text = name if len(name) <= char_num else name[: char_num - 2] + ".."
+            element_list.append(f'<text x="{x + 2:.1f}" y="{y + row_height - 4}">{escape(text)}</text>')
+        element_list.append("</g>")
+        child_x = x
+        for child_name, child in sorted(node[1].items()):
+            draw(child, child_name, child_x, depth + 1)
+            child_x += child[0] * scale
+
+    x = 0.0
+    for name, child in sorted(root[1].items()):
+        draw(child, name, x, 0)
+        x += child[0] * scale
+    element_list.append("</svg>")
+    return "\n".join(element_list) + "\n"
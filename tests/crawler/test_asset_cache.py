@@ -0,0 +1,83 @@
+import hashlib
+import sys
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from vrc_world_crawler.crawler.asset_cache import AssetCache
+
+
+class TestAssetCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.root = Path(self.enterContext(TemporaryDirectory()))
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def _put(self, instance: AssetCache, url: str, content: bytes) -> Path:
+        tmp_path = self.root / "download.tmp"
+        tmp_path.write_bytes(content)
+        return instance.put(url, hashlib.sha256(content).hexdigest(), tmp_path)
+
+    def test_init(self):
+        instance = AssetCache(self.root, 100)
+        self.assertEqual(self.root, instance.root)
+        self.assertEqual(100, instance.max_size)
+        self.assertEqual(0, instance.total_size)
+        self.assertTrue((self.root / "blobs").is_dir())
+
+        with self.assertRaises(ValueError):
+            AssetCache(self.root, 0)
+
+    def test_put_and_get_path(self):
+        instance = AssetCache(self.root, 100)
+        path = self._put(instance, "https://example.com/a.png", b"a" * 10)
+        self.assertEqual(b"a" * 10, path.read_bytes())
+        self.assertEqual(path, instance.get_path("https://example.com/a.png"))
+        self.assertIn("https://example.com/a.png", instance)
+        self.assertIsNone(instance.get_path("https://example.com/b.png"))
+        self.assertFalse((self.root / "download.tmp").exists())
+
+        # 同じ内容は URL が違っても1ファイルだけ保存する
+        self.assertEqual(path, self._put(instance, "https://example.com/a2.png", b"a" * 10))
+        self.assertEqual(1, len(instance))
+        self.assertEqual(10, instance.total_size)
+
+    def test_evict(self):
+        instance = AssetCache(self.root, 25)
+        path_a = self._put(instance, "a", b"a" * 10)
+        path_b = self._put(instance, "b", b"b" * 10)
+        # a を使うと b の方が長く使われていないことになる
+        instance.get_path("a")
+        path_c = self._put(instance, "c", b"c" * 10)
+
+        self.assertEqual(20, instance.total_size)
+        self.assertNotIn("b", instance)
+        self.assertFalse(path_b.exists())
+        self.assertTrue(path_a.exists())
+        self.assertTrue(path_c.exists())
+
+        # 上限より大きいファイルも直前に登録したものは残す
+        path_d = self._put(instance, "d", b"d" * 30)
+        self.assertEqual(["d"], [url for url in "abcd" if url in instance])
+        self.assertTrue(path_d.exists())
+
+    def test_save_and_load(self):
+        instance = AssetCache(self.root, 100)
+        self._put(instance, "a", b"a")
+        path_b = self._put(instance, "b", b"b")
+        instance.save()
+
+        # 保存後に削除されたファイルは読み込まない
+        path_b.unlink()
+        actual = AssetCache(self.root, 100)
+        self.assertIn("a", actual)
+        self.assertNotIn("b", actual)
+        self.assertEqual(1, actual.total_size)
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,107 @@
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from vrc_world_crawler.crawler.asset_cache import AssetCache
+from vrc_world_crawler.crawler.asset_downloader import AssetDownloader
+
+CONTENT_DICT = {
+    "/a.png": b"a" * 1000,
+    "/b.png": b"b" * 2000,
+    "/c.png": b"a" * 1000,
+    "/d.png": b"d" * 1000,
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    request_path_list: list[str] = []
+
+    def do_GET(self) -> None:
+        self.request_path_list.append(self.path)
+        content = CONTENT_DICT.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class TestAssetDownloader(unittest.TestCase):
+    def setUp(self) -> None:
+        _Handler.request_path_list = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.root = Path(self.enterContext(TemporaryDirectory()))
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        return super().tearDown()
+
+    def test_init(self):
+        cache = AssetCache(self.root, 100)
+        instance = AssetDownloader(cache)
+        self.assertIs(cache, instance.cache)
+        self.assertEqual(4, instance.concurrency)
+        self.assertIsNone(instance.client)
+
+        with self.assertRaises(ValueError):
+            AssetDownloader(cache, 0)
+
+    def test_download(self):
+        cache = AssetCache(self.root, 10000)
+        instance = AssetDownloader(cache, 2)
+        self.addCleanup(instance.close)
+        url_list = [f"{self.base_url}{path}" for path in ["/a.png", "/b.png", "/c.png", "/missing.png"]]
+
+        actual = instance.download([*url_list, url_list[0], None, ""])
+        self.assertEqual({"downloaded": 3, "skipped": 0, "failed": 1}, actual)
+        self.assertEqual(b"b" * 2000, cache.get_path(url_list[1]).read_bytes())
+        # 同じ内容の a と c は1ファイルにまとめられる
+        self.assertEqual(cache.get_path(url_list[0]), cache.get_path(url_list[2]))
+        self.assertEqual(2, len(cache))
+        self.assertEqual([], list(self.root.glob("*.tmp")))
+
+        # キャッシュにある URL はリクエストしない
+        _Handler.request_path_list.clear()
+        actual = instance.download(url_list)
+        self.assertEqual({"downloaded": 0, "skipped": 3, "failed": 1}, actual)
+        self.assertEqual(["/missing.png"], _Handler.request_path_list)
+
+        # 索引は保存され、次回起動時にも使われる
+        self.assertIn(url_list[0], AssetCache(self.root, 10000))
+
+    def test_download_touch_skipped(self):
+        cache = AssetCache(self.root, 3000)
+        instance = AssetDownloader(cache)
+        self.addCleanup(instance.close)
+        a_url, b_url, d_url = [f"{self.base_url}{path}" for path in ["/a.png", "/b.png", "/d.png"]]
+        instance.download([a_url])
+        instance.download([b_url])
+
+        # キャッシュにあった a は最近使ったものとなり、使用順は索引とともに保存される
+        self.assertEqual({"downloaded": 0, "skipped": 1, "failed": 0}, instance.download([a_url]))
+        # 上限を超えたときは a より先に b が削除される
+        cache = AssetCache(self.root, 3000)
+        instance = AssetDownloader(cache)
+        self.addCleanup(instance.close)
+        self.assertEqual({"downloaded": 1, "skipped": 0, "failed": 0}, instance.download([d_url]))
+        self.assertIn(a_url, cache)
+        self.assertNotIn(b_url, cache)
+        self.assertIn(d_url, cache)
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,141 @@
+import gzip
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import httpx
+import orjson
+from mock import call, patch
+
+from vrc_world_crawler.bench import make_favorites_transport
+from vrc_world_crawler.crawler.cassette import CassetteTransport
+from vrc_world_crawler.crawler.fetcher import Fetcher
+from vrc_world_crawler.crawler.valueobject.account import Account
+from vrc_world_crawler.db.model import DEFAULT_ACCOUNT_NAME
+
+
+class _Handler(BaseHTTPRequestHandler):
+    request_path_list: list[str] = []
+
+    def do_GET(self) -> None:
+        self.request_path_list.append(self.path)
+        if self.path != "/page":
+            self.send_error(404)
+            return
+        content = gzip.compress(orjson.dumps([{"id": len(self.request_path_list)}]))
+        self.send_response(200)
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Set-Cookie", "auth=secret")
+        self.send_header("X-Test", "1")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class TestCassetteTransport(unittest.TestCase):
+    def setUp(self) -> None:
+        _Handler.request_path_list = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.root = Path(self.enterContext(TemporaryDirectory()))
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        return super().tearDown()
+
+    def test_init(self):
+        path = self.root / "cassette.json"
+        with self.assertRaises(ValueError):
+            CassetteTransport(path, "unknown")
+        with self.assertRaises(ValueError):
+            CassetteTransport(path, "record", latency_scale=-1)
+        with self.assertRaises(FileNotFoundError):
+            CassetteTransport(path, "replay")
+        path.write_bytes(orjson.dumps({"version": 0, "interactions": []}))
+        with self.assertRaises(ValueError):
+            CassetteTransport(path, "replay")
+
+    def test_record_and_replay(self):
+        path = self.root / "cassette" / "default.json"
+        with httpx.Client(transport=CassetteTransport(path, "record"), cookies={"auth": "secret"}) as client:
+            recorded_list = [client.get(f"{self.base_url}{url_path}") for url_path in ["/page", "/page", "/none"]]
+        self.assertEqual(["/page", "/page", "/none"], _Handler.request_path_list)
+        self.assertEqual([[{"id": 1}], [{"id": 2}]], [response.json() for response in recorded_list[:2]])
+        self.assertEqual(404, recorded_list[2].status_code)
+
+        # 認証情報はファイルに残さない
+        cassette_bytes = path.read_bytes()
+        self.assertNotIn(b"secret", cassette_bytes)
+        interaction_list = CassetteTransport.load(path)
+        self.assertEqual(3, len(interaction_list))
+        self.assertEqual("GET", interaction_list[0]["request"]["method"])
+        self.assertEqual(f"{self.base_url}/page", interaction_list[0]["request"]["url"])
+        self.assertGreater(interaction_list[0]["elapsed"], 0)
+
+        # サーバを止めても同じレスポンスが返る
+        self.server.shutdown()
+        with httpx.Client(transport=CassetteTransport(path)) as client:
+            replayed_list = [client.get(f"{self.base_url}{url_path}") for url_path in ["/page", "/page", "/none"]]
+            for recorded, replayed in zip(recorded_list, replayed_list):
+                self.assertEqual(recorded.status_code, replayed.status_code)
+                self.assertEqual(recorded.content, replayed.content)
+                self.assertEqual(recorded.headers["Content-Length"], replayed.headers["Content-Length"])
+            self.assertEqual("1", replayed_list[0].headers["X-Test"])
+            self.assertEqual("gzip", replayed_list[0].headers["Content-Encoding"])
+            self.assertNotIn("Set-Cookie", replayed_list[0].headers)
+
+            # 記録より多いリクエストには最後のレスポンスを返す
+            self.assertEqual([{"id": 2}], client.get(f"{self.base_url}/page").json())
+            with self.assertRaises(LookupError):
+                client.get(f"{self.base_url}/unknown")
+        self.assertEqual(3, len(_Handler.request_path_list))
+
+    def test_replay_latency(self):
+        path = self.root / "cassette.json"
+        interaction = {
+            "request": {"method": "GET", "url": "https://example.com/", "headers": []},
+            "response": {"status_code": 200, "http_version": "HTTP/1.1", "headers": [], "content": ""},
+            "elapsed": 0.5,
+        }
+        path.write_bytes(orjson.dumps({"version": 1, "interactions": [interaction]}))
+        mock_sleep = self.enterContext(patch("vrc_world_crawler.crawler.cassette.time.sleep"))
+
+        with httpx.Client(transport=CassetteTransport(path)) as client:
+            client.get("https://example.com/")
+        mock_sleep.assert_not_called()
+
+        with httpx.Client(transport=CassetteTransport(path, latency_scale=2.0)) as client:
+            client.get("https://example.com/")
+        mock_sleep.assert_has_calls([call(1.0)])
+
+    def test_fetcher(self):
+        # 記録した通信を再生し、ページングを含めて同じ結果を得る
+        account = Account(DEFAULT_ACCOUNT_NAME, "", "", "")
+        path = self.root / "cassette.json"
+        transport = CassetteTransport(path, "record", inner_transport=make_favorites_transport(420))
+        fetcher = Fetcher(account, cache_path=self.root / "cache", transport=transport)
+        expect = [fetched_info.world_id for fetched_info in fetcher.fetch()]
+        fetcher.close()
+        self.assertEqual(420, len(expect))
+        # worlds1 は最後のページまで、worlds2 は空のページまで、他のタグは最初のページのみ取得する
+        self.assertEqual(7 + 3 + 6, len(CassetteTransport.load(path)))
+
+        fetcher = Fetcher(account, cache_path=self.root / "cache", transport=CassetteTransport(path))
+        actual = [fetched_info.world_id for fetched_info in fetcher.fetch()]
+        fetcher.close()
+        self.assertEqual(expect, actual)
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
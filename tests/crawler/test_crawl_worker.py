@@ -0,0 +1,142 @@
+import sys
+import threading
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import httpx
+from mock import MagicMock
+
+from vrc_world_crawler.bench import make_favorites_transport
+from vrc_world_crawler.crawler.crawl_worker import CrawlWorker, merge_crawl
+from vrc_world_crawler.crawler.fetcher import Fetcher
+from vrc_world_crawler.crawler.valueobject.account import Account
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.db.work_queue import WorkQueue
+
+
+class TestCrawlWorker(unittest.TestCase):
+    def setUp(self) -> None:
+        self.root = Path(self.enterContext(TemporaryDirectory()))
+        self.queue = WorkQueue(str(self.root / "queue.db"))
+        self.account_list = [Account("main", "", "", ""), Account("sub", "", "", "")]
+        self.db = FavoriteWorldDB(":memory:")
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.queue.dispose()
+        self.db.dispose()
+        return super().tearDown()
+
+    def _enqueue(self) -> str:
+        return self.queue.enqueue(
+            [account.name for account in self.account_list], Fetcher.tag_list, Fetcher.max_offset, 50, 2
+        )
+
+    def _get_worker(self, size_dict: dict[str, int], worker_id: str | None = None) -> CrawlWorker:
+        worker = CrawlWorker(
+            self.queue,
+            self.account_list,
+            worker_id,
+            self.root / "cache",
+            lambda account: make_favorites_transport(size_dict[account.name]),
+        )
+        self.addCleanup(worker.close)
+        return worker
+
+    def test_run_and_merge(self):
+        crawl_id = self._enqueue()
+        # 複数のワーカーで作業単位を分け合う
+        worker_list = [self._get_worker({"main": 420, "sub": 30}, f"worker{i}") for i in range(3)]
+        done_num_list = [0] * len(worker_list)
+
+        def run(index: int) -> None:
+            done_num_list[index] = worker_list[index].run(crawl_id)
+
+        thread_list = [threading.Thread(target=run, args=(i,)) for i in range(len(worker_list))]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        self.assertEqual(2 * 8 * 4, sum(done_num_list))
+        self.assertTrue(self.queue.is_finished(crawl_id))
+
+        # dry-run では書き込まず、キューにも残す
+        writer = merge_crawl(self.queue, self.db, crawl_id, dry_run=True)
+        self.assertEqual({}, writer.error_dict)
+        self.assertEqual(0, self.db.stats()["total"])
+        self.assertEqual([crawl_id], self.queue.crawl_id_list())
+
+        trending_engine = MagicMock(state_path=None)
+        writer = merge_crawl(self.queue, self.db, crawl_id, trending_engine=trending_engine)
+        self.assertEqual({}, writer.error_dict)
+        self.assertEqual({"main": 420, "sub": 30}, writer.fetched_num_dict)
+        # 書き込めたアカウントの値をクロールの登録日時の観測として渡す
+        trending_engine.update.assert_called_once()
+        self.assertEqual(writer.observed_metric_dict(), trending_engine.update.call_args.args[0])
+        trending_engine.save.assert_not_called()
+        self.assertEqual({"main": 420, "sub": 30}, self.db.stats()["account"])
+        self.assertEqual([], self.queue.crawl_id_list())
+        with self.assertRaises(ValueError):
+            merge_crawl(self.queue, self.db, crawl_id)
+
+    def test_merge_no_valid_record(self):
+        crawl_id = self._enqueue()
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            # 変換できないレコードのみのページを返す
+            if request.url.params["tag"] == "worlds1" and request.url.params["offset"] == "0":
+                return httpx.Response(200, content=b'[{"invalid": true}]')
+            return httpx.Response(200, content=b"[]")
+
+        worker = CrawlWorker(
+            self.queue,
+            self.account_list,
+            "worker",
+            self.root / "cache",
+            lambda account: make_favorites_transport(30) if account.name == "main" else httpx.MockTransport(handler),
+        )
+        self.addCleanup(worker.close)
+        worker.run(crawl_id)
+
+        # 受け取ったページがすべて空になったアカウントは書き込まずに完了する
+        writer = merge_crawl(self.queue, self.db, crawl_id)
+        self.assertEqual({}, writer.error_dict)
+        self.assertEqual({"main": 30}, writer.fetched_num_dict)
+        self.assertEqual({"main": 30}, self.db.stats()["account"])
+
+    def test_failed_account(self):
+        crawl_id = self._enqueue()
+        self.queue.max_attempts = 1
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.params["tag"] == "worlds2":
+                return httpx.Response(500)
+            return make_favorites_transport(100).handle_request(request)
+
+        worker = CrawlWorker(self.queue, self.account_list[:1], "worker", self.root / "cache")
+        self.addCleanup(worker.close)
+        worker.fetcher_dict["main"].transport = httpx.MockTransport(handler)
+
+        # 未完了の作業単位がある間は書き込まない
+        worker.run(crawl_id, max_units=1)
+        with self.assertRaises(ValueError):
+            merge_crawl(self.queue, self.db, crawl_id)
+        with self.assertRaises(ValueError):
+            worker.run(wait=True)
+
+        # 設定に無いアカウントの作業単位は失敗とする
+        worker.run(crawl_id)
+        self.assertEqual({"pending": 0, "leased": 0, "done": 28, "failed": 36}, self.queue.count_status(crawl_id))
+
+        # 失敗した作業単位のあるアカウントは書き込まず、キューにも残す
+        writer = merge_crawl(self.queue, self.db, crawl_id)
+        self.assertEqual(["main", "sub"], list(writer.error_dict))
+        self.assertEqual(0, self.db.stats()["total"])
+        self.assertEqual([crawl_id], self.queue.crawl_id_list())
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
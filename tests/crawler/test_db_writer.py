@@ -0,0 +1,355 @@
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from mock import ANY, patch
+from sqlalchemy import func, select
+
+from vrc_world_crawler.crawler.db_writer import DBWriter
+from vrc_world_crawler.crawler.valueobject.fetched_info import FetchedInfo
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.db.model import DEFAULT_ACCOUNT_NAME, FavoriteWorld
+from vrc_world_crawler.feed.change_feed import ChangeFeed
+
+
+class TestDBWriter(unittest.TestCase):
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def _get_fetched_info(self, index: int, star: int = 0) -> FetchedInfo:
+        return FetchedInfo(
+            f"wrld_world_id_{index}",
+            "world_name",
+            "world_url",
+            "description",
+            "author_id",
+            "author_name",
+            f"favorite_id_{index}",
+            "worlds1",
+            True,
+            "public",
+            0,
+            "image_url",
+            "thmbnail_image_url",
+            1,
+            star,
+            0,
+            "2024-09-03T12:34:56.789000",
+            "2024-09-02T12:34:56.789000",
+            "2024-09-01T12:34:56.789000",
+            "2024-09-04T12:34:56.789000",
+            "2024-09-05T12:34:56.789000",
+        )
+
+    def _get_db(self) -> FavoriteWorldDB:
+        db = FavoriteWorldDB(":memory:")
+        record_list = [FavoriteWorld.create(self._get_fetched_info(i).to_dict()) for i in range(3)]
+        db.upsert(record_list)
+        return db
+
+    def _get_state(self, db: FavoriteWorldDB) -> dict:
+        return {row.world_id: (row.is_favorited, row.star) for row in db.iter_rows()}
+
+    def test_init(self):
+        db = self._get_db()
+        instance = DBWriter(db, queue_size=4)
+        self.assertIs(db, instance.db)
+        self.assertEqual([DEFAULT_ACCOUNT_NAME], list(instance.queue_dict.keys()))
+        self.assertEqual(4, instance.queue_dict[DEFAULT_ACCOUNT_NAME].maxsize)
+        self.assertEqual({DEFAULT_ACCOUNT_NAME: []}, instance.result_dict)
+        self.assertEqual({}, instance.error_dict)
+        self.assertTrue(instance.daemon)
+
+        instance = DBWriter(db, ["main", "sub"])
+        self.assertEqual(["main", "sub"], list(instance.queue_dict.keys()))
+        self.assertEqual(8, instance.queue_dict["main"].maxsize)
+
+    def test_run(self):
+        db = self._get_db()
+        instance = DBWriter(db, queue_size=1)
+        instance.start()
+        instance.put([self._get_fetched_info(1, 10)])
+        instance.put([])
+        instance.put([self._get_fetched_info(3, 30), self._get_fetched_info(4, 40)])
+        # 同一ワールドが後続ページに含まれる場合は先に受け取ったものを残し、後のものは書き込まない
+        instance.put([self._get_fetched_info(4, 41)])
+        instance.finish()
+        instance.join()
+
+        self.assertEqual({}, instance.error_dict)
+        self.assertEqual({DEFAULT_ACCOUNT_NAME: [1, 0, 0]}, instance.result_dict)
+        self.assertEqual({DEFAULT_ACCOUNT_NAME: 4}, instance.fetched_num_dict)
+        self.assertEqual(1, instance.duplicate_dict[DEFAULT_ACCOUNT_NAME].duplicate_num)
+        expect = {
+            "wrld_world_id_0": (False, 0),
+            "wrld_world_id_1": (True, 10),
+            "wrld_world_id_2": (False, 0),
+            "wrld_world_id_3": (True, 30),
+            "wrld_world_id_4": (True, 40),
+        }
+        self.assertEqual(expect, self._get_state(db))
+        self.assertEqual(
+            {"wrld_world_id_1": (10, 0), "wrld_world_id_3": (30, 0), "wrld_world_id_4": (40, 0)},
+            instance.observed_metric_dict(),
+        )
+
+    def test_run_empty(self):
+        db = self._get_db()
+        expect = self._get_state(db)
+        instance = DBWriter(db)
+        instance.start()
+        instance.finish()
+        instance.join()
+
+        # 1ページも受け取らなかった場合はフラグクリアもしない
+        self.assertEqual({DEFAULT_ACCOUNT_NAME: []}, instance.result_dict)
+        self.assertEqual(expect, self._get_state(db))
+
+    def test_run_abort(self):
+        db = self._get_db()
+        expect = self._get_state(db)
+        instance = DBWriter(db)
+        instance.start()
+        instance.put([self._get_fetched_info(1, 10)])
+        instance.put([self._get_fetched_info(5, 50)])
+        instance.abort()
+        instance.join()
+
+        self.assertEqual({}, instance.error_dict)
+        self.assertEqual({DEFAULT_ACCOUNT_NAME: []}, instance.result_dict)
+        self.assertEqual(expect, self._get_state(db))
+
+    def test_run_error(self):
+        db = self._get_db()
+        expect = self._get_state(db)
+        self.enterContext(patch.object(db, "upsert", side_effect=[[1], TypeError]))
+        instance = DBWriter(db, queue_size=1)
+        instance.start()
+        for i in range(5):
+            # 書き込みでエラーが発生してもキューは消費され続ける
+            instance.put([self._get_fetched_info(i, 10)])
+        instance.finish()
+        instance.join()
+
+        self.assertIsInstance(instance.error_dict[DEFAULT_ACCOUNT_NAME], TypeError)
+        self.assertEqual(expect, self._get_state(db))
+        self.assertEqual({}, instance.observed_metric_dict())
+
+    def test_run_rollback_error(self):
+        db = self._get_db()
+        expect = self._get_state(db)
+        self.enterContext(patch.object(db, "upsert", side_effect=TypeError))
+        instance = DBWriter(db, [DEFAULT_ACCOUNT_NAME, "sub"], queue_size=1)
+        self.enterContext(patch.object(instance, "_rollback", side_effect=RuntimeError))
+
+        def produce(account_name: str) -> None:
+            for i in range(5):
+                instance.put([self._get_fetched_info(i, 10)], account_name)
+            instance.finish(account_name)
+
+        producer_list = [
+            threading.Thread(target=produce, args=(account_name,), daemon=True) for account_name in instance.queue_dict
+        ]
+        instance.start()
+        for producer in producer_list:
+            producer.start()
+        # rollback に失敗しても、すべてのアカウントのキューが消費され put 側は待ち続けない
+        for thread in [instance, *producer_list]:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+
+        self.assertIsInstance(instance.error_dict[DEFAULT_ACCOUNT_NAME], TypeError)
+        self.assertIsInstance(instance.error_dict["sub"], RuntimeError)
+        self.assertEqual(expect, self._get_state(db))
+
+    def test_run_delta(self):
+        db = self._get_db()
+        mock_bulk_update = self.enterContext(patch.object(db, "_bulk_update", wraps=db._bulk_update))
+        mock_clear_favorited = self.enterContext(patch.object(db, "clear_favorited"))
+        instance = DBWriter(db)
+        instance.start()
+        instance.put([self._get_fetched_info(i) for i in range(3)])
+        instance.finish()
+        instance.join()
+        self.assertEqual({DEFAULT_ACCOUNT_NAME: [1, 1, 1]}, instance.result_dict)
+        self.assertEqual({DEFAULT_ACCOUNT_NAME: 3}, instance.fetched_num_dict)
+        # 変化の無いレコードは UPDATE しない
+        mock_bulk_update.assert_called_once_with(ANY, {})
+
+        # 変化したレコードのみ書き込み、消えたレコードのみフラグを落とす
+        instance = DBWriter(db)
+        instance.start()
+        instance.put([self._get_fetched_info(1), self._get_fetched_info(2, 20), self._get_fetched_info(3)])
+        instance.finish()
+        instance.join()
+        mock_clear_favorited.assert_not_called()
+        self.assertEqual({DEFAULT_ACCOUNT_NAME: [1, 1, 0]}, instance.result_dict)
+        expect = {
+            "wrld_world_id_0": (False, 0),
+            "wrld_world_id_1": (True, 0),
+            "wrld_world_id_2": (True, 20),
+            "wrld_world_id_3": (True, 0),
+        }
+        self.assertEqual(expect, self._get_state(db))
+        self.assertEqual(
+            {"favorite_id_1", "favorite_id_2", "favorite_id_3"},
+            {entry.favorite_id for entry in db.index.iter_entries() if entry.is_favorited},
+        )
+
+        # 何も受け取らなかった場合はフラグを落とさない
+        instance = DBWriter(db)
+        instance.start()
+        instance.finish()
+        instance.join()
+        self.assertEqual({}, instance.fetched_num_dict)
+        self.assertEqual(expect, self._get_state(db))
+
+    def test_run_change_events(self):
+        db = self._get_db()
+        db.record_changes = True
+        instance = DBWriter(db, crawl_id="crawl_1")
+        self.assertEqual("crawl_1", instance.crawl_id)
+        instance.start()
+        instance.put([self._get_fetched_info(1), self._get_fetched_info(2, 20), self._get_fetched_info(3)])
+        instance.finish()
+        instance.join()
+
+        event_list, _ = ChangeFeed(db).read()
+        actual = [(event["crawl_id"], event["event_type"], event["world_id"]) for event in event_list]
+        expect = [
+            ("crawl_1", "added", "wrld_world_id_3"),
+            ("crawl_1", "updated", "wrld_world_id_2"),
+            ("crawl_1", "removed", "wrld_world_id_0"),
+        ]
+        self.assertEqual(expect, actual)
+
+        # dry_run では記録しない
+        instance = DBWriter(db, dry_run=True)
+        instance.start()
+        instance.put([self._get_fetched_info(4)])
+        instance.finish()
+        instance.join()
+        self.assertEqual(3, len(ChangeFeed(db).read()[0]))
+
+    def test_run_dry_run(self):
+        db = self._get_db()
+        expect = self._get_state(db)
+        instance = DBWriter(db, dry_run=True)
+        instance.start()
+        instance.put([self._get_fetched_info(1, 10), self._get_fetched_info(5, 50)])
+        instance.finish()
+        instance.join()
+
+        # rollback した変更は DB にも索引にも反映されない
+        self.assertEqual(expect, self._get_state(db))
+        self.assertEqual(3, len(db.index))
+        self.assertTrue(all(entry.is_favorited for entry in db.index.iter_entries()))
+
+    def test_run_multi_account(self):
+        db = self._get_db()
+        instance = DBWriter(db, [DEFAULT_ACCOUNT_NAME, "sub", "failed"], queue_size=1)
+        instance.start()
+        # 後ろのアカウントのページは前のアカウントの書き込み中もキューに積まれて待つ
+        instance.put([self._get_fetched_info(0, 100)], "sub")
+        instance.put([self._get_fetched_info(1, 200)], "failed")
+        instance.put([self._get_fetched_info(1, 10)])
+        instance.finish()
+        instance.finish("sub")
+        instance.abort("failed")
+        instance.join()
+
+        self.assertEqual({}, instance.error_dict)
+        self.assertEqual({DEFAULT_ACCOUNT_NAME: [1], "sub": [0], "failed": []}, instance.result_dict)
+        actual = {(row.account, row.world_id): (row.is_favorited, row.star) for row in db.iter_rows()}
+        expect = {
+            (DEFAULT_ACCOUNT_NAME, "wrld_world_id_0"): (False, 0),
+            (DEFAULT_ACCOUNT_NAME, "wrld_world_id_1"): (True, 10),
+            (DEFAULT_ACCOUNT_NAME, "wrld_world_id_2"): (False, 0),
+            ("sub", "wrld_world_id_0"): (True, 100),
+        }
+        self.assertEqual(expect, actual)
+        # rollback したアカウントの値は記録しない
+        self.assertEqual({"wrld_world_id_0": (100, 0), "wrld_world_id_1": (10, 0)}, instance.observed_metric_dict())
+
+    def test_run_concurrent_readers(self):
+        temp_dir = self.enterContext(tempfile.TemporaryDirectory())
+        db = FavoriteWorldDB(str(Path(temp_dir) / "vrc.db"))
+        self.addCleanup(db.dispose)
+        db.upsert([FavoriteWorld.create(self._get_fetched_info(i).to_dict()) for i in range(100)])
+        statement = select(
+            func.count(FavoriteWorld.id),
+            func.count(FavoriteWorld.id).filter(FavoriteWorld.is_favorited),
+            func.sum(FavoriteWorld.star),
+        )
+        # (総数, お気に入り数, star の合計) のクロール前後の状態
+        before = (100, 100, 0)
+        after = (150, 100, 100)
+
+        written_event = threading.Event()
+        stop_event = threading.Event()
+        lock = threading.Lock()
+        state_set = set()
+        during_write_count = [0]
+        max_elapsed = [0.0]
+        error_list = []
+
+        def read() -> None:
+            try:
+                while not stop_event.is_set():
+                    is_writing = written_event.is_set() and instance.is_alive()
+                    start = time.perf_counter()
+                    with db.snapshot_scope() as session:
+                        state = tuple(session.execute(statement).one())
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        state_set.add(state)
+                        max_elapsed[0] = max(max_elapsed[0], elapsed)
+                        if is_writing:
+                            during_write_count[0] += 1
+            except Exception as e:
+                error_list.append(e)
+
+        instance = DBWriter(db, queue_size=1)
+        instance.start()
+        reader_list = [threading.Thread(target=read) for _ in range(8)]
+        for reader in reader_list:
+            reader.start()
+
+        # クロール後は 0-49 がお気に入りから外れ、50-99 が更新され、100-149 が追加される
+        page_list = [[self._get_fetched_info(i, 1) for i in range(start, start + 10)] for start in range(50, 150, 10)]
+        instance.put(page_list[0])
+        # 最初のページの書き込みを待ち、書き込み中のトランザクションを保持したまま読み出させる
+        deadline = time.monotonic() + 10
+        while not instance.result_dict[DEFAULT_ACCOUNT_NAME] and time.monotonic() < deadline:
+            time.sleep(0.001)
+        written_event.set()
+        while during_write_count[0] < 50 and not error_list and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertGreaterEqual(during_write_count[0], 50, error_list)
+        for page in page_list[1:]:
+            instance.put(page)
+            time.sleep(0.01)
+        instance.finish()
+        instance.join()
+        time.sleep(0.05)
+        stop_event.set()
+        for reader in reader_list:
+            reader.join()
+
+        # 読み出し側は書き込みを待たず、クロール前かクロール後の状態のみを見る
+        self.assertEqual([], error_list)
+        self.assertEqual({}, instance.error_dict)
+        self.assertEqual({before, after}, state_set)
+        self.assertLess(max_elapsed[0], 1.0)
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
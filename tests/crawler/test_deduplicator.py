@@ -0,0 +1,57 @@
+import sys
+import unittest
+
+from vrc_world_crawler.bench import make_fetched_dict
+from vrc_world_crawler.crawler.deduplicator import Deduplicator
+from vrc_world_crawler.crawler.valueobject.fetched_info import FetchedInfo
+
+
+class TestDeduplicator(unittest.TestCase):
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def _get_fetched_info(self, index: int, favorite_group: str = "worlds1", **kwargs) -> FetchedInfo:
+        fetched_dict = make_fetched_dict(index, favorite_group) | kwargs
+        return FetchedInfo.create(fetched_dict, "2024-09-10T00:00:00")
+
+    def test_init(self):
+        instance = Deduplicator()
+        self.assertEqual(0, instance.record_num)
+        self.assertEqual(0, instance.duplicate_num)
+        self.assertEqual({}, instance.duplicate_group_dict)
+        self.assertEqual([], instance.filter([]))
+
+    def test_filter(self):
+        instance = Deduplicator()
+        first_page = [self._get_fetched_info(0), self._get_fetched_info(1), self._get_fetched_info(0, favorites=99)]
+        # 同じページ内の重複は先のものを残す
+        actual = instance.filter(first_page)
+        self.assertEqual([first_page[0], first_page[1]], actual)
+
+        # 別のグループに登録された同じワールドは、先に取得したグループのものを残す
+        second_page = [
+            self._get_fetched_info(1, "vrcPlusWorlds1", favoriteId="fvrt_other"),
+            self._get_fetched_info(2, "vrcPlusWorlds1"),
+        ]
+        self.assertEqual([second_page[1]], instance.filter(second_page))
+
+        # 非公開ワールドは world_id を持たないため favorite_id で判定する
+        private_fetched_info = self._get_fetched_info(3, releaseStatus="private", id="???")
+        other_private_fetched_info = self._get_fetched_info(4, releaseStatus="private", id="???")
+        self.assertEqual(
+            [private_fetched_info, other_private_fetched_info],
+            instance.filter([private_fetched_info, other_private_fetched_info, private_fetched_info]),
+        )
+
+        self.assertEqual(8, instance.record_num)
+        self.assertEqual(3, instance.duplicate_num)
+        self.assertEqual({"worlds1": 2, "vrcPlusWorlds1": 1}, instance.duplicate_group_dict)
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,110 @@
+import sys
+import threading
+import unittest
+
+import orjson
+from mock import MagicMock
+
+from vrc_world_crawler.bench import make_record_list
+from vrc_world_crawler.crawler.enricher import Enricher
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.db.model import WorldDetail
+
+
+class TestEnricher(unittest.TestCase):
+    def setUp(self) -> None:
+        self.db = FavoriteWorldDB(":memory:")
+        record_list = make_record_list(5)
+        self.world_id_list = [record.world_id for record in record_list]
+        self.db.upsert(record_list)
+        self.fetcher = MagicMock()
+        self.fetcher.fetch_world.side_effect = lambda world_id: {"id": world_id, "capacity": 10, "tags": ["tag"]}
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.db.engine.dispose()
+        return super().tearDown()
+
+    def _get_detail_dict(self) -> dict:
+        with self.db.session_scope() as session:
+            return {detail.world_id: detail.to_dict() for detail in session.query(WorldDetail)}
+
+    def test_init(self):
+        instance = Enricher(self.db, self.fetcher)
+        self.assertIs(self.db, instance.db)
+        self.assertIs(self.fetcher, instance.fetcher)
+        self.assertEqual(4, instance.concurrency)
+
+        with self.assertRaises(ValueError):
+            Enricher(self.db, self.fetcher, 0)
+
+    def test_enrich(self):
+        instance = Enricher(self.db, self.fetcher, 2)
+        self.addCleanup(instance.close)
+        instance.batch_size = 2
+        world_id_list = self.world_id_list
+
+        actual = instance.enrich()
+        self.assertEqual({"target": 5, "fetched": 5, "failed": 0}, actual)
+        detail_dict = self._get_detail_dict()
+        self.assertEqual(sorted(world_id_list), sorted(detail_dict))
+        self.assertEqual(10, detail_dict[world_id_list[0]]["capacity"])
+        self.assertEqual(["tag"], orjson.loads(detail_dict[world_id_list[0]]["tags"]))
+
+        # 変更の無いワールドは取得しない
+        self.fetcher.fetch_world.reset_mock()
+        self.assertEqual({"target": 0, "fetched": 0, "failed": 0}, instance.enrich())
+        self.fetcher.fetch_world.assert_not_called()
+
+        # version か updated_at が変わったワールドのみ取得する
+        record_list = make_record_list(5)
+        record_list[1].version += 1
+        record_list[3].updated_at = "2099-01-01T00:00:00+09:00"
+        expect_target = [(record.world_id, record.version, record.updated_at) for record in record_list]
+        self.db.upsert(record_list)
+        self.fetcher.fetch_world.side_effect = [{"id": world_id_list[1], "capacity": 20}, RuntimeError]
+        actual = instance.enrich()
+        self.assertEqual({"target": 2, "fetched": 1, "failed": 1}, actual)
+        detail_dict = self._get_detail_dict()
+        self.assertEqual(20, detail_dict[world_id_list[1]]["capacity"])
+        self.assertEqual(expect_target[1][1], detail_dict[world_id_list[1]]["version"])
+
+        # 失敗したワールドは次回も対象となる
+        self.assertEqual(
+            [(world_id_list[3], record_list[3].version, record_list[3].updated_at)], instance.select_target_list()
+        )
+
+        # お気に入りから外れたワールドは対象としない
+        self.db.clear_favorited()
+        self.assertEqual([], instance.select_target_list())
+
+    def test_fetch_detail_coalesce(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def fetch_world(world_id: str) -> dict:
+            started.set()
+            release.wait(5)
+            return {"id": world_id}
+
+        self.fetcher.fetch_world.side_effect = fetch_world
+        instance = Enricher(self.db, self.fetcher)
+        self.addCleanup(instance.close)
+
+        # 実行中の取得がある間は同じ Future を返す
+        future = instance.fetch_detail("wrld_a")
+        started.wait(5)
+        self.assertIs(future, instance.fetch_detail("wrld_a"))
+        self.assertIsNot(future, instance.fetch_detail("wrld_b"))
+        release.set()
+        self.assertEqual({"id": "wrld_a"}, future.result(5))
+        self.assertEqual(2, self.fetcher.fetch_world.call_count)
+
+        # 完了後は新たに取得する
+        self.assertIsNot(future, instance.fetch_detail("wrld_a"))
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,55 @@
+import sys
+import unittest
+
+from mock import patch
+
+from vrc_world_crawler.crawler.rate_limiter import RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def test_init(self):
+        instance = RateLimiter(2.0, 3)
+        self.assertEqual(2.0, instance.rate)
+        self.assertEqual(3, instance.burst)
+        with self.assertRaises(ValueError):
+            RateLimiter(1.0, 0)
+
+    def test_acquire(self):
+        mock_sleep = self.enterContext(patch("vrc_world_crawler.crawler.rate_limiter.time.sleep"))
+        mock_monotonic = self.enterContext(patch("vrc_world_crawler.crawler.rate_limiter.time.monotonic"))
+        mock_monotonic.return_value = 100.0
+
+        # burst 分は待たずに取得できる
+        instance = RateLimiter(2.0, 2)
+        self.assertEqual(0.0, instance.acquire())
+        self.assertEqual(0.0, instance.acquire())
+        mock_sleep.assert_not_called()
+
+        # 以降は 1 / rate 秒ずつ待機時間が積み上がる
+        self.assertEqual(0.5, instance.acquire())
+        self.assertEqual(1.0, instance.acquire())
+        self.assertEqual(2, mock_sleep.call_count)
+
+        # 時間経過でトークンが補充される
+        mock_sleep.reset_mock()
+        mock_monotonic.return_value = 110.0
+        self.assertEqual(0.0, instance.acquire())
+        mock_sleep.assert_not_called()
+
+        # rate が 0 以下なら制限しない
+        instance = RateLimiter(0)
+        for _ in range(10):
+            self.assertEqual(0.0, instance.acquire())
+        mock_sleep.assert_not_called()
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from vrc_world_crawler.crawler.run_lock import RunLock
+
+
+class TestRunLock(unittest.TestCase):
+    def setUp(self) -> None:
+        self.path = Path(self.enterContext(TemporaryDirectory())) / "vrc.db.lock"
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def _try_acquire_in_subprocess(self) -> bool:
+        """別のプロセスでロックの取得を試みる"""
+        env = os.environ.copy()
+        src_path = str(Path(__file__).parent.parent.parent / "src")
+        env["PYTHONPATH"] = os.pathsep.join([src_path, env.get("PYTHONPATH", "")])
+        code = (
+            "import sys; from pathlib import Path; from vrc_world_crawler.crawler.run_lock import RunLock; "
+            f"sys.exit(0 if RunLock(Path({str(self.path)!r})).acquire() else 1)"
+        )
+        return subprocess.run([sys.executable, "-c", code], env=env).returncode == 0
+
+    def test_acquire_and_release(self):
+        instance = RunLock(self.path)
+        self.assertFalse(instance.is_locked)
+        self.assertTrue(instance.acquire())
+        self.assertTrue(instance.is_locked)
+        self.assertEqual(str(os.getpid()), self.path.read_text())
+        # 保持中は同じインスタンスからも別のインスタンスからも取得できない
+        self.assertFalse(instance.acquire())
+        other = RunLock(self.path)
+        self.assertFalse(other.acquire())
+
+        instance.release()
+        self.assertFalse(instance.is_locked)
+        instance.release()
+        self.assertTrue(other.acquire())
+        other.release()
+
+    def test_acquire_other_process(self):
+        instance = RunLock(self.path)
+        instance.acquire()
+        self.assertFalse(self._try_acquire_in_subprocess())
+        instance.release()
+        # ロックファイルが残っていても、解放済みであれば取得できる
+        self.assertTrue(self.path.exists())
+        self.assertTrue(self._try_acquire_in_subprocess())
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,112 @@
+import signal
+import sys
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from mock import MagicMock, call, patch
+
+from vrc_world_crawler.crawler.run_lock import RunLock
+from vrc_world_crawler.crawler.scheduler import Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def test_init(self):
+        job = MagicMock()
+        instance = Scheduler(job, 60, 10)
+        self.assertIs(job, instance.job)
+        self.assertEqual(60, instance.interval)
+        self.assertEqual(10, instance.jitter)
+        self.assertEqual(0, instance.run_count)
+        self.assertIsNone(instance.run_lock)
+
+        with self.assertRaises(ValueError):
+            Scheduler(job, 0)
+        with self.assertRaises(ValueError):
+            Scheduler(job, 60, -1)
+
+    def test_next_delay(self):
+        mock_uniform = self.enterContext(patch("vrc_world_crawler.crawler.scheduler.random.uniform"))
+        mock_monotonic = self.enterContext(patch("vrc_world_crawler.crawler.scheduler.time.monotonic"))
+        mock_uniform.return_value = 5.0
+        instance = Scheduler(MagicMock(), 60, 10)
+
+        mock_monotonic.return_value = 110.0
+        self.assertEqual(55.0, instance._next_delay(100.0))
+        mock_uniform.assert_called_once_with(0, 10)
+
+        # 実行間隔を超えた場合は過ぎた回を飛ばして次の回まで待つ
+        mock_monotonic.return_value = 250.0
+        self.assertEqual(45.0, instance._next_delay(100.0))
+
+    def test_run_once(self):
+        job = MagicMock()
+        instance = Scheduler(job, 60)
+        self.assertTrue(instance.run_once())
+        job.assert_called_once_with()
+        self.assertEqual(1, instance.run_count)
+
+        # ジョブの例外はスケジューラの外に出さない
+        job.side_effect = ValueError
+        self.assertTrue(instance.run_once())
+        self.assertEqual(2, instance.run_count)
+
+    def test_run_once_locked(self):
+        temp_dir = self.enterContext(TemporaryDirectory())
+        lock_path = Path(temp_dir) / "vrc.db.lock"
+        job = MagicMock()
+        instance = Scheduler(job, 60, run_lock=RunLock(lock_path))
+        # 他がロックを保持している間は実行しない
+        other = RunLock(lock_path)
+        other.acquire()
+        self.assertFalse(instance.run_once())
+        job.assert_not_called()
+        self.assertEqual(0, instance.run_count)
+
+        # 解放後は実行し、実行後はロックを解放する
+        other.release()
+        self.assertTrue(instance.run_once())
+        job.assert_called_once_with()
+        self.assertFalse(instance.run_lock.is_locked)
+        # ジョブが例外を出してもロックを解放する
+        job.side_effect = ValueError
+        self.assertTrue(instance.run_once())
+        self.assertTrue(other.acquire())
+        other.release()
+
+    def test_run_forever(self):
+        job = MagicMock()
+        instance = Scheduler(job, 0.01)
+        instance.run_forever(max_run_count=3)
+        self.assertEqual(3, job.call_count)
+
+        # stop 後は次の回を実行しない
+        job.reset_mock()
+        job.side_effect = lambda: instance.stop()
+        instance = Scheduler(job, 0.01)
+        instance.run_forever()
+        job.assert_called_once_with()
+
+    def test_install_signal_handlers(self):
+        mock_signal = self.enterContext(patch("vrc_world_crawler.crawler.scheduler.signal.signal"))
+        instance = Scheduler(MagicMock(), 60)
+        instance.install_signal_handlers()
+        self.assertEqual(
+            [call(signal.SIGINT, mock_signal.call_args.args[1]), call(signal.SIGTERM, mock_signal.call_args.args[1])],
+            mock_signal.mock_calls,
+        )
+        handler = mock_signal.call_args.args[1]
+        handler(signal.SIGTERM, None)
+        self.assertTrue(instance._stop_event.is_set())
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
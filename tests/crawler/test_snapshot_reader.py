@@ -0,0 +1,113 @@
+import sys
+import tracemalloc
+import unittest
+from collections import namedtuple
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import orjson
+
+from vrc_world_crawler.bench import make_fetched_dict
+from vrc_world_crawler.crawler.snapshot_reader import SnapshotReader, find_world
+
+
+class TestSnapshotReader(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_path = Path(self.enterContext(TemporaryDirectory()))
+        self.fetched_dict_list = [make_fetched_dict(i) for i in range(5)]
+        # 文字列中の括弧・改行・エスケープは区切りとして扱わない
+        self.fetched_dict_list[1]["description"] = 'tricky "}]{[" \\ \n  }\n  {'
+        self.fetched_dict_list[2]["unityPackages"] = [{"id": "unp_id", "platform": "android"}]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def _write(self, name: str, data: bytes) -> Path:
+        path = self.temp_path / name
+        path.write_bytes(data)
+        return path
+
+    def test_iter(self):
+        Params = namedtuple("Params", ["name", "data", "expect"])
+        params_list = [
+            # fetch 結果の保存形式
+            Params("indented", orjson.dumps(self.fetched_dict_list, option=orjson.OPT_INDENT_2), None),
+            # それ以外の形式の JSON 配列
+            Params("compact", orjson.dumps(self.fetched_dict_list), None),
+            Params(
+                "spaced",
+                b"\n [ " + b" ,\r\n".join(orjson.dumps(d) for d in self.fetched_dict_list) + b" ]\n",
+                None,
+            ),
+            Params(
+                "indented_empty_record", orjson.dumps([{}, {"id": "wrld_a"}, {}], option=orjson.OPT_INDENT_2), None
+            ),
+            Params("empty_list", b"[]", []),
+        ]
+        for params in params_list:
+            with self.subTest(name=params.name):
+                path = self._write(f"{params.name}.json", params.data)
+                expect = orjson.loads(params.data) if params.expect is None else params.expect
+                self.assertEqual(expect, list(SnapshotReader(path)))
+
+    def test_iter_invalid(self):
+        Params = namedtuple("Params", ["name", "data"])
+        params_list = [
+            Params("empty", b""),
+            Params("object", b'{"id": "wrld_a"}'),
+            Params("truncated_indented", orjson.dumps(self.fetched_dict_list, option=orjson.OPT_INDENT_2)[:-10]),
+            Params("truncated_compact", orjson.dumps(self.fetched_dict_list)[:-10]),
+        ]
+        for params in params_list:
+            with self.subTest(name=params.name):
+                path = self._write(f"{params.name}.json", params.data)
+                with self.assertRaises(ValueError):
+                    list(SnapshotReader(path))
+
+    def test_iter_pages(self):
+        path = self._write("snapshot.json", orjson.dumps(self.fetched_dict_list, option=orjson.OPT_INDENT_2))
+        instance = SnapshotReader(path)
+        actual = list(instance.iter_pages(2))
+        expect = [self.fetched_dict_list[0:2], self.fetched_dict_list[2:4], self.fetched_dict_list[4:5]]
+        self.assertEqual(expect, actual)
+
+        with self.assertRaises(ValueError):
+            list(instance.iter_pages(0))
+
+    def test_find(self):
+        indented_path = self._write("indented.json", orjson.dumps(self.fetched_dict_list, option=orjson.OPT_INDENT_2))
+        compact_path = self._write("compact.json", orjson.dumps(self.fetched_dict_list[:2]))
+        for path in [indented_path, compact_path]:
+            with self.subTest(path=path.name):
+                instance = SnapshotReader(path)
+                self.assertEqual(self.fetched_dict_list[1], instance.find(self.fetched_dict_list[1]["id"]))
+                self.assertIsNone(instance.find("wrld_not_exist"))
+                # id 以外の項目に同じ値があっても一致としない
+                self.assertIsNone(instance.find("unp_id"))
+
+        world_id = self.fetched_dict_list[3]["id"]
+        actual = list(find_world([compact_path, indented_path], world_id))
+        self.assertEqual([(indented_path, self.fetched_dict_list[3])], actual)
+
+    def test_memory(self):
+        fetched_dict_list = [make_fetched_dict(i) for i in range(2000)]
+        data = orjson.dumps(fetched_dict_list, option=orjson.OPT_INDENT_2)
+        path = self._write("snapshot.json", data)
+        del fetched_dict_list
+
+        # ファイル全体を読み込まないため、使用メモリはファイルサイズよりも十分小さい
+        tracemalloc.start()
+        try:
+            count = sum(1 for _ in SnapshotReader(path))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(2000, count)
+        self.assertLess(peak, len(data) // 10)
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,83 @@
+import sys
+import unittest
+
+from vrc_world_crawler.crawler.valueobject.account import Account
+from vrc_world_crawler.db.model import DEFAULT_ACCOUNT_NAME
+
+
+class TestAccount(unittest.TestCase):
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def _get_account_dict(self, name: str | None = None) -> dict:
+        account_dict = {"apiKey": "api_key", "auth": "auth", "twoFactorAuth": "two_factor_auth"}
+        if name:
+            account_dict["name"] = name
+        return account_dict
+
+    def test_init(self):
+        instance = Account("name", "api_key", "auth", "two_factor_auth", 1.5)
+        self.assertEqual("name", instance.name)
+        self.assertEqual("api_key", instance.api_key)
+        self.assertEqual("auth", instance.auth)
+        self.assertEqual("two_factor_auth", instance.two_factor_auth)
+        self.assertEqual(1.5, instance.rate_limit)
+        self.assertEqual(0.0, Account("name", "api_key", "auth", "two_factor_auth").rate_limit)
+
+        with self.assertRaises(ValueError):
+            Account(-1, "api_key", "auth", "two_factor_auth")
+        with self.assertRaises(ValueError):
+            Account("", "api_key", "auth", "two_factor_auth")
+        with self.assertRaises(ValueError):
+            Account("name", -1, "auth", "two_factor_auth")
+        with self.assertRaises(ValueError):
+            Account("name", "api_key", -1, "two_factor_auth")
+        with self.assertRaises(ValueError):
+            Account("name", "api_key", "auth", -1)
+        with self.assertRaises(ValueError):
+            Account("name", "api_key", "auth", "two_factor_auth", "invalid rate_limit")
+
+    def test_create(self):
+        actual = Account.create(self._get_account_dict())
+        expect = Account(DEFAULT_ACCOUNT_NAME, "api_key", "auth", "two_factor_auth")
+        self.assertEqual(expect, actual)
+
+        account_dict = self._get_account_dict("main") | {"rateLimit": 2}
+        actual = Account.create(account_dict)
+        expect = Account("main", "api_key", "auth", "two_factor_auth", 2)
+        self.assertEqual(expect, actual)
+
+        with self.assertRaises(ValueError):
+            Account.create({"apiKey": "api_key"})
+
+    def test_create_list(self):
+        # 単一アカウント
+        actual = Account.create_list({"vrc": self._get_account_dict()})
+        expect = [Account(DEFAULT_ACCOUNT_NAME, "api_key", "auth", "two_factor_auth")]
+        self.assertEqual(expect, actual)
+
+        # 複数アカウント
+        actual = Account.create_list({"vrc": [self._get_account_dict("main"), self._get_account_dict("sub")]})
+        expect = [
+            Account("main", "api_key", "auth", "two_factor_auth"),
+            Account("sub", "api_key", "auth", "two_factor_auth"),
+        ]
+        self.assertEqual(expect, actual)
+
+        with self.assertRaises(ValueError):
+            Account.create_list({"vrc": [self._get_account_dict("main"), self._get_account_dict()]})
+        with self.assertRaises(ValueError):
+            Account.create_list({"vrc": [self._get_account_dict("main"), self._get_account_dict("main")]})
+        with self.assertRaises(ValueError):
+            Account.create_list({"vrc": []})
+        with self.assertRaises(ValueError):
+            Account.create_list({"invalid": {}})
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -232,6 +232,10 @@ class TestFetchedInfo(unittest.TestCase):
         actual = instance.to_dict()
         self.assertEqual(expect, actual)
 
+        # 登録日時を指定した場合はその値を使う
+        instance = FetchedInfo.create(fetched_dict, "2024-10-01T00:00:00")
+        self.assertEqual("2024-10-01T00:00:00", instance.registered_at)
+
         # release_status が "public" でない場合
         record = self._get_valid_args()
         record[9] = "hidden"
@@ -0,0 +1,169 @@
+import importlib.util
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+from mock import patch
+
+from vrc_world_crawler.bench import make_fetched_dict
+from vrc_world_crawler.crawler.valueobject.fetched_info import FetchedInfo
+from vrc_world_crawler.db.analytics_mirror import AnalyticsMirror
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.db.model import FavoriteWorld
+
+# NumPy がインストールされている場合は、NumPy と標準ライブラリの両方の実装で同じ結果になることを確認する
+USE_NUMPY_LIST = [False, True] if importlib.util.find_spec("numpy") is not None else [False]
+
+
+class TestAnalyticsMirror(unittest.TestCase):
+    def setUp(self) -> None:
+        self.db = FavoriteWorldDB(":memory:")
+        self.now = datetime(2024, 9, 10)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.db.dispose()
+        return super().tearDown()
+
+    def _get_record_list(self, size: int, star_dict: dict[int, int] | None = None) -> list[FavoriteWorld]:
+        # worlds1 と worlds2 に交互に入れ、作者は3人とする
+        record_list = []
+        for i in range(size):
+            fetched_dict = make_fetched_dict(i, f"worlds{i % 2 + 1}")
+            fetched_dict["authorName"] = f"author_{i % 3}"
+            fetched_dict["favorites"] = (star_dict or {}).get(i, i)
+            fetched_dict["visits"] = i * 10
+            record_list.append(FavoriteWorld.create(FetchedInfo.create(fetched_dict).to_dict()))
+        return record_list
+
+    def test_init(self):
+        with self.assertRaises(ValueError):
+            AnalyticsMirror(history_max_age=timedelta(0))
+        self.assertEqual("python", AnalyticsMirror(use_numpy=False).backend)
+        with patch.dict(sys.modules, {"numpy": None}):
+            self.assertEqual("python", AnalyticsMirror().backend)
+            with self.assertRaises(ImportError):
+                AnalyticsMirror(use_numpy=True)
+
+    def test_refresh(self):
+        self.db.upsert(self._get_record_list(6))
+        instance = AnalyticsMirror(use_numpy=False)
+        self.assertEqual(6, instance.refresh(self.db, self.now))
+        self.assertEqual(6, len(instance))
+        # 変更の無い行は読み直さない
+        self.assertEqual(0, instance.refresh(self.db, self.now))
+
+        # 内容が変わった行と、お気に入りから外れた行のみを読み直す
+        self.db.upsert(self._get_record_list(6, {0: 100, 1: 200}))
+        self.db.unfavorite([make_fetched_dict(5)["favoriteId"]])
+        self.assertEqual(3, instance.refresh(self.db, self.now))
+        self.assertEqual({"worlds1": 106, "worlds2": 208}, instance.aggregate("favorite_group", "star", "sum"))
+        self.assertEqual({"worlds1": 3, "worlds2": 2}, instance.aggregate("favorite_group", favorited_only=True))
+
+        # アーカイブした行は削除する
+        self.db.archive_unfavorited(timedelta(days=1), now=datetime.now() + timedelta(days=2))
+        self.assertEqual(1, instance.refresh(self.db, self.now))
+        self.assertEqual(5, len(instance))
+        self.assertEqual({"worlds1": 3, "worlds2": 2}, instance.aggregate("favorite_group"))
+        self.assertNotIn(make_fetched_dict(5)["id"], instance.aggregate("world_id"))
+
+    def test_aggregate(self):
+        self.db.upsert(self._get_record_list(7))
+        for use_numpy in USE_NUMPY_LIST:
+            with self.subTest(use_numpy=use_numpy):
+                instance = AnalyticsMirror(use_numpy=use_numpy)
+                instance.refresh(self.db, self.now)
+                # star は 0..6、author_0 は 0, 3, 6、author_1 は 1, 4、author_2 は 2, 5
+                self.assertEqual(
+                    {"author_0": 3, "author_1": 2, "author_2": 2}, instance.aggregate("author_name", func="count")
+                )
+                self.assertEqual(
+                    {"author_0": 9, "author_1": 5, "author_2": 7}, instance.aggregate("author_name", "star", "sum")
+                )
+                self.assertEqual(
+                    {"author_0": 3.0, "author_1": 2.5, "author_2": 3.5},
+                    instance.aggregate("author_name", "star", "mean"),
+                )
+                self.assertEqual(
+                    {"author_0": 0, "author_1": 1, "author_2": 2}, instance.aggregate("author_name", "star", "min")
+                )
+                self.assertEqual(
+                    {"author_0": 60, "author_1": 40, "author_2": 50}, instance.aggregate("author_name", "visit", "max")
+                )
+                self.assertEqual(
+                    {"author_0": 6, "author_1": 4, "author_2": 2},
+                    instance.aggregate("author_name", "star", "sum", where={"favorite_group": "worlds1"}),
+                )
+                self.assertEqual({}, instance.aggregate("author_name", where={"favorite_group": "unknown"}))
+
+                self.assertEqual([("author_0", 9), ("author_2", 7)], instance.top("author_name", "star", n=2))
+                # 集計値が同じ場合は値の順
+                self.assertEqual(
+                    [("author_0", 3), ("author_1", 2), ("author_2", 2)],
+                    instance.top("author_name", func="count", n=3),
+                )
+
+        instance = AnalyticsMirror(use_numpy=False)
+        with self.assertRaises(ValueError):
+            instance.aggregate("unknown")
+        with self.assertRaises(ValueError):
+            instance.aggregate("author_name", "unknown", "sum")
+        with self.assertRaises(ValueError):
+            instance.aggregate("author_name", "star", "unknown")
+        with self.assertRaises(ValueError):
+            instance.aggregate("author_name", func="sum")
+        with self.assertRaises(ValueError):
+            instance.aggregate("author_name", where={"unknown": "value"})
+        with self.assertRaises(ValueError):
+            instance.top("author_name", n=0)
+        # 空のミラーでは空の結果を返す
+        self.assertEqual({}, instance.aggregate("author_name", "star", "sum"))
+
+    def test_growth(self):
+        self.db.upsert(self._get_record_list(4))
+        for use_numpy in USE_NUMPY_LIST:
+            with self.subTest(use_numpy=use_numpy):
+                instance = AnalyticsMirror(use_numpy=use_numpy, history_max_age=timedelta(days=30))
+                self.db.upsert(self._get_record_list(4))
+                instance.refresh(self.db, self.now - timedelta(days=40))
+                # 40日前から35日前の変化は履歴の保持期間を過ぎて捨てられる
+                self.db.upsert(self._get_record_list(4, {0: 1000}))
+                instance.refresh(self.db, self.now - timedelta(days=35))
+                self.db.upsert(self._get_record_list(4, {0: 1010, 1: 6}))
+                instance.refresh(self.db, self.now - timedelta(days=3))
+                self.db.upsert(self._get_record_list(4, {0: 1011, 1: 8, 2: 1}))
+                instance.refresh(self.db, self.now - timedelta(hours=1))
+
+                world_id_list = [make_fetched_dict(i)["id"] for i in range(4)]
+                self.assertEqual(
+                    {world_id_list[0]: 1, world_id_list[1]: 2, world_id_list[2]: -1},
+                    instance.growth("star", timedelta(days=1), now=self.now),
+                )
+                self.assertEqual(
+                    {world_id_list[0]: 11, world_id_list[1]: 7, world_id_list[2]: -1},
+                    instance.growth("star", timedelta(days=7), now=self.now),
+                )
+                self.assertEqual(
+                    {"worlds1": 10, "worlds2": 7},
+                    instance.growth("star", timedelta(days=7), "favorite_group", self.now),
+                )
+                self.assertEqual({}, instance.growth("visit", timedelta(days=7), now=self.now))
+                # 区間ごとの行数、world3 は変化が無いため 0 として数える
+                self.assertEqual(
+                    [1, 1, 1, 1], instance.growth_histogram("star", timedelta(days=7), [-5, 0, 5, 10, 20], self.now)
+                )
+                self.assertEqual([2, 1], instance.growth_histogram("star", timedelta(days=7), [0, 10, 11], self.now))
+
+        instance = AnalyticsMirror(use_numpy=False)
+        with self.assertRaises(ValueError):
+            instance.growth("star", timedelta(0))
+        with self.assertRaises(ValueError):
+            instance.growth_histogram("star", timedelta(days=1), [0])
+        with self.assertRaises(ValueError):
+            instance.growth_histogram("star", timedelta(days=1), [1, 0])
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -1,9 +1,9 @@
 import sys
 import unittest
 
-from mock import MagicMock, patch
+from mock import MagicMock, call, patch
 
-from vrc_world_crawler.db.base import Base
+from vrc_world_crawler.db.base import Base, _on_begin, _on_connect, _on_read_connect, _on_write_connect
 
 
 class ConcreteDB(Base):
@@ -28,6 +28,11 @@ class TestBase(unittest.TestCase):
         mock_create_engine = self.enterContext(patch("vrc_world_crawler.db.base.create_engine"))
         mock_static_pool = self.enterContext(patch("vrc_world_crawler.db.base.StaticPool"))
         mock_model_base = self.enterContext(patch("vrc_world_crawler.db.base.ModelBase"))
+        mock_event = self.enterContext(patch("vrc_world_crawler.db.base.event"))
+        mock_migrate = self.enterContext(patch("vrc_world_crawler.db.base.migrate"))
+        mock_is_schema_current = self.enterContext(patch("vrc_world_crawler.db.base.is_schema_current"))
+        mock_is_schema_current.return_value = False
+        mock_sessionmaker = self.enterContext(patch("vrc_world_crawler.db.base.sessionmaker"))
         instance = ConcreteDB()
 
         db_path = "./tests/test.db"
@@ -38,17 +43,107 @@ class TestBase(unittest.TestCase):
         self.assertEqual(["select"], instance.select())
         self.assertEqual(["upsert"], instance.upsert([]))
 
-        mock_create_engine.assert_called_once_with(
-            db_url,
-            echo=False,
-            poolclass=mock_static_pool,
-            connect_args={
-                "timeout": 30,
-                "check_same_thread": False,
-            },
-        )
+        # 書き込み用は1つのコネクションを共有し、読み出し用は既定のプールでコネクションを分ける
+        mock_create_engine.assert_has_calls([
+            call(
+                db_url,
+                echo=False,
+                poolclass=mock_static_pool,
+                connect_args={
+                    "timeout": 30,
+                    "check_same_thread": False,
+                },
+            ),
+            call(db_url, echo=False, connect_args={"timeout": 30, "check_same_thread": False}),
+        ])
+        self.assertEqual(2, mock_create_engine.call_count)
+        self.assertFalse(instance.is_memory)
         mock_create_all: MagicMock = mock_model_base.metadata.create_all
         mock_create_all.assert_called_once_with(mock_create_engine.return_value)
+        mock_migrate.assert_called_once_with(mock_create_engine.return_value)
+        mock_is_schema_current.assert_called_once_with(mock_create_engine.return_value)
+        mock_event.listen.assert_has_calls([
+            call(mock_create_engine.return_value, "connect", _on_write_connect),
+            call(mock_create_engine.return_value, "connect", _on_connect),
+            call(mock_create_engine.return_value, "begin", _on_begin),
+            call(mock_create_engine.return_value, "connect", _on_connect),
+            call(mock_create_engine.return_value, "connect", _on_read_connect),
+            call(mock_create_engine.return_value, "begin", _on_begin),
+        ])
+        mock_sessionmaker.assert_has_calls([
+            call(bind=mock_create_engine.return_value, autoflush=False),
+            call(bind=mock_create_engine.return_value, autoflush=False),
+        ])
+        self.assertEqual(mock_sessionmaker.return_value, instance.Session)
+        self.assertEqual(mock_sessionmaker.return_value, instance.ReadSession)
+
+    def test_init_schema_current(self):
+        mock_create_engine = self.enterContext(patch("vrc_world_crawler.db.base.create_engine"))
+        self.enterContext(patch("vrc_world_crawler.db.base.StaticPool"))
+        mock_model_base = self.enterContext(patch("vrc_world_crawler.db.base.ModelBase"))
+        self.enterContext(patch("vrc_world_crawler.db.base.event"))
+        mock_migrate = self.enterContext(patch("vrc_world_crawler.db.base.migrate"))
+        self.enterContext(patch("vrc_world_crawler.db.base.is_schema_current", return_value=True))
+        ConcreteDB()
+
+        # スキーマが最新ならテーブル作成とマイグレーションは行わない
+        mock_model_base.metadata.create_all.assert_not_called()
+        mock_migrate.assert_not_called()
+
+    def test_session_scope(self):
+        self.enterContext(patch("vrc_world_crawler.db.base.create_engine"))
+        self.enterContext(patch("vrc_world_crawler.db.base.StaticPool"))
+        self.enterContext(patch("vrc_world_crawler.db.base.ModelBase"))
+        self.enterContext(patch("vrc_world_crawler.db.base.event"))
+        self.enterContext(patch("vrc_world_crawler.db.base.migrate"))
+        self.enterContext(patch("vrc_world_crawler.db.base.is_schema_current", return_value=False))
+        mock_sessionmaker = self.enterContext(patch("vrc_world_crawler.db.base.sessionmaker"))
+        instance = ConcreteDB()
+        mock_session: MagicMock = mock_sessionmaker.return_value.return_value
+
+        # 正常終了時は commit して close する
+        with instance.session_scope() as session:
+            self.assertIs(mock_session, session)
+        self.assertEqual([call.commit(), call.close()], mock_session.mock_calls)
+
+        # 例外発生時は rollback して close し、例外を再送出する
+        mock_session.reset_mock()
+        with self.assertRaises(ValueError):
+            with instance.session_scope() as session:
+                raise ValueError
+        self.assertEqual([call.rollback(), call.close()], mock_session.mock_calls)
+
+        # 既存のセッションを渡した場合は何もしない
+        mock_session.reset_mock()
+        outer_session = MagicMock()
+        with instance.session_scope(outer_session) as session:
+            self.assertIs(outer_session, session)
+        self.assertEqual([], mock_session.mock_calls)
+        self.assertEqual([], outer_session.mock_calls)
+
+    def test_on_connect(self):
+        mock_dbapi_connection = MagicMock()
+        _on_connect(mock_dbapi_connection, None)
+        self.assertIsNone(mock_dbapi_connection.isolation_level)
+        mock_dbapi_connection.execute.assert_has_calls([
+            call("PRAGMA journal_mode=WAL"),
+            call("PRAGMA synchronous=NORMAL"),
+        ])
+
+    def test_on_write_connect(self):
+        mock_dbapi_connection = MagicMock()
+        _on_write_connect(mock_dbapi_connection, None)
+        mock_dbapi_connection.execute.assert_called_once_with("PRAGMA auto_vacuum=INCREMENTAL")
+
+    def test_on_read_connect(self):
+        mock_dbapi_connection = MagicMock()
+        _on_read_connect(mock_dbapi_connection, None)
+        mock_dbapi_connection.execute.assert_called_once_with("PRAGMA query_only=ON")
+
+    def test_on_begin(self):
+        mock_connection = MagicMock()
+        _on_begin(mock_connection)
+        mock_connection.exec_driver_sql.assert_called_once_with("BEGIN")
 
 
 if __name__ == "__main__":
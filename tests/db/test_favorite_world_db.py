@@ -1,13 +1,18 @@
 import sys
 import unittest
 from collections import namedtuple
+from datetime import datetime, timedelta
+from pathlib import Path
+from tempfile import TemporaryDirectory
 
-from mock import MagicMock, call, patch
-from sqlalchemy import and_
-from sqlalchemy.orm.exc import NoResultFound
+from mock import ANY, call, patch
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
 
 from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
-from vrc_world_crawler.db.model import FavoriteWorld
+from vrc_world_crawler.db.model import DEFAULT_ACCOUNT_NAME, ChangeEvent, FavoriteWorld, FavoriteWorldArchive
+from vrc_world_crawler.db.valueobject.world_filter import WorldFilter
+from vrc_world_crawler.db.world_index import WorldIndex
 
 
 class TestFavoriteWorldDB(unittest.TestCase):
@@ -46,9 +51,28 @@ class TestFavoriteWorldDB(unittest.TestCase):
         mock_create_engine = self.enterContext(patch("vrc_world_crawler.db.base.create_engine"))
         mock_static_pool = self.enterContext(patch("vrc_world_crawler.db.base.StaticPool"))
         mock_model_base = self.enterContext(patch("vrc_world_crawler.db.base.ModelBase"))
+        mock_event = self.enterContext(patch("vrc_world_crawler.db.base.event"))
+        mock_migrate = self.enterContext(patch("vrc_world_crawler.db.base.migrate"))
+        mock_is_schema_current = self.enterContext(patch("vrc_world_crawler.db.base.is_schema_current"))
+        mock_is_schema_current.return_value = False
         instance = FavoriteWorldDB("./tests/test.db")
         return instance
 
+    def _get_memory_instance(self, record_num: int = 0) -> FavoriteWorldDB:
+        instance = FavoriteWorldDB(":memory:")
+        record_list = []
+        for i in range(record_num):
+            args_dict = self._get_args_dict()
+            args_dict["world_id"] = f"wrld_world_id_{i}"
+            args_dict["favorite_id"] = f"favorite_id_{i}"
+            args_dict["favorite_group"] = f"worlds{i % 2 + 1}"
+            args_dict["author_id"] = f"author_id_{i % 3}"
+            args_dict["updated_at"] = f"2024-09-{i % 28 + 1:02}T12:34:56.789000"
+            record_list.append(FavoriteWorld.create(args_dict))
+        if record_list:
+            instance.upsert(record_list)
+        return instance
+
     def test_init(self) -> None:
         instance = self._get_instance()
         db_path = "./tests/test.db"
@@ -57,7 +81,8 @@ class TestFavoriteWorldDB(unittest.TestCase):
         self.assertEqual(db_url, instance.db_url)
 
     def test_select(self) -> None:
-        mock_sessionmaker = self.enterContext(patch("vrc_world_crawler.db.favorite_world_db.sessionmaker"))
+        mock_sessionmaker = self.enterContext(patch("vrc_world_crawler.db.base.sessionmaker"))
+        self.enterContext(patch("vrc_world_crawler.db.favorite_world_db.event"))
         instance = self._get_instance()
 
         expect = mock_sessionmaker.return_value.return_value.query.return_value.all.return_value
@@ -65,6 +90,7 @@ class TestFavoriteWorldDB(unittest.TestCase):
         self.assertEqual(
             [
                 call(bind=instance.engine, autoflush=False),
+                call(bind=instance.read_engine, autoflush=False),
                 call()(),
                 call()().query(FavoriteWorld),
                 call()().query().all(),
@@ -74,132 +100,640 @@ class TestFavoriteWorldDB(unittest.TestCase):
         )
         self.assertEqual(expect, actual)
 
+    def test_iter_rows(self) -> None:
+        instance = self._get_memory_instance(10)
+
+        actual = list(instance.iter_rows(chunk_size=3))
+        self.assertEqual(10, len(actual))
+        self.assertEqual(list(range(1, 11)), [row.id for row in actual])
+        self.assertEqual("wrld_world_id_0", actual[0].world_id)
+
+        actual = list(instance.iter_rows(WorldFilter(favorite_group="worlds1"), ["world_id"], as_dict=True))
+        expect = [{"id": i + 1, "world_id": f"wrld_world_id_{i}"} for i in range(0, 10, 2)]
+        self.assertEqual(expect, actual)
+
+        world_filter = WorldFilter(author_id="author_id_0", updated_since="2024-09-04T00:00:00")
+        actual = [row.world_id for row in instance.iter_rows(world_filter, ["world_id"])]
+        self.assertEqual(["wrld_world_id_3", "wrld_world_id_6", "wrld_world_id_9"], actual)
+
+        actual = list(instance.iter_rows(WorldFilter(release_status="private")))
+        self.assertEqual([], actual)
+
+        with self.assertRaises(ValueError):
+            list(instance.iter_rows(columns=["invalid_column"]))
+        with self.assertRaises(ValueError):
+            list(instance.iter_rows(chunk_size=0))
+
+    def test_select_page(self) -> None:
+        instance = self._get_memory_instance(10)
+
+        actual_id_list = []
+        after_id = 0
+        page_num = 0
+        while after_id is not None:
+            row_list, after_id = instance.select_page(after_id=after_id, limit=4, columns=["world_id"])
+            actual_id_list.extend([row.id for row in row_list])
+            page_num += 1
+        self.assertEqual(list(range(1, 11)), actual_id_list)
+        self.assertEqual(3, page_num)
+
+        row_list, after_id = instance.select_page(WorldFilter(favorite_group="worlds2"), 0, 2, as_dict=True)
+        self.assertEqual(["wrld_world_id_1", "wrld_world_id_3"], [row["world_id"] for row in row_list])
+        self.assertEqual(4, after_id)
+
+        with self.assertRaises(ValueError):
+            instance.select_page(limit=0)
+
     def test_clear_favorited(self) -> None:
-        mock_sessionmaker = self.enterContext(patch("vrc_world_crawler.db.favorite_world_db.sessionmaker"))
-        instance = self._get_instance()
+        instance = self._get_memory_instance(3)
 
         expect = 0
         actual = instance.clear_favorited()
-        self.assertEqual(
-            [
-                call(bind=instance.engine, autoflush=False),
-                call()(),
-                call()().query(FavoriteWorld),
-                call()().query().update({FavoriteWorld.is_favorited: False}),
-                call()().commit(),
-                call()().close(),
-            ],
-            mock_sessionmaker.mock_calls,
-        )
         self.assertEqual(expect, actual)
+        actual = [row.is_favorited for row in instance.iter_rows()]
+        self.assertEqual([False, False, False], actual)
+        # commit 後に索引にも反映される
+        actual = [entry.is_favorited for entry in instance.index.iter_entries()]
+        self.assertEqual([False, False, False], actual)
 
-    def test_upsert(self) -> None:
-        mock_sessionmaker = self.enterContext(patch("vrc_world_crawler.db.favorite_world_db.sessionmaker"))
-        mock_and = self.enterContext(patch("vrc_world_crawler.db.favorite_world_db.and_"))
-        instance = self._get_instance()
+    def test_unit_of_work(self) -> None:
+        instance = self._get_memory_instance(3)
 
+        # clear_favorited と upsert を1トランザクションで実行する
+        args_dict = self._get_args_dict()
+        args_dict["world_id"] = "wrld_world_id_1"
+        args_dict["star"] = 100
+        with instance.session_scope() as session:
+            instance.clear_favorited(session)
+            instance.upsert(FavoriteWorld.create(args_dict), session)
+        actual = {row.world_id: (row.is_favorited, row.star) for row in instance.iter_rows()}
+        expect = {
+            "wrld_world_id_0": (False, 0),
+            "wrld_world_id_1": (True, 100),
+            "wrld_world_id_2": (False, 0),
+        }
+        self.assertEqual(expect, actual)
+
+        # 途中で例外が発生した場合は clear_favorited も含めてすべてロールバックされる
+        with self.assertRaises(TypeError):
+            with instance.session_scope() as session:
+                instance.clear_favorited(session)
+                instance.upsert("invalid args", session)
+        actual = {row.world_id: (row.is_favorited, row.star) for row in instance.iter_rows()}
+        self.assertEqual(expect, actual)
+
+    def test_account_isolation(self) -> None:
+        instance = self._get_memory_instance(2)
+
+        # 別アカウントで同じワールドを登録しても別レコードとなる
+        record_list = []
+        for i in range(3):
+            args_dict = self._get_args_dict()
+            args_dict["world_id"] = f"wrld_world_id_{i}"
+            args_dict["account"] = "sub"
+            args_dict["star"] = 10
+            record_list.append(FavoriteWorld.create(args_dict))
+        self.assertEqual([0, 0, 0], instance.upsert(record_list))
+
+        # フラグクリアは指定アカウントのレコードのみ対象とする
+        instance.clear_favorited(account="sub")
+        actual = {(row.account, row.world_id): (row.is_favorited, row.star) for row in instance.iter_rows()}
+        expect = {
+            (DEFAULT_ACCOUNT_NAME, "wrld_world_id_0"): (True, 0),
+            (DEFAULT_ACCOUNT_NAME, "wrld_world_id_1"): (True, 0),
+            ("sub", "wrld_world_id_0"): (False, 10),
+            ("sub", "wrld_world_id_1"): (False, 10),
+            ("sub", "wrld_world_id_2"): (False, 10),
+        }
+        self.assertEqual(expect, actual)
+
+    def test_upsert(self) -> None:
         Params = namedtuple(
             "Params",
             [
-                "is_error_occur",
-                "is_args_list",
-                "release_status",
-                "is_insert",
+                "record",
                 "result",
+                "expect",
                 "msg",
             ],
         )
 
-        def pre_run(params: Params) -> FavoriteWorld | list[FavoriteWorld] | str:
-            record = None
-            if params.is_error_occur:
-                record = "invalid args"
-                return record
-            else:
-                record = FavoriteWorld.create(self._get_args_dict())
-
-            record.release_status = params.release_status
-            if params.is_args_list:
-                record = [record]
-
-            mock_sessionmaker.reset_mock(side_effect=True)
-            mock_and.reset_mock()
-            mock_session: MagicMock = mock_sessionmaker.return_value.return_value
-            if params.is_insert:
-                mock_session.query.return_value.filter.return_value.with_for_update.side_effect = NoResultFound
-            else:
-                mock_session.query.return_value.filter.return_value.with_for_update.side_effect = lambda: MagicMock()
-
-            return record
-
-        def post_run(params: Params, record: FavoriteWorld | list[FavoriteWorld], actual: list[int]) -> None:
-            self.assertEqual(params.result, actual)
+        def make_record(index: int, **kwargs) -> FavoriteWorld:
+            args_dict = self._get_args_dict()
+            args_dict["world_id"] = f"wrld_world_id_{index}"
+            args_dict["favorite_id"] = f"favorite_id_{index}"
+            return FavoriteWorld.create(args_dict | kwargs)
 
-            if isinstance(record, list):
-                record = record[0]
+        def pre_run(params: Params) -> FavoriteWorldDB:
+            instance = self._get_memory_instance(2)
+            instance.clear_favorited()
+            return instance
 
-            expect_call = [
-                call(bind=instance.engine, autoflush=False),
-                call()(),
-            ]
-
-            if params.release_status == "public":
-                if params.is_insert:
-                    expect_call.extend([
-                        call()().query(FavoriteWorld),
-                        call()().query().filter(mock_and(FavoriteWorld.world_id == record.world_id)),
-                        call()().query().filter().with_for_update(),
-                        call()().add(record),
-                    ])
-                else:
-                    expect_call.extend([
-                        call()().query(FavoriteWorld),
-                        call()().query().filter(mock_and(FavoriteWorld.world_id == record.world_id)),
-                        call()().query().filter().with_for_update(),
-                    ])
-            else:
-                if params.is_insert:
-                    expect_call.extend([
-                        call()().query(FavoriteWorld),
-                        call()().query().filter(mock_and(FavoriteWorld.favorite_id == record.favorite_id)),
-                        call()().query().filter().with_for_update(),
-                    ])
-                else:
-                    expect_call.extend([
-                        call()().query(FavoriteWorld),
-                        call()().query().filter(mock_and(FavoriteWorld.favorite_id == record.favorite_id)),
-                        call()().query().filter().with_for_update(),
-                    ])
-
-            expect_call.extend([
-                call()().commit(),
-                call()().close(),
-            ])
-            # print(expect_call)
-            # print(mock_sessionmaker.mock_calls)
-            self.assertEqual(
-                expect_call,
-                mock_sessionmaker.mock_calls,
-            )
+        def post_run(params: Params, instance: FavoriteWorldDB, actual: list[int]) -> None:
+            self.assertEqual(params.result, actual)
+            actual = {
+                row.world_id: (row.favorite_id, row.is_favorited, row.release_status, row.star)
+                for row in instance.iter_rows()
+            }
+            self.assertEqual(params.expect, actual)
+            # 索引は DB の内容と一致する
+            expect_index = WorldIndex()
+            with instance.session_scope() as session:
+                expect_index.load(session)
+            self.assertEqual(expect_index.by_favorite_id, instance.index.by_favorite_id)
+            self.assertEqual(expect_index.by_world_id, instance.index.by_world_id)
 
+        not_favorited = {
+            "wrld_world_id_0": ("favorite_id_0", False, "public", 0),
+            "wrld_world_id_1": ("favorite_id_1", False, "public", 0),
+        }
         params_list: list[Params] = [
-            Params(False, False, "public", True, [0], "one public record insert"),
-            Params(False, False, "public", False, [1], "one public record update"),
-            Params(False, False, "private", True, [0], "one private record insert"),
-            Params(False, False, "private", False, [1], "one private record update"),
-            Params(False, True, "public", True, [0], "public record list insert"),
-            Params(False, True, "public", False, [1], "one public record update"),
-            Params(True, False, "public", True, TypeError, "invalid record"),
+            Params(
+                make_record(2),
+                [0],
+                not_favorited | {"wrld_world_id_2": ("favorite_id_2", True, "public", 0)},
+                "one public record insert",
+            ),
+            Params(
+                [make_record(0, star=10)],
+                [1],
+                not_favorited | {"wrld_world_id_0": ("favorite_id_0", True, "public", 10)},
+                "public record list update",
+            ),
+            Params(
+                [make_record(1)],
+                [1],
+                not_favorited | {"wrld_world_id_1": ("favorite_id_1", True, "public", 0)},
+                "public record unchanged except is_favorited",
+            ),
+            Params(
+                [make_record(2, star=1), make_record(2, star=2, favorite_id="favorite_id_other")],
+                [0, 1],
+                not_favorited | {"wrld_world_id_2": ("favorite_id_2", True, "public", 1)},
+                "duplicated public record insert keeps the first",
+            ),
+            Params(
+                [make_record(0, star=10), make_record(0, star=20)],
+                [1, 1],
+                not_favorited | {"wrld_world_id_0": ("favorite_id_0", True, "public", 10)},
+                "duplicated public record update keeps the first",
+            ),
+            Params(
+                [
+                    make_record(0, release_status="private", world_id="???"),
+                    make_record(0, release_status="hidden", world_id="???"),
+                ],
+                [1, 1],
+                not_favorited | {"wrld_world_id_0": ("favorite_id_0", True, "private", 0)},
+                "duplicated private record keeps the first",
+            ),
+            Params(
+                [make_record(2, release_status="private")],
+                [0],
+                not_favorited,
+                "private record not found",
+            ),
+            Params(
+                [make_record(0, release_status="private", world_id="???")],
+                [1],
+                not_favorited | {"wrld_world_id_0": ("favorite_id_0", True, "private", 0)},
+                "private record status changed",
+            ),
         ]
         for params in params_list:
             with self.subTest(params.msg):
-                record = pre_run(params)
-                if isinstance(params.result, list):
-                    actual = instance.upsert(record)
-                    post_run(params, record, actual)
-                else:
-                    with self.assertRaises(params.result):
-                        actual = instance.upsert(record)
+                instance = pre_run(params)
+                actual = instance.upsert(params.record)
+                post_run(params, instance, actual)
+
+        instance = self._get_memory_instance()
+        with self.assertRaises(TypeError):
+            instance.upsert("invalid record")
+
+    def test_upsert_skip_unchanged(self) -> None:
+        instance = self._get_memory_instance(3)
+        record_list = [FavoriteWorld.create(row) for row in instance.iter_rows(as_dict=True)]
+
+        # 内容も is_favorited も変わっていない場合は UPDATE を発行しない
+        mock_bulk_update = self.enterContext(patch.object(instance, "_bulk_update", wraps=instance._bulk_update))
+        self.assertEqual([1, 1, 1], instance.upsert(record_list))
+        mock_bulk_update.assert_called_once_with(ANY, {})
+
+    def test_index_rollback(self) -> None:
+        instance = self._get_memory_instance(2)
+        args_dict = self._get_args_dict()
+        args_dict["world_id"] = "wrld_world_id_new"
+
+        # rollback した変更は索引に反映されない
+        with self.assertRaises(TypeError):
+            with instance.session_scope() as session:
+                instance.upsert(FavoriteWorld.create(args_dict), session)
+                instance.clear_favorited(session)
+                raise TypeError
+        self.assertEqual(2, len(instance.index))
+        self.assertTrue(all(entry.is_favorited for entry in instance.index.iter_entries()))
+
+        # セーブポイント単位で破棄した変更も反映されない
+        with instance.session_scope() as session:
+            savepoint = session.begin_nested()
+            instance.upsert(FavoriteWorld.create(args_dict), session)
+            savepoint.rollback()
+            instance.index.discard(session, DEFAULT_ACCOUNT_NAME)
+        self.assertEqual(2, len(instance.index))
+        self.assertEqual([0], instance.upsert(FavoriteWorld.create(args_dict)))
+        self.assertEqual(3, len(instance.index))
+
+    def test_change_events(self) -> None:
+        instance = FavoriteWorldDB(":memory:", record_changes=True)
+
+        def create(index: int, **kwargs) -> FavoriteWorld:
+            args_dict = self._get_args_dict()
+            args_dict |= {"world_id": f"wrld_world_id_{index}", "favorite_id": f"favorite_id_{index}"}
+            return FavoriteWorld.create(args_dict | kwargs)
+
+        def pop_events() -> list[tuple]:
+            with instance.session_scope() as session:
+                event_list = [
+                    (event.event_type, event.world_id, event.to_dict()["changes"])
+                    for event in session.query(ChangeEvent).order_by(ChangeEvent.id)
+                ]
+                session.query(ChangeEvent).delete()
+            return event_list
+
+        instance.upsert([create(0), create(1), create(2)])
+        self.assertEqual([("added", f"wrld_world_id_{i}", {}) for i in range(3)], pop_events())
+
+        # 変化の無いレコードは記録しない
+        instance.upsert([create(0), create(1, star=10), create(2)])
+        self.assertEqual([("updated", "wrld_world_id_1", {"star": [0, 10]})], pop_events())
+
+        instance.unfavorite(["favorite_id_0", "favorite_id_not_exist"])
+        self.assertEqual([("removed", "wrld_world_id_0", {"is_favorited": [True, False]})], pop_events())
+        # お気に入りから外れているレコードは記録しない
+        instance.unfavorite(["favorite_id_0"])
+        self.assertEqual([], pop_events())
+
+        # 再びお気に入りに登録されたレコードは added とする
+        instance.upsert(create(0))
+        self.assertEqual([("added", "wrld_world_id_0", {"is_favorited": [False, True]})], pop_events())
+
+        # clear_favorited もお気に入りから外れたレコードのみを removed として記録する
+        instance.unfavorite(["favorite_id_1"])
+        pop_events()
+        instance.clear_favorited(account="other")
+        self.assertEqual([], pop_events())
+        instance.clear_favorited()
+        expect = [("removed", f"wrld_world_id_{i}", {"is_favorited": [True, False]}) for i in [0, 2]]
+        self.assertEqual(expect, pop_events())
+        instance.upsert([create(0), create(1, star=10), create(2)])
+        self.assertEqual(
+            [("added", f"wrld_world_id_{i}", {"is_favorited": [False, True]}) for i in range(3)], pop_events()
+        )
+
+        instance.upsert(create(2, world_id="???", release_status="private", registered_at="2024-10-01T00:00:00"))
+        expect = [
+            (
+                "status_changed",
+                "wrld_world_id_2",
+                {
+                    "release_status": ["public", "private"],
+                    "registered_at": ["2024-09-05T12:34:56.789000", "2024-10-01T00:00:00"],
+                },
+            )
+        ]
+        self.assertEqual(expect, pop_events())
+
+        # rollback した変更の記録は残らない
+        with self.assertRaises(TypeError):
+            with instance.session_scope() as session:
+                instance.upsert(create(3), session)
+                raise TypeError
+        self.assertEqual([], pop_events())
+
+        # record_changes が False の場合は記録しない
+        instance.record_changes = False
+        instance.upsert(create(4))
+        self.assertEqual([], pop_events())
+
+    def test_search(self) -> None:
+        instance = self._get_memory_instance(4)
+        name_dict = {
+            "wrld_world_id_0": ("ホラーワールド", "author_name", "怖い廃病院"),
+            "wrld_world_id_1": ("猫カフェ", "ホラー好き", "のんびりできる"),
+            "wrld_world_id_2": ("Horror House", "author_name", "100% 本物の幽霊"),
+        }
+        record_list = []
+        for world_id, (world_name, author_name, description) in name_dict.items():
+            args_dict = self._get_args_dict()
+            args_dict |= {
+                "world_id": world_id,
+                "world_name": world_name,
+                "author_name": author_name,
+                "description": description,
+            }
+            record_list.append(FavoriteWorld.create(args_dict))
+        instance.upsert(record_list)
+
+        Params = namedtuple("Params", ["query", "world_filter", "expect_world_id_list"])
+        params_list = [
+            # world_name の一致を author_name の一致より上位とする
+            Params("ホラー", None, ["wrld_world_id_0", "wrld_world_id_1"]),
+            # 大文字小文字は区別しない
+            Params("horror", None, ["wrld_world_id_2"]),
+            # すべての語を含むものに絞り込む、短い語は LIKE で絞り込む
+            Params("ホラー 猫", None, ["wrld_world_id_1"]),
+            Params("猫", None, ["wrld_world_id_1"]),
+            # FTS5 と LIKE の特殊文字は通常の文字として扱う
+            Params('"100% 本物"', None, []),
+            Params("100%", None, ["wrld_world_id_2"]),
+            Params("world_name", None, ["wrld_world_id_3"]),
+            Params("ホラー", WorldFilter(author_name="author_name"), ["wrld_world_id_0"]),
+            Params("見つからない", None, []),
+        ]
+        for params in params_list:
+            with self.subTest(params=params):
+                actual = [row["world_id"] for row in instance.search(params.query, params.world_filter)]
+                self.assertEqual(params.expect_world_id_list, actual)
+
+        actual = instance.search("ホラー", limit=1)
+        self.assertEqual(1, len(actual))
+        self.assertEqual("[ホラー]ワールド", actual[0]["snippet"])
+        self.assertLess(actual[0]["rank"], 0)
+        actual = instance.search("猫")[0]
+        self.assertIsNone(actual["rank"])
+        self.assertIsNone(actual["snippet"])
+
+        # upsert による更新が索引に反映される
+        args_dict = self._get_args_dict()
+        args_dict |= {"world_id": "wrld_world_id_0", "world_name": "廃病院", "version": 2}
+        instance.upsert(FavoriteWorld.create(args_dict))
+        self.assertEqual(["wrld_world_id_1"], [row["world_id"] for row in instance.search("ホラー")])
+        self.assertEqual(["wrld_world_id_0"], [row["world_id"] for row in instance.search("廃病院")])
+
+        # 索引を作り直しても結果は変わらない
+        instance.rebuild_search_index()
+        self.assertEqual(["wrld_world_id_0"], [row["world_id"] for row in instance.search("廃病院")])
+
+        with self.assertRaises(ValueError):
+            instance.search(" ")
+        with self.assertRaises(ValueError):
+            instance.search("ホラー", limit=0)
+
+    def test_persist_index(self) -> None:
+        temp_dir = Path(self.enterContext(TemporaryDirectory()))
+        db_path = str(temp_dir / "vrc.db")
+        instance = FavoriteWorldDB(db_path, persist_index=True)
+        args_dict = self._get_args_dict()
+        instance.upsert(FavoriteWorld.create(args_dict))
+        instance.engine.dispose()
+        self.assertTrue((temp_dir / "vrc.db.index").is_file())
+
+        # DB が変わっていなければ保存した索引を使う
+        instance = FavoriteWorldDB(db_path, persist_index=True)
+        mock_load = self.enterContext(patch.object(WorldIndex, "load"))
+        self.assertEqual(1, len(instance.index))
+        mock_load.assert_not_called()
+        instance.engine.dispose()
+
+        # DB が変わっていれば DB から作り直す
+        self.enterContext(patch.object(WorldIndex, "load_file", return_value=False))
+        instance = FavoriteWorldDB(db_path, persist_index=True)
+        instance.index
+        mock_load.assert_called_once()
+        instance.engine.dispose()
+
+    def test_revalidate_index(self) -> None:
+        temp_dir = Path(self.enterContext(TemporaryDirectory()))
+        db_path = str(temp_dir / "vrc.db")
+        instance = FavoriteWorldDB(db_path, persist_index=True)
+        self.addCleanup(instance.dispose)
+        other = FavoriteWorldDB(db_path)
+        self.addCleanup(other.dispose)
+
+        def create(index: int, **kwargs) -> FavoriteWorld:
+            args_dict = self._get_args_dict()
+            args_dict |= {"world_id": f"wrld_world_id_{index}", "favorite_id": f"favorite_id_{index}"}
+            return FavoriteWorld.create(args_dict | kwargs)
+
+        self.assertEqual([0], instance.upsert(create(0)))
+        # 自身の commit では読み込み済みの索引を捨てない
+        self.assertFalse(instance.revalidate_index())
+        self.assertTrue((temp_dir / "vrc.db.index").is_file())
+
+        # 別のインスタンスが追加したワールドは、次の書き込みで索引を読み込み直して更新とする
+        self.assertEqual([0, 0], other.upsert([create(1), create(2)]))
+        self.assertEqual([1, 1, 0], instance.upsert([create(1), create(2, star=10), create(3)]))
+        self.assertEqual(4, instance.stats()["total"])
+        self.assertEqual(10, next(row.star for row in instance.iter_rows() if row.world_id == "wrld_world_id_2"))
+
+        # 別のインスタンスがアーカイブした行は、再び登録されると新しい行として追加する
+        other.unfavorite(["favorite_id_0"])
+        self.assertEqual(1, other.archive_unfavorited(timedelta(0), now=datetime.now() + timedelta(days=1)))
+        self.assertEqual([0], instance.upsert(create(0, star=5)))
+        self.assertEqual({"total": 4, "archived": 0}, {k: instance.stats()[k] for k in ["total", "archived"]})
+
+        # 変更が無ければ読み込み直さない
+        self.assertFalse(instance.revalidate_index())
+        other.upsert(create(4))
+        self.assertTrue(instance.revalidate_index())
+        self.assertFalse((temp_dir / "vrc.db.index").is_file())
+        self.assertFalse(instance.revalidate_index())
+        self.assertEqual(5, len(instance.index))
+
+    def test_snapshot_scope(self) -> None:
+        temp_dir = Path(self.enterContext(TemporaryDirectory()))
+        db_path = str(temp_dir / "vrc.db")
+        instance = FavoriteWorldDB(db_path)
+        self.addCleanup(instance.dispose)
+        args_dict = self._get_args_dict()
+        instance.upsert(FavoriteWorld.create(args_dict))
+        count_statement = select(func.count(FavoriteWorld.id))
+
+        with instance.snapshot_scope() as session:
+            # 書き込み中のトランザクションを待たず、commit 前の内容も見えない
+            with instance.session_scope() as write_session:
+                args_dict = self._get_args_dict() | {"world_id": "wrld_world_id_2", "favorite_id": "favorite_id_2"}
+                instance.upsert(FavoriteWorld.create(args_dict), write_session)
+                self.assertEqual(1, session.execute(count_statement).scalar())
+                self.assertEqual(1, instance.stats()["total"])
+            # 開始後に commit された内容も見えない
+            self.assertEqual(1, session.execute(count_statement).scalar())
+            # 読み出し専用のため書き込めない
+            with self.assertRaises(OperationalError):
+                session.execute(FavoriteWorld.__table__.delete())
+
+        with instance.snapshot_scope() as session:
+            self.assertEqual(2, session.execute(count_statement).scalar())
+        self.assertEqual(2, instance.stats()["total"])
+        self.assertEqual(2, len(list(instance.iter_rows())))
+
+        # WAL の内容はすべて DB ファイルに書き戻せる
+        self.assertTrue(instance.checkpoint())
+        self.assertTrue(Path(f"{db_path}-wal").is_file())
+
+    def test_snapshot_scope_memory(self) -> None:
+        # :memory: の DB は書き込みと同じコネクションで読み出す
+        instance = self._get_memory_instance(3)
+        self.assertIs(instance.engine, instance.read_engine)
+        with instance.snapshot_scope() as session:
+            self.assertEqual(3, session.execute(select(func.count(FavoriteWorld.id))).scalar())
+        self.assertTrue(instance.checkpoint())
+
+    def test_summary(self) -> None:
+        instance = self._get_memory_instance(6)
+        # worlds1 は 0, 2, 4、worlds2 は 1, 3, 5、author_id_0 は 0, 3
+        args_dict = self._get_args_dict() | {
+            "world_id": "wrld_world_id_0",
+            "favorite_id": "favorite_id_0",
+            "favorite_group": "worlds1",
+            "author_id": "author_id_0",
+            "author_name": "renamed",
+            "star": 10,
+            "visit": 100,
+        }
+        instance.upsert(FavoriteWorld.create(args_dict))
+        instance.upsert(FavoriteWorld.create(args_dict | {"account": "sub", "star": 5, "visit": 50}))
+        instance.unfavorite(["favorite_id_1"])
+
+        expect = [
+            {"favorite_group": "worlds1", "world_num": 4, "favorited_num": 4, "star_total": 15, "visit_total": 150},
+            {"favorite_group": "worlds2", "world_num": 3, "favorited_num": 2, "star_total": 0, "visit_total": 0},
+        ]
+        self.assertEqual(expect, instance.summary(order_by="star_total"))
+        self.assertEqual(expect[:1], instance.summary(order_by="star_total", limit=1))
+        actual = instance.summary("author", account="default")
+        self.assertEqual(["author_id_0", "author_id_1", "author_id_2"], [row["author_id"] for row in actual])
+        self.assertEqual(["renamed", "author_name", "author_name"], [row["author_name"] for row in actual])
+        self.assertEqual([10, 0, 0], [row["star_total"] for row in actual])
+        stats = instance.stats()
+        self.assertEqual((7, 6), (stats["total"], stats["favorited"]))
+        self.assertEqual({"default": 6, "sub": 1}, stats["account"])
+        self.assertEqual({"worlds1": 4, "worlds2": 3}, stats["favorite_group"])
+
+        # アーカイブとお気に入りの解除も反映される
+        instance.archive_unfavorited(timedelta(days=1), now=datetime.now() + timedelta(days=2))
+        instance.clear_favorited(account="default")
+        actual = instance.summary(account="default")
+        self.assertEqual(
+            [("worlds1", 3, 0), ("worlds2", 2, 0)],
+            [(r["favorite_group"], r["world_num"], r["favorited_num"]) for r in actual],
+        )
+        self.assertEqual({"GroupSummary": 0, "AuthorSummary": 0}, instance.check_summary())
+
+        # グループの移動は移動元から引いて移動先に加える
+        args_dict |= {"world_id": "wrld_world_id_2", "favorite_id": "favorite_id_2", "favorite_group": "worlds3"}
+        instance.upsert(FavoriteWorld.create(args_dict))
+        actual = instance.summary(account="default")
+        self.assertEqual(
+            {"worlds1": 2, "worlds2": 2, "worlds3": 1}, {r["favorite_group"]: r["world_num"] for r in actual}
+        )
+        self.assertEqual({"GroupSummary": 0, "AuthorSummary": 0}, instance.check_summary())
+
+        # トリガを経由せずに書き換えた集計値は検出して作り直せる
+        with instance.engine.begin() as connection:
+            connection.exec_driver_sql('UPDATE "GroupSummary" SET star_total = 0')
+        # star_total が0でなかった3行が、集計テーブルと全件走査の結果の両方で不一致となる
+        self.assertEqual({"GroupSummary": 6, "AuthorSummary": 0}, instance.check_summary())
+        instance.rebuild_summary()
+        self.assertEqual({"GroupSummary": 0, "AuthorSummary": 0}, instance.check_summary())
+        self.assertEqual(expect[0]["star_total"], instance.summary()[0]["star_total"])
+
+        with self.assertRaises(ValueError):
+            instance.summary("unknown")
+        with self.assertRaises(ValueError):
+            instance.summary(order_by="unknown")
+        with self.assertRaises(ValueError):
+            instance.summary(limit=0)
+
+    def test_archive_unfavorited(self) -> None:
+        instance = self._get_memory_instance(4)
+        now = datetime(2024, 9, 10)
+        instance.unfavorite(["favorite_id_0", "favorite_id_1"])
+        self.assertEqual(
+            [False, False, True, True], [row.is_favorited for row in instance.iter_rows(columns=["is_favorited"])]
+        )
+        # お気に入りから外れた日時が記録される
+        with instance.session_scope() as session:
+            session.execute(
+                FavoriteWorld.__table__
+                .update()
+                .where(FavoriteWorld.world_id == "wrld_world_id_0")
+                .values(unfavorited_at=(now - timedelta(days=31)).isoformat())
+            )
+            session.execute(
+                FavoriteWorld.__table__
+                .update()
+                .where(FavoriteWorld.world_id == "wrld_world_id_1")
+                .values(unfavorited_at=(now - timedelta(days=29)).isoformat())
+            )
+
+        with self.assertRaises(ValueError):
+            instance.archive_unfavorited(timedelta(days=30), batch_size=0)
+        self.assertEqual(1, instance.archive_unfavorited(timedelta(days=30), batch_size=1, now=now))
+        self.assertEqual(0, instance.archive_unfavorited(timedelta(days=30), now=now))
+
+        # 既定ではアーカイブ済みのレコードを読み出さない
+        actual = [row.world_id for row in instance.iter_rows(columns=["world_id"])]
+        self.assertEqual([f"wrld_world_id_{i}" for i in range(1, 4)], actual)
+        actual = [row.world_id for row in instance.iter_rows(columns=["world_id"], include_archived=True)]
+        self.assertEqual([f"wrld_world_id_{i}" for i in range(4)], actual)
+        world_filter = WorldFilter(is_favorited=False)
+        actual = [
+            row[1]
+            for chunk in instance.iter_chunks(world_filter, ["world_id"], include_archived=True)
+            for row in chunk
+        ]
+        self.assertEqual(["wrld_world_id_0", "wrld_world_id_1"], actual)
+        self.assertEqual(
+            {"total": 3, "favorited": 2, "archived": 1},
+            {k: instance.stats()[k] for k in ["total", "favorited", "archived"]},
+        )
+        self.assertEqual([], instance.search("wrld_world_id_0"))
+        self.assertNotIn("wrld_world_id_0", [entry.world_id for entry in instance.index.iter_entries()])
+        with instance.session_scope() as session:
+            archived = session.execute(select(FavoriteWorldArchive)).scalar_one()
+            self.assertEqual("wrld_world_id_0", archived.world_id)
+            self.assertEqual(now.isoformat(), archived.archived_at)
+
+        # 再びお気に入りに登録されたワールドは FavoriteWorld に戻る
+        args_dict = self._get_args_dict() | {"world_id": "wrld_world_id_0", "favorite_id": "favorite_id_0"}
+        instance.upsert(FavoriteWorld.create(args_dict))
+        args_dict = self._get_args_dict() | {"world_id": "wrld_world_id_1", "favorite_id": "favorite_id_1"}
+        instance.upsert(FavoriteWorld.create(args_dict))
+        self.assertEqual(0, instance.stats()["archived"])
+        actual = [tuple(row[1:]) for row in instance.iter_rows(columns=["world_id", "is_favorited", "unfavorited_at"])]
+        expect = [(f"wrld_world_id_{i}", True, None) for i in [1, 2, 3, 0]]
+        self.assertEqual(expect, actual)
+
+    def test_incremental_vacuum(self) -> None:
+        temp_dir = Path(self.enterContext(TemporaryDirectory()))
+        db_path = temp_dir / "vrc.db"
+        instance = FavoriteWorldDB(str(db_path))
+        self.addCleanup(instance.dispose)
+        # 新しい DB は作成時から INCREMENTAL のため切り替え不要
+        self.assertFalse(instance.enable_incremental_vacuum())
+        record_list = []
+        for i in range(500):
+            args_dict = self._get_args_dict() | {"world_id": f"wrld_world_id_{i}", "favorite_id": f"favorite_id_{i}"}
+            record_list.append(FavoriteWorld.create(args_dict | {"description": "description" * 100}))
+        instance.upsert(record_list)
+        instance.clear_favorited()
+        self.assertEqual(500, instance.archive_unfavorited(timedelta(0), now=datetime.now() + timedelta(days=1)))
+        # アーカイブに移した分の空きページを解放し、WAL を書き戻すとファイルが小さくなる
+        with instance.session_scope() as session:
+            session.execute(FavoriteWorldArchive.__table__.delete())
+        self.assertTrue(instance.checkpoint())
+        size = db_path.stat().st_size
+        with self.assertRaises(ValueError):
+            instance.incremental_vacuum(0)
+        self.assertGreater(instance.incremental_vacuum(max_pages=100000, step_pages=16), 0)
+        self.assertEqual(0, instance.incremental_vacuum())
+        self.assertTrue(instance.checkpoint())
+        self.assertLess(db_path.stat().st_size, size)
+
+        memory_instance = self._get_memory_instance()
+        self.assertFalse(memory_instance.enable_incremental_vacuum())
+        self.assertEqual(0, memory_instance.incremental_vacuum())
 
 
 if __name__ == "__main__":
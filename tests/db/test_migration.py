@@ -0,0 +1,122 @@
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from sqlalchemy import create_engine, inspect
+
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.db.migration import SCHEMA_VERSION, is_schema_current, migrate
+from vrc_world_crawler.db.model import DEFAULT_ACCOUNT_NAME, FavoriteWorld
+
+
+class TestMigration(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = Path(self.temp_dir.name) / "test.db"
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+        return super().tearDown()
+
+    def _create_old_db(self) -> None:
+        # account 列追加前のスキーマ
+        connection = sqlite3.connect(self.db_path)
+        connection.execute("""
+            CREATE TABLE "FavoriteWorld" (
+                id INTEGER NOT NULL, world_id VARCHAR(256) NOT NULL, world_name VARCHAR(256) NOT NULL,
+                world_url VARCHAR(512) NOT NULL, description VARCHAR(512), author_id VARCHAR(256) NOT NULL,
+                author_name VARCHAR(256) NOT NULL, favorite_id VARCHAR(256) NOT NULL,
+                favorite_group VARCHAR(256) NOT NULL, is_favorited BOOLEAN NOT NULL,
+                release_status VARCHAR(256) NOT NULL, featured INTEGER NOT NULL, image_url VARCHAR(512),
+                thmbnail_image_url VARCHAR(512), version INTEGER NOT NULL, star INTEGER NOT NULL,
+                visit INTEGER NOT NULL, published_at VARCHAR(256), lab_published_at VARCHAR(256),
+                created_at VARCHAR(256) NOT NULL, updated_at VARCHAR(256) NOT NULL,
+                registered_at VARCHAR(256) NOT NULL, PRIMARY KEY (id), UNIQUE (world_id)
+            )
+        """)
+        for i in range(3):
+            connection.execute(
+                'INSERT INTO "FavoriteWorld" VALUES '
+                "(?, ?, 'name', 'url', 'desc', 'author_id', 'author_name', ?, 'worlds1', 1, 'public', 0, "
+                "'image_url', 'thumbnail_url', 1, 0, 0, '', '', '2024-09-01T00:00:00', '2024-09-01T00:00:00', "
+                "'2024-09-01T00:00:00')",
+                (i + 1, f"wrld_world_id_{i}", f"favorite_id_{i}"),
+            )
+        connection.commit()
+        connection.close()
+
+    def test_add_account_column(self):
+        self._create_old_db()
+        db = FavoriteWorldDB(str(self.db_path))
+
+        column_list = [column["name"] for column in inspect(db.engine).get_columns("FavoriteWorld")]
+        self.assertIn("account", column_list)
+        actual = [(row.id, row.account, row.world_id) for row in db.iter_rows()]
+        expect = [(i + 1, DEFAULT_ACCOUNT_NAME, f"wrld_world_id_{i}") for i in range(3)]
+        self.assertEqual(expect, actual)
+
+        # 移行後は別アカウントで同じ world_id を登録できる
+        args_dict = {column: value for column, value in db.select()[0].to_dict().items()}
+        args_dict["account"] = "sub"
+        self.assertEqual([0], db.upsert(FavoriteWorld.create(args_dict)))
+        self.assertEqual(4, len(db.select()))
+
+        # 既存レコードも全文検索の対象となる
+        self.assertEqual(4, len(db.search("name")))
+        db.engine.dispose()
+
+    def test_add_unfavorited_at_column(self):
+        self._create_old_db()
+        connection = sqlite3.connect(self.db_path)
+        connection.execute('UPDATE "FavoriteWorld" SET is_favorited = 0 WHERE id = 1')
+        connection.commit()
+        connection.close()
+        db = FavoriteWorldDB(str(self.db_path))
+
+        # 既にお気に入りから外れているレコードにはマイグレーションの日時が入る
+        actual = [
+            (row.world_id, row.unfavorited_at is None) for row in db.iter_rows(columns=["world_id", "unfavorited_at"])
+        ]
+        expect = [("wrld_world_id_0", False), ("wrld_world_id_1", True), ("wrld_world_id_2", True)]
+        self.assertEqual(expect, actual)
+        self.assertEqual(0, db.stats()["archived"])
+        db.dispose()
+
+    def test_add_summary_tables(self):
+        self._create_old_db()
+        db = FavoriteWorldDB(str(self.db_path))
+
+        # 既存レコードから集計する
+        expect = [{"favorite_group": "worlds1", "world_num": 3, "favorited_num": 3, "star_total": 0, "visit_total": 0}]
+        self.assertEqual(expect, db.summary())
+        self.assertEqual({"GroupSummary": 0, "AuthorSummary": 0}, db.check_summary())
+        db.dispose()
+
+    def test_migrate_idempotent(self):
+        engine = create_engine(f"sqlite:///{self.db_path}")
+        FavoriteWorld.metadata.create_all(engine)
+        migrate(engine)
+        migrate(engine)
+        column_list = [column["name"] for column in inspect(engine).get_columns("FavoriteWorld")]
+        self.assertEqual(1, column_list.count("account"))
+        self.assertEqual(1, column_list.count("unfavorited_at"))
+        engine.dispose()
+
+    def test_is_schema_current(self):
+        engine = create_engine(f"sqlite:///{self.db_path}")
+        self.assertFalse(is_schema_current(engine))
+        FavoriteWorld.metadata.create_all(engine)
+        migrate(engine)
+        self.assertTrue(is_schema_current(engine))
+        with engine.connect() as connection:
+            self.assertEqual(SCHEMA_VERSION, connection.exec_driver_sql("PRAGMA user_version").scalar())
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
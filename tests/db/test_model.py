@@ -3,7 +3,7 @@ import unittest
 
 from mock import MagicMock, patch
 
-from vrc_world_crawler.db.model import FavoriteWorld
+from vrc_world_crawler.db.model import DEFAULT_ACCOUNT_NAME, FavoriteWorld, WorldDetail
 
 
 class TestFavoriteWorld(unittest.TestCase):
@@ -60,6 +60,7 @@ class TestFavoriteWorld(unittest.TestCase):
         self.assertEqual(expect[18], actual.created_at)
         self.assertEqual(expect[19], actual.updated_at)
         self.assertEqual(expect[20], actual.registered_at)
+        self.assertEqual(expect[21] if len(expect) > 21 else DEFAULT_ACCOUNT_NAME, actual.account)
 
     def test_init(self) -> None:
         record = self._get_valid_args()
@@ -94,6 +95,10 @@ class TestFavoriteWorld(unittest.TestCase):
         instance = FavoriteWorld.create(args_dict)
         self._check_member(record, instance)
 
+        args_dict["account"] = "account_name"
+        instance = FavoriteWorld.create(args_dict)
+        self._check_member(record + ["account_name"], instance)
+
         with self.assertRaises(ValueError):
             instance = FavoriteWorld.create({"invalid_dict": ""})
 
@@ -115,10 +120,14 @@ class TestFavoriteWorld(unittest.TestCase):
         self.assertFalse(instance1 == instance2)
         self.assertFalse(instance1 == "Not Same Class")
 
+        instance3 = FavoriteWorld(*record1, "account_name")
+        self.assertFalse(instance1 == instance3)
+
     def test_to_dict(self) -> None:
         record = self._get_valid_args()
         instance = FavoriteWorld(*record)
         expect = {
+            "account": DEFAULT_ACCOUNT_NAME,
             "world_id": record[0],
             "world_name": record[1],
             "world_url": record[2],
@@ -144,6 +153,51 @@ class TestFavoriteWorld(unittest.TestCase):
         self.assertEqual(expect, instance.to_dict())
 
 
+class TestWorldDetail(unittest.TestCase):
+    def test_create(self) -> None:
+        detail_dict = {
+            "id": "wrld_world_id",
+            "capacity": 32,
+            "recommendedCapacity": 16,
+            "heat": 3,
+            "popularity": 5,
+            "occupants": 7,
+            "favorites": 100,
+            "tags": ["system_approved", "author_tag_game"],
+            "unityPackages": [
+                {"platform": "standalonewindows"},
+                {"platform": "android"},
+                {"platform": "standalonewindows"},
+                {},
+            ],
+        }
+        instance = WorldDetail.create(detail_dict, 3, "2024-09-04T12:34:56+09:00", "2024-09-05T00:00:00")
+        expect = {
+            "world_id": "wrld_world_id",
+            "capacity": 32,
+            "recommended_capacity": 16,
+            "heat": 3,
+            "popularity": 5,
+            "occupants": 7,
+            "favorites": 100,
+            "tags": '["system_approved","author_tag_game"]',
+            "platforms": '["android","standalonewindows"]',
+            "version": 3,
+            "updated_at": "2024-09-04T12:34:56+09:00",
+            "fetched_at": "2024-09-05T00:00:00",
+        }
+        self.assertEqual(expect, instance.to_dict())
+        self.assertEqual("<WorldDetail(world_id='wrld_world_id')>", repr(instance))
+
+        # 項目が欠けていても id があれば作成できる
+        instance = WorldDetail.create({"id": "wrld_world_id"}, 1, "", "")
+        self.assertIsNone(instance.capacity)
+        self.assertEqual("[]", instance.tags)
+
+        with self.assertRaises(ValueError):
+            WorldDetail.create({"name": "no id"}, 1, "", "")
+
+
 if __name__ == "__main__":
     if sys.argv:
         del sys.argv[1:]
@@ -0,0 +1,125 @@
+import sys
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import orjson
+
+from vrc_world_crawler.db.trending_engine import TrendingEngine, _Ranking
+
+
+class TestRanking(unittest.TestCase):
+    def test_add_and_top(self):
+        instance = _Ranking({"a": 3, "b": 0, "c": -1})
+        self.assertEqual({"a": 3, "c": -1}, instance.value_dict)
+        instance.add("b", 3)
+        instance.add("d", 5)
+        instance.add("d", -5)
+        # 同じ値の場合はキーの順、値が正のキーのみ
+        self.assertEqual([("a", 3), ("b", 3)], instance.top(5))
+        self.assertNotIn("d", instance.value_dict)
+        # 値が一度変わって元に戻っても重複して返さない
+        instance.add("a", 1)
+        instance.add("a", -1)
+        self.assertEqual([("a", 3)], instance.top(1))
+        self.assertEqual([("a", 3), ("b", 3)], instance.top(2))
+
+    def test_compaction(self):
+        instance = _Ranking()
+        for i in range(1000):
+            instance.add("a", 1)
+            instance.add(f"key_{i % 10}", 1)
+        # 古いエントリが溜まり続けない
+        self.assertLessEqual(len(instance._heap), 2 * len(instance.value_dict) + 64)
+        self.assertEqual([("a", 1000), ("key_0", 100)], instance.top(2))
+
+
+class TestTrendingEngine(unittest.TestCase):
+    def setUp(self) -> None:
+        self.root = Path(self.enterContext(TemporaryDirectory()))
+        self.now = datetime(2024, 9, 10)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def _get_engine(self) -> TrendingEngine:
+        instance = TrendingEngine(self.root / "vrc.db.trending")
+        # 最初の観測は基準値とする
+        self.assertEqual(0, instance.update({"a": (10, 100), "b": (5, 50)}, self.now))
+        self.assertEqual(
+            2, instance.update({"a": (15, 100), "b": (6, 60), "c": (1, 1)}, self.now + timedelta(hours=1))
+        )
+        self.assertEqual(2, instance.update({"a": (16, 100), "b": (26, 60)}, self.now + timedelta(days=2)))
+        return instance
+
+    def test_init(self):
+        for bucket_seconds in [0, 7000]:
+            with self.subTest(bucket_seconds=bucket_seconds):
+                with self.assertRaises(ValueError):
+                    TrendingEngine(bucket_seconds=bucket_seconds)
+        instance = TrendingEngine()
+        self.assertIsNone(instance.state_path)
+        self.assertEqual([], instance.top())
+        with self.assertRaises(ValueError):
+            instance.save()
+
+    def test_update_and_top(self):
+        instance = self._get_engine()
+        self.assertEqual([("b", 20), ("a", 1)], instance.top("24h", "star"))
+        self.assertEqual([("b", 21), ("a", 6)], instance.top("7d", "star"))
+        self.assertEqual([("b", 21)], instance.top("30d", "star", 1))
+        self.assertEqual([("b", 10)], instance.top("7d", "visit"))
+        self.assertEqual(6, instance.growth("a", "7d"))
+        self.assertEqual(0, instance.growth("c", "7d"))
+
+        # 減少したワールドはランキングに載せない
+        instance.update({"a": (6, 100)}, self.now + timedelta(days=2, hours=1))
+        self.assertEqual([("b", 20)], instance.top("24h", "star"))
+        self.assertEqual(-9, instance.growth("a", "24h"))
+
+        # 期間から外れた増加量を引く
+        instance.advance(self.now + timedelta(days=3, hours=1))
+        self.assertEqual([], instance.top("24h", "star"))
+        self.assertEqual([("b", 21)], instance.top("7d", "star"))
+        instance.advance(self.now + timedelta(days=40))
+        self.assertEqual([], instance.top("30d", "star"))
+        self.assertEqual([], instance._bucket_start_list)
+
+        # 前回より前の観測は最新のバケットに加える
+        instance.update({"c": (3, 1)}, self.now)
+        self.assertEqual([("c", 2)], instance.top("24h", "star"))
+
+        for window, metric, n in [("1h", "star", 1), ("24h", "unknown", 1), ("24h", "star", 0)]:
+            with self.subTest(window=window, metric=metric, n=n):
+                with self.assertRaises(ValueError):
+                    instance.top(window, metric, n)
+
+    def test_save_and_load(self):
+        instance = self._get_engine()
+        instance.save()
+        loaded = TrendingEngine(instance.state_path)
+        for window in ["24h", "7d", "30d"]:
+            for metric in ["star", "visit"]:
+                with self.subTest(window=window, metric=metric):
+                    self.assertEqual(instance.top(window, metric), loaded.top(window, metric))
+
+        # 保存した最後の観測値とバケットから続きを更新する
+        loaded.update({"a": (20, 100)}, self.now + timedelta(days=2, hours=1))
+        self.assertEqual([("b", 20), ("a", 5)], loaded.top("24h", "star"))
+        loaded.advance(self.now + timedelta(days=9))
+        self.assertEqual([("a", 4)], loaded.top("7d", "star"))
+
+        with self.assertRaises(ValueError):
+            TrendingEngine(instance.state_path, bucket_seconds=600)
+        state = orjson.loads(instance.state_path.read_bytes())
+        instance.state_path.write_bytes(orjson.dumps(state | {"version": 0}))
+        with self.assertRaises(ValueError):
+            TrendingEngine(instance.state_path)
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,147 @@
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from mock import patch
+
+from vrc_world_crawler.db.work_queue import WorkQueue
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self) -> None:
+        self.db_path = str(Path(self.enterContext(TemporaryDirectory())) / "queue.db")
+        return super().setUp()
+
+    def _get_instance(self, **kwargs) -> WorkQueue:
+        instance = WorkQueue(self.db_path, **kwargs)
+        self.addCleanup(instance.dispose)
+        return instance
+
+    def test_init(self):
+        instance = self._get_instance()
+        self.assertEqual(self.db_path, instance.db_path)
+        self.assertEqual(300, instance.lease_seconds)
+        self.assertEqual(3, instance.max_attempts)
+        with self.assertRaises(ValueError):
+            WorkQueue(self.db_path, lease_seconds=0)
+        with self.assertRaises(ValueError):
+            WorkQueue(self.db_path, max_attempts=0)
+
+    def test_enqueue(self):
+        instance = self._get_instance()
+        crawl_id = instance.enqueue(["main", "sub"], ["worlds1", "worlds2"], 300, 50, unit_pages=3, crawl_id="c1")
+        self.assertEqual("c1", crawl_id)
+        self.assertEqual(["c1"], instance.crawl_id_list())
+        self.assertEqual(["main", "sub"], instance.account_name_list("c1"))
+        self.assertIsNotNone(instance.created_at("c1"))
+        self.assertIsNone(instance.created_at("unknown"))
+        # 7ページを3ページずつに分けるため、1タグあたり3つの作業単位となる
+        self.assertEqual({"pending": 12, "leased": 0, "done": 0, "failed": 0}, instance.count_status("c1"))
+        self.assertFalse(instance.is_finished("c1"))
+
+        unit_list = [instance.claim("worker") for _ in range(3)]
+        actual = [(unit.account, unit.tag, unit.offset_start, unit.offset_end, unit.attempt) for unit in unit_list]
+        expect = [("main", "worlds1", 0, 100, 1), ("main", "worlds1", 150, 250, 1), ("main", "worlds1", 300, 300, 1)]
+        self.assertEqual(expect, actual)
+
+        with self.assertRaises(ValueError):
+            instance.enqueue(["main"], ["worlds1"], 300, 50, crawl_id="c1")
+        with self.assertRaises(ValueError):
+            instance.enqueue(["main"], ["worlds1"], 300, 0)
+        with self.assertRaises(ValueError):
+            instance.enqueue(["main"], ["worlds1"], -1, 50)
+
+    def test_complete(self):
+        instance = self._get_instance()
+        instance.enqueue(["main"], ["worlds1", "worlds2"], 50, 50, crawl_id="c1")
+        instance.enqueue(["main"], ["worlds1"], 0, 50, crawl_id="c2")
+
+        # crawl_id を指定すると、そのクロールの作業単位のみを取得する
+        unit = instance.claim("worker", "c2")
+        self.assertEqual(("c2", "worlds1", 0), (unit.crawl_id, unit.tag, unit.offset_start))
+        self.assertTrue(instance.complete(unit, "worker", [[{"id": "c2"}]]))
+        self.assertIsNone(instance.claim("worker", "c2"))
+        self.assertTrue(instance.is_finished("c2"))
+
+        unit_list = []
+        while (unit := instance.claim("worker", "c1")) is not None:
+            unit_list.append(unit)
+        self.assertEqual(4, len(unit_list))
+        self.assertEqual({"pending": 0, "leased": 4, "done": 0, "failed": 0}, instance.count_status("c1"))
+        # 他のワーカーのリースは延長も完了もできない
+        self.assertFalse(instance.heartbeat(unit_list[0], "other"))
+        self.assertFalse(instance.complete(unit_list[0], "other", []))
+        self.assertTrue(instance.heartbeat(unit_list[0], "worker"))
+        # 登録順と異なる順で完了しても、登録順に読み出す
+        for index in reversed(range(4)):
+            page_list = [[{"id": index, "page": 0}], [{"id": index, "page": 1}]] if index % 2 == 0 else []
+            self.assertTrue(instance.complete(unit_list[index], "worker", page_list))
+        self.assertTrue(instance.is_finished("c1"))
+        actual = list(instance.iter_pages("c1", "main"))
+        expect = [[{"id": index, "page": page}] for index in [0, 2] for page in [0, 1]]
+        self.assertEqual(expect, actual)
+        self.assertEqual([], list(instance.iter_pages("c1", "sub")))
+
+        self.assertEqual(4, instance.purge("c1"))
+        self.assertEqual(["c2"], instance.crawl_id_list())
+
+    def test_retry(self):
+        instance = self._get_instance(lease_seconds=60, max_attempts=2)
+        instance.enqueue(["main"], ["worlds1"], 0, 50, crawl_id="c1")
+
+        # 失敗した作業単位は上限まで再び取得できる
+        unit = instance.claim("worker1")
+        self.assertTrue(instance.fail(unit, "worker1", "error"))
+        unit = instance.claim("worker2")
+        self.assertEqual(2, unit.attempt)
+
+        # リースが切れた作業単位は他のワーカーが引き継ぐ、上限に達していれば failed となる
+        self.assertIsNone(instance.claim("worker3"))
+        with patch("vrc_world_crawler.db.work_queue.time.time", return_value=time.time() + 120):
+            self.assertIsNone(instance.claim("worker3"))
+        self.assertEqual({"pending": 0, "leased": 0, "done": 0, "failed": 1}, instance.count_status("c1"))
+        self.assertFalse(instance.complete(unit, "worker2", []))
+
+        instance.enqueue(["main"], ["worlds1"], 0, 50, crawl_id="c2")
+        unit = instance.claim("worker1")
+        with patch("vrc_world_crawler.db.work_queue.time.time", return_value=time.time() + 120):
+            retry_unit = instance.claim("worker2")
+        self.assertEqual((unit.unit_id, 2), (retry_unit.unit_id, retry_unit.attempt))
+        # リースを失ったワーカーは結果を保存できない
+        self.assertFalse(instance.heartbeat(unit, "worker1"))
+        self.assertFalse(instance.complete(unit, "worker1", []))
+        self.assertTrue(instance.fail(retry_unit, "worker2", "error"))
+        self.assertEqual({"pending": 0, "leased": 0, "done": 0, "failed": 1}, instance.count_status("c2"))
+        self.assertTrue(instance.is_finished("c2"))
+
+    def test_claim_concurrent(self):
+        # 別々のコネクションから同時に取得しても、同じ作業単位を2回取得しない
+        self._get_instance().enqueue(["main"], [f"worlds{i}" for i in range(20)], 300, 50)
+        claimed_list = []
+        lock = threading.Lock()
+
+        def run(worker_id: str) -> None:
+            instance = WorkQueue(self.db_path)
+            try:
+                while (unit := instance.claim(worker_id)) is not None:
+                    with lock:
+                        claimed_list.append(unit.unit_id)
+            finally:
+                instance.dispose()
+
+        thread_list = [threading.Thread(target=run, args=(f"worker{i}",)) for i in range(4)]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        self.assertEqual(140, len(claimed_list))
+        self.assertEqual(140, len(set(claimed_list)))
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,113 @@
+import sys
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from mock import MagicMock
+
+from vrc_world_crawler.db.world_index import HASH_COLUMN_LIST, IndexEntry, WorldIndex, content_hash
+
+
+class TestWorldIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def _get_entry(self, index: int, **kwargs) -> IndexEntry:
+        entry_dict = {
+            "account": "default",
+            "row_id": index,
+            "world_id": f"wrld_world_id_{index}",
+            "favorite_id": f"favorite_id_{index}",
+            "content_hash": index,
+            "is_favorited": True,
+            "release_status": "public",
+        }
+        return IndexEntry(**(entry_dict | kwargs))
+
+    def _get_session(self) -> MagicMock:
+        session = MagicMock()
+        session.info = {}
+        return session
+
+    def test_content_hash(self) -> None:
+        record_dict = {column: column for column in HASH_COLUMN_LIST} | {"featured": True, "star": 1}
+        actual = content_hash(record_dict)
+        self.assertIsInstance(actual, int)
+        # bool と int は同じ値として扱う
+        self.assertEqual(actual, content_hash(record_dict | {"featured": 1}))
+        self.assertNotEqual(actual, content_hash(record_dict | {"star": 2}))
+        # ハッシュ対象外の列は影響しない
+        self.assertEqual(actual, content_hash(record_dict | {"registered_at": "now"}))
+
+    def test_stage_and_commit(self) -> None:
+        instance = WorldIndex()
+        session = self._get_session()
+        instance.stage(session, [self._get_entry(1), self._get_entry(2)])
+
+        # 保留中の変更はそのセッションからのみ見える
+        self.assertEqual(0, len(instance))
+        self.assertEqual(self._get_entry(1), instance.get_by_world_id(session, "default", "wrld_world_id_1"))
+        self.assertIsNone(instance.get_by_world_id(self._get_session(), "default", "wrld_world_id_1"))
+
+        # 非公開になったエントリは world_id では引けない
+        instance.stage(session, [self._get_entry(2, release_status="private")])
+        self.assertIsNone(instance.get_by_world_id(session, "default", "wrld_world_id_2"))
+        self.assertEqual(
+            self._get_entry(2, release_status="private"),
+            instance.get_by_favorite_id(session, "default", "favorite_id_2"),
+        )
+
+        self.assertTrue(instance.commit(session))
+        self.assertFalse(instance.commit(session))
+        self.assertEqual(2, len(instance))
+        self.assertEqual(["wrld_world_id_1"], [world_id for _, world_id in instance.by_world_id.keys()])
+
+        # お気に入りから外れたエントリを求める
+        session = self._get_session()
+        actual = instance.removed_favorite_id_list(session, "default", {"favorite_id_2"})
+        self.assertEqual(["favorite_id_1"], actual)
+        instance.stage_unfavorited(session, "default", actual)
+        self.assertEqual([], instance.removed_favorite_id_list(session, "default", {"favorite_id_2"}))
+
+        # 破棄した変更は反映されない
+        instance.discard(session, "default")
+        self.assertFalse(instance.commit(session))
+        self.assertTrue(instance.by_world_id[("default", "wrld_world_id_1")].is_favorited)
+
+    def test_remove(self) -> None:
+        instance = WorldIndex()
+        session = self._get_session()
+        instance.stage(session, [self._get_entry(1), self._get_entry(2)])
+        instance.commit(session)
+
+        # row_id が一致しないエントリは、同じキーで追加し直された行のため消さない
+        instance.remove([self._get_entry(1), self._get_entry(2, row_id=3)])
+        self.assertEqual(1, len(instance))
+        self.assertIsNone(instance.get_by_world_id(session, "default", "wrld_world_id_1"))
+        self.assertIsNone(instance.get_by_favorite_id(session, "default", "favorite_id_1"))
+        self.assertEqual(self._get_entry(2), instance.get_by_world_id(session, "default", "wrld_world_id_2"))
+
+    def test_save_and_load_file(self) -> None:
+        temp_dir = Path(self.enterContext(TemporaryDirectory()))
+        path = temp_dir / "vrc.db.index"
+        instance = WorldIndex()
+        session = self._get_session()
+        instance.stage(session, [self._get_entry(1), self._get_entry(2, release_status="private")])
+        instance.commit(session)
+        instance.save(path, ["vrc.db", 1, 2])
+
+        actual = WorldIndex()
+        self.assertFalse(actual.load_file(temp_dir / "missing.index", ["vrc.db", 1, 2]))
+        self.assertFalse(actual.load_file(path, ["vrc.db", 1, 3]))
+        self.assertTrue(actual.load_file(path, ["vrc.db", 1, 2]))
+        self.assertEqual(instance.by_world_id, actual.by_world_id)
+        self.assertEqual(instance.by_favorite_id, actual.by_favorite_id)
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
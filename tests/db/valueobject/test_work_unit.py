@@ -0,0 +1,29 @@
+import sys
+import unittest
+
+from vrc_world_crawler.db.valueobject.work_unit import WorkUnit
+
+
+class TestWorkUnit(unittest.TestCase):
+    def test_init(self):
+        instance = WorkUnit(1, "crawl", "default", "worlds1", 0, 50, 50, 1)
+        self.assertEqual(1, instance.unit_id)
+        self.assertEqual("crawl", instance.crawl_id)
+        self.assertEqual("default", instance.account)
+        self.assertEqual("worlds1", instance.tag)
+        self.assertEqual(0, instance.offset_start)
+        self.assertEqual(50, instance.offset_end)
+        self.assertEqual(50, instance.page_size)
+        self.assertEqual(1, instance.attempt)
+
+        args = [1, "crawl", "default", "worlds1", 0, 50, 50, 1]
+        for index, value in [(0, "1"), (0, True), (1, ""), (2, ""), (3, ""), (4, -1), (5, -1), (6, 0), (7, 0)]:
+            with self.subTest(index=index, value=value):
+                with self.assertRaises(ValueError):
+                    WorkUnit(*args[:index], value, *args[index + 1 :])
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
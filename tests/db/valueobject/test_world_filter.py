@@ -0,0 +1,66 @@
+import sys
+import unittest
+
+from sqlalchemy.dialects import sqlite
+
+from vrc_world_crawler.db.valueobject.world_filter import WorldFilter
+
+
+class TestWorldFilter(unittest.TestCase):
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def _compile(self, clause) -> str:
+        return str(clause.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+
+    def test_init(self):
+        instance = WorldFilter()
+        self.assertIsNone(instance.favorite_group)
+        self.assertIsNone(instance.release_status)
+        self.assertIsNone(instance.author_id)
+        self.assertIsNone(instance.author_name)
+        self.assertIsNone(instance.is_favorited)
+        self.assertIsNone(instance.updated_since)
+
+        instance = WorldFilter("worlds1", "public", "author_id", "author_name", True, "2024-09-01T00:00:00")
+        self.assertEqual("worlds1", instance.favorite_group)
+        self.assertEqual("2024-09-01T00:00:00", instance.updated_since)
+
+        with self.assertRaises(ValueError):
+            WorldFilter(favorite_group=-1)
+        with self.assertRaises(ValueError):
+            WorldFilter(release_status=-1)
+        with self.assertRaises(ValueError):
+            WorldFilter(author_id=-1)
+        with self.assertRaises(ValueError):
+            WorldFilter(author_name=-1)
+        with self.assertRaises(ValueError):
+            WorldFilter(is_favorited="True")
+        with self.assertRaises(ValueError):
+            WorldFilter(updated_since=-1)
+        with self.assertRaises(ValueError):
+            WorldFilter(updated_since="invalid updated_since str")
+
+    def test_to_clause_list(self):
+        self.assertEqual([], WorldFilter().to_clause_list())
+
+        instance = WorldFilter("worlds1", "public", "author_id", "author_name", False, "2024-09-01T00:00:00")
+        actual = [self._compile(clause) for clause in instance.to_clause_list()]
+        expect = [
+            "\"FavoriteWorld\".favorite_group = 'worlds1'",
+            "\"FavoriteWorld\".release_status = 'public'",
+            "\"FavoriteWorld\".author_id = 'author_id'",
+            "\"FavoriteWorld\".author_name = 'author_name'",
+            '"FavoriteWorld".is_favorited = 0',
+            "\"FavoriteWorld\".updated_at >= '2024-09-01T00:00:00'",
+        ]
+        self.assertEqual(expect, actual)
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
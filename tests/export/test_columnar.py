@@ -0,0 +1,76 @@
+import io
+import sys
+import unittest
+from collections import namedtuple
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from vrc_world_crawler.export.columnar import MAGIC, ColumnarReader, ColumnarWriter
+
+
+class TestColumnar(unittest.TestCase):
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def _write(self, column_dict: dict[str, str], chunk_list: list[list[tuple]]) -> Path:
+        path = Path(self.enterContext(TemporaryDirectory())) / "export.col"
+        with path.open("wb") as output:
+            writer = ColumnarWriter(output, column_dict)
+            for chunk in chunk_list:
+                writer.write_chunk(chunk)
+            writer.close()
+        return path
+
+    def test_write_and_read(self):
+        Params = namedtuple("Params", ["chunk_list", "msg"])
+        column_dict = {"id": "int", "name": "str", "is_favorited": "bool", "description": "str"}
+        params_list = [
+            Params([], "no row"),
+            Params([[(1, "a", True, "desc")]], "one row"),
+            Params(
+                [
+                    [(1, "ワールド", True, None), (2, "", False, "説明")],
+                    [],
+                    [(3, "c" * 1000, True, "d"), (-(2**63), "e", False, None), (2**63 - 1, "f", True, "")],
+                ],
+                "multi row group with null and non ascii",
+            ),
+        ]
+        for params in params_list:
+            with self.subTest(params.msg):
+                path = self._write(column_dict, params.chunk_list)
+                expect = [dict(zip(column_dict, row)) for chunk in params.chunk_list for row in chunk]
+                reader = ColumnarReader(path)
+                self.assertEqual(column_dict, reader.column_dict)
+                self.assertEqual(expect, list(reader.iter_rows()))
+
+                # 指定した列のみを読み込む
+                expect = [{"name": row["name"], "id": row["id"]} for row in expect]
+                self.assertEqual(expect, list(reader.iter_rows(["name", "id"])))
+                # 空の行グループは書き出さない
+                self.assertEqual(
+                    len([chunk for chunk in params.chunk_list if chunk]), len(list(reader.iter_columns()))
+                )
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            ColumnarWriter(io.BytesIO(), {"id": "float"})
+
+        path = Path(self.enterContext(TemporaryDirectory())) / "export.jsonl"
+        path.write_bytes(b'{"id": 1}\n')
+        with self.assertRaises(ValueError):
+            ColumnarReader(path)
+
+        path = self._write({"id": "int"}, [[(1,)]])
+        self.assertTrue(path.read_bytes().startswith(MAGIC))
+        with self.assertRaises(ValueError):
+            list(ColumnarReader(path).iter_rows(["name"]))
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,119 @@
+import csv
+import io
+import sys
+import unittest
+from collections import namedtuple
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import orjson
+from mock import patch
+
+from vrc_world_crawler.bench import make_record_list
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.db.model import FavoriteWorld
+from vrc_world_crawler.db.valueobject.world_filter import WorldFilter
+from vrc_world_crawler.export.columnar import ColumnarReader
+from vrc_world_crawler.export.exporter import Exporter
+
+
+class TestExporter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_path = Path(self.enterContext(TemporaryDirectory()))
+        self.db = FavoriteWorldDB(":memory:")
+        self.db.upsert(make_record_list(10))
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.db.engine.dispose()
+        return super().tearDown()
+
+    def _read(self, export_format: str, path: Path) -> list[dict]:
+        match export_format:
+            case "jsonl":
+                return [orjson.loads(line) for line in path.read_bytes().splitlines()]
+            case "csv":
+                with path.open(newline="", encoding="utf-8") as file:
+                    return list(csv.DictReader(file))
+            case "columnar":
+                return list(ColumnarReader(path).iter_rows())
+
+    def test_init(self):
+        instance = Exporter(self.db)
+        self.assertIs(self.db, instance.db)
+        self.assertEqual("jsonl", instance.export_format)
+        self.assertEqual(1000, instance.chunk_size)
+
+        with self.assertRaises(ValueError):
+            Exporter(self.db, "parquet")
+        with self.assertRaises(ValueError):
+            Exporter(self.db, chunk_size=0)
+
+    def test_export(self):
+        Params = namedtuple("Params", ["export_format", "world_filter", "columns", "expect_num", "msg"])
+        params_list = [
+            Params("jsonl", None, None, 10, "jsonl all"),
+            Params("csv", None, ["world_id", "star"], 10, "csv columns"),
+            Params("columnar", WorldFilter(favorite_group="worlds1"), ["world_id", "is_favorited"], 10, "columnar"),
+            Params("jsonl", WorldFilter(favorite_group="worlds2"), None, 0, "no match"),
+        ]
+        expect_list = list(self.db.iter_rows(as_dict=True))
+        for params in params_list:
+            with self.subTest(params.msg):
+                path = self.temp_path / f"export.{params.export_format}"
+                instance = Exporter(self.db, params.export_format, chunk_size=3)
+                actual = instance.export(path, params.world_filter, params.columns)
+                self.assertEqual(params.expect_num, actual)
+
+                actual = self._read(params.export_format, path)
+                columns = params.columns or list(FavoriteWorld.__table__.columns.keys())
+                expect = [{column: row[column] for column in columns} for row in expect_list][: params.expect_num]
+                if params.export_format == "csv":
+                    expect = [{k: str(v) for k, v in row.items()} for row in expect]
+                self.assertEqual(expect, actual)
+                self.assertFalse(path.with_name(path.name + ".tmp").exists())
+
+        with self.assertRaises(ValueError):
+            Exporter(self.db).export(self.temp_path / "invalid.jsonl", columns=["invalid_column"])
+
+    def test_export_stdout(self):
+        stdout = io.TextIOWrapper(io.BytesIO())
+        self.enterContext(patch("sys.stdout", stdout))
+        self.assertEqual(10, Exporter(self.db).export(None, columns=["id"]))
+        actual = [orjson.loads(line) for line in stdout.buffer.getvalue().splitlines()]
+        self.assertEqual([{"id": i} for i in range(1, 11)], actual)
+
+    def test_export_watermark(self):
+        path = self.temp_path / "export.jsonl"
+        watermark_path = self.temp_path / "watermark.json"
+        instance = Exporter(self.db, chunk_size=4)
+        self.assertEqual(10, instance.export(path, columns=["id"], watermark_path=watermark_path))
+
+        # 変化が無ければ何も書き出さない
+        self.assertEqual(0, instance.export(path, columns=["id"], watermark_path=watermark_path))
+
+        # 追加・更新したレコードのみ書き出す
+        record_list = make_record_list(12)
+        record_list[0].updated_at = "2099-01-01T00:00:00+09:00"
+        self.db.upsert(record_list)
+        self.assertEqual(3, instance.export(path, columns=["id"], watermark_path=watermark_path))
+        self.assertEqual([{"id": 1}, {"id": 11}, {"id": 12}], self._read("jsonl", path))
+
+    def test_export_failed(self):
+        path = self.temp_path / "export.jsonl"
+        watermark_path = self.temp_path / "watermark.json"
+        path.write_bytes(b"previous")
+        self.enterContext(patch.object(self.db, "iter_chunks", side_effect=RuntimeError))
+
+        # 失敗した場合は既存のファイルも watermark も変更しない
+        with self.assertRaises(RuntimeError):
+            Exporter(self.db).export(path, watermark_path=watermark_path)
+        self.assertEqual(b"previous", path.read_bytes())
+        self.assertFalse(watermark_path.exists())
+        self.assertEqual(["export.jsonl"], [p.name for p in self.temp_path.iterdir()])
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
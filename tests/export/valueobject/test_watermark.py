@@ -0,0 +1,60 @@
+import sys
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from sqlalchemy.dialects import sqlite
+
+from vrc_world_crawler.export.valueobject.watermark import Watermark
+
+
+class TestWatermark(unittest.TestCase):
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def test_init(self):
+        instance = Watermark()
+        self.assertEqual(0, instance.last_id)
+        self.assertEqual("", instance.updated_at)
+
+        with self.assertRaises(ValueError):
+            Watermark(last_id="1")
+        with self.assertRaises(ValueError):
+            Watermark(last_id=True)
+        with self.assertRaises(ValueError):
+            Watermark(last_id=-1)
+        with self.assertRaises(ValueError):
+            Watermark(updated_at=None)
+
+    def test_to_clause(self):
+        clause = Watermark(10, "2024-09-01T00:00:00").to_clause()
+        actual = str(clause.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+        self.assertEqual(
+            '"FavoriteWorld".id > 10 OR "FavoriteWorld".updated_at > \'2024-09-01T00:00:00\'',
+            actual,
+        )
+
+    def test_advance(self):
+        instance = Watermark(10, "2024-09-02T00:00:00")
+        self.assertEqual(Watermark(12, "2024-09-02T00:00:00"), instance.advance(12, "2024-09-01T00:00:00"))
+        self.assertEqual(Watermark(10, "2024-09-03T00:00:00"), instance.advance(5, "2024-09-03T00:00:00"))
+        self.assertEqual(instance, instance.advance(1, None))
+
+    def test_save_and_load(self):
+        temp_dir = Path(self.enterContext(TemporaryDirectory()))
+        path = temp_dir / "watermark.json"
+        self.assertEqual(Watermark(), Watermark.load(path))
+
+        instance = Watermark(3, "2024-09-01T00:00:00")
+        instance.save(path)
+        self.assertEqual(instance, Watermark.load(path))
+        self.assertFalse((temp_dir / "watermark.json.tmp").exists())
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
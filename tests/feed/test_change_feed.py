@@ -0,0 +1,96 @@
+import sys
+import unittest
+from collections import namedtuple
+
+from mock import MagicMock
+
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.db.model import ChangeEvent
+from vrc_world_crawler.feed.change_feed import ChangeFeed
+
+
+class TestChangeFeed(unittest.TestCase):
+    def setUp(self) -> None:
+        self.db = FavoriteWorldDB(":memory:")
+        with self.db.session_scope() as session:
+            for i in range(5):
+                session.add(
+                    ChangeEvent(
+                        crawl_id="crawl_1",
+                        event_type=["added", "removed"][i % 2],
+                        account="default" if i < 3 else "sub",
+                        world_id=f"wrld_world_id_{i}",
+                        favorite_id=f"favorite_id_{i}",
+                        favorite_group="worlds1",
+                        changes="{}",
+                        created_at="2024-09-01T00:00:00",
+                    )
+                )
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.db.engine.dispose()
+        return super().tearDown()
+
+    def test_read(self):
+        instance = ChangeFeed(self.db)
+        Params = namedtuple("Params", ["kwargs", "expect_id_list", "expect_next_id"])
+        params_list = [
+            Params({}, [1, 2, 3, 4, 5], 5),
+            Params({"after_id": 3}, [4, 5], 5),
+            Params({"after_id": 5}, [], 5),
+            Params({"limit": 2}, [1, 2], 2),
+            Params({"after_id": 2, "limit": 2}, [3, 4], 4),
+            # 絞り込みで読み飛ばしたイベントは次回読まない
+            Params({"event_type": "removed"}, [2, 4], 5),
+            Params({"account": "sub", "limit": 1}, [4], 4),
+            Params({"favorite_group": "worlds2"}, [], 5),
+        ]
+        for params in params_list:
+            with self.subTest(params=params):
+                event_list, next_id = instance.read(**params.kwargs)
+                self.assertEqual(params.expect_id_list, [event["id"] for event in event_list])
+                self.assertEqual(params.expect_next_id, next_id)
+
+        event = instance.read(limit=1)[0][0]
+        self.assertEqual({}, event["changes"])
+        self.assertEqual("wrld_world_id_0", event["world_id"])
+
+        with self.assertRaises(ValueError):
+            instance.read(limit=0)
+        with self.assertRaises(ValueError):
+            instance.read(event_type="unknown")
+
+    def test_consume(self):
+        instance = ChangeFeed(self.db)
+        sink = MagicMock()
+        self.assertEqual(0, instance.get_cursor("consumer_a"))
+
+        self.assertEqual(5, instance.consume("consumer_a", sink, batch_size=2))
+        self.assertEqual([[1, 2], [3, 4], [5]], [[e["id"] for e in c.args[0]] for c in sink.send.call_args_list])
+        self.assertEqual(5, instance.get_cursor("consumer_a"))
+
+        # 送信済みのイベントは送らない、カーソルは利用者ごとに持つ
+        sink.reset_mock()
+        self.assertEqual(0, instance.consume("consumer_a", sink))
+        sink.send.assert_not_called()
+        self.assertEqual(0, instance.get_cursor("consumer_b"))
+
+        # 送信に失敗した場合は、送信済みの分までカーソルを進める
+        sink.send.side_effect = [None, RuntimeError]
+        with self.assertRaises(RuntimeError):
+            instance.consume("consumer_b", sink, batch_size=2)
+        self.assertEqual(2, instance.get_cursor("consumer_b"))
+        sink.send.side_effect = None
+        sink.reset_mock()
+        self.assertEqual(3, instance.consume("consumer_b", sink, batch_size=2))
+        self.assertEqual(3, sink.send.call_args_list[0].args[0][0]["id"])
+
+        instance.set_cursor("consumer_a", 1)
+        self.assertEqual(1, instance.get_cursor("consumer_a"))
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
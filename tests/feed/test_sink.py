@@ -0,0 +1,76 @@
+import io
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import httpx
+import orjson
+
+from vrc_world_crawler.feed.sink import FileSink, StreamSink, WebhookSink
+
+
+class _Handler(BaseHTTPRequestHandler):
+    body_list: list[bytes] = []
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path != "/hook":
+            self.send_error(500)
+            return
+        self.body_list.append(body)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class TestSink(unittest.TestCase):
+    def setUp(self) -> None:
+        self.event_list = [{"id": 1, "event_type": "added"}, {"id": 2, "event_type": "removed"}]
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def test_stream_sink(self):
+        output = io.BytesIO()
+        StreamSink(output).send(self.event_list)
+        self.assertEqual(self.event_list, [orjson.loads(line) for line in output.getvalue().splitlines()])
+
+    def test_file_sink(self):
+        path = Path(self.enterContext(TemporaryDirectory())) / "changes.jsonl"
+        instance = FileSink(path)
+        instance.send(self.event_list[:1])
+        instance.send(self.event_list[1:])
+        instance.close()
+        # 追記される
+        self.assertEqual(self.event_list, [orjson.loads(line) for line in path.read_bytes().splitlines()])
+
+    def test_webhook_sink(self):
+        _Handler.body_list = []
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        instance = WebhookSink(f"{base_url}/hook")
+        self.addCleanup(instance.close)
+        instance.send(self.event_list)
+        self.assertEqual([{"events": self.event_list}], [orjson.loads(body) for body in _Handler.body_list])
+
+        # 2xx 以外は送信失敗とする
+        instance = WebhookSink(f"{base_url}/error")
+        self.addCleanup(instance.close)
+        with self.assertRaises(httpx.HTTPStatusError):
+            instance.send(self.event_list)
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,297 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import orjson
+from mock import MagicMock, patch
+
+from vrc_world_crawler.bench import make_fetched_dict
+from vrc_world_crawler.crawler.run_lock import RunLock
+from vrc_world_crawler.db.favorite_world_db import FavoriteWorldDB
+from vrc_world_crawler.main import archive, bench, build_parser, changes, crawl, enqueue, export, main, merge, replay
+from vrc_world_crawler.main import search, stats, summary, trending, work
+
+# main --help の時点で読み込まないモジュール
+# cron やデバッグ実行での起動時間を抑えるため、重いライブラリとクローラ本体はサブコマンドの実行時に読み込む
+# 所要時間は実行環境の負荷で揺れるため、時間ではなく読み込んだモジュールで確認する
+MAIN_LAZY_MODULE_LIST = [
+    "sqlalchemy",
+    "httpx",
+    "orjson",
+    "logging.config",
+    "vrc_world_crawler.crawler",
+    "vrc_world_crawler.db",
+]
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def _import_time(self, argv: list[str]) -> dict[str, int]:
+        """-X importtime で argv を実行し、読み込んだモジュール名から累積 import 時間を引く辞書を返す"""
+        env = os.environ.copy()
+        src_path = str(Path(__file__).parent.parent / "src")
+        env["PYTHONPATH"] = os.pathsep.join([src_path, env.get("PYTHONPATH", "")])
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", *argv],
+            capture_output=True,
+            text=True,
+            env=env,
+            check=True,
+        )
+        result = {}
+        for line in completed.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line.removeprefix("import time:").split("|")
+            result[name.strip()] = int(cumulative)
+        return result
+
+    def test_import_main(self):
+        import_time_dict = self._import_time(["-m", "vrc_world_crawler.main", "--help"])
+
+        # 重いライブラリとクローラ本体は、ヘルプの表示までに読み込まない
+        self.assertIn("argparse", import_time_dict)
+        for module_name in MAIN_LAZY_MODULE_LIST:
+            with self.subTest(module_name=module_name):
+                imported_list = [
+                    name for name in import_time_dict if name == module_name or name.startswith(f"{module_name}.")
+                ]
+                self.assertEqual([], imported_list)
+
+    def test_import_crawler(self):
+        import_time_dict = self._import_time(["-c", "import vrc_world_crawler.crawler.crawler"])
+
+        # httpx は実際に API へアクセスするときに初めて読み込む
+        self.assertIn("sqlalchemy", import_time_dict)
+        self.assertNotIn("httpx", import_time_dict)
+
+    def test_build_parser(self):
+        parser = build_parser()
+
+        # サブコマンド省略時は既定の設定の crawl
+        args = parser.parse_args([])
+        self.assertIs(crawl, args.handler)
+        self.assertEqual(Path("./config/config.json"), args.config)
+        self.assertEqual("vrc.db", args.db)
+        self.assertEqual(Path("./cache/"), args.cache_dir)
+        self.assertFalse(args.dry_run)
+        self.assertFalse(args.daemon)
+        self.assertIsNone(args.profile)
+        self.assertFalse(args.trace_memory)
+
+        args = parser.parse_args(["--profile", "cprofile", "--profile-dir", "prof", "--profile-top", "5", "crawl"])
+        self.assertEqual("cprofile", args.profile)
+        self.assertEqual(Path("prof"), args.profile_dir)
+        self.assertEqual(5, args.profile_top)
+        self.assertTrue(parser.parse_args(["--trace-memory", "replay"]).trace_memory)
+
+        argv = ["--db", "other.db", "crawl", "--concurrency", "2", "--page-size", "100", "--dry-run"]
+        args = parser.parse_args(argv)
+        self.assertIs(crawl, args.handler)
+        self.assertEqual("other.db", args.db)
+        self.assertEqual(2, args.concurrency)
+        self.assertEqual(100, args.page_size)
+        self.assertTrue(args.dry_run)
+
+        args = parser.parse_args(["crawl", "--daemon", "--interval", "600", "--jitter", "30"])
+        self.assertTrue(args.daemon)
+        self.assertEqual(600.0, args.interval)
+        self.assertEqual(30.0, args.jitter)
+
+        args = parser.parse_args(["replay", "--snapshot", "snapshot.json"])
+        self.assertIs(replay, args.handler)
+        self.assertEqual(Path("snapshot.json"), args.snapshot)
+
+        args = parser.parse_args(["export", "-o", "out.jsonl", "--favorite-group", "worlds1", "--favorited-only"])
+        self.assertIs(export, args.handler)
+        self.assertEqual("out.jsonl", args.output)
+        self.assertEqual("worlds1", args.favorite_group)
+        self.assertTrue(args.favorited_only)
+
+        self.assertIs(stats, parser.parse_args(["stats"]).handler)
+
+        args = parser.parse_args(["changes", "--after", "10", "--event-type", "removed"])
+        self.assertIs(changes, args.handler)
+        self.assertEqual(10, args.after)
+        self.assertEqual("removed", args.event_type)
+
+        args = parser.parse_args(["crawl", "--change-file", "a.jsonl", "--change-webhook", "http://localhost/hook"])
+        self.assertEqual([Path("a.jsonl")], args.change_file)
+        self.assertEqual(["http://localhost/hook"], args.change_webhook)
+
+        args = parser.parse_args(["search", "horror", "world", "--limit", "5", "--rebuild"])
+        self.assertIs(search, args.handler)
+        self.assertEqual(["horror", "world"], args.query)
+        self.assertEqual(5, args.limit)
+        self.assertTrue(args.rebuild)
+
+        args = parser.parse_args(["crawl", "--replay-cassette", "cassette", "--replay-latency", "0.5"])
+        self.assertEqual(Path("cassette"), args.replay_cassette)
+        self.assertIsNone(args.record_cassette)
+        self.assertEqual(0.5, args.replay_latency)
+        with self.assertRaises(SystemExit), patch("sys.stderr", new_callable=io.StringIO):
+            parser.parse_args(["crawl", "--record-cassette", "a", "--replay-cassette", "b"])
+
+        args = parser.parse_args(["--queue-db", "q.db", "enqueue", "--unit-pages", "2"])
+        self.assertIs(enqueue, args.handler)
+        self.assertEqual("q.db", args.queue_db)
+        self.assertEqual(2, args.unit_pages)
+        args = parser.parse_args(["work", "--crawl-id", "c1", "--wait", "--lease-seconds", "60"])
+        self.assertIs(work, args.handler)
+        self.assertEqual("c1", args.crawl_id)
+        self.assertTrue(args.wait)
+        self.assertEqual(60, args.lease_seconds)
+        args = parser.parse_args(["merge", "--dry-run", "--keep"])
+        self.assertIs(merge, args.handler)
+        self.assertIsNone(args.crawl_id)
+        self.assertTrue(args.dry_run)
+        self.assertTrue(args.keep)
+
+        args = parser.parse_args(["crawl", "--archive-after-days", "180"])
+        self.assertEqual(180.0, args.archive_after_days)
+        self.assertIsNone(parser.parse_args(["crawl"]).archive_after_days)
+
+        args = parser.parse_args([
+            "archive",
+            "--after-days",
+            "30",
+            "--vacuum-pages",
+            "0",
+            "--enable-incremental-vacuum",
+        ])
+        self.assertIs(archive, args.handler)
+        self.assertEqual(30.0, args.after_days)
+        self.assertEqual(500, args.batch_size)
+        self.assertEqual(0, args.vacuum_pages)
+        self.assertTrue(args.enable_incremental_vacuum)
+
+        args = parser.parse_args(["summary", "author", "--order-by", "star_total", "--limit", "10"])
+        self.assertIs(summary, args.handler)
+        self.assertEqual(("author", "star_total", 10), (args.by, args.order_by, args.limit))
+        args = parser.parse_args(["summary", "--check", "--rebuild"])
+        self.assertEqual("favorite_group", args.by)
+        self.assertTrue(args.check)
+        self.assertTrue(args.rebuild)
+
+        args = parser.parse_args(["trending", "--window", "7d", "--metric", "visit", "--top", "5"])
+        self.assertIs(trending, args.handler)
+        self.assertEqual(("7d", "visit", 5), (args.window, args.metric, args.top))
+        self.assertTrue(parser.parse_args(["crawl", "--trending"]).trending)
+        self.assertTrue(parser.parse_args(["merge", "--trending"]).trending)
+        self.assertFalse(parser.parse_args(["replay"]).trending)
+
+        args = parser.parse_args(["bench", "iter_rows", "--size", "10", "--repeat", "1"])
+        self.assertIs(bench, args.handler)
+        self.assertEqual(["iter_rows"], args.name)
+        self.assertEqual(10, args.size)
+
+    def test_replay_export_stats(self):
+        temp_dir = self.enterContext(tempfile.TemporaryDirectory())
+        temp_path = Path(temp_dir)
+        cache_path = temp_path / "cache"
+        cache_path.mkdir()
+        snapshot_path = cache_path / "favorites_world_20240901000000.json"
+        snapshot_path.write_bytes(orjson.dumps([make_fetched_dict(i) for i in range(5)]))
+        db_path = str(temp_path / "test.db")
+        self.enterContext(patch("vrc_world_crawler.main._setup_logging"))
+        base_argv = ["--config", str(temp_path / "not_exist.json"), "--db", db_path, "--cache-dir", str(cache_path)]
+
+        # 同じ DB の crawl, replay, merge, archive が実行中の場合は実行しない
+        run_lock = RunLock(Path(f"{db_path}.lock"))
+        run_lock.acquire()
+        for argv in [["replay"], ["--queue-db", str(temp_path / "queue.db"), "merge"], ["archive"]]:
+            with self.subTest(argv=argv), self.assertRaises(RuntimeError):
+                main(base_argv + argv)
+        run_lock.release()
+
+        # dry-run では DB に反映しない
+        main(base_argv + ["replay", "--dry-run"])
+        db = FavoriteWorldDB(db_path)
+        self.assertEqual(0, db.stats()["total"])
+
+        main(base_argv + ["replay", "--snapshot", str(snapshot_path)])
+        self.assertEqual(5, db.stats()["total"])
+        db.engine.dispose()
+
+        output_path = temp_path / "export.jsonl"
+        main(base_argv + ["export", "-o", str(output_path), "--author-id", make_fetched_dict(1)["authorId"]])
+        actual = [orjson.loads(line) for line in output_path.read_bytes().splitlines()]
+        self.assertEqual([make_fetched_dict(1)["id"]], [row["world_id"] for row in actual])
+
+        stdout = self.enterContext(patch("sys.stdout", new_callable=io.StringIO))
+        main(base_argv + ["stats"])
+        self.assertIn("total: 5, favorited: 5, archived: 0", stdout.getvalue())
+        self.assertIn("worlds1: 5", stdout.getvalue())
+
+        main(base_argv + ["summary", "--check"])
+        self.assertIn("GroupSummary: ok\nAuthorSummary: ok", stdout.getvalue())
+        main(base_argv + ["summary"])
+        expect = sum(make_fetched_dict(i)["favorites"] for i in range(5))
+        self.assertIn(f"worlds1\t5\t5\t{expect}", stdout.getvalue())
+
+        # 状態ファイルが無い場合はランキングを表示できない
+        with self.assertRaises(FileNotFoundError):
+            main(base_argv + ["trending"])
+        # 最初の観測は基準値とし、次の観測との差分でランキングを作る
+        main(base_argv + ["replay", "--trending", "--snapshot", str(snapshot_path)])
+        fetched_dict_list = [make_fetched_dict(i) for i in range(5)]
+        fetched_dict_list[2]["favorites"] += 7
+        fetched_dict_list[4]["favorites"] += 3
+        next_snapshot_path = cache_path / "favorites_world_20240902000000.json"
+        next_snapshot_path.write_bytes(orjson.dumps(fetched_dict_list))
+        main(base_argv + ["replay", "--trending", "--snapshot", str(next_snapshot_path)])
+        main(base_argv + ["trending", "--top", "1"])
+        self.assertIn(f"{make_fetched_dict(2)['id']}\t7", stdout.getvalue())
+        self.assertNotIn(f"{make_fetched_dict(4)['id']}\t3", stdout.getvalue())
+
+        world_name = make_fetched_dict(3)["name"]
+        main(base_argv + ["search", "--rebuild", world_name])
+        self.assertIn(f"{make_fetched_dict(3)['id']}\t{world_name}", stdout.getvalue())
+
+    def test_replay_profile(self):
+        temp_dir = self.enterContext(tempfile.TemporaryDirectory())
+        temp_path = Path(temp_dir)
+        cache_path = temp_path / "cache"
+        cache_path.mkdir()
+        snapshot_path = cache_path / "favorites_world_20240901000000.json"
+        snapshot_path.write_bytes(orjson.dumps([make_fetched_dict(i) for i in range(5)]))
+        profile_path = temp_path / "profile"
+        self.enterContext(patch("vrc_world_crawler.main._setup_logging"))
+        base_argv = ["--config", str(temp_path / "not_exist.json"), "--db", str(temp_path / "test.db")]
+        base_argv += ["--cache-dir", str(cache_path), "--profile-dir", str(profile_path)]
+
+        # 1回の実行ごとに pstats と集計を書き出す
+        main(base_argv + ["--profile", "cprofile", "replay"])
+        self.assertEqual(1, len(list(profile_path.glob("replay_*.pstats"))))
+        summary_path = next(profile_path.glob("replay_*_summary.txt"))
+        self.assertIn("run", summary_path.read_text(encoding="utf-8"))
+
+        # 計測しない場合は何も書き出さない
+        shutil.rmtree(profile_path)
+        main(base_argv + ["replay"])
+        self.assertFalse(profile_path.exists())
+
+    def test_bench(self):
+        stdout = self.enterContext(patch("sys.stdout", new_callable=io.StringIO))
+        main(["bench", "fetched_info_create", "--size", "10", "--repeat", "1"])
+        self.assertIn("fetched_info_create", stdout.getvalue())
+
+        main(["bench", "--memory", "--size", "10"])
+        for name in ["fetch", "record", "upsert", "total"]:
+            self.assertIn(f"\n{name} ", stdout.getvalue())
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
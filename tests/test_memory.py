@@ -0,0 +1,135 @@
+import logging
+import sys
+import threading
+import tracemalloc
+import unittest
+
+from vrc_world_crawler.bench import measure_pipeline_memory
+from vrc_world_crawler.memory import MemoryTracker, MemoryUsage, track_memory
+
+# 合成したお気に入り 10,000 件あたりのメモリ使用量の上限(バイト)
+# 計測値に 25% 程度の余裕を持たせた値、1回の run で同時に保持するデータが増えた場合はテストを失敗させる
+PIPELINE_SIZE = 10_000
+PIPELINE_BUDGET_DICT = {
+    # 段階名: (区間終了時に残っている量の上限, 区間内のピークの上限)
+    "fetch": (17 * 1024 * 1024, 17 * 1024 * 1024),
+    "record": (21 * 1024 * 1024, 21 * 1024 * 1024),
+    "upsert": (25 * 1024 * 1024, 38 * 1024 * 1024),
+}
+PIPELINE_PEAK_BUDGET = 75 * 1024 * 1024
+
+
+class TestMemory(unittest.TestCase):
+    def setUp(self) -> None:
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def test_memory_usage(self):
+        usage = MemoryUsage("fetch", -1024, 2048)
+        self.assertEqual("fetch", usage.name)
+        self.assertIn("allocated=      -1.0KiB peak=       2.0KiB", str(usage))
+        with self.assertRaises(ValueError):
+            MemoryUsage("fetch", 0, -1)
+
+    def test_phase(self):
+        with MemoryTracker() as tracker:
+            self.assertTrue(tracemalloc.is_tracing())
+            with tracker.phase("keep"):
+                kept = [bytearray(1024) for _ in range(100)]
+            with tracker.phase("temporary"):
+                temporary = bytearray(1024 * 1024)
+                del temporary
+        self.assertFalse(tracemalloc.is_tracing())
+
+        self.assertEqual(["keep", "temporary"], [usage.name for usage in tracker.usage_list])
+        keep, temporary = tracker.usage_list
+        # 残っている量とピークを区間ごとに記録する
+        self.assertGreaterEqual(keep.allocated, 100 * 1024)
+        self.assertGreaterEqual(keep.peak, keep.allocated)
+        self.assertLess(temporary.allocated, 1024)
+        self.assertGreaterEqual(temporary.peak, 1024 * 1024)
+        # 全体のピークは前の区間で残した分も含む
+        self.assertGreaterEqual(tracker.peak, keep.allocated + temporary.peak)
+        self.assertIn("total", tracker.report())
+
+    def test_phase_error(self):
+        tracker = MemoryTracker()
+        with self.assertRaises(RuntimeError):
+            with tracker.phase("not_started"):
+                pass
+
+        with tracker:
+            with tracker.phase("outer"):
+                with self.assertRaises(RuntimeError):
+                    with tracker.phase("inner"):
+                        pass
+            # 例外で終了した区間も記録する
+            with self.assertRaises(KeyError):
+                with tracker.phase("error"):
+                    raise KeyError()
+        self.assertEqual(["outer", "error"], [usage.name for usage in tracker.usage_list])
+
+    def test_tracing_started(self):
+        # 既に動いている tracemalloc は止めない
+        tracemalloc.start()
+        try:
+            with MemoryTracker() as tracker:
+                with tracker.phase("phase"):
+                    pass
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+
+    def test_phase_other_thread(self):
+        # 他のスレッドで確保したメモリも区間に含む
+        with MemoryTracker() as tracker:
+            with tracker.phase("thread"):
+                kept = []
+                thread = threading.Thread(target=lambda: kept.append(bytearray(1024 * 1024)))
+                thread.start()
+                thread.join()
+        self.assertGreaterEqual(tracker.usage_list[0].allocated, 1024 * 1024)
+
+    def test_track_memory(self):
+        with self.assertLogs("vrc_world_crawler.memory") as cm:
+            with track_memory("crawl", 3) as tracker:
+                kept = bytearray(1024 * 1024)
+        self.assertEqual(["crawl"], [usage.name for usage in tracker.usage_list])
+        self.assertIn("Memory usage:\ncrawl", cm.output[0])
+        self.assertIn("Top allocations:", cm.output[1])
+        self.assertEqual(3, len(cm.output[1].splitlines()) - 1)
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+class TestPipelineMemory(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        # 計測に時間がかかるため、1回の計測結果を各テストで共有する
+        # テストランナーがログレコードを保持すると計測値に含まれるため、計測中はログを出力しない
+        logging.disable(logging.INFO)
+        try:
+            cls.tracker = measure_pipeline_memory(PIPELINE_SIZE)
+        finally:
+            logging.disable(logging.NOTSET)
+        return super().setUpClass()
+
+    def test_phase_budget(self):
+        usage_dict = {usage.name: usage for usage in self.tracker.usage_list}
+        self.assertEqual(list(PIPELINE_BUDGET_DICT.keys()), list(usage_dict.keys()))
+        for name, (allocated_budget, peak_budget) in PIPELINE_BUDGET_DICT.items():
+            with self.subTest(name=name):
+                usage = usage_dict[name]
+                self.assertGreater(usage.allocated, 0)
+                self.assertLessEqual(usage.allocated, allocated_budget, str(usage))
+                self.assertLessEqual(usage.peak, peak_budget, str(usage))
+
+    def test_peak_budget(self):
+        self.assertLessEqual(self.tracker.peak, PIPELINE_PEAK_BUDGET, self.tracker.report())
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -0,0 +1,166 @@
+import pstats
+import sys
+import tempfile
+import threading
+import unittest
+import xml.etree.ElementTree as ET
+from collections import Counter
+from pathlib import Path
+
+from vrc_world_crawler.profiler import CProfileProfiler, SamplingProfiler, create_profiler, profile_run
+from vrc_world_crawler.profiler import render_flame_graph
+
+
+def _busy_loop(stop_event: threading.Event) -> int:
+    """stop_event が立つまで CPU を使い続ける"""
+    total = 0
+    while not stop_event.is_set():
+        total += sum(range(1000))
+    return total
+
+
+def _busy_count(n: int) -> int:
+    return sum(i * i for i in range(n))
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self) -> None:
+        temp_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.output_dir = Path(temp_dir)
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        return super().tearDown()
+
+    def test_create_profiler(self):
+        self.assertIsInstance(create_profiler("sampling"), SamplingProfiler)
+        self.assertIsInstance(create_profiler("cprofile"), CProfileProfiler)
+        with self.assertRaises(ValueError):
+            create_profiler("perf")
+        with self.assertRaises(ValueError):
+            SamplingProfiler(interval=0)
+
+    def test_sampling_profiler(self):
+        stop_event = threading.Event()
+        thread = threading.Thread(target=_busy_loop, args=(stop_event,), name="Busy_0")
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        thread.start()
+        try:
+            while sum(profiler.sample_counter.values()) < 20:
+                stop_event.wait(0.01)
+        finally:
+            stop_event.set()
+            thread.join()
+            profiler.stop()
+
+        # ワーカー名の番号は取り除き、根元をスレッド名としてスタックを記録する
+        busy_stack_list = [stack for stack in profiler.sample_counter if stack[0] == "Busy"]
+        self.assertTrue(busy_stack_list)
+        self.assertTrue(all(any(name.startswith("_busy_loop ") for name in stack) for stack in busy_stack_list))
+        # 待機中のスレッドとプロファイラ自身は記録しない
+        self.assertFalse(any(stack[0] == "SamplingProfiler" for stack in profiler.sample_counter))
+        self.assertFalse(any(stack[-1].startswith("wait (threading.py") for stack in profiler.sample_counter))
+
+        path_list = profiler.write(self.output_dir, "test", 5)
+        self.assertEqual(["test.collapsed", "test.svg", "test_summary.txt"], [path.name for path in path_list])
+        for line in path_list[0].read_text(encoding="utf-8").splitlines():
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+            self.assertGreater(len(stack.split(";")), 1)
+        ET.fromstring(path_list[1].read_text(encoding="utf-8"))
+        summary = path_list[2].read_text(encoding="utf-8")
+        self.assertIn("top 5 functions by self samples:", summary)
+        self.assertIn("_busy_loop", summary)
+
+    def test_cprofile_profiler(self):
+        profiler = CProfileProfiler()
+        profiler.start()
+        # 計測中に開始したスレッドも計測する
+        thread = threading.Thread(target=_busy_count, args=(1000,))
+        thread.start()
+        thread.join()
+        _busy_count(10)
+        profiler.stop()
+
+        # 各スレッドの呼び出しは1つの関数にまとめる
+        call_num_list = [value[1] for (_, _, name), value in profiler.stats.stats.items() if name == "_busy_count"]
+        self.assertEqual([2], call_num_list)
+        self.assertIsNone(threading.getprofile())
+
+        path_list = profiler.write(self.output_dir, "test", 5)
+        self.assertEqual(["test.pstats", "test_summary.txt"], [path.name for path in path_list])
+        stats = pstats.Stats(str(path_list[0]))
+        self.assertTrue(any(name == "_busy_count" for _, _, name in stats.stats))
+        self.assertIn("_busy_count", path_list[1].read_text(encoding="utf-8"))
+
+    def test_cprofile_profiler_running_thread(self):
+        stop_event = threading.Event()
+        started_event = threading.Event()
+
+        def target():
+            started_event.set()
+            stop_event.wait()
+
+        profiler = CProfileProfiler()
+        profiler.start()
+        thread = threading.Thread(target=target)
+        thread.start()
+        started_event.wait()
+        try:
+            # 動作中のスレッドの計測結果は含めない
+            with self.assertLogs("vrc_world_crawler.profiler") as cm:
+                profiler.stop()
+            self.assertIn("1 threads still running", cm.output[0])
+            self.assertFalse(any(name == "target" for _, _, name in profiler.stats.stats))
+        finally:
+            stop_event.set()
+            thread.join()
+
+    def test_profile_run(self):
+        for mode, suffix_list in [
+            ("sampling", [".collapsed", ".svg", "_summary.txt"]),
+            ("cprofile", [".pstats", "_summary.txt"]),
+        ]:
+            with self.subTest(mode=mode):
+                output_dir = self.output_dir / mode
+                with self.assertRaises(RuntimeError):
+                    with profile_run(mode, output_dir, "crawl", 5) as profiler:
+                        _busy_count(1000)
+                        raise RuntimeError()
+                # 例外で終了した場合もそれまでの結果を書き出す
+                self.assertFalse(profiler._thread if mode == "sampling" else threading.getprofile())
+                path_list = sorted(output_dir.iterdir())
+                self.assertEqual(len(suffix_list), len(path_list))
+                for suffix in suffix_list:
+                    self.assertEqual(1, len([path for path in path_list if path.name.endswith(suffix)]))
+                self.assertTrue(all(path.name.startswith("crawl_") for path in path_list))
+
+    def test_render_flame_graph(self):
+        sample_counter = Counter({
+            ("MainThread", "main (a.py:1)", "run (b.py:2)"): 3,
+            ("MainThread", "main (a.py:1)", "<lambda> (c.py:3)"): 1,
+        })
+        svg = render_flame_graph(sample_counter, "test <run>")
+        root = ET.fromstring(svg)
+        ns = {"svg": "http://www.w3.org/2000/svg"}
+        title_list = [element.text for element in root.iterfind("svg:g/svg:title", ns)]
+        self.assertIn("MainThread (4 samples, 100.0%)", title_list)
+        self.assertIn("run (b.py:2) (3 samples, 75.0%)", title_list)
+        self.assertIn("<lambda> (c.py:3) (1 samples, 25.0%)", title_list)
+        self.assertIn("test <run> (4 samples)", root.find("svg:text", ns).text)
+        # 根元ほど下に描き、子の幅の合計は親の幅に等しい
+        rect_list = root.findall("svg:g/svg:rect", ns)
+        y_list = [float(rect.get("y")) for rect in rect_list]
+        self.assertEqual(max(y_list), y_list[0])
+        leaf_width_list = [float(rect.get("width")) for rect, y in zip(rect_list, y_list) if y == min(y_list)]
+        self.assertAlmostEqual(1200.0, sum(leaf_width_list))
+
+        # サンプルが無い場合も SVG として読める
+        ET.fromstring(render_flame_graph(Counter(), "empty"))
+
+
+if __name__ == "__main__":
+    if sys.argv:
+        del sys.argv[1:]
+    unittest.main(warnings="ignore")
@@ -1,12 +1,14 @@
 import sys
 import unittest
-from datetime import datetime, timedelta
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 import orjson
 from mock import MagicMock, patch
 
-from vrc_world_crawler.util import find_values, to_jst
+from vrc_world_crawler import util
+from vrc_world_crawler.util import JST, find_values, normalize_date_at, parse_iso_date, to_jst
 
 
 class TestUtil(unittest.TestCase):
@@ -114,9 +116,63 @@ class TestUtil(unittest.TestCase):
         actual = to_jst(utc)
         self.assertEqual(expect, actual)
 
+        # タイムゾーンを持つ日時はそのタイムゾーンから変換する
+        Params = namedtuple("Params", ["date_at_str", "expect"])
+        params_list = [
+            Params("2025-06-13T12:34:56.789000+00:00", "2025-06-13T21:34:56.789000+09:00"),
+            Params("2025-06-13T21:34:56.789000+09:00", "2025-06-13T21:34:56.789000+09:00"),
+            Params("2025-06-13T12:34:56.789000-05:00", "2025-06-14T02:34:56.789000+09:00"),
+        ]
+        for params in params_list:
+            with self.subTest(params=params):
+                actual = to_jst(datetime.fromisoformat(params.date_at_str))
+                self.assertEqual(params.expect, actual.isoformat())
+                self.assertEqual(datetime.fromisoformat(params.date_at_str), actual)
+
         with self.assertRaises(ValueError):
             actual = to_jst("invalid type")
 
+    def test_jst(self) -> None:
+        self.assertEqual(timedelta(hours=9), JST.utcoffset(datetime(2025, 6, 13)))
+
+        # tzdata が無い環境では固定オフセットで代用する
+        self.enterContext(patch("vrc_world_crawler.util.ZoneInfo", side_effect=util.ZoneInfoNotFoundError))
+        actual = util._load_jst()
+        self.assertEqual(timezone(timedelta(hours=9), "JST"), actual)
+
+    def test_normalize_date_at(self) -> None:
+        Params = namedtuple("Params", ["date_at_str", "expect"])
+        params_list = [
+            Params("2024-09-01T12:34:56.789Z", "2024-09-01T21:34:56.789000"),
+            Params("2024-09-01T20:34:56.789Z", "2024-09-02T05:34:56.789000"),
+            # タイムゾーンを持たない場合は UTC とみなす
+            Params("2024-09-01T12:34:56", "2024-09-01T21:34:56"),
+            Params("2024-09-01T21:34:56+09:00", "2024-09-01T21:34:56"),
+        ]
+        for params in params_list:
+            with self.subTest(params=params):
+                self.assertEqual(params.expect, normalize_date_at(params.date_at_str))
+
+        # ワールドごとに異なる日時は parse_iso_date のキャッシュに載せない
+        parse_iso_date.cache_clear()
+        normalize_date_at("2024-09-01T12:34:56.789Z")
+        self.assertEqual(0, parse_iso_date.cache_info().currsize)
+
+        with self.assertRaises(ValueError):
+            normalize_date_at("invalid date")
+
+    def test_parse_iso_date(self) -> None:
+        self.assertEqual(datetime(2024, 9, 1, 12, 34, 56), parse_iso_date("2024-09-01T12:34:56"))
+        with self.assertRaises(ValueError):
+            parse_iso_date("invalid date")
+
+        # 同じ日時文字列の2回目以降はキャッシュから返す
+        parse_iso_date.cache_clear()
+        parse_iso_date("2024-09-01T12:34:56")
+        parse_iso_date("2024-09-01T12:34:56")
+        self.assertEqual(1, parse_iso_date.cache_info().hits)
+        self.assertEqual(util.DATE_CACHE_SIZE, parse_iso_date.cache_info().maxsize)
+
 
 if __name__ == "__main__":
     if sys.argv: